@@ -11,7 +11,9 @@ from routes.network import network_bp
 from routes.persona_api import persona_bp
 from routes.browsing import browsing_bp
 from routes.archives import archives_bp
+from routes.memento import memento_bp
 from routes.journey import journey_bp
+from routes.artifacts import artifacts_bp
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -72,7 +74,9 @@ def create_app():
     app.register_blueprint(persona_bp)
     app.register_blueprint(browsing_bp)
     app.register_blueprint(archives_bp)
+    app.register_blueprint(memento_bp)
     app.register_blueprint(journey_bp)
+    app.register_blueprint(artifacts_bp)
     
     # Import agent_bp here to prevent circular imports
     from routes.agent import agent_bp
@@ -114,6 +118,30 @@ if __name__ == "__main__":
             pass
     atexit.register(_shutdown_browser)
 
+    # Close pooled LLM connections on exit
+    from utils.llm_client import close_llm_clients
+    atexit.register(close_llm_clients)
+
+    # Write LLM telemetry still buffered on exit (registered before the
+    # extraction queue so its last calls are included)
+    from utils.llm_telemetry import telemetry
+    atexit.register(telemetry.flush)
+
+    # Periodic archive GC (ARCHIVE_GC_INTERVAL; disabled by default)
+    from utils.archive_gc import archive_gc
+    archive_gc.start_periodic()
+
+    # Resume Internet Archive submissions queued before the last shutdown
+    from utils.internet_archive import submission_queue
+    submission_queue.start()
+
+    # Resume persona attribute extraction, and let running extractions
+    # finish on exit (the rest stay queued for the next start)
+    from config import EXTRACTION_DRAIN_TIMEOUT
+    from utils.extraction_queue import extraction_queue
+    extraction_queue.start()
+    atexit.register(extraction_queue.stop, EXTRACTION_DRAIN_TIMEOUT)
+
     app = create_app()
 
     # Drive debug from config (FLASK_DEBUG/DEBUG), and never expose the interactive
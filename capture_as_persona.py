@@ -22,6 +22,9 @@ Examples:
     python3 capture_as_persona.py https://www.cnn.com \
         --profile-dir ./Alex_Johnson_Browser_Profile --channel chrome --har --video
 
+    # Append HTML + screenshot to the rolling WARC in archives/warc/ instead of files
+    python3 capture_as_persona.py https://www.cnn.com --warc
+
 Note on real-profile mode:
     ``Alex_Johnson_Browser_Profile.zip`` (~510 MB) is NOT included in the repo --
     it is gitignored, so a fresh clone does not have it. To use ``--profile-dir``
@@ -81,6 +84,8 @@ def main():
     parser.add_argument("--video", action="store_true", help="Record a session video")
     parser.add_argument("--wait", type=int, default=5, help="Settle time after load (seconds)")
     parser.add_argument("--headed", action="store_true", help="Run with a visible browser window")
+    parser.add_argument("--warc", action="store_true",
+                        help="Write HTML/screenshot as records in the rolling archives/warc/ file")
     args = parser.parse_args()
 
     persona = _load_persona(args.persona_id, args.persona_name)
@@ -99,6 +104,7 @@ def main():
             record_video=args.video,
             wait_time=args.wait,
             headless=not args.headed,
+            archive_format="warc" if args.warc else None,
         )
     finally:
         manager.shutdown()
@@ -106,6 +112,8 @@ def main():
     logger.info("Title: %s", result.get("title"))
     logger.info("Memento: %s", result.get("memento_location"))
     logger.info("Screenshot: %s", result.get("screenshot_path"))
+    for record_type, ref in (result.get("warc_records") or {}).items():
+        logger.info("WARC %s: %s @ %s", record_type, ref["filename"], ref["offset"])
     if result.get("har_path"):
         logger.info("HAR: %s", result["har_path"])
     if result.get("video_path"):
@@ -14,7 +14,6 @@ Usage:
     from database import get_persona, save_persona
     persona = get_persona(1)
 """
-from datetime import datetime
 
 from .connection import get_db_connection
 
@@ -24,6 +23,9 @@ from .repositories.journey import JourneyRepository
 from .repositories.archive import ArchiveRepository
 from .repositories.user import UserRepository
 from .repositories.settings import SettingsRepository
+from .repositories.llm_cache import LLMCacheRepository
+from .repositories.extraction import ExtractionJobRepository
+from .repositories.llm_telemetry import LLMTelemetryRepository
 
 # Initialize repository singletons
 _persona_repo = None
@@ -31,6 +33,9 @@ _journey_repo = None
 _archive_repo = None
 _user_repo = None
 _settings_repo = None
+_llm_cache_repo = None
+_extraction_repo = None
+_llm_telemetry_repo = None
 
 
 def _get_persona_repo():
@@ -68,10 +73,31 @@ def _get_settings_repo():
     return _settings_repo
 
 
+def _get_llm_cache_repo():
+    global _llm_cache_repo
+    if _llm_cache_repo is None:
+        _llm_cache_repo = LLMCacheRepository()
+    return _llm_cache_repo
+
+
+def _get_extraction_repo():
+    global _extraction_repo
+    if _extraction_repo is None:
+        _extraction_repo = ExtractionJobRepository()
+    return _extraction_repo
+
+
 # ============================================================================
 # Schema Initialization
 # ============================================================================
 
+def _get_llm_telemetry_repo():
+    global _llm_telemetry_repo
+    if _llm_telemetry_repo is None:
+        _llm_telemetry_repo = LLMTelemetryRepository()
+    return _llm_telemetry_repo
+
+
 def init_db():
     """Initialize the database with required tables."""
     conn = get_db_connection()
@@ -102,6 +128,10 @@ def init_db():
         headers TEXT,
         screenshot_path TEXT,
         internet_archive_id TEXT,
+        internet_archive_status TEXT,
+        capture_timings TEXT,
+        content_encoding TEXT,
+        last_accessed_at TIMESTAMP,
         created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
         FOREIGN KEY (archived_website_id) REFERENCES archived_websites (id) ON DELETE CASCADE
     )
@@ -151,10 +181,294 @@ def init_db():
     if 'agent_data' not in column_names:
         cursor.execute("ALTER TABLE waypoints ADD COLUMN agent_data TEXT")
 
+    # Check for columns added to mementos after the initial schema
+    cursor.execute("PRAGMA table_info(mementos)")
+    memento_columns = [col['name'] for col in cursor.fetchall()]
+
+    if 'capture_timings' not in memento_columns:
+        cursor.execute("ALTER TABLE mementos ADD COLUMN capture_timings TEXT")
+
+    if 'content_encoding' not in memento_columns:
+        cursor.execute("ALTER TABLE mementos ADD COLUMN content_encoding TEXT")
+
+    if 'last_accessed_at' not in memento_columns:
+        cursor.execute("ALTER TABLE mementos ADD COLUMN last_accessed_at TIMESTAMP")
+
+    if 'internet_archive_status' not in memento_columns:
+        cursor.execute("ALTER TABLE mementos ADD COLUMN internet_archive_status TEXT")
+
+    # Per-URL memento lookups: capture resolves uri_r -> website, listings
+    # and time-based lookups scan a website's mementos by datetime.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_archived_websites_uri_r ON archived_websites (uri_r)")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_mementos_website_datetime "
+        "ON mementos (archived_website_id, memento_datetime)"
+    )
+
+    # Content-addressed artifact blobs (utils/blob_store.py). refcount is the
+    # number of memento_blobs rows pointing at the blob.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS blobs (
+        sha256 TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        refcount INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS memento_blobs (
+        memento_id INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        sha256 TEXT NOT NULL,
+        PRIMARY KEY (memento_id, role),
+        FOREIGN KEY (memento_id) REFERENCES mementos (id) ON DELETE CASCADE,
+        FOREIGN KEY (sha256) REFERENCES blobs (sha256)
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_memento_blobs_sha256 ON memento_blobs (sha256)")
+
+    # Re-indexing and the archive GC match dirs on disk to rows by location;
+    # one row per dir, so a re-index racing a capture cannot register it twice.
+    cursor.execute("DROP INDEX IF EXISTS idx_mementos_location")
+    _drop_duplicate_mementos(cursor)
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_mementos_location_unique ON mementos (memento_location)")
+
+    # Memento dirs whose rows were deleted; the archive GC removes only these
+    # from disk, so captures that never had a row (or a lost DB) are safe.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS deleted_mementos (
+        memento_location TEXT PRIMARY KEY,
+        deleted_at TIMESTAMP NOT NULL
+    )
+    ''')
+
+    # Offset index into the rolling WARC files (ARCHIVE_FORMAT=warc). Rows for
+    # ad-hoc captures have no memento; rows outlive their memento because the
+    # WARC files are append-only.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS warc_records (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        memento_id INTEGER,
+        record_id TEXT NOT NULL,
+        record_type TEXT NOT NULL,
+        target_uri TEXT NOT NULL,
+        warc_filename TEXT NOT NULL,
+        record_offset INTEGER NOT NULL,
+        record_length INTEGER NOT NULL,
+        warc_date TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (memento_id) REFERENCES mementos (id) ON DELETE SET NULL
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_warc_records_uri_date ON warc_records (target_uri, warc_date)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_warc_records_memento ON warc_records (memento_id)")
+
+    # Perceptual hashes of memento screenshots (utils/image_hash.py). The
+    # pHash bands let near-duplicate lookups use indexed equality.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS screenshot_hashes (
+        memento_id INTEGER PRIMARY KEY,
+        archived_website_id INTEGER NOT NULL,
+        dhash TEXT NOT NULL,
+        phash TEXT NOT NULL,
+        phash_band0 INTEGER NOT NULL,
+        phash_band1 INTEGER NOT NULL,
+        phash_band2 INTEGER NOT NULL,
+        phash_band3 INTEGER NOT NULL,
+        FOREIGN KEY (memento_id) REFERENCES mementos (id) ON DELETE CASCADE
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_screenshot_hashes_website ON screenshot_hashes (archived_website_id)")
+    for band in range(4):
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS idx_screenshot_hashes_band{band} "
+            f"ON screenshot_hashes (phash_band{band})"
+        )
+
+    # Save Page Now submissions, worked off by utils.internet_archive's queue.
+    # memento_id is NULL for URLs submitted without a local capture; batch_id
+    # groups the jobs of one bulk submission.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS internet_archive_batches (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        label TEXT NOT NULL,
+        check_availability INTEGER NOT NULL DEFAULT 1,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS internet_archive_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        memento_id INTEGER,
+        uri_r TEXT NOT NULL,
+        batch_id INTEGER,
+        check_availability INTEGER NOT NULL DEFAULT 0,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        next_attempt_at TIMESTAMP NOT NULL,
+        last_error TEXT,
+        archived_url TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP,
+        finished_at TIMESTAMP,
+        FOREIGN KEY (memento_id) REFERENCES mementos (id) ON DELETE CASCADE,
+        FOREIGN KEY (batch_id) REFERENCES internet_archive_batches (id) ON DELETE CASCADE
+    )
+    ''')
+    cursor.execute("PRAGMA table_info(internet_archive_jobs)")
+    ia_job_columns = [col['name'] for col in cursor.fetchall()]
+
+    if 'batch_id' not in ia_job_columns:
+        cursor.execute("ALTER TABLE internet_archive_jobs ADD COLUMN batch_id INTEGER "
+                       "REFERENCES internet_archive_batches (id) ON DELETE CASCADE")
+
+    if 'check_availability' not in ia_job_columns:
+        cursor.execute("ALTER TABLE internet_archive_jobs ADD COLUMN check_availability INTEGER NOT NULL DEFAULT 0")
+
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_internet_archive_jobs_due "
+        "ON internet_archive_jobs (status, next_attempt_at)"
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_internet_archive_jobs_memento ON internet_archive_jobs (memento_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_internet_archive_jobs_batch ON internet_archive_jobs (batch_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_internet_archive_jobs_uri_r ON internet_archive_jobs (uri_r)")
+
+    # Cached Wayback availability lookups (closest snapshot per URL; NULL if none).
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS internet_archive_availability (
+        uri_r TEXT PRIMARY KEY,
+        snapshot_url TEXT,
+        snapshot_at TIMESTAMP,
+        checked_at TIMESTAMP NOT NULL
+    )
+    ''')
+
+    # Content-addressed LLM responses (utils/llm_cache.py); key is a hash of
+    # provider, model, prompt and schema.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS llm_response_cache (
+        key TEXT PRIMARY KEY,
+        provider TEXT NOT NULL,
+        model TEXT,
+        kind TEXT NOT NULL,
+        response TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        hits INTEGER NOT NULL DEFAULT 0,
+        created_at TIMESTAMP NOT NULL,
+        expires_at TIMESTAMP,
+        last_used_at TIMESTAMP NOT NULL
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_response_cache_lru ON llm_response_cache (last_used_at)")
+
+    # One row per LLMClient call (utils/llm_telemetry.py); rows past the
+    # retention window are folded into hourly rollups.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS llm_calls (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        provider TEXT,
+        model TEXT,
+        kind TEXT NOT NULL,
+        outcome TEXT NOT NULL,
+        prompt_tokens INTEGER,
+        cached_tokens INTEGER,
+        completion_tokens INTEGER,
+        ttft_ms REAL,
+        latency_ms REAL NOT NULL,
+        attempts INTEGER NOT NULL DEFAULT 1,
+        error TEXT,
+        created_at TIMESTAMP NOT NULL
+    )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_llm_calls_created ON llm_calls (created_at)")
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS llm_call_rollups (
+        hour TEXT NOT NULL,
+        provider TEXT NOT NULL,
+        model TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        calls INTEGER NOT NULL,
+        errors INTEGER NOT NULL,
+        retries INTEGER NOT NULL,
+        prompt_tokens INTEGER NOT NULL,
+        cached_tokens INTEGER NOT NULL,
+        completion_tokens INTEGER NOT NULL,
+        latency_ms REAL NOT NULL,
+        generation_ms REAL NOT NULL,
+        PRIMARY KEY (hour, provider, model, kind)
+    )
+    ''')
+
+    # Bulk re-extraction runs over many saved conversations.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS extraction_batches (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        label TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'running',
+        created_at TIMESTAMP NOT NULL,
+        finished_at TIMESTAMP
+    )
+    ''')
+
+    # Persona attribute extraction queue (at most one queued job per waypoint).
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS extraction_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        waypoint_id INTEGER NOT NULL,
+        batch_id INTEGER,
+        status TEXT NOT NULL DEFAULT 'queued',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL,
+        requests INTEGER NOT NULL DEFAULT 1,
+        next_attempt_at TIMESTAMP NOT NULL,
+        last_error TEXT,
+        persona_id INTEGER,
+        created_at TIMESTAMP NOT NULL,
+        updated_at TIMESTAMP,
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP,
+        FOREIGN KEY (waypoint_id) REFERENCES waypoints (id) ON DELETE CASCADE,
+        FOREIGN KEY (batch_id) REFERENCES extraction_batches (id) ON DELETE CASCADE
+    )
+    ''')
+    cursor.execute("PRAGMA table_info(extraction_jobs)")
+    extraction_job_columns = [col['name'] for col in cursor.fetchall()]
+
+    if 'batch_id' not in extraction_job_columns:
+        cursor.execute("ALTER TABLE extraction_jobs ADD COLUMN batch_id INTEGER "
+                       "REFERENCES extraction_batches (id) ON DELETE CASCADE")
+
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_extraction_jobs_due ON extraction_jobs (status, next_attempt_at)"
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_extraction_jobs_waypoint ON extraction_jobs (waypoint_id)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_extraction_jobs_batch ON extraction_jobs (batch_id)")
+
     conn.commit()
     conn.close()
 
 
+def _drop_duplicate_mementos(cursor):
+    """Keep the oldest row per memento_location, releasing the others' blob references."""
+    duplicates = (
+        "SELECT id FROM mementos WHERE id NOT IN "
+        "(SELECT MIN(id) FROM mementos GROUP BY memento_location)"
+    )
+    cursor.execute(f"SELECT COUNT(*) FROM ({duplicates})")
+    if not cursor.fetchone()[0]:
+        return
+    cursor.execute(f"""
+    UPDATE blobs SET refcount = MAX(refcount - (
+        SELECT COUNT(*) FROM memento_blobs mb
+        WHERE mb.sha256 = blobs.sha256 AND mb.memento_id IN ({duplicates})
+    ), 0)
+    """)
+    cursor.execute(f"DELETE FROM mementos WHERE id IN ({duplicates})")
+
+
 def create_persona_tables():
     """Create persona-related tables if they don't exist."""
     conn = get_db_connection()
@@ -275,11 +589,19 @@ def init_user_table():
 def init_default_settings():
     """Initialize default settings if they don't exist."""
     repo = _get_settings_repo()
-    repo.save('internet_archive_enabled', 'true', 'Enable Internet Archive integration')
-    repo.save('internet_archive_rate_limit', '10', 'Maximum Internet Archive submissions per day')
-    repo.save('internet_archive_submissions_today', '0', 'Number of Internet Archive submissions made today')
-    repo.save('internet_archive_last_reset', datetime.now().strftime('%Y-%m-%d'),
-              'Last date the submission counter was reset')
+    if repo.get('internet_archive_enabled') is None:
+        repo.save('internet_archive_enabled', 'true', 'Enable Internet Archive integration')
+    if repo.get('internet_archive_rate_per_hour') is None:
+        # internet_archive_rate_limit was a daily cap; keep its pace (at least one an hour)
+        per_hour = 10
+        per_day = repo.get('internet_archive_rate_limit')
+        if per_day is not None:
+            try:
+                per_hour = max(1, -(-int(per_day) // 24))
+            except ValueError:
+                pass
+        repo.save('internet_archive_rate_per_hour', str(per_hour), 'Maximum Internet Archive submissions per hour')
+    repo.delete('internet_archive_rate_limit')
 
 
 def initialize_database():
@@ -302,10 +624,12 @@ def save_archived_website(url, persona_id=None, archive_type='filesystem', archi
 
 def save_memento(archived_website_id, memento_location, http_status=None,
                  content_type=None, content_length=None, headers=None,
-                 screenshot_path=None, internet_archive_id=None):
+                 screenshot_path=None, internet_archive_id=None, capture_timings=None,
+                 blobs=None, content_encoding=None, screenshot_hashes=None):
     return _get_archive_repo().save_memento(
         archived_website_id, memento_location, http_status,
-        content_type, content_length, headers, screenshot_path, internet_archive_id
+        content_type, content_length, headers, screenshot_path, internet_archive_id,
+        capture_timings, blobs, content_encoding, screenshot_hashes
     )
 
 
@@ -325,10 +649,146 @@ def get_memento(memento_id):
     return _get_archive_repo().get_memento(memento_id)
 
 
+def get_memento_blobs(memento_id):
+    return _get_archive_repo().get_memento_blobs(memento_id)
+
+
+def get_uncompressed_mementos(after_id=0, limit=None):
+    return _get_archive_repo().get_uncompressed_mementos(after_id, limit)
+
+
+def replace_memento_html(memento_id, content_encoding, sha256, size):
+    return _get_archive_repo().replace_memento_html(memento_id, content_encoding, sha256, size)
+
+
+def save_screenshot_hashes(memento_id, hashes):
+    return _get_archive_repo().save_screenshot_hashes(memento_id, hashes)
+
+
+def get_screenshot_hashes(memento_id):
+    return _get_archive_repo().get_screenshot_hashes(memento_id)
+
+
+def get_screenshot_hash_candidates(kind='phash', archived_website_id=None, phash=None):
+    return _get_archive_repo().get_screenshot_hash_candidates(kind, archived_website_id, phash)
+
+
+def save_warc_records(refs, memento_id=None):
+    return _get_archive_repo().save_warc_records(refs, memento_id)
+
+
+def get_warc_records(memento_id):
+    return _get_archive_repo().get_warc_records(memento_id)
+
+
 def delete_archived_website(archived_website_id):
     return _get_archive_repo().delete(archived_website_id)
 
 
+def enqueue_ia_job(uri_r, memento_id=None, max_attempts=5):
+    return _get_archive_repo().enqueue_ia_job(uri_r, memento_id, max_attempts)
+
+
+def get_ia_job(job_id):
+    return _get_archive_repo().get_ia_job(job_id)
+
+
+def claim_ia_job():
+    return _get_archive_repo().claim_ia_job()
+
+
+def get_next_ia_attempt_at():
+    return _get_archive_repo().get_next_ia_attempt_at()
+
+
+def finish_ia_job(job_id, archived_url=None, error=None, skipped=False):
+    return _get_archive_repo().finish_ia_job(job_id, archived_url, error, skipped)
+
+
+def retry_ia_job(job_id, error, next_attempt_at):
+    return _get_archive_repo().retry_ia_job(job_id, error, next_attempt_at)
+
+
+def requeue_running_ia_jobs(claimed_before):
+    return _get_archive_repo().requeue_running_ia_jobs(claimed_before)
+
+
+def get_ia_job_counts():
+    return _get_archive_repo().get_ia_job_counts()
+
+
+def create_ia_batch(label, targets, check_availability=True, max_attempts=5):
+    return _get_archive_repo().create_ia_batch(label, targets, check_availability, max_attempts)
+
+
+def get_ia_batch(batch_id):
+    return _get_archive_repo().get_ia_batch(batch_id)
+
+
+def get_ia_availability(uri_r):
+    return _get_archive_repo().get_ia_availability(uri_r)
+
+
+def save_ia_availability(uri_r, snapshot_url, snapshot_at):
+    return _get_archive_repo().save_ia_availability(uri_r, snapshot_url, snapshot_at)
+
+
+def get_latest_mementos(uris=None, url_contains=None, persona_id=None, since=None, until=None):
+    return _get_archive_repo().get_latest_mementos(uris, url_contains, persona_id, since, until)
+
+
+def get_archived_website_ids(uris, persona_id=None):
+    return _get_archive_repo().get_archived_website_ids(uris, persona_id)
+
+
+def seek_memento(archived_website_ids, direction, when=None):
+    return _get_archive_repo().seek_memento(archived_website_ids, direction, when)
+
+
+def get_timemap_page(archived_website_ids, after=None, limit=500):
+    return _get_archive_repo().get_timemap_page(archived_website_ids, after, limit)
+
+
+def delete_memento(memento_id):
+    return _get_archive_repo().delete_memento(memento_id)
+
+
+def get_deleted_memento_locations():
+    return _get_archive_repo().get_deleted_memento_locations()
+
+
+def forget_deleted_mementos(locations):
+    return _get_archive_repo().forget_deleted_mementos(locations)
+
+
+def touch_memento(memento_id, min_interval=3600):
+    return _get_archive_repo().touch_memento(memento_id, min_interval)
+
+
+def get_memento_locations():
+    return _get_archive_repo().get_memento_locations()
+
+
+def import_mementos(records, replace=False):
+    return _get_archive_repo().import_mementos(records, replace)
+
+
+def get_expired_mementos(keep_last=None, older_than=None):
+    return _get_archive_repo().get_expired_mementos(keep_last, older_than)
+
+
+def get_mementos_by_last_access():
+    return _get_archive_repo().get_mementos_by_last_access()
+
+
+def get_blob_refcounts():
+    return _get_archive_repo().get_blob_refcounts()
+
+
+def delete_blob_rows(sha256s):
+    return _get_archive_repo().delete_blob_rows(sha256s)
+
+
 # --- Journey functions ---
 def create_journey(name, description=None, persona_id=None, journey_type='marketing', status='active'):
     return _get_journey_repo().save({
@@ -419,6 +879,112 @@ def set_setting(key, value, description=None):
     return _get_settings_repo().save(key, value, description)
 
 
+# --- LLM response cache functions ---
+def get_llm_cache_entry(key):
+    return _get_llm_cache_repo().get(key)
+
+
+def save_llm_cache_entry(key, provider, model, kind, response, ttl=None):
+    return _get_llm_cache_repo().save({
+        'key': key, 'provider': provider, 'model': model,
+        'kind': kind, 'response': response, 'ttl': ttl,
+    })
+
+
+def evict_llm_cache(max_entries, max_bytes):
+    return _get_llm_cache_repo().evict(max_entries, max_bytes)
+
+
+def clear_llm_cache():
+    return _get_llm_cache_repo().clear()
+
+
+def get_llm_cache_stats():
+    return _get_llm_cache_repo().stats()
+
+
+# --- LLM telemetry functions ---
+def save_llm_calls(calls):
+    return _get_llm_telemetry_repo().save_many(calls)
+
+
+def get_llm_calls(since=None, limit=None):
+    return _get_llm_telemetry_repo().get_all(since=since, limit=limit)
+
+
+def get_llm_call_summary(since):
+    return _get_llm_telemetry_repo().summary(since)
+
+
+def get_llm_call_daily(since):
+    return _get_llm_telemetry_repo().daily(since)
+
+
+def rollup_llm_calls(before):
+    return _get_llm_telemetry_repo().rollup(before)
+
+
+# --- Attribute extraction job functions ---
+def enqueue_extraction_job(waypoint_id, delay=0, max_attempts=3):
+    return _get_extraction_repo().enqueue(waypoint_id, delay, max_attempts)
+
+
+def get_extraction_job(job_id):
+    return _get_extraction_repo().get(job_id)
+
+
+def get_latest_extraction_job(waypoint_id):
+    return _get_extraction_repo().get_latest(waypoint_id)
+
+
+def claim_extraction_job(batch_id=None):
+    return _get_extraction_repo().claim(batch_id)
+
+
+def get_next_extraction_attempt_at(batch_id=None):
+    return _get_extraction_repo().get_next_attempt_at(batch_id)
+
+
+def finish_extraction_job(job_id, persona_id=None, error=None):
+    return _get_extraction_repo().finish(job_id, persona_id, error)
+
+
+def finish_extraction_jobs(job_ids, persona_id=None):
+    return _get_extraction_repo().finish_many(job_ids, persona_id)
+
+
+def retry_extraction_job(job_id, error, next_attempt_at):
+    return _get_extraction_repo().retry(job_id, error, next_attempt_at)
+
+
+def requeue_running_extraction_jobs(started_before):
+    return _get_extraction_repo().requeue_running(started_before)
+
+
+def get_extraction_job_counts():
+    return _get_extraction_repo().get_counts()
+
+
+def find_unextracted_waypoints(include_current=False):
+    return _get_extraction_repo().find_unextracted_waypoints(include_current)
+
+
+def create_extraction_batch(label, waypoint_ids, max_attempts=3):
+    return _get_extraction_repo().create_batch(label, waypoint_ids, max_attempts)
+
+
+def get_extraction_batch(batch_id):
+    return _get_extraction_repo().get_batch(batch_id)
+
+
+def get_running_extraction_batches():
+    return _get_extraction_repo().get_running_batches()
+
+
+def finish_extraction_batch(batch_id):
+    return _get_extraction_repo().finish_batch(batch_id)
+
+
 # --- User functions ---
 def create_user(email, password_hash):
     return _get_user_repo().save({'email': email, 'password_hash': password_hash})
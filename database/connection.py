@@ -43,7 +43,7 @@ class DatabaseConnection:
         return conn
 
     @contextmanager
-    def transaction(self):
+    def transaction(self, immediate=False):
         """
         Context manager for database transactions.
 
@@ -51,10 +51,16 @@ class DatabaseConnection:
             with db.transaction() as cursor:
                 cursor.execute("INSERT INTO ...")
                 # Auto-commits on success, rolls back on exception
+
+        With ``immediate=True`` the write lock is taken up front (BEGIN
+        IMMEDIATE), so a read-modify-write is serialized against every other
+        connection, in this process or another.
         """
         conn = self.get_connection()
         cursor = conn.cursor()
         try:
+            if immediate:
+                cursor.execute("BEGIN IMMEDIATE")
             yield cursor
             conn.commit()
         except Exception:
@@ -186,6 +186,10 @@ class Memento:
     headers: Optional[Dict[str, Any]] = None
     screenshot_path: Optional[str] = None
     internet_archive_id: Optional[str] = None
+    internet_archive_status: Optional[str] = None  # queued, archived or failed
+    capture_timings: Optional[Dict[str, float]] = None
+    content_encoding: Optional[str] = None  # None/"identity" or "gzip"
+    last_accessed_at: Optional[datetime] = None  # LRU order for the disk quota
     created_at: Optional[datetime] = None
 
 
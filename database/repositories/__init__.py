@@ -33,6 +33,9 @@ from .journey import JourneyRepository
 from .archive import ArchiveRepository
 from .user import UserRepository
 from .settings import SettingsRepository
+from .llm_cache import LLMCacheRepository
+from .extraction import ExtractionJobRepository
+from .llm_telemetry import LLMTelemetryRepository
 
 __all__ = [
     'BaseRepository',
@@ -41,4 +44,7 @@ __all__ = [
     'ArchiveRepository',
     'UserRepository',
     'SettingsRepository',
+    'LLMCacheRepository',
+    'ExtractionJobRepository',
+    'LLMTelemetryRepository',
 ]
@@ -5,8 +5,8 @@ Handles all database operations related to archived websites and mementos.
 """
 import json
 import hashlib
-from datetime import datetime
-from typing import Optional, List, Dict, Any
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any, Tuple
 
 from ..connection import get_db
 from . import BaseRepository
@@ -86,10 +86,44 @@ class ArchiveRepository(BaseRepository):
             archived_website_id = cursor.lastrowid
             return archived_website_id
 
+    @staticmethod
+    def _release_blobs(cursor, where: str, params: Tuple) -> None:
+        """Decrement the refcount of every blob referenced by the matched mementos."""
+        cursor.execute(
+            f"""
+            SELECT mb.sha256, COUNT(*) AS refs
+            FROM memento_blobs mb
+            JOIN mementos m ON mb.memento_id = m.id
+            WHERE {where}
+            GROUP BY mb.sha256
+            """,
+            params
+        )
+        for row in cursor.fetchall():
+            cursor.execute(
+                "UPDATE blobs SET refcount = MAX(refcount - ?, 0) WHERE sha256 = ?",
+                (row['refs'], row['sha256'])
+            )
+
+    @staticmethod
+    def _record_deleted(cursor, where: str, params: Tuple) -> None:
+        """Remember the matched mementos' dirs so the archive GC may remove them."""
+        cursor.execute(
+            f"""
+            INSERT OR REPLACE INTO deleted_mementos (memento_location, deleted_at)
+            SELECT m.memento_location, ? FROM mementos m
+            WHERE {where} AND m.memento_location IS NOT NULL
+            """,
+            (datetime.now(),) + params
+        )
+
     def delete(self, id: int) -> bool:
         """
         Delete an archived website and all its associated mementos.
 
+        Releases the mementos' blob references first; the memento dirs and
+        blob files themselves are left for the archive GC to reclaim.
+
         Args:
             id: The archived website ID to delete
 
@@ -97,6 +131,8 @@ class ArchiveRepository(BaseRepository):
             True if successful
         """
         with get_db().transaction() as cursor:
+            self._release_blobs(cursor, "m.archived_website_id = ?", (id,))
+            self._record_deleted(cursor, "m.archived_website_id = ?", (id,))
             cursor.execute("DELETE FROM archived_websites WHERE id = ?", (id,))
             return True
 
@@ -105,7 +141,11 @@ class ArchiveRepository(BaseRepository):
     def save_memento(self, archived_website_id: int, memento_location: str,
                      http_status: int = None, content_type: str = None,
                      content_length: int = None, headers: Dict = None,
-                     screenshot_path: str = None, internet_archive_id: str = None) -> int:
+                     screenshot_path: str = None, internet_archive_id: str = None,
+                     capture_timings: Dict[str, float] = None,
+                     blobs: Dict[str, Tuple[str, int]] = None,
+                     content_encoding: str = None,
+                     screenshot_hashes: Dict[str, str] = None) -> int:
         """
         Save a memento for an archived website.
 
@@ -118,34 +158,1081 @@ class ArchiveRepository(BaseRepository):
             headers: Response headers
             screenshot_path: Path to the screenshot
             internet_archive_id: ID/URL if submitted to Internet Archive
+            capture_timings: Per-phase capture timings in milliseconds
+            blobs: Content-addressed artifacts as {role: (sha256, size)};
+                each reference increments the blob's refcount
+            content_encoding: Encoding of the stored HTML ("gzip"; None for
+                plain content.html)
+            screenshot_hashes: Perceptual hashes as {"dhash": hex, "phash": hex}
 
         Returns:
-            The ID of the newly created memento
+            The ID of the newly created memento, or of the row already
+            registered for ``memento_location`` (a re-index got there first)
         """
         with get_db().transaction() as cursor:
+            memento_id = self._insert_memento(
+                cursor, archived_website_id, datetime.now(), memento_location,
+                http_status=http_status, content_type=content_type,
+                content_length=content_length, headers=headers,
+                screenshot_path=screenshot_path, internet_archive_id=internet_archive_id,
+                capture_timings=capture_timings, blobs=blobs,
+                content_encoding=content_encoding, screenshot_hashes=screenshot_hashes,
+                ignore_existing=True,
+            )
+            if memento_id is None:
+                cursor.execute("SELECT id FROM mementos WHERE memento_location = ?", (memento_location,))
+                memento_id = cursor.fetchone()['id']
+            return memento_id
+
+    def _insert_memento(self, cursor, archived_website_id: int, memento_datetime: datetime,
+                        memento_location: str, http_status: int = None,
+                        content_type: str = None, content_length: int = None,
+                        headers: Dict = None, screenshot_path: str = None,
+                        internet_archive_id: str = None,
+                        capture_timings: Dict[str, float] = None,
+                        blobs: Dict[str, Tuple[str, int]] = None,
+                        content_encoding: str = None,
+                        screenshot_hashes: Dict[str, str] = None,
+                        ignore_existing: bool = False) -> Optional[int]:
+        """Insert a memento row; with ``ignore_existing``, returns None if its dir is already registered."""
+        cursor.execute(
+            f"""
+            INSERT {'OR IGNORE ' if ignore_existing else ''}INTO mementos
+            (archived_website_id, memento_datetime, memento_location, http_status,
+             content_type, content_length, headers, screenshot_path, internet_archive_id,
+             capture_timings, content_encoding, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                archived_website_id,
+                memento_datetime,
+                memento_location,
+                http_status,
+                content_type,
+                content_length,
+                json.dumps(headers) if headers else None,
+                screenshot_path,
+                internet_archive_id,
+                json.dumps(capture_timings) if capture_timings else None,
+                content_encoding,
+                datetime.now()
+            )
+        )
+        if cursor.rowcount == 0:
+            return None
+        memento_id = cursor.lastrowid
+        self._add_blob_refs(cursor, memento_id, blobs)
+        if screenshot_hashes:
+            self._insert_screenshot_hashes(cursor, memento_id, archived_website_id,
+                                           screenshot_hashes)
+        return memento_id
+
+    @staticmethod
+    def _add_blob_refs(cursor, memento_id: int, blobs: Optional[Dict[str, Tuple[str, int]]]) -> None:
+        for role, (sha256, size) in (blobs or {}).items():
             cursor.execute(
                 """
-                INSERT INTO mementos
-                (archived_website_id, memento_datetime, memento_location, http_status,
-                 content_type, content_length, headers, screenshot_path, internet_archive_id, created_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO blobs (sha256, size, refcount, created_at)
+                VALUES (?, ?, 1, ?)
+                ON CONFLICT(sha256) DO UPDATE SET refcount = refcount + 1
                 """,
-                (
-                    archived_website_id,
-                    datetime.now(),
-                    memento_location,
-                    http_status,
-                    content_type,
-                    content_length,
-                    json.dumps(headers) if headers else None,
-                    screenshot_path,
-                    internet_archive_id,
-                    datetime.now()
+                (sha256, size, datetime.now())
+            )
+            cursor.execute(
+                "INSERT INTO memento_blobs (memento_id, role, sha256) VALUES (?, ?, ?)",
+                (memento_id, role, sha256)
+            )
+
+    def get_memento_blobs(self, memento_id: int) -> Dict[str, str]:
+        """
+        Get the content-addressed artifacts referenced by a memento.
+
+        Args:
+            memento_id: The ID of the memento
+
+        Returns:
+            Dictionary mapping artifact role (html, screenshot) to SHA-256
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute(
+                "SELECT role, sha256 FROM memento_blobs WHERE memento_id = ?",
+                (memento_id,)
+            )
+            return {row['role']: row['sha256'] for row in cursor.fetchall()}
+
+    def get_uncompressed_mementos(self, after_id: int = 0,
+                                  limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Get mementos whose HTML is not recorded as compressed.
+
+        Args:
+            after_id: Only return mementos with a greater ID (for paging)
+            limit: Maximum number of rows to return (all if None)
+
+        Returns:
+            List of dictionaries with id and memento_location, by ascending ID
+        """
+        query = """
+            SELECT id, memento_location FROM mementos
+            WHERE id > ? AND (content_encoding IS NULL OR content_encoding = 'identity')
+            ORDER BY id
+        """
+        params: Tuple = (after_id,)
+        if limit is not None:
+            query += " LIMIT ?"
+            params = (after_id, limit)
+        with get_db().cursor() as cursor:
+            cursor.execute(query, params)
+            return [dict(row) for row in cursor.fetchall()]
+
+    def replace_memento_html(self, memento_id: int, content_encoding: str,
+                             sha256: str, size: int) -> bool:
+        """
+        Point a memento's HTML at a re-encoded blob.
+
+        Moves the memento's ``html`` blob reference (adjusting both refcounts)
+        and records the new content encoding.
+
+        Args:
+            memento_id: The ID of the memento
+            content_encoding: Encoding of the new blob (e.g. "gzip")
+            sha256: SHA-256 of the encoded bytes
+            size: Size of the encoded bytes
+
+        Returns:
+            True if the memento exists
+        """
+        with get_db().transaction() as cursor:
+            cursor.execute("SELECT id FROM mementos WHERE id = ?", (memento_id,))
+            if not cursor.fetchone():
+                return False
+            cursor.execute(
+                "SELECT sha256 FROM memento_blobs WHERE memento_id = ? AND role = 'html'",
+                (memento_id,)
+            )
+            old = cursor.fetchone()
+            if old:
+                cursor.execute(
+                    "UPDATE blobs SET refcount = MAX(refcount - 1, 0) WHERE sha256 = ?",
+                    (old['sha256'],)
                 )
+            cursor.execute(
+                """
+                INSERT INTO blobs (sha256, size, refcount, created_at)
+                VALUES (?, ?, 1, ?)
+                ON CONFLICT(sha256) DO UPDATE SET refcount = refcount + 1
+                """,
+                (sha256, size, datetime.now())
+            )
+            cursor.execute(
+                "INSERT OR REPLACE INTO memento_blobs (memento_id, role, sha256) VALUES (?, 'html', ?)",
+                (memento_id, sha256)
+            )
+            cursor.execute(
+                "UPDATE mementos SET content_encoding = ? WHERE id = ?",
+                (content_encoding, memento_id)
             )
+            return True
 
-            memento_id = cursor.lastrowid
-            return memento_id
+    def get_blob(self, sha256: str) -> Optional[Dict[str, Any]]:
+        """
+        Get a blob's size and reference count.
+
+        Args:
+            sha256: The blob's SHA-256 hex digest
+
+        Returns:
+            Dictionary containing blob data or None if not found
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute("SELECT * FROM blobs WHERE sha256 = ?", (sha256,))
+            row = cursor.fetchone()
+        return dict(row) if row else None
+
+    @staticmethod
+    def _phash_bands(phash: str) -> List[int]:
+        """Split a 64-bit hex pHash into four 16-bit bands, most significant first."""
+        value = int(phash, 16)
+        return [(value >> shift) & 0xFFFF for shift in (48, 32, 16, 0)]
+
+    def _insert_screenshot_hashes(self, cursor, memento_id: int, archived_website_id: int,
+                                  hashes: Dict[str, str]) -> None:
+        cursor.execute(
+            """
+            INSERT OR REPLACE INTO screenshot_hashes
+            (memento_id, archived_website_id, dhash, phash,
+             phash_band0, phash_band1, phash_band2, phash_band3)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (memento_id, archived_website_id, hashes['dhash'], hashes['phash'],
+             *self._phash_bands(hashes['phash']))
+        )
+
+    def save_screenshot_hashes(self, memento_id: int, hashes: Dict[str, str]) -> bool:
+        """
+        Store (or replace) the perceptual hashes of a memento's screenshot.
+
+        Args:
+            memento_id: The ID of the memento
+            hashes: {"dhash": hex, "phash": hex}
+
+        Returns:
+            True if the memento exists
+        """
+        with get_db().transaction() as cursor:
+            cursor.execute("SELECT archived_website_id FROM mementos WHERE id = ?", (memento_id,))
+            row = cursor.fetchone()
+            if not row:
+                return False
+            self._insert_screenshot_hashes(cursor, memento_id, row['archived_website_id'], hashes)
+            return True
+
+    def get_screenshot_hashes(self, memento_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get the perceptual hashes of a memento's screenshot.
+
+        Args:
+            memento_id: The ID of the memento
+
+        Returns:
+            Dictionary with memento_id, archived_website_id, dhash and phash,
+            or None if the screenshot has not been hashed
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute(
+                "SELECT memento_id, archived_website_id, dhash, phash "
+                "FROM screenshot_hashes WHERE memento_id = ?",
+                (memento_id,)
+            )
+            row = cursor.fetchone()
+        return dict(row) if row else None
+
+    def get_screenshot_hash_candidates(self, kind: str = 'phash',
+                                       archived_website_id: Optional[int] = None,
+                                       phash: Optional[str] = None) -> List[Tuple[int, str]]:
+        """
+        Get (memento_id, hash) pairs to rank by Hamming distance.
+
+        Args:
+            kind: Which hash to return, "phash" or "dhash"
+            archived_website_id: Restrict to one URL's mementos
+            phash: If given, only rows sharing at least one pHash band with it
+                (exact for distances up to 3)
+
+        Returns:
+            List of (memento_id, hex hash) tuples
+        """
+        if kind not in ('phash', 'dhash'):
+            raise ValueError(f"Unknown hash kind: {kind}")
+        query = f"SELECT memento_id, {kind} AS hash FROM screenshot_hashes WHERE 1 = 1"
+        params: List[Any] = []
+        if archived_website_id is not None:
+            query += " AND archived_website_id = ?"
+            params.append(archived_website_id)
+        if phash is not None:
+            query += " AND (" + " OR ".join(f"phash_band{i} = ?" for i in range(4)) + ")"
+            params.extend(self._phash_bands(phash))
+        with get_db().cursor() as cursor:
+            cursor.execute(query, params)
+            return [(row['memento_id'], row['hash']) for row in cursor.fetchall()]
+
+    def save_warc_records(self, refs: List[Any], memento_id: Optional[int] = None) -> int:
+        """
+        Index appended WARC records for random access.
+
+        Args:
+            refs: ``WarcRecordRef`` tuples returned by ``WarcWriter.write_records``
+            memento_id: The memento the records belong to (None for ad-hoc captures)
+
+        Returns:
+            Number of records indexed
+        """
+        with get_db().transaction() as cursor:
+            cursor.executemany(
+                """
+                INSERT INTO warc_records
+                (memento_id, record_id, record_type, target_uri, warc_filename,
+                 record_offset, record_length, warc_date, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                [
+                    (memento_id, ref.record_id, ref.record_type, ref.target_uri, ref.filename,
+                     ref.offset, ref.length, ref.warc_date, datetime.now())
+                    for ref in refs
+                ]
+            )
+        return len(refs)
+
+    def get_warc_records(self, memento_id: int) -> Dict[str, Dict[str, Any]]:
+        """
+        Get the WARC records written for a memento.
+
+        Args:
+            memento_id: The ID of the memento
+
+        Returns:
+            Dictionary mapping record type (request, response, resource, metadata)
+            to its index row
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute(
+                "SELECT * FROM warc_records WHERE memento_id = ? ORDER BY record_offset",
+                (memento_id,)
+            )
+            return {row['record_type']: dict(row) for row in cursor.fetchall()}
+
+    def delete_memento(self, memento_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Delete a single memento, releasing its blob references.
+
+        The archived website is deleted too once its last memento is gone.
+        Files on disk are left to the caller (the archive GC); the memento's
+        dir is recorded in ``deleted_mementos``.
+
+        Args:
+            memento_id: The ID of the memento to delete
+
+        Returns:
+            Dictionary with the deleted memento's id, archived_website_id and
+            memento_location, or None if it did not exist
+        """
+        with get_db().transaction() as cursor:
+            cursor.execute(
+                "SELECT id, archived_website_id, memento_location FROM mementos WHERE id = ?",
+                (memento_id,)
+            )
+            row = cursor.fetchone()
+            if not row:
+                return None
+            self._release_blobs(cursor, "m.id = ?", (memento_id,))
+            self._record_deleted(cursor, "m.id = ?", (memento_id,))
+            cursor.execute("DELETE FROM mementos WHERE id = ?", (memento_id,))
+            cursor.execute(
+                """
+                DELETE FROM archived_websites
+                WHERE id = ? AND NOT EXISTS (SELECT 1 FROM mementos WHERE archived_website_id = ?)
+                """,
+                (row['archived_website_id'], row['archived_website_id'])
+            )
+            return dict(row)
+
+    def touch_memento(self, memento_id: int, min_interval: int = 3600) -> None:
+        """
+        Record that a memento was viewed, for LRU quota eviction.
+
+        Writes at most once per ``min_interval`` seconds per memento so busy
+        viewers do not turn reads into writes.
+
+        Args:
+            memento_id: The ID of the memento
+            min_interval: Minimum seconds between recorded accesses
+        """
+        now = datetime.now()
+        with get_db().transaction() as cursor:
+            cursor.execute(
+                """
+                UPDATE mementos SET last_accessed_at = ?
+                WHERE id = ? AND (last_accessed_at IS NULL OR last_accessed_at < ?)
+                """,
+                (now, memento_id, now - timedelta(seconds=min_interval))
+            )
+
+    # --- Internet Archive submission jobs ---
+
+    def enqueue_ia_job(self, uri_r: str, memento_id: Optional[int] = None,
+                       max_attempts: int = 5) -> Dict[str, Any]:
+        """
+        Queue a Save Page Now submission.
+
+        A memento with a job already queued or running gets that job back
+        instead of a duplicate.
+
+        Args:
+            uri_r: The URL to submit
+            memento_id: The memento to record the result on (None for bare URLs)
+            max_attempts: Attempts before the job is marked failed
+
+        Returns:
+            The job as a dictionary, with ``created`` False if it already existed
+        """
+        now = datetime.now()
+        with get_db().transaction() as cursor:
+            if memento_id is not None:
+                cursor.execute(
+                    "SELECT * FROM internet_archive_jobs "
+                    "WHERE memento_id = ? AND status IN ('queued', 'running') ORDER BY id LIMIT 1",
+                    (memento_id,)
+                )
+                existing = cursor.fetchone()
+                if existing:
+                    return {**dict(existing), 'created': False}
+                cursor.execute("UPDATE mementos SET internet_archive_status = 'queued' WHERE id = ?",
+                               (memento_id,))
+            cursor.execute(
+                """
+                INSERT INTO internet_archive_jobs
+                (memento_id, uri_r, status, attempts, max_attempts, next_attempt_at, updated_at)
+                VALUES (?, ?, 'queued', 0, ?, ?, ?)
+                """,
+                (memento_id, uri_r, max_attempts, now, now)
+            )
+            cursor.execute("SELECT * FROM internet_archive_jobs WHERE id = ?", (cursor.lastrowid,))
+            return {**dict(cursor.fetchone()), 'created': True}
+
+    def get_ia_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get a Save Page Now job.
+
+        Args:
+            job_id: The ID of the job
+
+        Returns:
+            Dictionary containing job data or None if not found
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute("SELECT * FROM internet_archive_jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+        return dict(row) if row else None
+
+    def claim_ia_job(self) -> Optional[Dict[str, Any]]:
+        """
+        Take the next due queued job and mark it running.
+
+        Safe to call from several workers: the claim is a conditional update,
+        and a worker that loses the race moves on to the next due job.
+
+        Returns:
+            The claimed job (attempts already incremented) or None if none is due
+        """
+        while True:
+            now = datetime.now()
+            with get_db().transaction() as cursor:
+                cursor.execute(
+                    "SELECT id FROM internet_archive_jobs WHERE status = 'queued' AND next_attempt_at <= ? "
+                    "ORDER BY next_attempt_at, id LIMIT 1",
+                    (now,)
+                )
+                row = cursor.fetchone()
+                if not row:
+                    return None
+                cursor.execute(
+                    "UPDATE internet_archive_jobs SET status = 'running', attempts = attempts + 1, updated_at = ? "
+                    "WHERE id = ? AND status = 'queued'",
+                    (now, row['id'])
+                )
+                if cursor.rowcount == 0:
+                    continue
+                cursor.execute("SELECT * FROM internet_archive_jobs WHERE id = ?", (row['id'],))
+                return dict(cursor.fetchone())
+
+    def get_next_ia_attempt_at(self) -> Optional[datetime]:
+        """
+        Get when the earliest queued job becomes due.
+
+        Returns:
+            The datetime, or None if nothing is queued
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute("SELECT MIN(next_attempt_at) AS due FROM internet_archive_jobs WHERE status = 'queued'")
+            due = cursor.fetchone()['due']
+        return datetime.fromisoformat(due) if isinstance(due, str) else due
+
+    def finish_ia_job(self, job_id: int, archived_url: Optional[str] = None,
+                      error: Optional[str] = None, skipped: bool = False) -> None:
+        """
+        Record a job's final outcome, on the job and on its memento.
+
+        Args:
+            job_id: The ID of the job
+            archived_url: The Wayback URL on success (or of the recent snapshot when skipped)
+            error: The last error on failure (when ``archived_url`` is None)
+            skipped: The URL already had a recent snapshot, so nothing was submitted
+        """
+        now = datetime.now()
+        status = 'skipped' if skipped else 'succeeded' if archived_url else 'failed'
+        with get_db().transaction() as cursor:
+            cursor.execute(
+                """
+                UPDATE internet_archive_jobs
+                SET status = ?, archived_url = ?, last_error = ?, updated_at = ?, finished_at = ?
+                WHERE id = ?
+                """,
+                (status, archived_url, error, now, now, job_id)
+            )
+            if archived_url:
+                cursor.execute(
+                    "UPDATE mementos SET internet_archive_id = ?, internet_archive_status = 'archived' "
+                    "WHERE id = (SELECT memento_id FROM internet_archive_jobs WHERE id = ?)",
+                    (archived_url, job_id)
+                )
+            else:
+                cursor.execute(
+                    "UPDATE mementos SET internet_archive_status = 'failed' "
+                    "WHERE id = (SELECT memento_id FROM internet_archive_jobs WHERE id = ?)",
+                    (job_id,)
+                )
+
+    def retry_ia_job(self, job_id: int, error: str, next_attempt_at: datetime) -> None:
+        """
+        Put a running job back in the queue after a transient failure.
+
+        Args:
+            job_id: The ID of the job
+            error: Why this attempt failed
+            next_attempt_at: When the job becomes due again
+        """
+        with get_db().transaction() as cursor:
+            cursor.execute(
+                "UPDATE internet_archive_jobs SET status = 'queued', last_error = ?, next_attempt_at = ?, "
+                "updated_at = ? WHERE id = ?",
+                (error, next_attempt_at, datetime.now(), job_id)
+            )
+
+    def requeue_running_ia_jobs(self, claimed_before: datetime) -> int:
+        """
+        Return jobs left running by a crashed worker to the queue.
+
+        Args:
+            claimed_before: Only requeue jobs claimed before this time, so
+                submissions still in flight in another process are left alone
+
+        Returns:
+            Number of jobs requeued
+        """
+        now = datetime.now()
+        with get_db().transaction() as cursor:
+            cursor.execute(
+                "UPDATE internet_archive_jobs SET status = 'queued', next_attempt_at = ?, updated_at = ? "
+                "WHERE status = 'running' AND updated_at < ?",
+                (now, now, claimed_before)
+            )
+            return cursor.rowcount
+
+    def get_ia_job_counts(self) -> Dict[str, int]:
+        """
+        Count Save Page Now jobs by status.
+
+        Returns:
+            Dictionary mapping queued/running/succeeded/skipped/failed to counts
+        """
+        return self._ia_job_counts("", ())
+
+    @staticmethod
+    def _ia_job_counts(where: str, params: Tuple) -> Dict[str, int]:
+        counts = {'queued': 0, 'running': 0, 'succeeded': 0, 'skipped': 0, 'failed': 0}
+        with get_db().cursor() as cursor:
+            cursor.execute(f"SELECT status, COUNT(*) AS n FROM internet_archive_jobs {where} GROUP BY status",
+                           params)
+            counts.update({row['status']: row['n'] for row in cursor.fetchall()})
+        return counts
+
+    def create_ia_batch(self, label: str, targets: List[Dict[str, Any]], check_availability: bool = True,
+                        max_attempts: int = 5) -> Dict[str, Any]:
+        """
+        Queue one job per distinct URL as a batch.
+
+        URLs that already have a queued or running job are left to that job.
+
+        Args:
+            label: Human-readable description of the batch
+            targets: ``{"uri_r", "memento_id"}`` dictionaries, already deduplicated
+            check_availability: Skip URLs with a recent Wayback snapshot
+            max_attempts: Attempts before a job is marked failed
+
+        Returns:
+            Dictionary with batch_id, queued and already_queued counts
+        """
+        now = datetime.now()
+        queued = already_queued = 0
+        with get_db().transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO internet_archive_batches (label, check_availability, created_at) VALUES (?, ?, ?)",
+                (label, int(check_availability), now)
+            )
+            batch_id = cursor.lastrowid
+            for target in targets:
+                cursor.execute(
+                    "SELECT 1 FROM internet_archive_jobs WHERE uri_r = ? AND status IN ('queued', 'running')",
+                    (target['uri_r'],)
+                )
+                if cursor.fetchone():
+                    already_queued += 1
+                    continue
+                cursor.execute(
+                    """
+                    INSERT INTO internet_archive_jobs
+                    (memento_id, uri_r, batch_id, check_availability, status, attempts, max_attempts,
+                     next_attempt_at, updated_at)
+                    VALUES (?, ?, ?, ?, 'queued', 0, ?, ?, ?)
+                    """,
+                    (target.get('memento_id'), target['uri_r'], batch_id, int(check_availability),
+                     max_attempts, now, now)
+                )
+                if target.get('memento_id') is not None:
+                    cursor.execute("UPDATE mementos SET internet_archive_status = 'queued' WHERE id = ?",
+                                   (target['memento_id'],))
+                queued += 1
+        return {'batch_id': batch_id, 'queued': queued, 'already_queued': already_queued}
+
+    def get_ia_batch(self, batch_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get a batch with its jobs counted by status.
+
+        Args:
+            batch_id: The ID of the batch
+
+        Returns:
+            Dictionary containing batch data and ``jobs`` counts, or None if not found
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute("SELECT * FROM internet_archive_batches WHERE id = ?", (batch_id,))
+            row = cursor.fetchone()
+        if not row:
+            return None
+        batch = dict(row)
+        batch['jobs'] = self._ia_job_counts("WHERE batch_id = ?", (batch_id,))
+        return batch
+
+    def get_ia_availability(self, uri_r: str) -> Optional[Dict[str, Any]]:
+        """
+        Get the cached Wayback availability lookup for a URL.
+
+        Args:
+            uri_r: The URL
+
+        Returns:
+            Dictionary with snapshot_url, snapshot_at and checked_at, or None if never checked
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute("SELECT * FROM internet_archive_availability WHERE uri_r = ?", (uri_r,))
+            row = cursor.fetchone()
+        return dict(row) if row else None
+
+    def save_ia_availability(self, uri_r: str, snapshot_url: Optional[str],
+                             snapshot_at: Optional[datetime]) -> None:
+        """
+        Cache a Wayback availability lookup (a None snapshot means none exists).
+
+        Args:
+            uri_r: The URL
+            snapshot_url: Closest snapshot's Wayback URL
+            snapshot_at: Closest snapshot's capture time (UTC)
+        """
+        with get_db().transaction() as cursor:
+            cursor.execute(
+                """
+                INSERT INTO internet_archive_availability (uri_r, snapshot_url, snapshot_at, checked_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(uri_r) DO UPDATE SET
+                    snapshot_url = excluded.snapshot_url,
+                    snapshot_at = excluded.snapshot_at,
+                    checked_at = excluded.checked_at
+                """,
+                (uri_r, snapshot_url, snapshot_at, datetime.now())
+            )
+
+    def get_latest_mementos(self, uris: Optional[List[str]] = None, url_contains: Optional[str] = None,
+                            persona_id: Optional[int] = None, since: Optional[datetime] = None,
+                            until: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Get the newest memento of every archived website matching a filter.
+
+        Args:
+            uris: Only these exact URLs
+            url_contains: Only URLs containing this substring
+            persona_id: Only websites captured as this persona
+            since: Only mementos captured at or after this time
+            until: Only mementos captured before this time
+
+        Returns:
+            List of dictionaries with memento_id, uri_r, persona_id,
+            memento_datetime and internet_archive_id, newest first
+        """
+        conditions, params = [], []
+        if uris is not None:
+            if not uris:
+                return []
+            conditions.append(f"aw.uri_r IN ({', '.join('?' for _ in uris)})")
+            params.extend(uris)
+        if url_contains:
+            conditions.append("aw.uri_r LIKE ? ESCAPE '\\'")
+            escaped = url_contains.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            params.append(f"%{escaped}%")
+        if persona_id is not None:
+            conditions.append("aw.persona_id = ?")
+            params.append(persona_id)
+        if since is not None:
+            conditions.append("m.memento_datetime >= ?")
+            params.append(since)
+        if until is not None:
+            conditions.append("m.memento_datetime < ?")
+            params.append(until)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with get_db().cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT memento_id, uri_r, persona_id, memento_datetime, internet_archive_id FROM (
+                    SELECT m.id AS memento_id, aw.uri_r, aw.persona_id, m.memento_datetime,
+                           m.internet_archive_id,
+                           ROW_NUMBER() OVER (PARTITION BY m.archived_website_id
+                                              ORDER BY m.memento_datetime DESC, m.id DESC) AS rank
+                    FROM mementos m
+                    JOIN archived_websites aw ON m.archived_website_id = aw.id
+                    {where}
+                )
+                WHERE rank = 1
+                ORDER BY memento_datetime DESC, memento_id DESC
+                """,
+                params
+            )
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_memento_locations(self) -> Dict[str, int]:
+        """
+        Get every memento's storage location.
+
+        Returns:
+            Dictionary mapping memento_location to memento ID
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute("SELECT id, memento_location FROM mementos")
+            return {row['memento_location']: row['id'] for row in cursor.fetchall()}
+
+    def get_deleted_memento_locations(self) -> List[str]:
+        """
+        Get the dirs of mementos deleted from the database.
+
+        Returns:
+            List of memento_location values, oldest deletion first
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute("SELECT memento_location FROM deleted_mementos ORDER BY deleted_at")
+            return [row['memento_location'] for row in cursor.fetchall()]
+
+    def forget_deleted_mementos(self, locations: List[str]) -> int:
+        """
+        Drop deleted-memento records once their dirs are gone.
+
+        Args:
+            locations: memento_location values to forget
+
+        Returns:
+            Number of records removed
+        """
+        with get_db().transaction() as cursor:
+            cursor.executemany("DELETE FROM deleted_mementos WHERE memento_location = ?",
+                               [(location,) for location in locations])
+            return cursor.rowcount
+
+    def import_mementos(self, records: List[Dict[str, Any]], replace: bool = False) -> Dict[str, int]:
+        """
+        Upsert mementos rebuilt from disk (see utils/reindex.py) in one transaction.
+
+        Mementos are matched on ``memento_location`` and archived websites on
+        (``uri_r``, ``persona_id``), so re-importing the same dirs is a no-op.
+
+        Args:
+            records: Parsed memento dicts with ``uri_r``, ``persona_id``,
+                ``archive_type``, ``archive_location``, ``memento_datetime``,
+                ``memento_location``, the ``save_memento`` fields, and
+                ``warc_records`` (list of index rows)
+            replace: Re-write the columns, blob references and hashes of
+                mementos that are already indexed instead of skipping them,
+                moving them to the website of their recorded persona
+
+        Returns:
+            Counts of inserted, updated and skipped mementos
+        """
+        counts = {"inserted": 0, "updated": 0, "skipped": 0}
+        fields = ('http_status', 'content_type', 'content_length', 'headers', 'screenshot_path',
+                  'capture_timings', 'blobs', 'content_encoding', 'screenshot_hashes')
+        websites: Dict[Tuple[str, Optional[int]], int] = {}
+        with get_db().transaction() as cursor:
+            for record in records:
+                cursor.execute("SELECT id, archived_website_id FROM mementos WHERE memento_location = ?",
+                               (record['memento_location'],))
+                existing = cursor.fetchone()
+                if existing and not replace:
+                    counts["skipped"] += 1
+                    continue
+
+                key = (record['uri_r'], record.get('persona_id'))
+                if key not in websites:
+                    cursor.execute(
+                        "SELECT id FROM archived_websites WHERE uri_r = ? AND persona_id IS ? "
+                        "ORDER BY id LIMIT 1",
+                        key
+                    )
+                    row = cursor.fetchone()
+                    if row:
+                        websites[key] = row['id']
+                    else:
+                        cursor.execute(
+                            """
+                            INSERT INTO archived_websites
+                            (uri_r, persona_id, archive_type, archive_location, created_at)
+                            VALUES (?, ?, ?, ?, ?)
+                            """,
+                            (record['uri_r'], record.get('persona_id'), record['archive_type'],
+                             record['archive_location'], datetime.now())
+                        )
+                        websites[key] = cursor.lastrowid
+                website_id = websites[key]
+
+                if existing:
+                    memento_id = existing['id']
+                    self._release_blobs(cursor, "m.id = ?", (memento_id,))
+                    cursor.execute("DELETE FROM memento_blobs WHERE memento_id = ?", (memento_id,))
+                    cursor.execute(
+                        """
+                        UPDATE mementos SET archived_website_id = ?, http_status = ?, content_type = ?,
+                            content_length = ?, headers = ?, screenshot_path = ?, capture_timings = ?,
+                            content_encoding = ?
+                        WHERE id = ?
+                        """,
+                        (website_id, record.get('http_status'), record.get('content_type'),
+                         record.get('content_length'),
+                         json.dumps(record['headers']) if record.get('headers') else None,
+                         record.get('screenshot_path'),
+                         json.dumps(record['capture_timings']) if record.get('capture_timings') else None,
+                         record.get('content_encoding'), memento_id)
+                    )
+                    self._add_blob_refs(cursor, memento_id, record.get('blobs'))
+                    if record.get('screenshot_hashes'):
+                        self._insert_screenshot_hashes(cursor, memento_id, website_id,
+                                                       record['screenshot_hashes'])
+                    if existing['archived_website_id'] != website_id:
+                        # Filed under another persona's website; drop that one if now empty
+                        cursor.execute("UPDATE screenshot_hashes SET archived_website_id = ? WHERE memento_id = ?",
+                                       (website_id, memento_id))
+                        cursor.execute(
+                            """
+                            DELETE FROM archived_websites WHERE id = ?
+                            AND NOT EXISTS (SELECT 1 FROM mementos WHERE archived_website_id = ?)
+                            """,
+                            (existing['archived_website_id'], existing['archived_website_id'])
+                        )
+                    counts["updated"] += 1
+                else:
+                    memento_id = self._insert_memento(
+                        cursor, website_id, record['memento_datetime'], record['memento_location'],
+                        ignore_existing=True, **{field: record.get(field) for field in fields}
+                    )
+                    if memento_id is None:
+                        # Registered since the lookup above (e.g. by a capture)
+                        counts["skipped"] += 1
+                        continue
+                    counts["inserted"] += 1
+
+                for ref in record.get('warc_records') or []:
+                    cursor.execute(
+                        "UPDATE warc_records SET memento_id = ? WHERE record_id = ?",
+                        (memento_id, ref['record_id'])
+                    )
+                    if cursor.rowcount == 0:
+                        cursor.execute(
+                            """
+                            INSERT INTO warc_records
+                            (memento_id, record_id, record_type, target_uri, warc_filename,
+                             record_offset, record_length, warc_date, created_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                            """,
+                            (memento_id, ref['record_id'], ref['record_type'], ref['target_uri'],
+                             ref['filename'], ref['offset'], ref['length'], ref['warc_date'],
+                             datetime.now())
+                        )
+        return counts
+
+    def get_expired_mementos(self, keep_last: Optional[int] = None,
+                             older_than: Optional[datetime] = None) -> List[Dict[str, Any]]:
+        """
+        Get mementos that fall outside the retention policy.
+
+        Args:
+            keep_last: Keep only the newest N mementos per (URL, persona)
+            older_than: Expire mementos captured before this time
+
+        Returns:
+            List of dictionaries with id, archived_website_id, memento_location
+            and reason ("keep_last" or "max_age"), oldest first
+        """
+        if not keep_last and older_than is None:
+            return []
+        with get_db().cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT id, archived_website_id, memento_location, memento_datetime, rank
+                FROM (
+                    SELECT m.id, m.archived_website_id, m.memento_location, m.memento_datetime,
+                           ROW_NUMBER() OVER (
+                               PARTITION BY aw.uri_r, aw.persona_id
+                               ORDER BY m.memento_datetime DESC, m.id DESC
+                           ) AS rank
+                    FROM mementos m
+                    JOIN archived_websites aw ON m.archived_website_id = aw.id
+                )
+                WHERE (? > 0 AND rank > ?) OR (? IS NOT NULL AND memento_datetime < ?)
+                ORDER BY memento_datetime, id
+                """,
+                (keep_last or 0, keep_last or 0, older_than, older_than)
+            )
+            rows = [dict(row) for row in cursor.fetchall()]
+
+        for row in rows:
+            rank = row.pop('rank')
+            row.pop('memento_datetime')
+            row['reason'] = 'keep_last' if keep_last and rank > keep_last else 'max_age'
+        return rows
+
+    def get_mementos_by_last_access(self) -> List[Dict[str, Any]]:
+        """
+        Get all mementos, least recently used first.
+
+        Mementos never viewed count as last used when they were captured.
+
+        Returns:
+            List of dictionaries with id, archived_website_id and memento_location
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute("""
+                SELECT id, archived_website_id, memento_location
+                FROM mementos
+                ORDER BY COALESCE(last_accessed_at, memento_datetime), id
+            """)
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_blob_refcounts(self) -> Dict[str, int]:
+        """
+        Get every registered blob's reference count.
+
+        Returns:
+            Dictionary mapping SHA-256 to refcount
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute("SELECT sha256, refcount FROM blobs")
+            return {row['sha256']: row['refcount'] for row in cursor.fetchall()}
+
+    def delete_blob_rows(self, sha256s: List[str]) -> int:
+        """
+        Forget blobs that are no longer referenced.
+
+        Rows whose refcount went back up (a capture re-used the blob) are kept.
+
+        Args:
+            sha256s: SHA-256 digests of the blobs to forget
+
+        Returns:
+            Number of rows deleted
+        """
+        with get_db().transaction() as cursor:
+            cursor.executemany(
+                "DELETE FROM blobs WHERE sha256 = ? AND refcount = 0",
+                [(sha256,) for sha256 in sha256s]
+            )
+            return cursor.rowcount
+
+    def get_archived_website_ids(self, uris: List[str], persona_id: Optional[int] = None) -> List[int]:
+        """
+        Get the archived websites holding mementos of a URI-R.
+
+        Args:
+            uris: Spellings of the URI-R to match exactly (uses the uri_r index)
+            persona_id: Only websites captured as this persona
+
+        Returns:
+            List of archived website IDs
+        """
+        if not uris:
+            return []
+        query = (f"SELECT id FROM archived_websites WHERE uri_r IN ({', '.join('?' for _ in uris)})")
+        params: List[Any] = list(uris)
+        if persona_id is not None:
+            query += " AND persona_id = ?"
+            params.append(persona_id)
+        with get_db().cursor() as cursor:
+            cursor.execute(query + " ORDER BY id", params)
+            return [row['id'] for row in cursor.fetchall()]
+
+    # direction -> (comparison against the target datetime, sort order)
+    _SEEKS = {
+        'le': ('<= ?', 'DESC'),
+        'lt': ('< ?', 'DESC'),
+        'ge': ('>= ?', 'ASC'),
+        'gt': ('> ?', 'ASC'),
+        'first': (None, 'ASC'),
+        'last': (None, 'DESC'),
+    }
+
+    def seek_memento(self, archived_website_ids: List[int], direction: str,
+                     when: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+        """
+        Find the memento closest to ``when`` on one side, across websites.
+
+        Each website is one LIMIT 1 seek on the (archived_website_id,
+        memento_datetime) index; the per-website winners are then compared.
+
+        Args:
+            archived_website_ids: Websites to search (see get_archived_website_ids)
+            direction: "le"/"lt" (latest at or before ``when``), "ge"/"gt"
+                (earliest at or after), "first" or "last"
+            when: Target datetime (local time, like memento_datetime)
+
+        Returns:
+            Dictionary with id, archived_website_id and memento_datetime, or None
+        """
+        condition, order = self._SEEKS[direction]
+        subqueries, params = [], []
+        for website_id in archived_website_ids:
+            where = "archived_website_id = ?"
+            params.append(website_id)
+            if condition:
+                where += f" AND memento_datetime {condition}"
+                params.append(when)
+            subqueries.append(
+                f"SELECT * FROM (SELECT id, archived_website_id, memento_datetime FROM mementos "
+                f"WHERE {where} ORDER BY memento_datetime {order}, id {order} LIMIT 1)"
+            )
+        if not subqueries:
+            return None
+        with get_db().cursor() as cursor:
+            cursor.execute(
+                " UNION ALL ".join(subqueries) + f" ORDER BY memento_datetime {order}, id {order} LIMIT 1",
+                params
+            )
+            row = cursor.fetchone()
+        return dict(row) if row else None
+
+    def get_timemap_page(self, archived_website_ids: List[int], after: Optional[Tuple[Any, int]] = None,
+                         limit: int = 500) -> List[Dict[str, Any]]:
+        """
+        Get mementos in (memento_datetime, id) order after a keyset cursor.
+
+        The cursor carries both values, so a page still resumes in place when
+        the memento it was taken from has since been deleted.
+
+        Args:
+            archived_website_ids: Websites to list
+            after: (memento_datetime, id) of the last row already returned (None for the start)
+            limit: Maximum rows to return
+
+        Returns:
+            List of dictionaries with id, archived_website_id and memento_datetime
+        """
+        if not archived_website_ids:
+            return []
+        query = (
+            "SELECT id, archived_website_id, memento_datetime FROM mementos "
+            f"WHERE archived_website_id IN ({', '.join('?' for _ in archived_website_ids)})"
+        )
+        params: List[Any] = list(archived_website_ids)
+        if after is not None:
+            query += " AND (memento_datetime, id) > (?, ?)"
+            params.extend(after)
+        query += " ORDER BY memento_datetime, id LIMIT ?"
+        params.append(limit)
+        with get_db().cursor() as cursor:
+            cursor.execute(query, params)
+            return [dict(row) for row in cursor.fetchall()]
 
     def get_mementos(self, archived_website_id: int) -> List[Dict[str, Any]]:
         """
@@ -167,8 +1254,7 @@ class ArchiveRepository(BaseRepository):
             mementos = [dict(row) for row in cursor.fetchall()]
 
         for memento in mementos:
-            if memento['headers']:
-                memento['headers'] = json.loads(memento['headers'])
+            self._decode_json_columns(memento)
         return mementos
 
     def get_memento(self, memento_id: int) -> Optional[Dict[str, Any]]:
@@ -183,7 +1269,7 @@ class ArchiveRepository(BaseRepository):
         """
         with get_db().cursor() as cursor:
             cursor.execute("""
-                SELECT m.*, aw.uri_r
+                SELECT m.*, aw.uri_r, aw.persona_id
                 FROM mementos m
                 JOIN archived_websites aw ON m.archived_website_id = aw.id
                 WHERE m.id = ?
@@ -194,6 +1280,12 @@ class ArchiveRepository(BaseRepository):
             return None
 
         result = dict(memento)
-        if result['headers']:
-            result['headers'] = json.loads(result['headers'])
+        self._decode_json_columns(result)
         return result
+
+    @staticmethod
+    def _decode_json_columns(memento: Dict[str, Any]) -> None:
+        """Decode the JSON-encoded memento columns in place."""
+        for column in ('headers', 'capture_timings'):
+            if memento.get(column):
+                memento[column] = json.loads(memento[column])
@@ -0,0 +1,424 @@
+"""
+Persona attribute extraction job repository module.
+
+Handles all database operations related to queued attribute extraction jobs.
+"""
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any
+
+from ..connection import get_db
+from . import BaseRepository
+
+
+class ExtractionJobRepository(BaseRepository):
+    """Repository for the persistent attribute extraction queue."""
+
+    def get(self, id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get an extraction job.
+
+        Args:
+            id: The ID of the job
+
+        Returns:
+            Dictionary containing job data or None if not found
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute("SELECT * FROM extraction_jobs WHERE id = ?", (id,))
+            row = cursor.fetchone()
+        return dict(row) if row else None
+
+    def get_all(self, waypoint_id: Optional[int] = None, **filters) -> List[Dict[str, Any]]:
+        """
+        Get extraction jobs, newest first.
+
+        Args:
+            waypoint_id: Only jobs for this waypoint
+
+        Returns:
+            List of dictionaries containing job data
+        """
+        with get_db().cursor() as cursor:
+            if waypoint_id is None:
+                cursor.execute("SELECT * FROM extraction_jobs ORDER BY id DESC")
+            else:
+                cursor.execute("SELECT * FROM extraction_jobs WHERE waypoint_id = ? ORDER BY id DESC",
+                               (waypoint_id,))
+            return [dict(row) for row in cursor.fetchall()]
+
+    def get_latest(self, waypoint_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get the most recent extraction job for a waypoint.
+
+        Args:
+            waypoint_id: The ID of the waypoint
+
+        Returns:
+            Dictionary containing job data or None if none was queued
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute("SELECT * FROM extraction_jobs WHERE waypoint_id = ? ORDER BY id DESC LIMIT 1",
+                           (waypoint_id,))
+            row = cursor.fetchone()
+        return dict(row) if row else None
+
+    def save(self, job: Dict[str, Any]) -> int:
+        """
+        Queue an extraction job (see ``enqueue``).
+
+        Args:
+            job: Dictionary with waypoint_id and optional delay and max_attempts
+
+        Returns:
+            The ID of the queued job
+        """
+        return self.enqueue(job['waypoint_id'], job.get('delay', 0), job.get('max_attempts', 3))['id']
+
+    def enqueue(self, waypoint_id: int, delay: float = 0, max_attempts: int = 3) -> Dict[str, Any]:
+        """
+        Queue extraction for a waypoint, coalescing with a job already queued.
+
+        A waypoint has at most one queued job. Saving it again before that job
+        starts pushes the job back by ``delay`` seconds instead of adding
+        another, so a burst of re-saves is extracted once (and a job waiting
+        to retry gets its attempts back). A job already running is left
+        alone; the new one runs after it.
+
+        Args:
+            waypoint_id: The ID of the waypoint
+            delay: Seconds to wait for further saves before extracting
+            max_attempts: Attempts before the job is marked failed
+
+        Returns:
+            The job as a dictionary, with ``created`` False if it was coalesced
+        """
+        now = datetime.now()
+        due = now + timedelta(seconds=delay)
+        with get_db().transaction() as cursor:
+            cursor.execute(
+                "SELECT id FROM extraction_jobs WHERE waypoint_id = ? AND status = 'queued' ORDER BY id LIMIT 1",
+                (waypoint_id,)
+            )
+            existing = cursor.fetchone()
+            if existing:
+                cursor.execute(
+                    "UPDATE extraction_jobs SET requests = requests + 1, attempts = 0, next_attempt_at = ?, updated_at = ? "
+                    "WHERE id = ?",
+                    (due, now, existing['id'])
+                )
+                job_id, created = existing['id'], False
+            else:
+                cursor.execute(
+                    """
+                    INSERT INTO extraction_jobs
+                    (waypoint_id, status, attempts, max_attempts, requests, next_attempt_at, created_at, updated_at)
+                    VALUES (?, 'queued', 0, ?, 1, ?, ?, ?)
+                    """,
+                    (waypoint_id, max_attempts, due, now, now)
+                )
+                job_id, created = cursor.lastrowid, True
+            cursor.execute("SELECT * FROM extraction_jobs WHERE id = ?", (job_id,))
+            return {**dict(cursor.fetchone()), 'created': created}
+
+    def claim(self, batch_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        Take the next due queued job and mark it running.
+
+        Jobs for a waypoint that is already being extracted wait, so one
+        waypoint is never processed twice at once. Safe to call from several
+        workers: the claim is a conditional update.
+
+        Args:
+            batch_id: Claim from this batch; None claims jobs queued by saves
+
+        Returns:
+            The claimed job (attempts already incremented) or None if none is due
+        """
+        while True:
+            now = datetime.now()
+            with get_db().transaction() as cursor:
+                cursor.execute(
+                    f"SELECT id FROM extraction_jobs WHERE {self._batch_clause(batch_id)} "
+                    "AND status = 'queued' AND next_attempt_at <= ? "
+                    "AND waypoint_id NOT IN (SELECT waypoint_id FROM extraction_jobs WHERE status = 'running') "
+                    "ORDER BY next_attempt_at, id LIMIT 1",
+                    self._batch_params(batch_id) + (now,)
+                )
+                row = cursor.fetchone()
+                if not row:
+                    return None
+                cursor.execute(
+                    "UPDATE extraction_jobs SET status = 'running', attempts = attempts + 1, "
+                    "started_at = ?, updated_at = ? WHERE id = ? AND status = 'queued'",
+                    (now, now, row['id'])
+                )
+                if cursor.rowcount == 0:
+                    continue
+                cursor.execute("SELECT * FROM extraction_jobs WHERE id = ?", (row['id'],))
+                return dict(cursor.fetchone())
+
+    def get_next_attempt_at(self, batch_id: Optional[int] = None) -> Optional[datetime]:
+        """
+        Get when the earliest claimable queued job becomes due.
+
+        Jobs waiting for a running extraction of the same waypoint are left
+        out; the worker running it picks them up next.
+
+        Args:
+            batch_id: Look at this batch; None looks at jobs queued by saves
+
+        Returns:
+            The datetime, or None if nothing can be claimed
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute(
+                f"SELECT MIN(next_attempt_at) AS due FROM extraction_jobs WHERE {self._batch_clause(batch_id)} "
+                "AND status = 'queued' "
+                "AND waypoint_id NOT IN (SELECT waypoint_id FROM extraction_jobs WHERE status = 'running')",
+                self._batch_params(batch_id)
+            )
+            due = cursor.fetchone()['due']
+        return datetime.fromisoformat(due) if isinstance(due, str) else due
+
+    @staticmethod
+    def _batch_clause(batch_id: Optional[int]) -> str:
+        return "batch_id IS NULL" if batch_id is None else "batch_id = ?"
+
+    @staticmethod
+    def _batch_params(batch_id: Optional[int]) -> tuple:
+        return () if batch_id is None else (batch_id,)
+
+    def finish(self, job_id: int, persona_id: Optional[int] = None, error: Optional[str] = None) -> None:
+        """
+        Record a job's final outcome.
+
+        Args:
+            job_id: The ID of the job
+            persona_id: The persona that was updated (None if nothing changed)
+            error: The last error on failure
+        """
+        now = datetime.now()
+        with get_db().transaction() as cursor:
+            cursor.execute(
+                "UPDATE extraction_jobs SET status = ?, persona_id = ?, last_error = ?, updated_at = ?, "
+                "finished_at = ? WHERE id = ?",
+                ('failed' if error else 'succeeded', persona_id, error, now, now, job_id)
+            )
+
+    def finish_many(self, job_ids: List[int], persona_id: Optional[int] = None) -> None:
+        """
+        Mark a group of jobs succeeded in one transaction.
+
+        Args:
+            job_ids: The IDs of the jobs
+            persona_id: The persona their extractions updated (None if nothing changed)
+        """
+        now = datetime.now()
+        with get_db().transaction() as cursor:
+            cursor.executemany(
+                "UPDATE extraction_jobs SET status = 'succeeded', persona_id = ?, last_error = NULL, "
+                "updated_at = ?, finished_at = ? WHERE id = ?",
+                [(persona_id, now, now, job_id) for job_id in job_ids]
+            )
+
+    def retry(self, job_id: int, error: str, next_attempt_at: datetime) -> None:
+        """
+        Put a running job back in the queue after a transient failure.
+
+        Args:
+            job_id: The ID of the job
+            error: Why this attempt failed
+            next_attempt_at: When the job becomes due again
+        """
+        with get_db().transaction() as cursor:
+            cursor.execute(
+                "UPDATE extraction_jobs SET status = 'queued', last_error = ?, next_attempt_at = ?, "
+                "updated_at = ? WHERE id = ?",
+                (error, next_attempt_at, datetime.now(), job_id)
+            )
+
+    def requeue_running(self, started_before: datetime) -> int:
+        """
+        Return jobs left running by a stopped worker to the queue.
+
+        Args:
+            started_before: Only requeue jobs started before this time, so
+                extractions still in flight in another process (the app or
+                extract_attributes.py) are left alone
+
+        Returns:
+            Number of jobs requeued
+        """
+        now = datetime.now()
+        with get_db().transaction() as cursor:
+            cursor.execute(
+                "UPDATE extraction_jobs SET status = 'queued', next_attempt_at = ?, updated_at = ? "
+                "WHERE status = 'running' AND started_at < ?",
+                (now, now, started_before)
+            )
+            return cursor.rowcount
+
+    def delete(self, id: int) -> bool:
+        """
+        Delete an extraction job.
+
+        Args:
+            id: The ID of the job
+
+        Returns:
+            True if a job was deleted
+        """
+        with get_db().transaction() as cursor:
+            cursor.execute("DELETE FROM extraction_jobs WHERE id = ?", (id,))
+            return cursor.rowcount > 0
+
+    def get_counts(self) -> Dict[str, int]:
+        """
+        Count extraction jobs by status.
+
+        Returns:
+            Dictionary mapping queued/running/succeeded/failed to counts
+        """
+        return self._counts("", ())
+
+    @staticmethod
+    def _counts(where: str, params: tuple) -> Dict[str, int]:
+        counts = {'queued': 0, 'running': 0, 'succeeded': 0, 'failed': 0}
+        with get_db().cursor() as cursor:
+            cursor.execute(f"SELECT status, COUNT(*) AS n FROM extraction_jobs {where} GROUP BY status", params)
+            counts.update({row['status']: row['n'] for row in cursor.fetchall()})
+        return counts
+
+    def find_unextracted_waypoints(self, include_current: bool = False) -> List[int]:
+        """
+        Find saved conversations whose attributes need (re-)extracting.
+
+        A conversation is due if it was never extracted, or if its persona
+        changed after both its last extraction and the persona's latest
+        extraction from any conversation (so updates made by extraction
+        itself do not count). Conversations with a job already queued or
+        running are left to that job.
+
+        Args:
+            include_current: Also return conversations that are up to date
+
+        Returns:
+            Waypoint IDs, grouped by persona
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute(
+                """
+                SELECT w.id AS waypoint_id, j.persona_id, p.updated_at,
+                       (SELECT MAX(e.finished_at) FROM extraction_jobs e
+                        WHERE e.waypoint_id = w.id AND e.status = 'succeeded') AS extracted_at,
+                       (SELECT MAX(e.finished_at) FROM extraction_jobs e
+                        JOIN waypoints w2 ON w2.id = e.waypoint_id
+                        JOIN journeys j2 ON j2.id = w2.journey_id
+                        WHERE j2.persona_id = j.persona_id AND e.status = 'succeeded') AS persona_extracted_at
+                FROM waypoints w
+                JOIN journeys j ON j.id = w.journey_id
+                JOIN personas p ON p.id = j.persona_id
+                WHERE w.type IN ('agent', 'persona') AND w.agent_data IS NOT NULL
+                  AND w.id NOT IN (SELECT waypoint_id FROM extraction_jobs WHERE status IN ('queued', 'running'))
+                ORDER BY j.persona_id, w.id
+                """
+            )
+            rows = cursor.fetchall()
+        return [row['waypoint_id'] for row in rows if include_current or self._needs_extraction(row)]
+
+    @staticmethod
+    def _needs_extraction(row) -> bool:
+        if row['extracted_at'] is None:
+            return True
+        if row['updated_at'] is None:
+            return False
+        # Timestamps are stored as ISO strings, which sort chronologically
+        changed_at = str(row['updated_at'])
+        return changed_at > str(row['extracted_at']) and changed_at > str(row['persona_extracted_at'])
+
+    def create_batch(self, label: str, waypoint_ids: List[int], max_attempts: int = 3) -> Dict[str, Any]:
+        """
+        Queue one extraction job per waypoint as a batch.
+
+        Waypoints that already have a queued or running job are left to that job.
+
+        Args:
+            label: Human-readable description of the batch
+            waypoint_ids: The waypoints to extract
+            max_attempts: Attempts before a job is marked failed
+
+        Returns:
+            Dictionary with batch_id, queued and already_queued counts
+        """
+        now = datetime.now()
+        queued = already_queued = 0
+        with get_db().transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO extraction_batches (label, status, created_at) VALUES (?, 'running', ?)",
+                (label, now)
+            )
+            batch_id = cursor.lastrowid
+            for waypoint_id in dict.fromkeys(waypoint_ids):
+                cursor.execute(
+                    "SELECT 1 FROM extraction_jobs WHERE waypoint_id = ? AND status IN ('queued', 'running')",
+                    (waypoint_id,)
+                )
+                if cursor.fetchone():
+                    already_queued += 1
+                    continue
+                cursor.execute(
+                    """
+                    INSERT INTO extraction_jobs
+                    (waypoint_id, batch_id, status, attempts, max_attempts, requests, next_attempt_at,
+                     created_at, updated_at)
+                    VALUES (?, ?, 'queued', 0, ?, 1, ?, ?, ?)
+                    """,
+                    (waypoint_id, batch_id, max_attempts, now, now, now)
+                )
+                queued += 1
+        return {'batch_id': batch_id, 'queued': queued, 'already_queued': already_queued}
+
+    def get_batch(self, batch_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get a batch with its jobs counted by status.
+
+        Args:
+            batch_id: The ID of the batch
+
+        Returns:
+            Dictionary containing batch data and ``jobs`` counts, or None if not found
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute("SELECT * FROM extraction_batches WHERE id = ?", (batch_id,))
+            row = cursor.fetchone()
+        if not row:
+            return None
+        batch = dict(row)
+        batch['jobs'] = self._counts("WHERE batch_id = ?", (batch_id,))
+        return batch
+
+    def get_running_batches(self) -> List[int]:
+        """
+        Get batches that have not finished (e.g. interrupted by a restart).
+
+        Returns:
+            Batch IDs, oldest first
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute("SELECT id FROM extraction_batches WHERE status = 'running' ORDER BY id")
+            return [row['id'] for row in cursor.fetchall()]
+
+    def finish_batch(self, batch_id: int) -> None:
+        """
+        Mark a batch finished once none of its jobs are queued or running.
+
+        Args:
+            batch_id: The ID of the batch
+        """
+        now = datetime.now()
+        with get_db().transaction() as cursor:
+            cursor.execute(
+                "UPDATE extraction_batches SET status = 'finished', finished_at = ? WHERE id = ? "
+                "AND NOT EXISTS (SELECT 1 FROM extraction_jobs WHERE batch_id = ? AND status IN ('queued', 'running'))",
+                (now, batch_id, batch_id)
+            )
@@ -0,0 +1,149 @@
+"""
+LLM response cache repository module.
+
+Handles all database operations related to cached LLM responses.
+"""
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any
+
+from ..connection import get_db
+from . import BaseRepository
+
+
+class LLMCacheRepository(BaseRepository):
+    """Repository for the content-addressed LLM response cache."""
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """
+        Get an unexpired cache entry and record the hit.
+
+        Args:
+            key: The cache key
+
+        Returns:
+            Dictionary containing the entry, or None on a miss
+        """
+        now = datetime.now()
+        with get_db().transaction() as cursor:
+            cursor.execute(
+                "SELECT * FROM llm_response_cache WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now)
+            )
+            row = cursor.fetchone()
+            if row:
+                cursor.execute(
+                    "UPDATE llm_response_cache SET hits = hits + 1, last_used_at = ? WHERE key = ?",
+                    (now, key)
+                )
+        return dict(row) if row else None
+
+    def get_all(self, **filters) -> List[Dict[str, Any]]:
+        """
+        Get all cache entries, most recently used first. (Required by the
+        BaseRepository ABC interface.)
+
+        Returns:
+            List of dictionaries containing entry data
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute("SELECT * FROM llm_response_cache ORDER BY last_used_at DESC")
+            return [dict(row) for row in cursor.fetchall()]
+
+    def save(self, entry: Dict[str, Any]) -> str:
+        """
+        Store a response, replacing any entry under the same key.
+
+        Args:
+            entry: Dictionary with key, provider, model, kind, response and
+                an optional ttl (seconds; None or 0 never expires)
+
+        Returns:
+            The cache key
+        """
+        now = datetime.now()
+        ttl = entry.get('ttl')
+        with get_db().transaction() as cursor:
+            cursor.execute(
+                """
+                INSERT OR REPLACE INTO llm_response_cache
+                    (key, provider, model, kind, response, size, hits, created_at, expires_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?, ?)
+                """,
+                (entry['key'], entry['provider'], entry.get('model'), entry['kind'], entry['response'],
+                 len(entry['response'].encode('utf-8')), now,
+                 now + timedelta(seconds=ttl) if ttl else None, now)
+            )
+        return entry['key']
+
+    def delete(self, key: str) -> bool:
+        """
+        Delete a cache entry.
+
+        Args:
+            key: The cache key
+
+        Returns:
+            True if an entry was deleted
+        """
+        with get_db().transaction() as cursor:
+            cursor.execute("DELETE FROM llm_response_cache WHERE key = ?", (key,))
+            return cursor.rowcount > 0
+
+    def clear(self) -> int:
+        """
+        Delete every cache entry.
+
+        Returns:
+            Number of entries deleted
+        """
+        with get_db().transaction() as cursor:
+            cursor.execute("DELETE FROM llm_response_cache")
+            return cursor.rowcount
+
+    def evict(self, max_entries: int, max_bytes: int) -> int:
+        """
+        Drop expired entries, then least recently used ones until the cache
+        is within both bounds (0 disables a bound).
+
+        Args:
+            max_entries: Maximum number of entries to keep
+            max_bytes: Maximum total response size to keep
+
+        Returns:
+            Number of entries evicted
+        """
+        with get_db().transaction() as cursor:
+            cursor.execute("DELETE FROM llm_response_cache WHERE expires_at <= ?", (datetime.now(),))
+            evicted = cursor.rowcount
+
+            cursor.execute("SELECT COUNT(*) AS entries, COALESCE(SUM(size), 0) AS bytes FROM llm_response_cache")
+            totals = cursor.fetchone()
+            excess_entries = max(totals['entries'] - max_entries, 0) if max_entries else 0
+            excess_bytes = max(totals['bytes'] - max_bytes, 0) if max_bytes else 0
+            if not excess_entries and not excess_bytes:
+                return evicted
+
+            # Walk from the least recently used end until both bounds hold
+            cursor.execute("SELECT key, size FROM llm_response_cache ORDER BY last_used_at, created_at")
+            doomed = []
+            for row in cursor.fetchall():
+                if len(doomed) >= excess_entries and excess_bytes <= 0:
+                    break
+                doomed.append((row['key'],))
+                excess_bytes -= row['size']
+            cursor.executemany("DELETE FROM llm_response_cache WHERE key = ?", doomed)
+        return evicted + len(doomed)
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Get cache totals.
+
+        Returns:
+            Dictionary with entries, bytes and lifetime hits
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*) AS entries, COALESCE(SUM(size), 0) AS bytes, "
+                "COALESCE(SUM(hits), 0) AS hits FROM llm_response_cache"
+            )
+            return dict(cursor.fetchone())
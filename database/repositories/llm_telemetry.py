@@ -0,0 +1,221 @@
+"""
+LLM telemetry repository module.
+
+Handles all database operations related to recorded LLM calls and their
+hourly rollups.
+"""
+from datetime import datetime
+from typing import Optional, List, Dict, Any
+
+from ..connection import get_db
+from . import BaseRepository
+
+_CALL_COLUMNS = ('provider', 'model', 'kind', 'outcome', 'prompt_tokens', 'cached_tokens',
+                 'completion_tokens', 'ttft_ms', 'latency_ms', 'attempts', 'error', 'created_at')
+
+# Time spent generating output: after the first token when streamed, else the whole call
+_GENERATION_MS = "(latency_ms - COALESCE(ttft_ms, 0))"
+
+
+class LLMTelemetryRepository(BaseRepository):
+    """Repository for per-call LLM telemetry (``llm_calls``) and hourly rollups."""
+
+    def get(self, call_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get a recorded call by ID.
+
+        Args:
+            call_id: The ID of the call
+
+        Returns:
+            Dictionary containing call data or None if not found
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute("SELECT * FROM llm_calls WHERE id = ?", (call_id,))
+            row = cursor.fetchone()
+            return dict(row) if row else None
+
+    def get_all(self, **filters) -> List[Dict[str, Any]]:
+        """
+        Get recorded calls, newest first.
+
+        Args:
+            **filters: Optional ``since`` (datetime) and ``limit``
+
+        Returns:
+            List of dictionaries containing call data
+        """
+        query = "SELECT * FROM llm_calls"
+        params: List[Any] = []
+        if filters.get('since'):
+            query += " WHERE created_at >= ?"
+            params.append(filters['since'])
+        query += " ORDER BY created_at DESC, id DESC"
+        if filters.get('limit'):
+            query += " LIMIT ?"
+            params.append(filters['limit'])
+        with get_db().cursor() as cursor:
+            cursor.execute(query, params)
+            return [dict(row) for row in cursor.fetchall()]
+
+    def save(self, call: Dict[str, Any]) -> int:
+        """
+        Record one call.
+
+        Args:
+            call: Dictionary with the ``llm_calls`` columns (created_at
+                defaults to now)
+
+        Returns:
+            The ID of the recorded call
+        """
+        with get_db().transaction() as cursor:
+            cursor.execute(
+                f"INSERT INTO llm_calls ({', '.join(_CALL_COLUMNS)}) VALUES ({', '.join('?' * len(_CALL_COLUMNS))})",
+                self._values(call)
+            )
+            return cursor.lastrowid
+
+    def save_many(self, calls: List[Dict[str, Any]]) -> int:
+        """
+        Record several calls in one transaction.
+
+        Args:
+            calls: Dictionaries with the ``llm_calls`` columns
+
+        Returns:
+            Number of calls recorded
+        """
+        if not calls:
+            return 0
+        with get_db().transaction() as cursor:
+            cursor.executemany(
+                f"INSERT INTO llm_calls ({', '.join(_CALL_COLUMNS)}) VALUES ({', '.join('?' * len(_CALL_COLUMNS))})",
+                [self._values(call) for call in calls]
+            )
+        return len(calls)
+
+    @staticmethod
+    def _values(call: Dict[str, Any]) -> tuple:
+        values = dict(call, attempts=call.get('attempts') or 1, created_at=call.get('created_at') or datetime.now())
+        return tuple(values.get(column) for column in _CALL_COLUMNS)
+
+    def delete(self, call_id: int) -> bool:
+        """
+        Delete a recorded call.
+
+        Args:
+            call_id: The ID of the call
+
+        Returns:
+            True if a call was deleted
+        """
+        with get_db().transaction() as cursor:
+            cursor.execute("DELETE FROM llm_calls WHERE id = ?", (call_id,))
+            return cursor.rowcount > 0
+
+    def summary(self, since: datetime) -> List[Dict[str, Any]]:
+        """
+        Per provider and model totals for calls since ``since``.
+
+        Returns:
+            List of dictionaries with calls, errors, retries, token sums,
+            latency_ms and generation_ms sums, and the sorted ``latencies``
+            and ``ttfts`` (ms) of successful calls for percentiles
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT provider, model, COUNT(*) AS calls,
+                       SUM(outcome != 'ok') AS errors,
+                       SUM(attempts - 1) AS retries,
+                       COALESCE(SUM(prompt_tokens), 0) AS prompt_tokens,
+                       COALESCE(SUM(cached_tokens), 0) AS cached_tokens,
+                       COALESCE(SUM(completion_tokens), 0) AS completion_tokens,
+                       COALESCE(SUM(CASE WHEN completion_tokens > 0 THEN {_GENERATION_MS} END), 0)
+                           AS generation_ms
+                FROM llm_calls WHERE created_at >= ?
+                GROUP BY provider, model ORDER BY calls DESC
+                """,
+                (since,)
+            )
+            groups = [dict(row) for row in cursor.fetchall()]
+            for group in groups:
+                cursor.execute(
+                    "SELECT latency_ms, ttft_ms FROM llm_calls WHERE created_at >= ? AND outcome = 'ok' "
+                    "AND provider IS ? AND model IS ?",
+                    (since, group['provider'], group['model'])
+                )
+                rows = cursor.fetchall()
+                group['latencies'] = sorted(row['latency_ms'] for row in rows)
+                group['ttfts'] = sorted(row['ttft_ms'] for row in rows if row['ttft_ms'] is not None)
+        return groups
+
+    def rollup(self, before: datetime) -> int:
+        """
+        Fold calls older than ``before`` into ``llm_call_rollups`` (one row
+        per hour, provider, model and kind) and delete them.
+
+        Returns:
+            Number of calls folded
+        """
+        with get_db().transaction() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO llm_call_rollups
+                    (hour, provider, model, kind, calls, errors, retries, prompt_tokens, cached_tokens,
+                     completion_tokens, latency_ms, generation_ms)
+                SELECT strftime('%Y-%m-%d %H:00', created_at), COALESCE(provider, ''), COALESCE(model, ''), kind,
+                       COUNT(*), SUM(outcome != 'ok'), SUM(attempts - 1),
+                       COALESCE(SUM(prompt_tokens), 0), COALESCE(SUM(cached_tokens), 0),
+                       COALESCE(SUM(completion_tokens), 0), SUM(latency_ms),
+                       COALESCE(SUM(CASE WHEN completion_tokens > 0 THEN {_GENERATION_MS} END), 0)
+                FROM llm_calls WHERE created_at < ?
+                GROUP BY 1, 2, 3, 4
+                ON CONFLICT (hour, provider, model, kind) DO UPDATE SET
+                    calls = calls + excluded.calls,
+                    errors = errors + excluded.errors,
+                    retries = retries + excluded.retries,
+                    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                    cached_tokens = cached_tokens + excluded.cached_tokens,
+                    completion_tokens = completion_tokens + excluded.completion_tokens,
+                    latency_ms = latency_ms + excluded.latency_ms,
+                    generation_ms = generation_ms + excluded.generation_ms
+                """,
+                (before,)
+            )
+            cursor.execute("DELETE FROM llm_calls WHERE created_at < ?", (before,))
+            return cursor.rowcount
+
+    def daily(self, since: datetime) -> List[Dict[str, Any]]:
+        """
+        Daily totals per provider and model since ``since``, from the rollups
+        and the calls not yet rolled up.
+
+        Returns:
+            List of dictionaries with day, provider, model, calls, errors,
+            token sums, latency_ms and generation_ms sums
+        """
+        with get_db().cursor() as cursor:
+            cursor.execute(
+                f"""
+                SELECT day, provider, model, SUM(calls) AS calls, SUM(errors) AS errors,
+                       SUM(prompt_tokens) AS prompt_tokens, SUM(cached_tokens) AS cached_tokens,
+                       SUM(completion_tokens) AS completion_tokens, SUM(latency_ms) AS latency_ms,
+                       SUM(generation_ms) AS generation_ms
+                FROM (
+                    SELECT substr(hour, 1, 10) AS day, provider, model, calls, errors, prompt_tokens,
+                           cached_tokens, completion_tokens, latency_ms, generation_ms
+                    FROM llm_call_rollups WHERE hour >= strftime('%Y-%m-%d %H:00', ?)
+                    UNION ALL
+                    SELECT substr(created_at, 1, 10), COALESCE(provider, ''), COALESCE(model, ''), 1,
+                           outcome != 'ok', COALESCE(prompt_tokens, 0), COALESCE(cached_tokens, 0),
+                           COALESCE(completion_tokens, 0), latency_ms,
+                           CASE WHEN completion_tokens > 0 THEN {_GENERATION_MS} ELSE 0 END
+                    FROM llm_calls WHERE created_at >= ?
+                )
+                GROUP BY day, provider, model ORDER BY day, provider, model
+                """,
+                (since, since)
+            )
+            return [dict(row) for row in cursor.fetchall()]
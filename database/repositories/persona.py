@@ -5,7 +5,7 @@ Handles all database operations related to personas and their associated data.
 """
 import json
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Callable
 
 from ..connection import get_db
 from . import BaseRepository
@@ -25,16 +25,43 @@ class PersonaRepository(BaseRepository):
             Dictionary containing persona data or None if not found
         """
         with get_db().cursor() as cursor:
-            cursor.execute("SELECT * FROM personas WHERE id = ?", (id,))
-            persona_row = cursor.fetchone()
+            return self._get(cursor, id)
 
-            if not persona_row:
-                return None
+    def _get(self, cursor, id: int) -> Optional[Dict[str, Any]]:
+        cursor.execute("SELECT * FROM personas WHERE id = ?", (id,))
+        persona_row = cursor.fetchone()
+
+        if not persona_row:
+            return None
+
+        persona = dict(persona_row)
+        persona.update(self._get_persona_data(cursor, id))
 
-            persona = dict(persona_row)
-            persona.update(self._get_persona_data(cursor, id))
+        return persona
+
+    def update(self, id: int, change: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Read a persona, derive updates from it and save them atomically.
+
+        The read, ``change(persona)`` and the save run in one BEGIN IMMEDIATE
+        transaction, so concurrent updates from other threads or processes
+        are applied one after another instead of overwriting each other.
+
+        Args:
+            id: The persona ID
+            change: Returns the persona data to save (empty to save nothing)
 
-            return persona
+        Returns:
+            The saved updates ({} if there were none), or None if not found
+        """
+        with get_db().transaction(immediate=True) as cursor:
+            persona = self._get(cursor, id)
+            if not persona:
+                return None
+            updates = change(persona)
+            if updates:
+                self._save(cursor, updates)
+            return updates
 
     def get_all(self, page: int = 1, per_page: int = 100, **filters) -> Dict[str, Any]:
         """
@@ -87,48 +114,51 @@ class PersonaRepository(BaseRepository):
             The ID of the saved persona
         """
         with get_db().transaction() as cursor:
-            persona_id = persona_data.get('id')
-            now = datetime.now()
-
-            if persona_id:
-                # Check if persona exists
-                cursor.execute("SELECT id FROM personas WHERE id = ?", (persona_id,))
-                exists = cursor.fetchone()
-
-                if exists:
-                    # Update existing persona
-                    cursor.execute(
-                        "UPDATE personas SET name = ?, updated_at = ? WHERE id = ?",
-                        (persona_data.get('name', 'Unnamed Persona'), now, persona_id)
-                    )
-                else:
-                    # Insert with specific ID (for update-after-delete pattern)
-                    cursor.execute(
-                        "INSERT INTO personas (id, name, created_at, updated_at) VALUES (?, ?, ?, ?)",
-                        (persona_id, persona_data.get('name', 'Unnamed Persona'), now, now)
-                    )
+            return self._save(cursor, persona_data)
+
+    def _save(self, cursor, persona_data: Dict[str, Any]) -> int:
+        persona_id = persona_data.get('id')
+        now = datetime.now()
+
+        if persona_id:
+            # Check if persona exists
+            cursor.execute("SELECT id FROM personas WHERE id = ?", (persona_id,))
+            exists = cursor.fetchone()
+
+            if exists:
+                # Update existing persona
+                cursor.execute(
+                    "UPDATE personas SET name = ?, updated_at = ? WHERE id = ?",
+                    (persona_data.get('name', 'Unnamed Persona'), now, persona_id)
+                )
             else:
-                # Create new persona
+                # Insert with specific ID (for update-after-delete pattern)
                 cursor.execute(
-                    "INSERT INTO personas (name, created_at, updated_at) VALUES (?, ?, ?)",
-                    (persona_data.get('name', 'Unnamed Persona'), now, now)
+                    "INSERT INTO personas (id, name, created_at, updated_at) VALUES (?, ?, ?, ?)",
+                    (persona_id, persona_data.get('name', 'Unnamed Persona'), now, now)
                 )
-                persona_id = cursor.lastrowid
+        else:
+            # Create new persona
+            cursor.execute(
+                "INSERT INTO personas (name, created_at, updated_at) VALUES (?, ?, ?)",
+                (persona_data.get('name', 'Unnamed Persona'), now, now)
+            )
+            persona_id = cursor.lastrowid
 
-            # Save associated data
-            if 'demographic' in persona_data:
-                self._save_demographic_data(cursor, persona_id, persona_data['demographic'])
+        # Save associated data
+        if 'demographic' in persona_data:
+            self._save_demographic_data(cursor, persona_id, persona_data['demographic'])
 
-            if 'psychographic' in persona_data:
-                self._save_psychographic_data(cursor, persona_id, persona_data['psychographic'])
+        if 'psychographic' in persona_data:
+            self._save_psychographic_data(cursor, persona_id, persona_data['psychographic'])
 
-            if 'behavioral' in persona_data:
-                self._save_behavioral_data(cursor, persona_id, persona_data['behavioral'])
+        if 'behavioral' in persona_data:
+            self._save_behavioral_data(cursor, persona_id, persona_data['behavioral'])
 
-            if 'contextual' in persona_data:
-                self._save_contextual_data(cursor, persona_id, persona_data['contextual'])
+        if 'contextual' in persona_data:
+            self._save_contextual_data(cursor, persona_id, persona_data['contextual'])
 
-            return persona_id
+        return persona_id
 
     def delete(self, id: int) -> bool:
         """
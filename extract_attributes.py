@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Extract persona attributes from saved conversations in bulk.
+
+Queues every agent/persona chat that was never extracted, or whose persona
+changed since its last extraction, as one batch and works it off with a
+bounded number of LLM calls in flight. Results are merged into personas in
+grouped transactions. Each job's status is its checkpoint: interrupting the
+command (Ctrl-C) finishes the calls in flight and leaves the rest queued, and
+running it again resumes unfinished batches before looking for new work.
+
+Jobs left running by a run that was killed outright are requeued once they
+are older than EXTRACTION_JOB_LEASE; until then they may belong to another
+process (the app or a second run). If nothing else is extracting, pass
+--requeue-running to take them back at once.
+
+Examples:
+    python3 extract_attributes.py
+    python3 extract_attributes.py --concurrency 64 --group-size 200
+    python3 extract_attributes.py --all   # re-extract chats that are up to date too
+    python3 extract_attributes.py --requeue-running   # after kill -9, with the app stopped
+"""
+import argparse
+import json
+import logging
+import threading
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch persona attribute extraction over saved chats.")
+    parser.add_argument("--all", action="store_true",
+                        help="Include chats whose extraction is already up to date")
+    parser.add_argument("--concurrency", type=int, help="LLM calls in flight (default: EXTRACTION_BATCH_CONCURRENCY)")
+    parser.add_argument("--group-size", type=int,
+                        help="Extractions merged per transaction (default: EXTRACTION_BATCH_GROUP_SIZE)")
+    parser.add_argument("--label", help="Batch label shown by the status endpoint")
+    parser.add_argument("--requeue-running", action="store_true",
+                        help="Requeue every running job first (only when no other process is extracting)")
+    args = parser.parse_args()
+
+    import database
+    from config import EXTRACTION_BATCH_CONCURRENCY, EXTRACTION_BATCH_GROUP_SIZE
+    from utils.extraction_queue import ExtractionQueue
+
+    database.init_db()
+    queue = ExtractionQueue(batch_concurrency=args.concurrency or EXTRACTION_BATCH_CONCURRENCY,
+                            batch_group_size=args.group_size or EXTRACTION_BATCH_GROUP_SIZE)
+    queue.requeue_stale(lease=0 if args.requeue_running else None)
+    submitted = queue.submit_batch(args.label, include_current=args.all, start=False)
+    batch_ids = database.get_running_extraction_batches()
+
+    def run():
+        # Once stopped, run_batch claims nothing more and returns at once
+        for batch_id in batch_ids:
+            queue.run_batch(batch_id)
+
+    # Run in a thread so Ctrl-C can drain the calls in flight instead of
+    # abandoning them mid-batch
+    runner = threading.Thread(target=run, name="extract-attributes")
+    runner.start()
+    try:
+        while runner.is_alive():
+            runner.join(0.5)
+    except KeyboardInterrupt:
+        logger.info("Interrupted; finishing extractions in flight (Ctrl-C again to abort)")
+        queue.stop()
+
+    batches = [database.get_extraction_batch(batch_id) for batch_id in batch_ids]
+    print(json.dumps({"submitted": submitted, "batches": batches}, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Run a stub OpenAI-compatible (and Anthropic-shaped) LLM server for load tests.
+
+Replies are made up and deterministic, streamed after a sampled time to first
+token at a fixed number of tokens per second; structured requests get JSON
+that matches their schema. No model, GPU or network connection is needed.
+Point A-Proxy at it with:
+
+    LLM_PROVIDER=openai_compatible
+    OPENAI_COMPATIBLE_URL=http://127.0.0.1:8900/v1
+
+or, for the Anthropic adapter, ANTHROPIC_BASE_URL=http://127.0.0.1:8900 and
+any ANTHROPIC_API_KEY.
+
+Latencies take a distribution: MS, fixed:MS, uniform:LOW,HIGH,
+normal:MEAN,SD or lognormal:MEDIAN,SIGMA.
+
+Examples:
+    python3 llm_stub_server.py
+    python3 llm_stub_server.py --ttft lognormal:400,0.6 --tokens-per-second 30
+    python3 llm_stub_server.py --error-rate 0.05 --error-status 503 --seed 7
+"""
+import argparse
+import logging
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def main():
+    from utils.llm_stub import StubConfig, create_stub_app, parse_distribution
+
+    defaults = StubConfig()
+    parser = argparse.ArgumentParser(description="Stub OpenAI/Anthropic-compatible LLM server for load tests.")
+    parser.add_argument("--host", default="127.0.0.1", help="Host address to listen on")
+    parser.add_argument("--port", type=int, default=8900, help="Port to listen on")
+    parser.add_argument("--ttft", default=defaults.ttft_ms,
+                        help=f"Time to first token in ms, as a distribution (default: {defaults.ttft_ms})")
+    parser.add_argument("--tokens-per-second", type=float, default=defaults.tokens_per_second,
+                        help=f"Generation speed per request, 0 for instant (default: {defaults.tokens_per_second:g})")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=defaults.prefill_tokens_per_second,
+                        help="Prompt processing speed added to the time to first token, 0 to ignore (default: 0)")
+    parser.add_argument("--output-tokens", default=defaults.output_tokens,
+                        help=f"Reply length in tokens, as a distribution (default: {defaults.output_tokens})")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate,
+                        help="Share of requests failed with an injected error (default: 0)")
+    parser.add_argument("--error-status", type=int, action="append",
+                        help="Status code for injected errors; repeat to mix (default: 500, 503 and 429)")
+    parser.add_argument("--seed", type=int, default=defaults.seed, help="Seed for replies, latencies and errors")
+    parser.add_argument("--quiet", action="store_true", help="Don't log each request")
+    args = parser.parse_args()
+
+    for spec in (args.ttft, args.output_tokens):
+        try:
+            parse_distribution(spec)
+        except ValueError as exc:
+            parser.error(str(exc))
+    if not 0 <= args.error_rate <= 1:
+        parser.error("--error-rate must be between 0 and 1")
+
+    config = StubConfig(
+        ttft_ms=args.ttft,
+        tokens_per_second=args.tokens_per_second,
+        prefill_tokens_per_second=args.prefill_tokens_per_second,
+        output_tokens=args.output_tokens,
+        error_rate=args.error_rate,
+        error_statuses=args.error_status or defaults.error_statuses,
+        seed=args.seed,
+    )
+    if args.quiet:
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    logger.info("Stub LLM server on http://%s:%d/v1 (%s)", args.host, args.port, config)
+    create_stub_app(config).run(host=args.host, port=args.port, threaded=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Re-index the archives/ tree into the database.
+
+Registers memento dirs that have no ``mementos`` row: captures made with
+``capture_as_persona.py`` (which writes files only) and archives left behind
+by a lost or reset database. Metadata is parsed by a process pool and written
+in batched transactions; already-indexed dirs are skipped, so the command is
+safe to re-run and resumes after an interruption.
+
+Examples:
+    python3 reindex_archives.py
+    python3 reindex_archives.py --workers 8 --batch-size 500
+    python3 reindex_archives.py --force   # refresh rows that already exist
+"""
+import argparse
+import json
+import logging
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+logger = logging.getLogger(__name__)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild archive DB rows from archives/*/*/metadata.json.")
+    parser.add_argument("--root", default="archives", help="Archive root (default: archives)")
+    parser.add_argument("--workers", type=int, help="Parser processes (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=200, help="Mementos per DB transaction")
+    parser.add_argument("--force", action="store_true",
+                        help="Re-parse and update mementos that are already indexed")
+    args = parser.parse_args()
+
+    import database
+    from utils.reindex import Reindexer
+
+    database.init_db()
+    stats = Reindexer(root=args.root, workers=args.workers, batch_size=args.batch_size,
+                      replace=args.force).run()
+    for error in stats["errors"]:
+        logger.warning("%s: %s", error["memento_location"], error["error"])
+    stats["errors"] = len(stats["errors"])
+    print(json.dumps(stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
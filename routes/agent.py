@@ -1,11 +1,10 @@
-from flask import Blueprint, request, jsonify, render_template, flash, redirect, url_for
+from flask import Blueprint, Response, request, jsonify, render_template, flash, redirect, url_for, stream_with_context
 import logging
 import json
 import database
 import time
 from datetime import datetime
 from flask_login import login_required
-from services.persona_attribute_service import PersonaAttributeService
 
 # Create blueprint
 agent_bp = Blueprint('agent', __name__)
@@ -35,6 +34,39 @@ def agent_chat():
 
 from services import fetch_persona_context, flatten_persona_context
 
+
+def _wants_stream():
+    """True when the client asked for Server-Sent Events instead of one JSON reply."""
+    return request.accept_mimetypes.best_match(['application/json', 'text/event-stream']) == 'text/event-stream'
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def _event_stream(chunks, done):
+    """
+    Stream an LLM reply as Server-Sent Events: a ``token`` event per chunk,
+    then ``done`` with ``done(full_text)`` as its data, or ``error``.
+    """
+    def generate():
+        parts = []
+        try:
+            for text in chunks:
+                parts.append(text)
+                yield _sse("token", {"text": text})
+        except Exception as e:
+            logger.error(f"Error streaming LLM response: {e}", exc_info=True)
+            yield _sse("error", {"success": False, "error": str(e)})
+            return
+        finally:
+            # Stops the upstream request too if the browser disconnected.
+            chunks.close()
+        yield _sse("done", done("".join(parts)))
+
+    return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @agent_bp.route("/agent/message", methods=["POST"])
 @login_required
 def standalone_agent_message():
@@ -63,21 +95,30 @@ def standalone_agent_message():
         chat_mode = data.get('chat_mode', 'with')
         chat_history = data.get('chat_history', [])
         
+        from services import ContextBudget, ContextOverflowError, history_to_messages
+        from utils.llm_client import get_llm_client
+
+        llm = get_llm_client()
+        # Budget against the model's context window, keeping room for the reply
+        budget = ContextBudget(model or llm.adapter.default_model)
+        history = history_to_messages(chat_history) if isinstance(chat_history, list) else []
+
         # If user provided a system prompt, use it directly
         if not system_prompt:
             # Use the new context management system
             from services import ContextManager, PersonaContextProvider, JourneyContextProvider
             
-            # Initialize context manager
-            from config import LLM_MAX_OUTPUT_TOKENS
-            ctx_manager = ContextManager(max_tokens=LLM_MAX_OUTPUT_TOKENS)
+            # Size the context to leave room for the new message and recent history
+            ctx_manager = ContextManager(max_tokens=budget.system_tokens(message, history),
+                                         model=budget.model)
             
             # Add providers
             ctx_manager.add_provider(PersonaContextProvider())
             ctx_manager.add_provider(JourneyContextProvider())
             
-            # Generate the full system prompt with all context
-            system_prompt = ctx_manager.get_combined_context(
+            # Generate the system prompt as stable (persona) and volatile
+            # (journey) blocks, stable first so prompt caches can reuse it
+            system_prompt = ctx_manager.get_context_blocks(
                 persona_id=persona_id,
                 journey_id=journey_id,
                 mode=chat_mode
@@ -89,57 +130,48 @@ def standalone_agent_message():
         
         # Build messages for LLMClient
         try:
-            from utils.llm_client import LLMClient
-
-            messages = []
-
-            # Add system prompt
-            if system_prompt:
-                messages.append({"role": "system", "content": system_prompt})
-
-            # Add chat history if provided
-            if chat_history and isinstance(chat_history, list):
-                max_history_messages = 10
-                history_to_use = chat_history[-max_history_messages:] if len(chat_history) > max_history_messages else chat_history
-
-                for msg in history_to_use:
-                    role = msg.get('role', '')
-                    content = msg.get('content', '')
-
-                    llm_role = 'user'
-                    if role in ('agent', 'assistant', 'target'):
-                        llm_role = 'assistant'
-                    elif role in ('user', 'persona'):
-                        llm_role = 'user'
-
-                    if content and role:
-                        messages.append({"role": llm_role, "content": content})
-
-            # Add current message
-            messages.append({"role": "user", "content": message})
+            # System prompt, then as much recent history as fits, then the new message
+            messages = budget.pack(system_prompt, history, message)
 
             logger.info(f"Sending message via LLMClient with {len(messages)} messages")
 
-            llm = LLMClient()
-            response_content = llm.chat(messages, model_hint=model if model else None)
-
-            logger.info(f"Received LLM response: {response_content[:200]}...")
-
             # Calculate context depth for returning to client
             context_depth = {}
             if persona_id:
                 context_depth["persona"] = True
             if journey_id:
                 context_depth["journey"] = True
-            if chat_history and len(chat_history) > 0:
-                context_depth["history"] = len(chat_history)
+            # History messages that fit the context window
+            history_sent = sum(1 for m in messages[:-1] if m["role"] != "system")
+            if history_sent:
+                context_depth["history"] = history_sent
+
+            if _wants_stream():
+                return _event_stream(
+                    llm.chat_stream(messages, model_hint=model if model else None),
+                    lambda text: {
+                        "success": True,
+                        "response": text,
+                        "conversation_id": conversation_id,
+                        "context_depth": context_depth,
+                        "provider": llm.served_by()
+                    },
+                )
+
+            response_content = llm.chat(messages, model_hint=model if model else None)
+
+            logger.info(f"Received LLM response: {response_content[:200]}...")
 
             return jsonify({
                 "success": True,
                 "response": response_content,
                 "conversation_id": conversation_id,
-                "context_depth": context_depth
+                "context_depth": context_depth,
+                "provider": llm.served_by()
             })
+        except ContextOverflowError as e:
+            logger.warning(f"Agent message too long: {e}")
+            return jsonify({"success": False, "error": str(e)}), 413
         except Exception as e:
             logger.error(f"Error calling LLM: {e}", exc_info=True)
             raise
@@ -151,6 +183,156 @@ def standalone_agent_message():
         logger.error(f"Traceback: {trace}")
         return jsonify({"success": False, "error": str(e)}), 500
 
+@agent_bp.route("/agent/panel", methods=["POST"])
+@login_required
+def panel_message():
+    """Ask several personas the same question concurrently."""
+    from config import LLM_PANEL_MAX_PERSONAS
+    from services.panel import PanelChat
+    from utils.llm_client import get_llm_client
+
+    data = request.get_json(silent=True)
+    if not data:
+        return jsonify({"success": False, "error": "No data provided"}), 400
+
+    message = data.get('message')
+    if not message:
+        return jsonify({"success": False, "error": "No message provided"}), 400
+
+    try:
+        # Deduplicated, in the order given
+        persona_ids = list(dict.fromkeys(int(pid) for pid in data.get('persona_ids') or []))
+    except (TypeError, ValueError):
+        return jsonify({"success": False, "error": "persona_ids must be a list of persona IDs"}), 400
+    if not persona_ids:
+        return jsonify({"success": False, "error": "No personas provided"}), 400
+    if len(persona_ids) > LLM_PANEL_MAX_PERSONAS:
+        return jsonify({"success": False,
+                        "error": f"A panel can have at most {LLM_PANEL_MAX_PERSONAS} personas"}), 400
+
+    missing = [pid for pid in persona_ids if not database.get_persona(pid)]
+    if missing:
+        return jsonify({"success": False, "error": "Persona not found", "persona_ids": missing}), 404
+
+    journey_id = data.get('journey_id')
+    chat_mode = data.get('chat_mode', 'with')
+    panel = PanelChat(get_llm_client(), model=data.get('model') or None)
+    logger.info(f"Panel message to {len(persona_ids)} personas (concurrency {panel.concurrency})")
+    started = time.monotonic()
+
+    def summary(answers):
+        return {
+            "success": True,
+            "count": len(persona_ids),
+            "failed": sum(1 for answer in answers if not answer["success"]),
+            "elapsed_ms": int((time.monotonic() - started) * 1000),
+        }
+
+    if _wants_stream():
+        def generate():
+            answers = []
+            results = panel.answers(persona_ids, message, journey_id=journey_id, mode=chat_mode)
+            try:
+                for answer in results:
+                    answers.append(answer)
+                    yield _sse("answer", answer)
+            finally:
+                # Cancels the calls not yet started if the browser disconnected
+                results.close()
+            yield _sse("done", summary(answers))
+
+        return Response(stream_with_context(generate()), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    answers = list(panel.answers(persona_ids, message, journey_id=journey_id, mode=chat_mode))
+    answers.sort(key=lambda answer: persona_ids.index(answer["persona_id"]))
+    return jsonify(dict(summary(answers), answers=answers))
+
+@agent_bp.route("/api/llm-cache-status")
+@login_required
+def llm_cache_status():
+    """Hit/miss counters and size of the LLM response cache."""
+    from utils.llm_cache import response_cache
+    return jsonify(response_cache.stats())
+
+@agent_bp.route("/api/llm-providers")
+@login_required
+def llm_providers():
+    """The LLM provider chain and each provider's circuit breaker state."""
+    from utils.llm_client import ProviderNotConfiguredError, get_llm_client
+    try:
+        return jsonify(get_llm_client().provider_status())
+    except ProviderNotConfiguredError as e:
+        return jsonify({"success": False, "error": str(e)}), 503
+
+@agent_bp.route("/api/llm-telemetry")
+@login_required
+def llm_telemetry():
+    """Per-model latency, token and throughput figures from recorded LLM calls."""
+    try:
+        hours = float(request.args.get('hours', 24))
+        days = int(request.args.get('days', 30))
+    except ValueError:
+        return jsonify({"success": False, "error": "hours and days must be numbers"}), 400
+    if hours <= 0 or days <= 0:
+        return jsonify({"success": False, "error": "hours and days must be positive"}), 400
+    from utils.llm_telemetry import telemetry
+    return jsonify(telemetry.summary(hours=hours, days=days))
+
+@agent_bp.route("/llm-telemetry")
+@login_required
+def llm_telemetry_dashboard():
+    """Dashboard of LLM latency and throughput per model."""
+    return render_template("llm_telemetry.html")
+
+@agent_bp.route("/api/extraction-status")
+@login_required
+def extraction_status():
+    """Job counts and workers of the persona attribute extraction queue."""
+    from utils.extraction_queue import extraction_queue
+    return jsonify(extraction_queue.status())
+
+@agent_bp.route("/api/waypoints/<int:waypoint_id>/extraction")
+@login_required
+def waypoint_extraction_status(waypoint_id):
+    """The latest attribute extraction job for a saved chat."""
+    job = database.get_latest_extraction_job(waypoint_id)
+    if not job:
+        return jsonify({"success": False, "error": "No extraction queued for this waypoint"}), 404
+    return jsonify({
+        "success": True,
+        "job_id": job['id'],
+        "waypoint_id": job['waypoint_id'],
+        "status": job['status'],
+        "done": job['status'] in ('succeeded', 'failed'),
+        "attempts": job['attempts'],
+        "requests": job['requests'],
+        "persona_id": job['persona_id'],
+        "error": job['last_error'] if job['status'] == 'failed' else None,
+        "created_at": str(job['created_at']),
+        "finished_at": str(job['finished_at']) if job['finished_at'] else None,
+    })
+
+@agent_bp.route("/api/extraction-batches", methods=["POST"])
+@login_required
+def submit_extraction_batch():
+    """Re-extract persona attributes from every saved chat that needs it, as one batch."""
+    params = request.get_json(silent=True) or request.form
+    include_current = str(params.get('include_current', 'false')).lower() in ('1', 'true', 'yes', 'on')
+    from utils.extraction_queue import extraction_queue
+    result = extraction_queue.submit_batch(params.get('label') or None, include_current=include_current)
+    result["status_url"] = url_for('agent.extraction_batch', batch_id=result["batch_id"])
+    return jsonify(result), 202
+
+@agent_bp.route("/api/extraction-batches/<int:batch_id>")
+@login_required
+def extraction_batch(batch_id):
+    """Poll a batch attribute extraction."""
+    batch = database.get_extraction_batch(batch_id)
+    if not batch:
+        return jsonify({"error": "Batch not found"}), 404
+    return jsonify(batch)
+
 @agent_bp.route("/direct-chat/<int:persona_id>")
 @login_required
 def direct_chat(persona_id):
@@ -446,20 +628,22 @@ def save_direct_chat(persona_id):
 
             logger.info(f"Successfully added waypoint {waypoint_id} to journey {journey_id}")
 
-            import threading
-            def _extract_attributes(wp_id):
-                try:
-                    PersonaAttributeService().process_waypoint(wp_id)
-                except Exception:
-                    logger.error("Persona attribute extraction failed", exc_info=True)
-            threading.Thread(target=_extract_attributes, args=(waypoint_id,), daemon=True).start()
+            # Update the persona from the conversation in the background
+            extraction_job = None
+            try:
+                from utils.extraction_queue import extraction_queue
+                extraction_job = extraction_queue.enqueue(waypoint_id)
+            except Exception:
+                logger.error("Could not queue persona attribute extraction", exc_info=True)
 
             # Success response
             if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
                 return jsonify({
                     'success': True,
                     'waypoint_id': waypoint_id,
-                    'journey_id': journey_id
+                    'journey_id': journey_id,
+                    'extraction_job_id': extraction_job['id'] if extraction_job else None,
+                    'extraction_status_url': url_for('agent.waypoint_extraction_status', waypoint_id=waypoint_id)
                 }), 200, response_headers
             
             # For non-AJAX requests
@@ -559,6 +743,13 @@ def agent_message(journey_id):
         # Get agent service
         from utils.agent import get_agent_service
         agent_service = get_agent_service()
+
+        if _wants_stream():
+            return _event_stream(
+                agent_service.stream_message(message, claude_context),
+                lambda text: {"success": True, "response": text, "conversation_id": conversation_id,
+                              "provider": agent_service.llm.served_by()},
+            )
         
         # Send message to Claude
         claude_response = agent_service.send_message(message, claude_context)
@@ -569,7 +760,8 @@ def agent_message(journey_id):
         return jsonify({
             "success": True,
             "response": response_content,
-            "conversation_id": conversation_id
+            "conversation_id": conversation_id,
+            "provider": claude_response.get('provider')
         })
     
     except Exception as e:
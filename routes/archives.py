@@ -1,8 +1,15 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, abort, send_file
+from flask_login import login_required
 import database
+import hashlib
+import io
 import os
 import logging
-from utils import internet_archive
+from datetime import datetime
+from functools import lru_cache
+from routes.memento import TIMEMAP_MIMETYPES, timegate_uri, timemap_uri
+from services.html_diff import html_diff_service
+from utils import archive_gc, image_hash, internet_archive, memento_content, memento_protocol, visual_diff, warc
 
 archives_bp = Blueprint('archives', __name__)
 
@@ -36,18 +43,183 @@ def view_memento(archived_website_id, memento_id):
         flash("Memento not found.", "danger")
         return redirect(url_for('archives.view_archive', archived_website_id=archived_website_id))
     
-    # Check if the memento HTML file exists
-    html_file_path = os.path.join(memento['memento_location'], 'content.html')
-    if os.path.exists(html_file_path):
-        with open(html_file_path, 'r', encoding='utf-8') as f:
-            html_content = f.read()
-    else:
-        html_content = "<p>HTML content not available.</p>"
-    
+    # The page itself is streamed into a sandboxed iframe by memento_content_raw,
+    # so the viewer only needs to know whether there is anything to show.
+    has_content = (memento_content.locate_html(memento['memento_location'])[0] is not None
+                   or 'response' in database.get_warc_records(memento_id))
+    # Viewing keeps the memento at the back of the disk quota's LRU queue.
+    database.touch_memento(memento_id)
+
     return render_template("memento_viewer.html", 
                           archived_website=archived_website, 
                           memento=memento, 
-                          html_content=html_content)
+                          has_content=has_content)
+
+@archives_bp.route("/archives/<int:archived_website_id>/mementos/<int:memento_id>/content")
+def memento_content_raw(archived_website_id, memento_id):
+    """Stream a memento's archived HTML with validators for conditional/range requests.
+
+    Mementos are immutable, so the ETag is the SHA-256 of the stored bytes and
+    repeat views revalidate to 304 without re-reading the file. Stored gzip
+    bytes pass straight through when the client accepts gzip. ``?as=text``
+    serves the same bytes as text/plain for the viewer's source tab.
+    """
+    memento = database.get_memento(memento_id)
+    if not memento or memento['archived_website_id'] != archived_website_id:
+        abort(404)
+
+    mimetype = 'text/plain' if request.args.get('as') == 'text' else 'text/html'
+    path, encoding = memento_content.locate_html(memento['memento_location'])
+    content_encoding = None
+
+    if path is None:
+        html = _warc_html(memento_id)
+        if html is None:
+            abort(404)
+        response = send_file(io.BytesIO(html), mimetype=mimetype, conditional=True,
+                             etag=hashlib.sha256(html).hexdigest(),
+                             last_modified=_memento_datetime(memento))
+    else:
+        path = os.path.abspath(path)
+        etag = database.get_memento_blobs(memento_id).get('html') or _file_sha256(path)
+        # Quality-aware, so "gzip;q=0" counts as a refusal
+        if encoding == memento_content.GZIP and not request.accept_encodings['gzip']:
+            with open(path, 'rb') as f:
+                html = memento_content.decode(f.read(), encoding)
+            response = send_file(io.BytesIO(html), mimetype=mimetype, conditional=True,
+                                 etag=hashlib.sha256(html).hexdigest(),
+                                 last_modified=os.path.getmtime(path))
+        else:
+            if encoding == memento_content.GZIP:
+                content_encoding = 'gzip'
+            response = send_file(path, mimetype=mimetype, conditional=True, etag=etag)
+
+    if content_encoding and response.status_code != 304:
+        response.headers['Content-Encoding'] = content_encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    _add_memento_headers(response, memento)
+    return response
+
+def _add_memento_headers(response, memento):
+    """Mark the response as a URI-M (RFC 7089) pointing at its TimeGate and TimeMap."""
+    http_date = memento_protocol.format_http_datetime(memento['memento_datetime'])
+    if http_date:
+        response.headers['Memento-Datetime'] = http_date
+    uri_r, persona_id = memento['uri_r'], memento.get('persona_id')
+    response.headers['Link'] = ", ".join([
+        memento_protocol.link_value(uri_r, 'original'),
+        memento_protocol.link_value(timegate_uri(uri_r, persona_id), 'timegate'),
+        memento_protocol.link_value(timemap_uri(uri_r, persona_id), 'timemap',
+                                    type=TIMEMAP_MIMETYPES['link']),
+    ])
+
+def _memento_datetime(memento):
+    """Parse the memento's capture time for Last-Modified (None if unparseable)."""
+    value = memento.get('memento_datetime')
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+def _file_sha256(path):
+    """SHA-256 of a stored file that is not in the blob store (pre-dedup mementos)."""
+    stat = os.stat(path)
+    return _hash_file(path, stat.st_mtime_ns, stat.st_size)
+
+@lru_cache(maxsize=1024)
+def _hash_file(path, mtime_ns, size):
+    # Keyed on mtime and size, so a rewritten file (e.g. by CompressionJob) is re-hashed
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _warc_html(memento_id):
+    """Read a WARC-mode memento's rendered HTML bytes (None if absent)."""
+    block = memento_content.read_warc_block(memento_id, 'response')
+    return warc.http_body(block) if block is not None else None
+
+@archives_bp.route("/api/mementos/<int:memento_id>/similar")
+def similar_mementos(memento_id):
+    """List mementos whose screenshots are perceptually close to this one."""
+    if not database.get_memento(memento_id):
+        return jsonify({"error": "Memento not found"}), 404
+    kind = request.args.get('kind', 'phash')
+    if kind not in ('phash', 'dhash'):
+        return jsonify({"error": "kind must be 'phash' or 'dhash'"}), 400
+    max_distance = request.args.get('max_distance', 6, type=int)
+    same_url = request.args.get('same_url', 'false').lower() == 'true'
+
+    hashes = database.get_screenshot_hashes(memento_id)
+    matches = image_hash.find_similar(memento_id, max_distance, kind, same_url)
+    return jsonify({
+        "memento_id": memento_id,
+        "hashes": {"dhash": hashes['dhash'], "phash": hashes['phash']} if hashes else None,
+        "kind": kind,
+        "max_distance": max_distance,
+        "matches": matches,
+    })
+
+def _visual_diff(memento_id, other_id, heatmap=True):
+    """Diff two mementos' screenshots; returns (result, error_response)."""
+    width = request.args.get('width', visual_diff.DEFAULT_WIDTH, type=int)
+    threshold = request.args.get('threshold', visual_diff.DEFAULT_THRESHOLD, type=int)
+    if width <= 0:
+        return None, (jsonify({"error": "width must be positive"}), 400)
+    mementos = [database.get_memento(memento_id), database.get_memento(other_id)]
+    if not all(mementos):
+        return None, (jsonify({"error": "Memento not found"}), 404)
+    screenshots = [memento_content.read_screenshot(m) for m in mementos]
+    if not all(screenshots):
+        return None, (jsonify({"error": "Screenshot not available"}), 404)
+    result = visual_diff.diff_images(screenshots[0], screenshots[1], width=width, threshold=threshold,
+                                     heatmap=heatmap)
+
+    hashes = [database.get_screenshot_hashes(m['id']) for m in mementos]
+    if all(hashes):
+        result["hash_distance"] = {
+            kind: image_hash.hamming(hashes[0][kind], hashes[1][kind]) for kind in ('dhash', 'phash')
+        }
+    return result, None
+
+@archives_bp.route("/api/mementos/<int:memento_id>/visual-diff/<int:other_id>")
+def memento_visual_diff(memento_id, other_id):
+    """Changed fraction and changed-region bounding box between two screenshots."""
+    result, error = _visual_diff(memento_id, other_id, heatmap=False)
+    if error:
+        return error
+    result.pop("heatmap")
+    params = {key: request.args[key] for key in ('width', 'threshold') if key in request.args}
+    result["heatmap_url"] = url_for('archives.memento_visual_diff_heatmap', memento_id=memento_id,
+                                    other_id=other_id, **params)
+    return jsonify(result)
+
+@archives_bp.route("/api/mementos/<int:memento_id>/visual-diff/<int:other_id>/heatmap.png")
+def memento_visual_diff_heatmap(memento_id, other_id):
+    """Heatmap PNG of the pixels that differ between two screenshots."""
+    result, error = _visual_diff(memento_id, other_id)
+    if error:
+        return error
+    response = send_file(io.BytesIO(result["heatmap"]), mimetype='image/png')
+    response.headers['X-Changed-Bbox'] = ",".join(map(str, result["bbox"] or []))
+    return response
+
+@archives_bp.route("/api/mementos/<int:memento_id>/html-diff/<int:other_id>")
+def memento_html_diff(memento_id, other_id):
+    """Block-level structural diff between two mementos' HTML."""
+    mementos = [database.get_memento(memento_id), database.get_memento(other_id)]
+    if not all(mementos):
+        return jsonify({"error": "Memento not found"}), 404
+    limit = max(0, request.args.get('limit', 200, type=int))
+    result = html_diff_service.diff(mementos[0], mementos[1], limit=limit)
+    if result is None:
+        return jsonify({"error": "HTML content not available"}), 404
+    return jsonify(result)
 
 @archives_bp.route("/delete-archive/<int:archived_website_id>", methods=["POST"])
 def delete_archive(archived_website_id):
@@ -72,77 +244,115 @@ def delete_archive(archived_website_id):
 
 @archives_bp.route("/submit-to-internet-archive/<int:memento_id>", methods=["POST"])
 def submit_to_internet_archive(memento_id):
-    """Submit a memento to the Internet Archive."""
+    """Queue a memento's URL for the Internet Archive; answers 202 with the job."""
+    is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
     try:
-        # Get the memento
         memento = database.get_memento(memento_id)
         if not memento:
-            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            if is_ajax:
                 return jsonify({"success": False, "message": "Memento not found."}), 404
             flash("Memento not found.", "danger")
             return redirect(url_for('archives.list_archives'))
-        
+        back = url_for('archives.view_archive', archived_website_id=memento['archived_website_id'])
+
         # Check if already submitted
         if memento.get('internet_archive_id'):
-            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            if is_ajax:
                 return jsonify({
                     "success": True, 
                     "message": "Already submitted to the Internet Archive.",
                     "archived_url": memento.get('internet_archive_id')
                 })
             flash("This page has already been submitted to the Internet Archive.", "info")
-            return redirect(url_for('archives.view_archive', archived_website_id=memento['archived_website_id']))
-        
-        # Check rate limit before submission
-        can_submit, submissions_today, rate_limit = internet_archive.check_rate_limit()
-        if not can_submit:
-            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                return jsonify({
-                    "success": False, 
-                    "message": f"Rate limit exceeded: {submissions_today}/{rate_limit} submissions today"
-                }), 429
-            flash(f"Rate limit exceeded: {submissions_today}/{rate_limit} submissions today", "danger")
-            return redirect(url_for('archives.view_archive', archived_website_id=memento['archived_website_id']))
-        
-        # Submit to Internet Archive
-        success, result = internet_archive.submit_to_internet_archive(memento['uri_r'])
-        
-        if success:
-            # Update the memento with the Internet Archive ID
-            internet_archive.update_memento_with_ia_url(memento_id, result)
-            
-            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                return jsonify({
-                    "success": True, 
-                    "message": "Successfully submitted to the Internet Archive.", 
-                    "archived_url": result
-                })
-            
-            flash("Successfully submitted to the Internet Archive.", "success")
-        else:
-            if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
-                return jsonify({"success": False, "message": f"Failed to submit: {result}"}), 500
-            
-            flash(f"Failed to submit to Internet Archive: {result}", "danger")
-        
-        return redirect(url_for('archives.view_archive', archived_website_id=memento['archived_website_id']))
-    
+            return redirect(back)
+
+        if not internet_archive.is_enabled():
+            if is_ajax:
+                return jsonify({"success": False, "message": "Internet Archive integration is disabled"}), 409
+            flash("Internet Archive integration is disabled.", "danger")
+            return redirect(back)
+
+        job = internet_archive.submission_queue.enqueue(memento['uri_r'], memento_id)
+        message = "Queued for submission to the Internet Archive."
+        if is_ajax:
+            return jsonify({
+                "success": True,
+                "queued": True,
+                "message": message,
+                "job_id": job['id'],
+                "status_url": url_for('archives.internet_archive_job', job_id=job['id']),
+            }), 202
+        flash(message, "info")
+        return redirect(back)
+
     except Exception as e:
         logging.error(f"Error submitting to Internet Archive: {e}")
         
-        if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        if is_ajax:
             return jsonify({"success": False, "message": f"Error: {str(e)}"}), 500
         
         flash(f"Error submitting to Internet Archive: {str(e)}", "danger")
         return redirect(url_for('archives.list_archives'))
 
+@archives_bp.route("/api/internet-archive/jobs/<int:job_id>", methods=["GET"])
+def internet_archive_job(job_id):
+    """Poll a queued Internet Archive submission."""
+    job = database.get_ia_job(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job)
+
+@archives_bp.route("/api/internet-archive/batches", methods=["POST"])
+def submit_internet_archive_batch():
+    """Queue every page of a journey, or every archive matching a filter, as one batch."""
+    params = request.get_json(silent=True) or request.form
+    if not internet_archive.is_enabled():
+        return jsonify({"error": "Internet Archive integration is disabled"}), 409
+    try:
+        journey_id, persona_id = (int(params[key]) if params.get(key) not in (None, '') else None
+                                  for key in ('journey_id', 'persona_id'))
+    except (TypeError, ValueError):
+        return jsonify({"error": "journey_id and persona_id must be integers"}), 400
+    try:
+        since, until = (datetime.fromisoformat(str(params[key])) if params.get(key) else None
+                        for key in ('since', 'until'))
+    except ValueError:
+        return jsonify({"error": "since and until must be ISO 8601 dates"}), 400
+    url_contains = params.get('url_contains') or None
+    skip_recent = str(params.get('skip_recent', 'true')).lower() not in ('0', 'false', 'no', 'off')
+
+    if journey_id is not None:
+        rows = internet_archive.journey_targets(journey_id)
+        if rows is None:
+            return jsonify({"error": "Journey not found"}), 404
+        label = f"journey {journey_id}"
+    elif any(value is not None for value in (url_contains, persona_id, since, until)):
+        rows = internet_archive.filter_targets(url_contains, persona_id, since, until)
+        label = ", ".join(f"{key}={value}" for key, value in
+                          (("url_contains", url_contains), ("persona_id", persona_id),
+                           ("since", since), ("until", until)) if value is not None)
+    else:
+        return jsonify({"error": "Give a journey_id or at least one of url_contains, persona_id, since, until"}), 400
+
+    result = internet_archive.submission_queue.submit_batch(label, rows, check_availability=skip_recent)
+    result["status_url"] = url_for('archives.internet_archive_batch', batch_id=result["batch_id"])
+    return jsonify(result), 202
+
+@archives_bp.route("/api/internet-archive/batches/<int:batch_id>", methods=["GET"])
+def internet_archive_batch(batch_id):
+    """Poll a bulk Internet Archive submission."""
+    batch = database.get_ia_batch(batch_id)
+    if not batch:
+        return jsonify({"error": "Batch not found"}), 404
+    return jsonify(batch)
+
 @archives_bp.route("/settings", methods=["GET", "POST"])
 def settings():
     """Manage archive settings."""
     if request.method == "POST":
         # Update settings
         ia_enabled = request.form.get('internet_archive_enabled', 'false') == 'on'
-        ia_rate_limit = request.form.get('internet_archive_rate_limit', '10')
+        ia_rate_limit = request.form.get('internet_archive_rate_per_hour', '10')
         
         # Validate rate limit
         try:
@@ -156,35 +366,70 @@ def settings():
         
         # Save settings
         database.set_setting('internet_archive_enabled', 'true' if ia_enabled else 'false')
-        database.set_setting('internet_archive_rate_limit', str(rate_limit))
+        database.set_setting('internet_archive_rate_per_hour', str(rate_limit))
         
         flash("Settings updated successfully.", "success")
     
     # Get current settings
     settings = {
         'internet_archive_enabled': database.get_setting('internet_archive_enabled', 'true') == 'true',
-        'internet_archive_rate_limit': int(database.get_setting('internet_archive_rate_limit', '10')),
-        'internet_archive_submissions_today': int(database.get_setting('internet_archive_submissions_today', '0'))
+        'internet_archive_rate_per_hour': int(database.get_setting('internet_archive_rate_per_hour', '10')),
+        'internet_archive_jobs': database.get_ia_job_counts(),
     }
     
     return render_template("archive_settings.html", settings=settings)
 
+@archives_bp.route("/api/archives/compress", methods=["GET", "POST"])
+@login_required
+def compress_archives():
+    """Start (POST) or poll (GET) the background job that gzips plain-HTML mementos."""
+    if request.method == "POST":
+        started = memento_content.compression_job.start()
+        return jsonify({"started": started, **memento_content.compression_job.status()}), 202 if started else 409
+    return jsonify(memento_content.compression_job.status())
+
+@archives_bp.route("/api/archives/gc", methods=["GET", "POST"])
+@login_required
+def collect_archive_garbage():
+    """Start (POST) or poll (GET) the archive GC (retention, orphans, quota).
+
+    POST accepts ``dry_run`` and per-run overrides of the configured policy:
+    ``keep_last``, ``max_age_days``, ``quota_mb`` and ``orphans``.
+    """
+    if request.method == "POST":
+        params = request.get_json(silent=True) or request.form
+        policy = {}
+        try:
+            for key in ('keep_last', 'max_age_days'):
+                if params.get(key) is not None:
+                    policy[key] = int(params[key])
+            if params.get('quota_mb') is not None:
+                policy['quota_bytes'] = int(params['quota_mb']) * 1024 * 1024
+        except (TypeError, ValueError):
+            return jsonify({"error": "keep_last, max_age_days and quota_mb must be integers"}), 400
+        if params.get('orphans') is not None:
+            policy['orphans'] = str(params['orphans']).lower() in ('1', 'true')
+        dry_run = str(params.get('dry_run', 'false')).lower() in ('1', 'true')
+        started = archive_gc.archive_gc.start(dry_run=dry_run, policy=policy)
+        return jsonify({"started": started, **archive_gc.archive_gc.status()}), 202 if started else 409
+    return jsonify(archive_gc.archive_gc.status())
+
 @archives_bp.route("/api/internet-archive-status", methods=["GET"])
 def get_internet_archive_status():
     """API endpoint to get Internet Archive status information."""
-    # Reset counter if it's a new day
-    internet_archive.reset_rate_limit_if_needed()
-    
-    # Get current values
-    submissions_today = int(database.get_setting('internet_archive_submissions_today', '0'))
-    rate_limit = int(database.get_setting('internet_archive_rate_limit', '10'))
-    enabled = database.get_setting('internet_archive_enabled', 'true') == 'true'
-    can_submit = enabled and submissions_today < rate_limit
-    
+    return jsonify(internet_archive.submission_queue.status())
+
+@archives_bp.route("/api/capture-timings", methods=["GET"])
+def get_capture_timings():
+    """API endpoint to get per-phase capture latency percentiles (milliseconds)."""
+    from utils.capture_timing import PHASES, capture_stats
+
+    summary = capture_stats.summary()
+    # Pipeline phases first, then totals (overall and per capture path).
+    ordered = {name: summary[name] for name in PHASES if name in summary}
+    ordered.update({name: stats for name, stats in sorted(summary.items()) if name not in ordered})
+
     return jsonify({
-        'enabled': enabled,
-        'submissions_today': submissions_today,
-        'rate_limit': rate_limit,
-        'can_submit': can_submit,
-        'remaining': max(0, rate_limit - submissions_today)
+        'captures': capture_stats.captures,
+        'phases': ordered,
     })
@@ -0,0 +1,36 @@
+from flask import Blueprint, abort, request, send_file
+from flask_login import login_required
+
+from utils import artifacts
+
+artifacts_bp = Blueprint('artifacts', __name__)
+
+# Media artifact paths embed their capture timestamp and are never rewritten,
+# so browsers may cache them for a year without revalidating.
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+@artifacts_bp.route("/artifacts/<path:artifact_path>")
+@login_required
+def serve_artifact(artifact_path):
+    """Serve a stored screenshot/artifact, or one of its thumbnails with ?size=sm|md."""
+    path = artifacts.resolve_artifact(artifact_path)
+    if path is None:
+        abort(404)
+
+    size = request.args.get('size')
+    if size:
+        path = artifacts.ensure_thumbnail(path, size)
+        if path is None:
+            abort(404)
+
+    if artifacts.is_immutable(path):
+        response = send_file(path, conditional=True, max_age=IMMUTABLE_MAX_AGE)
+        response.cache_control.immutable = True
+    else:
+        response = send_file(path, conditional=True)
+        response.cache_control.no_store = True
+    response.cache_control.private = True
+    response.cache_control.public = False
+    response.headers['X-Content-Type-Options'] = 'nosniff'
+    return response
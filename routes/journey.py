@@ -5,6 +5,7 @@ import logging
 import os
 from datetime import datetime
 import base64
+from utils import artifacts
 
 journey_bp = Blueprint('journey', __name__)
 
@@ -213,6 +214,7 @@ def add_waypoint(journey_id):
             # Save the screenshot
             with open(screenshot_path, 'wb') as f:
                 f.write(screenshot_bytes)
+            artifacts.make_thumbnails(screenshot_path, screenshot_bytes)
         
         # Collect additional metadata
         metadata = {
@@ -438,6 +440,7 @@ def save_page_as_waypoint(persona_id):
             # Save the screenshot
             with open(screenshot_path, 'wb') as f:
                 f.write(screenshot_bytes)
+            artifacts.make_thumbnails(screenshot_path, screenshot_bytes)
         
         # Collect additional metadata
         metadata = {
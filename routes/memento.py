@@ -0,0 +1,228 @@
+"""
+Memento protocol (RFC 7089) TimeGates and TimeMaps.
+
+The URI-R is the rest of the path, e.g. ``/timegate/https://example.com/a``;
+its own query string travels in the request's query string. Prefixing it
+with ``persona/<id>/`` restricts negotiation to captures made as that persona.
+
+Datetime negotiation is two ``LIMIT 1`` seeks per archived website on the
+(archived_website_id, memento_datetime) index, so it costs the same for a URI
+with ten captures or a million. TimeMaps are streamed one keyset-paginated
+page at a time; the ``next`` link at the end of a page resumes after its last
+memento. Its cursor is that memento's ``<YYYYMMDDhhmmss[ffffff]>-<id>``, so
+the link keeps working after the memento itself is deleted.
+"""
+import json
+import re
+from datetime import datetime
+
+from flask import Blueprint, Response, abort, request, stream_with_context, url_for
+
+import database
+from utils import memento_protocol
+
+memento_bp = Blueprint('memento', __name__)
+
+TIMEMAP_PAGE_SIZE = 1000
+TIMEMAP_BATCH_SIZE = 500
+TIMEMAP_MIMETYPES = {'link': 'application/link-format', 'json': 'application/json'}
+
+
+def _uri_r(path_uri):
+    """Rebuild the URI-R from the path segment and the request's query string."""
+    query = request.query_string.decode('utf-8', errors='replace')
+    return f"{path_uri}?{query}" if query else path_uri
+
+
+def _website_ids(uri_r, persona_id):
+    """Archived websites for the URI-R, tolerating a missing/extra trailing slash."""
+    alternate = uri_r[:-1] if uri_r.endswith('/') else uri_r + '/'
+    return database.get_archived_website_ids([uri_r, alternate], persona_id)
+
+
+def memento_uri(memento):
+    """Absolute URI-M of a memento (its raw archived content)."""
+    return url_for('archives.memento_content_raw', archived_website_id=memento['archived_website_id'],
+                   memento_id=memento['id'], _external=True)
+
+
+def timegate_uri(uri_r, persona_id=None):
+    return url_for('memento.timegate', uri_r=uri_r, persona_id=persona_id, _external=True)
+
+
+def timemap_uri(uri_r, persona_id=None, fmt='link', after=None):
+    """TimeMap URI; ``after`` is the memento row a page resumes after."""
+    return _timemap_page_uri(uri_r, persona_id, fmt, _cursor(after) if after else None)
+
+
+def _timemap_page_uri(uri_r, persona_id, fmt, cursor):
+    return url_for('memento.timemap', fmt=fmt, uri_r=uri_r, persona_id=persona_id,
+                   cursor=cursor, _external=True)
+
+
+_CURSOR = re.compile(r"^(\d{14}(?:\d{6})?)-(\d+)$")
+
+
+def _cursor(memento):
+    """Encode a memento's (memento_datetime, id) keyset position for a URL."""
+    when = memento_protocol.to_datetime(memento['memento_datetime'])
+    stamp = when.strftime('%Y%m%d%H%M%S%f' if when.microsecond else '%Y%m%d%H%M%S')
+    return f"{stamp}-{memento['id']}"
+
+
+def _parse_cursor(cursor):
+    """Decode a cursor into (memento_datetime, id); None if malformed."""
+    match = _CURSOR.match(cursor)
+    if not match:
+        return None
+    stamp, memento_id = match.groups()
+    try:
+        when = datetime.strptime(stamp, '%Y%m%d%H%M%S%f' if len(stamp) > 14 else '%Y%m%d%H%M%S')
+    except ValueError:
+        return None
+    return when, int(memento_id)
+
+
+def _nearest(website_ids, when):
+    """The memento closest to ``when``; ties go to the earlier capture."""
+    before = database.seek_memento(website_ids, 'le', when)
+    after = database.seek_memento(website_ids, 'ge', when)
+    if before is None or after is None:
+        return before or after
+    distance_before = when - memento_protocol.to_datetime(before['memento_datetime'])
+    distance_after = memento_protocol.to_datetime(after['memento_datetime']) - when
+    return before if distance_before <= distance_after else after
+
+
+@memento_bp.route("/timegate/<path:uri_r>", defaults={'persona_id': None}, merge_slashes=False)
+@memento_bp.route("/timegate/persona/<int:persona_id>/<path:uri_r>", merge_slashes=False)
+def timegate(uri_r, persona_id):
+    """Redirect to the memento closest to Accept-Datetime (the latest one without it)."""
+    uri_r = _uri_r(uri_r)
+    website_ids = _website_ids(uri_r, persona_id)
+    if not website_ids:
+        abort(404)
+
+    header = request.headers.get('Accept-Datetime')
+    if header:
+        when = memento_protocol.parse_accept_datetime(header)
+        if when is None:
+            return Response("Malformed Accept-Datetime header\n", status=400, mimetype='text/plain')
+        selected = _nearest(website_ids, when)
+    else:
+        selected = database.seek_memento(website_ids, 'last')
+    if selected is None:
+        abort(404)
+
+    selected_at = memento_protocol.to_datetime(selected['memento_datetime'])
+    rels = memento_protocol.memento_rels([
+        ('first memento', database.seek_memento(website_ids, 'first')),
+        ('last memento', database.seek_memento(website_ids, 'last')),
+        ('prev memento', database.seek_memento(website_ids, 'lt', selected_at)),
+        ('next memento', database.seek_memento(website_ids, 'gt', selected_at)),
+        ('memento', selected),
+    ])
+    links = [
+        memento_protocol.link_value(uri_r, 'original'),
+        memento_protocol.link_value(timemap_uri(uri_r, persona_id), 'timemap',
+                                    type=TIMEMAP_MIMETYPES['link']),
+    ]
+    links.extend(memento_protocol.memento_link(memento_uri(memento), rel, memento['memento_datetime'])
+                 for rel, memento in rels)
+
+    response = Response(status=302)
+    response.headers['Location'] = memento_uri(selected)
+    response.headers['Vary'] = 'accept-datetime'
+    response.headers['Link'] = ", ".join(links)
+    return response
+
+
+def _position(memento):
+    return memento['memento_datetime'], memento['id']
+
+
+def _timemap_rows(website_ids, after):
+    """Yield one page of mementos in (memento_datetime, id) order, a batch at a time."""
+    remaining = TIMEMAP_PAGE_SIZE
+    while remaining > 0:
+        limit = min(TIMEMAP_BATCH_SIZE, remaining)
+        batch = database.get_timemap_page(website_ids, after, limit)
+        yield from batch
+        if len(batch) < limit:
+            return
+        remaining -= limit
+        after = _position(batch[-1])
+
+
+def _timemap_link(uri_r, persona_id, cursor, website_ids, first, last):
+    after = _parse_cursor(cursor) if cursor else None
+    yield ",\n".join([
+        memento_protocol.link_value(uri_r, 'original'),
+        memento_protocol.link_value(_timemap_page_uri(uri_r, persona_id, 'link', cursor), 'self',
+                                    type=TIMEMAP_MIMETYPES['link']),
+        memento_protocol.link_value(timegate_uri(uri_r, persona_id), 'timegate'),
+    ])
+    last_row, count = None, 0
+    for memento in _timemap_rows(website_ids, after):
+        rel = " ".join([token for token, edge in (('first', first), ('last', last))
+                        if memento['id'] == edge['id']] + ['memento'])
+        yield ",\n" + memento_protocol.memento_link(memento_uri(memento), rel, memento['memento_datetime'])
+        last_row, count = memento, count + 1
+    if count == TIMEMAP_PAGE_SIZE and database.get_timemap_page(website_ids, _position(last_row), 1):
+        yield ",\n" + memento_protocol.link_value(
+            timemap_uri(uri_r, persona_id, 'link', last_row), 'next',
+            type=TIMEMAP_MIMETYPES['link'])
+    yield "\n"
+
+
+def _timemap_json(uri_r, persona_id, cursor, website_ids, first, last):
+    after = _parse_cursor(cursor) if cursor else None
+
+    def entry(memento):
+        return {"datetime": memento_protocol.format_iso_datetime(memento['memento_datetime']),
+                "uri": memento_uri(memento)}
+
+    head = json.dumps({
+        "original_uri": uri_r,
+        "self": _timemap_page_uri(uri_r, persona_id, 'json', cursor),
+        "timegate_uri": timegate_uri(uri_r, persona_id),
+        "timemap_uri": {"link_format": timemap_uri(uri_r, persona_id, 'link'),
+                        "json_format": timemap_uri(uri_r, persona_id, 'json')},
+    })
+    # Open the object and its mementos list; entries follow as they are read.
+    yield head[:-1] + ', "mementos": {"first": ' + json.dumps(entry(first)) + \
+        ', "last": ' + json.dumps(entry(last)) + ', "list": ['
+    last_row, count = None, 0
+    for memento in _timemap_rows(website_ids, after):
+        yield (", " if count else "") + json.dumps(entry(memento))
+        last_row, count = memento, count + 1
+    next_uri = None
+    if count == TIMEMAP_PAGE_SIZE and database.get_timemap_page(website_ids, _position(last_row), 1):
+        next_uri = timemap_uri(uri_r, persona_id, 'json', last_row)
+    yield "]}, " + '"next": ' + json.dumps(next_uri) + "}\n"
+
+
+_TIMEMAP_WRITERS = {'link': _timemap_link, 'json': _timemap_json}
+
+
+@memento_bp.route("/timemap/<any(link, json):fmt>/<path:uri_r>",
+                  defaults={'persona_id': None, 'cursor': None}, merge_slashes=False)
+@memento_bp.route("/timemap/<any(link, json):fmt>/persona/<int:persona_id>/<path:uri_r>",
+                  defaults={'cursor': None}, merge_slashes=False)
+@memento_bp.route("/timemap/<any(link, json):fmt>/after/<cursor>/<path:uri_r>",
+                  defaults={'persona_id': None}, merge_slashes=False)
+@memento_bp.route("/timemap/<any(link, json):fmt>/persona/<int:persona_id>/after/<cursor>/<path:uri_r>",
+                  merge_slashes=False)
+def timemap(fmt, uri_r, persona_id, cursor):
+    """Stream a page of the URI-R's TimeMap as link-format or JSON."""
+    if cursor is not None and _parse_cursor(cursor) is None:
+        abort(404)
+    uri_r = _uri_r(uri_r)
+    website_ids = _website_ids(uri_r, persona_id)
+    first = database.seek_memento(website_ids, 'first') if website_ids else None
+    if first is None:
+        abort(404)
+    last = database.seek_memento(website_ids, 'last')
+
+    body = _TIMEMAP_WRITERS[fmt](uri_r, persona_id, cursor, website_ids, first, last)
+    return Response(stream_with_context(body), mimetype=TIMEMAP_MIMETYPES[fmt])
@@ -10,6 +10,9 @@ from .context import (
     flatten_persona_context,
     persona_context_to_system_prompt,
 )
+from .html_diff import HtmlDiffService, html_diff_service
+from .tokens import ContextBudget, ContextOverflowError, count_tokens, history_to_messages
+from .panel import PanelChat
 
 __all__ = [
     "PersonaAttributeService",
@@ -20,4 +23,11 @@ __all__ = [
     "fetch_persona_context",
     "flatten_persona_context",
     "persona_context_to_system_prompt",
+    "HtmlDiffService",
+    "html_diff_service",
+    "ContextBudget",
+    "ContextOverflowError",
+    "count_tokens",
+    "history_to_messages",
+    "PanelChat",
 ]
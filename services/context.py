@@ -1,29 +1,25 @@
 import logging
 from abc import ABC, abstractmethod
-import tiktoken  # For token counting
-from config import LLM_MAX_OUTPUT_TOKENS
+
+from .tokens import ContextBudget, count_tokens
 
 logger = logging.getLogger(__name__)
 
 # Context management system
 class ContextProvider(ABC):
     """Base interface for context providers"""
+
+    # Stable context (the same on every turn) is laid out before volatile
+    # context so providers' KV/prompt caches can reuse the common prefix.
+    stable = True
     
     @abstractmethod
     def get_context(self, **kwargs):
         """Return context as formatted text"""
         
-    def get_token_estimate(self, text):
-        """Estimate tokens used by text"""
-        try:
-            # Use cl100k_base encoding which is close to what Claude uses
-            encoding = tiktoken.get_encoding("cl100k_base")
-            tokens = len(encoding.encode(text))
-            return tokens
-        except Exception as e:
-            logger.warning(f"Error estimating tokens: {e}")
-            # Fallback: rough estimate based on whitespace-split words × 1.3
-            return int(len(text.split()) * 1.3)
+    def get_token_estimate(self, text, model=None):
+        """Estimate tokens used by text (cached tokenizer, memoized counts)"""
+        return count_tokens(text, model)
 
 class PersonaContextProvider(ContextProvider):
     """Provides persona context"""
@@ -46,6 +42,9 @@ class PersonaContextProvider(ContextProvider):
             
 class JourneyContextProvider(ContextProvider):
     """Provides journey context"""
+
+    # Waypoints change as the journey grows
+    stable = False
     
     def get_context(self, journey_id=None, **kwargs):
         """Get formatted journey context"""
@@ -96,44 +95,54 @@ class JourneyContextProvider(ContextProvider):
 class ContextManager:
     """Manages multiple context providers and handles token limits"""
     
-    def __init__(self, max_tokens=LLM_MAX_OUTPUT_TOKENS):
+    def __init__(self, max_tokens=None, model=None):
         self.providers = []
-        self.max_tokens = max_tokens
+        self.model = model
+        # Default to the model's input budget (context window minus reserved output)
+        self.max_tokens = max_tokens if max_tokens is not None else ContextBudget(model).input_tokens
         
     def add_provider(self, provider):
         self.providers.append(provider)
         
-    def get_combined_context(self, **kwargs):
-        """Get combined context from all providers, respecting token limits"""
-        contexts = []
+    def get_context_blocks(self, **kwargs):
+        """
+        Get provider contexts as [stable, volatile] prompt blocks (empty ones
+        omitted), respecting token limits.
+
+        Stable providers and the mode instruction come first, in a fixed
+        order, so the prompt prefix is byte-identical from turn to turn.
+        """
+        stable, volatile = [], []
         total_tokens = 0
         
-        for provider in self.providers:
+        for provider in sorted(self.providers, key=lambda p: not p.stable):
             context = provider.get_context(**kwargs)
             if not context:
                 continue
                 
-            token_estimate = provider.get_token_estimate(context)
+            token_estimate = provider.get_token_estimate(context, self.model)
             
             # If adding this context would exceed our limit, skip it
             if total_tokens + token_estimate > self.max_tokens:
                 logger.warning(f"Skipping context from {provider.__class__.__name__} due to token limits")
                 continue
                 
-            contexts.append(context)
+            (stable if provider.stable else volatile).append(context)
             total_tokens += token_estimate
-            
-        # Combine all contexts
-        combined = "\n\n".join(contexts)
         
-        # If we have a conversation mode specified, add a clear instruction at the end
+        # If we have a conversation mode specified, add a clear instruction
+        # after the stable context
         mode = kwargs.get("mode")
         if mode == "with":
-            combined += "\n\nYou are the persona described above. Respond to the user's messages accordingly."
+            stable.append("You are the persona described above. Respond to the user's messages accordingly.")
         elif mode == "as":
-            combined += "\n\nThe user is roleplaying as the persona described above. You are responding to them, not as the persona."
+            stable.append("The user is roleplaying as the persona described above. You are responding to them, not as the persona.")
         
-        return combined
+        return [block for block in ("\n\n".join(stable), "\n\n".join(volatile)) if block]
+
+    def get_combined_context(self, **kwargs):
+        """Get combined context from all providers, respecting token limits"""
+        return "\n\n".join(self.get_context_blocks(**kwargs))
 
 
 def fetch_persona_context(persona_id):
@@ -164,7 +173,8 @@ def persona_context_to_system_prompt(persona_context, mode="with"):
     for section, fields in persona_context.items():
         if fields:
             lines.append(f"{section}:")
-            for key, value in fields.items():
+            # Sorted so the prompt is identical however the persona JSON was ordered
+            for key, value in sorted(fields.items()):
                 if value:
                     lines.append(f"- {key.replace('_', ' ').title()}: {value}")
     if mode == "with":
@@ -0,0 +1,288 @@
+"""
+Structural HTML diff between mementos.
+
+Instead of running difflib over whole documents, each memento is tokenized
+once into a flat list of DOM *blocks*:
+
+* leaf block-level elements (paragraphs, headings, list items, cells, ...),
+  with whitespace-normalized text;
+* direct text of container elements;
+* ad slots (iframes, ``<ins>``, elements whose id/class looks like an ad),
+  reduced to a signature (tag, id, classes, iframe host).
+
+Each block is hashed. The two documents are aligned on their hash sequences,
+which is cheap because there are thousands of blocks rather than millions of
+characters. Only replaced blocks get a word-level diff.
+
+Token lists are cached per memento: in process (LRU) and as ``blocks.json``
+in the memento dir. Comparing many captures against one baseline therefore
+tokenizes the baseline once.
+"""
+import difflib
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from bs4 import BeautifulSoup, NavigableString, Tag
+
+logger = logging.getLogger(__name__)
+
+# Bump when tokenization changes so persisted blocks.json files are rebuilt.
+TOKENIZER_VERSION = 1
+CACHE_FILENAME = "blocks.json"
+
+try:
+    import lxml  # noqa: F401
+    _PARSER = "lxml"
+except ImportError:
+    _PARSER = "html.parser"
+
+BLOCK_TAGS = {
+    "address", "article", "aside", "blockquote", "caption", "dd", "details", "div",
+    "dl", "dt", "fieldset", "figcaption", "figure", "footer", "form", "h1", "h2",
+    "h3", "h4", "h5", "h6", "header", "li", "main", "nav", "ol", "p", "pre",
+    "section", "summary", "table", "tbody", "td", "tfoot", "th", "thead", "tr", "ul",
+}
+SKIP_TAGS = {"script", "style", "noscript", "template", "svg", "head", "meta", "link"}
+AD_TAGS = {"iframe", "ins"}
+_AD_TOKEN = re.compile(
+    r"(?:^|[-_\s])(?:ad|ads|adslot|adunit|advert|advertisement|dfp|gpt|sponsor|sponsored|promoted)(?:[-_\s]|\d|$)",
+    re.IGNORECASE,
+)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def _block_hash(kind: str, text: str) -> str:
+    return hashlib.sha1(f"{kind}\0{text}".encode("utf-8")).hexdigest()[:16]
+
+
+def _is_ad(tag: Tag) -> bool:
+    if tag.name in AD_TAGS:
+        return True
+    ident = " ".join([tag.get("id") or ""] + list(tag.get("class") or []))
+    return bool(ident.strip()) and bool(_AD_TOKEN.search(ident))
+
+
+def _ad_signature(tag: Tag) -> str:
+    parts = [tag.name]
+    if tag.get("id"):
+        parts.append(f"#{tag['id']}")
+    parts.extend(f".{cls}" for cls in tag.get("class") or [])
+    src = tag.get("src") or tag.get("data-src")
+    if src:
+        host = re.sub(r"^(?:https?:)?//", "", src).split("/", 1)[0]
+        parts.append(f"@{host}")
+    return "".join(parts)
+
+
+def _path(tag: Tag) -> str:
+    label = tag.name
+    if tag.get("id"):
+        label += f"#{tag['id']}"
+    elif tag.get("class"):
+        label += "." + ".".join(tag["class"][:2])
+    return label
+
+
+def tokenize(html: str) -> List[Dict[str, str]]:
+    """Split an HTML document into ``[{kind, path, text, hash}]`` blocks.
+
+    Blocks follow document order, except that a container's loose inline text
+    is emitted after its nested blocks.
+    """
+    soup = BeautifulSoup(html, _PARSER)
+    root = soup.body or soup
+    blocks: List[Dict[str, str]] = []
+
+    def emit(kind: str, tag: Tag, text: str) -> None:
+        if text:
+            blocks.append({"kind": kind, "path": _path(tag), "text": text,
+                           "hash": _block_hash(kind, text)})
+
+    def walk(node: Tag) -> bool:
+        """Emit node's blocks; returns True if it contained any block-level element."""
+        has_block = False
+        direct_text = []
+        for child in node.children:
+            if isinstance(child, NavigableString):
+                if type(child) is NavigableString:
+                    direct_text.append(str(child))
+                continue
+            if not isinstance(child, Tag) or child.name in SKIP_TAGS:
+                continue
+            if _is_ad(child):
+                emit("ad", child, _ad_signature(child))
+                has_block = True
+                continue
+            if child.name in BLOCK_TAGS:
+                has_block = True
+                if not walk(child):
+                    emit("text", child, _normalize(child.get_text(" ")))
+            elif walk(child):
+                has_block = True
+            else:
+                direct_text.append(child.get_text(" "))
+        if has_block:
+            # Inline text sitting between nested blocks becomes its own block.
+            emit("text", node, _normalize(" ".join(direct_text)))
+        return has_block
+
+    if not walk(root):
+        emit("text", root, _normalize(root.get_text(" ")))
+    return blocks
+
+
+def _word_diff(a: str, b: str) -> List[List[str]]:
+    """Word-level ``[[op, text], ...]`` with op in equal/insert/delete."""
+    words_a, words_b = a.split(), b.split()
+    ops = []
+    matcher = difflib.SequenceMatcher(None, words_a, words_b, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append(["equal", " ".join(words_a[i1:i2])])
+            continue
+        if i2 > i1:
+            ops.append(["delete", " ".join(words_a[i1:i2])])
+        if j2 > j1:
+            ops.append(["insert", " ".join(words_b[j1:j2])])
+    return ops
+
+
+def diff_blocks(blocks_a: List[Dict[str, str]], blocks_b: List[Dict[str, str]],
+                limit: int = 200) -> Dict[str, Any]:
+    """Align two block lists by hash and describe the differences.
+
+    ``changes`` is capped at ``limit`` entries; ``stats`` always covers everything.
+    """
+    hashes_a = [block["hash"] for block in blocks_a]
+    hashes_b = [block["hash"] for block in blocks_b]
+    matcher = difflib.SequenceMatcher(None, hashes_a, hashes_b, autojunk=False)
+
+    stats = {"blocks_a": len(blocks_a), "blocks_b": len(blocks_b),
+             "equal": 0, "inserted": 0, "deleted": 0, "replaced": 0}
+    changes: List[Dict[str, Any]] = []
+
+    def add(change: Dict[str, Any]) -> None:
+        if len(changes) < limit:
+            changes.append(change)
+
+    def ref(block: Dict[str, str], index: int) -> Dict[str, Any]:
+        return {"index": index, "kind": block["kind"], "path": block["path"], "text": block["text"]}
+
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            stats["equal"] += i2 - i1
+            continue
+        # Within a changed region, pair blocks of the same kind (text with
+        # text, ad with ad); whatever is left over was inserted or deleted.
+        kinds = difflib.SequenceMatcher(None, [b["kind"] for b in blocks_a[i1:i2]],
+                                        [b["kind"] for b in blocks_b[j1:j2]], autojunk=False)
+        for kind_tag, ki1, ki2, kj1, kj2 in kinds.get_opcodes():
+            paired = min(ki2 - ki1, kj2 - kj1) if kind_tag == "equal" else 0
+            for k in range(paired):
+                i, j = i1 + ki1 + k, j1 + kj1 + k
+                a, b = blocks_a[i], blocks_b[j]
+                stats["replaced"] += 1
+                change = {"op": "replace", "a": ref(a, i), "b": ref(b, j)}
+                if a["kind"] == "text":
+                    change["words"] = _word_diff(a["text"], b["text"])
+                add(change)
+            for i in range(i1 + ki1 + paired, i1 + ki2):
+                stats["deleted"] += 1
+                add({"op": "delete", "a": ref(blocks_a[i], i)})
+            for j in range(j1 + kj1 + paired, j1 + kj2):
+                stats["inserted"] += 1
+                add({"op": "insert", "b": ref(blocks_b[j], j)})
+
+    total = max(len(blocks_a), len(blocks_b)) or 1
+    stats["similarity"] = round(stats["equal"] / total, 4)
+
+    ads_a = {block["text"] for block in blocks_a if block["kind"] == "ad"}
+    ads_b = {block["text"] for block in blocks_b if block["kind"] == "ad"}
+    return {
+        "stats": stats,
+        "changes": changes,
+        "truncated": sum(stats[k] for k in ("inserted", "deleted", "replaced")) > len(changes),
+        "ads": {"only_a": sorted(ads_a - ads_b), "only_b": sorted(ads_b - ads_a),
+                "common": len(ads_a & ads_b)},
+    }
+
+
+class HtmlDiffService:
+    """Tokenizes mementos (with caching) and diffs them."""
+
+    def __init__(self, max_cached: int = 64):
+        self.max_cached = max_cached
+        self._cache: "OrderedDict[int, List[Dict[str, str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load_cached(self, memento: Dict[str, Any]) -> Optional[List[Dict[str, str]]]:
+        with self._lock:
+            blocks = self._cache.get(memento["id"])
+            if blocks is not None:
+                self._cache.move_to_end(memento["id"])
+                return blocks
+        path = os.path.join(memento["memento_location"], CACHE_FILENAME)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return cached["blocks"] if cached.get("version") == TOKENIZER_VERSION else None
+
+    def _store(self, memento: Dict[str, Any], blocks: List[Dict[str, str]], persist: bool) -> None:
+        with self._lock:
+            self._cache[memento["id"]] = blocks
+            self._cache.move_to_end(memento["id"])
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+        if not persist or not os.path.isdir(memento["memento_location"]):
+            return
+        path = os.path.join(memento["memento_location"], CACHE_FILENAME)
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": TOKENIZER_VERSION, "blocks": blocks}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not persist HTML blocks for memento {memento['id']}: {e}")
+
+    def get_blocks(self, memento: Dict[str, Any]) -> Optional[List[Dict[str, str]]]:
+        """Return the memento's block list, tokenizing (and caching) on first use."""
+        blocks = self._load_cached(memento)
+        if blocks is not None:
+            self._store(memento, blocks, persist=False)
+            return blocks
+
+        from utils import memento_content
+
+        html = memento_content.read_memento_html(memento)
+        if html is None:
+            return None
+        blocks = tokenize(html.decode("utf-8", errors="replace"))
+        self._store(memento, blocks, persist=True)
+        return blocks
+
+    def diff(self, memento_a: Dict[str, Any], memento_b: Dict[str, Any],
+             limit: int = 200) -> Optional[Dict[str, Any]]:
+        """Diff two mementos; returns None if either has no stored HTML."""
+        blocks_a = self.get_blocks(memento_a)
+        blocks_b = self.get_blocks(memento_b)
+        if blocks_a is None or blocks_b is None:
+            return None
+        result = diff_blocks(blocks_a, blocks_b, limit=limit)
+        result["a"] = memento_a["id"]
+        result["b"] = memento_b["id"]
+        return result
+
+
+html_diff_service = HtmlDiffService()
@@ -0,0 +1,68 @@
+"""
+Panel chat: one question put to several personas at once.
+
+Each persona gets the same system prompt it would get in a standalone chat,
+and the LLM calls run concurrently, at most LLM_PANEL_CONCURRENCY at a time.
+Answers are yielded as they complete, so a server that batches concurrent
+requests (vLLM) answers the whole panel in about the time of one reply.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional
+
+from config import LLM_PANEL_CONCURRENCY
+
+from .context import ContextManager, JourneyContextProvider, PersonaContextProvider
+from .tokens import ContextBudget
+
+logger = logging.getLogger(__name__)
+
+
+class PanelChat:
+    """Fans one message out to a list of personas."""
+
+    def __init__(self, llm, model: Optional[str] = None, concurrency: int = LLM_PANEL_CONCURRENCY):
+        self.llm = llm
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self.budget = ContextBudget(model or llm.adapter.default_model)
+
+    def build_messages(self, persona_id: int, message: str, journey_id: Optional[int] = None,
+                       mode: str = "with") -> List[Dict[str, str]]:
+        """The persona's system prompt blocks followed by the message."""
+        ctx_manager = ContextManager(max_tokens=self.budget.input_tokens, model=self.budget.model)
+        ctx_manager.add_provider(PersonaContextProvider())
+        ctx_manager.add_provider(JourneyContextProvider())
+        blocks = ctx_manager.get_context_blocks(persona_id=persona_id, journey_id=journey_id, mode=mode)
+        return self.budget.pack(blocks, [], message)
+
+    def _answer(self, persona_id: int, message: str, journey_id: Optional[int], mode: str) -> Dict[str, Any]:
+        started = time.monotonic()
+        try:
+            response = self.llm.chat(self.build_messages(persona_id, message, journey_id, mode),
+                                     model_hint=self.model)
+            result = {"persona_id": persona_id, "success": True, "response": response,
+                      "provider": self.llm.served_by()}
+        except Exception as e:
+            logger.error(f"Panel answer for persona {persona_id} failed: {e}", exc_info=True)
+            result = {"persona_id": persona_id, "success": False, "error": str(e)}
+        result["elapsed_ms"] = int((time.monotonic() - started) * 1000)
+        return result
+
+    def answers(self, persona_ids: List[int], message: str, journey_id: Optional[int] = None,
+                mode: str = "with") -> Iterator[Dict[str, Any]]:
+        """
+        Yield one result per persona, in completion order. A failed call
+        yields ``success: False`` with the error rather than ending the panel.
+        Closing the iterator early cancels the calls that have not started.
+        """
+        executor = ThreadPoolExecutor(max_workers=min(self.concurrency, len(persona_ids)) or 1,
+                                      thread_name_prefix="panel")
+        try:
+            futures = [executor.submit(self._answer, persona_id, message, journey_id, mode)
+                       for persona_id in persona_ids]
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
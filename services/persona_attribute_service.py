@@ -6,7 +6,7 @@ from typing import Any, Dict, List, Optional
 
 from database.repositories.journey import JourneyRepository
 from database.repositories.persona import PersonaRepository
-from utils.llm_client import LLMClient
+from utils.llm_client import LLMClient, get_llm_client
 
 _EXTRACTED_FILE = Path(os.environ.get("DATA_DIR", "data")) / "chat_extracted.json"
 
@@ -89,7 +89,7 @@ class PersonaAttributeService:
         persona_repo: Optional[PersonaRepository] = None,
         journey_repo: Optional[JourneyRepository] = None,
     ):
-        self.llm_client = llm_client or LLMClient()
+        self.llm_client = llm_client or get_llm_client()
         self.persona_repo = persona_repo or PersonaRepository()
         self.journey_repo = journey_repo or JourneyRepository()
 
@@ -99,6 +99,22 @@ class PersonaAttributeService:
 
         Returns the persona ID if updates were applied, otherwise None.
         """
+        result = self.extract_waypoint(waypoint_id)
+        if not result:
+            return None
+        if not self.apply_extractions(result["persona_id"], [result["extraction"]]):
+            return None
+        logger.info("Persona %s updated from waypoint %s", result["persona_id"], waypoint_id)
+        return result["persona_id"]
+
+    def extract_waypoint(self, waypoint_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Run the LLM extraction for a saved conversation without touching the persona.
+
+        Returns ``{"persona_id", "extraction"}``, or None if the waypoint has no
+        linked persona or no conversation. Raises ValueError if the waypoint
+        does not exist.
+        """
         waypoint = self.journey_repo.get_waypoint(waypoint_id)
         if not waypoint:
             raise ValueError(f"Waypoint {waypoint_id} was not found")
@@ -120,16 +136,35 @@ class PersonaAttributeService:
             return None
 
         prompt = self._build_prompt(conversation, persona.get("name"))
-        extraction = self.llm_client.generate_structured(prompt, EXTRACTION_SCHEMA)
-        updates = self._prepare_updates(persona, extraction)
+        # Re-saving a conversation sends the same transcript again, so reuse
+        # the earlier extraction when there is one
+        extraction = self.llm_client.generate_structured(prompt, EXTRACTION_SCHEMA, cache=True)
+        return {"persona_id": persona["id"], "extraction": extraction}
 
-        if not updates:
-            logger.info("LLM returned no usable persona updates for waypoint %s", waypoint_id)
-            return None
+    def apply_extractions(self, persona_id: int, extractions: List[Dict[str, Any]]) -> bool:
+        """
+        Merge one or more extractions into a persona with a single save.
 
-        self.persona_repo.save(updates)
-        logger.info("Persona %s updated from waypoint %s", journey.get("persona_id"), waypoint_id)
-        return journey.get("persona_id")
+        The read, merge and save run in one database transaction that holds
+        the write lock, so concurrent extractions for one persona (from this
+        app or the batch CLI) cannot overwrite each other's updates.
+
+        Returns True if the persona was updated.
+        """
+        def merge(persona: Dict[str, Any]) -> Dict[str, Any]:
+            updates: Dict[str, Any] = {}
+            for extraction in extractions:
+                updates.update(self._prepare_updates({**persona, **updates}, extraction))
+            return updates
+
+        updates = self.persona_repo.update(persona_id, merge)
+        if updates is None:
+            logger.warning("Persona %s not found; dropping %d extractions", persona_id, len(extractions))
+            return False
+        if not updates:
+            logger.info("LLM returned no usable updates for persona %s", persona_id)
+            return False
+        return True
 
     @staticmethod
     def _collect_extracted_items(extraction: Dict[str, Any]) -> Dict[str, Dict[str, list]]:
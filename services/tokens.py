@@ -0,0 +1,217 @@
+"""
+Token counting and context-window budgeting for LLM prompts.
+
+Tokenizers are loaded once per model family, and counts are memoized by
+content hash, so re-sending a long chat history does not re-encode every
+message on each turn. ``ContextBudget`` packs the system prompt, the new
+message and as much of the newest history as fits into the model's input
+window (its context window minus the reserved output tokens). A prompt that
+cannot fit raises ``ContextOverflowError`` rather than being sent.
+"""
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from config import LLM_CONTEXT_WINDOW, LLM_MAX_OUTPUT_TOKENS
+
+logger = logging.getLogger(__name__)
+
+# (model name prefix, context window, tiktoken encoding). Claude, Qwen and
+# Llama use their own tokenizers; cl100k_base is a close enough stand-in for
+# budgeting. Unknown models get DEFAULT_CONTEXT_WINDOW.
+MODEL_FAMILIES: Tuple[Tuple[str, int, str], ...] = (
+    ("claude", 200000, "cl100k_base"),
+    ("gpt-4o", 128000, "o200k_base"),
+    ("gpt-4-turbo", 128000, "cl100k_base"),
+    ("gpt-4", 8192, "cl100k_base"),
+    ("gpt-3.5", 16385, "cl100k_base"),
+    ("qwen", 32768, "cl100k_base"),
+    ("llama", 131072, "cl100k_base"),
+)
+DEFAULT_CONTEXT_WINDOW = 8192
+DEFAULT_ENCODING = "cl100k_base"
+
+# Chat formats wrap each message in a few role/separator tokens, and the
+# reply is primed with a few more.
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 3
+# Room kept for recent chat turns when sizing the system context, so a large
+# persona prompt cannot crowd out the whole conversation.
+MIN_HISTORY_TOKENS = 1024
+
+
+class ContextOverflowError(ValueError):
+    """The system prompt and the new message alone exceed the input window."""
+
+
+def _family(model: Optional[str]) -> Optional[Tuple[str, int, str]]:
+    name = (model or "").lower().rsplit("/", 1)[-1]
+    for family in MODEL_FAMILIES:
+        if name.startswith(family[0]):
+            return family
+    return None
+
+
+def context_window(model: Optional[str] = None) -> int:
+    """The model's context window in tokens (LLM_CONTEXT_WINDOW overrides)."""
+    if LLM_CONTEXT_WINDOW:
+        return LLM_CONTEXT_WINDOW
+    family = _family(model)
+    return family[1] if family else DEFAULT_CONTEXT_WINDOW
+
+
+def encoding_name(model: Optional[str] = None) -> str:
+    family = _family(model)
+    return family[2] if family else DEFAULT_ENCODING
+
+
+@lru_cache(maxsize=None)
+def get_encoding(name: str):
+    """
+    Load a tiktoken encoding once per process; None if it is unavailable.
+
+    tiktoken downloads its BPE files on first use, so a failure (e.g. no
+    network) is cached too instead of being retried on every count.
+    """
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(name)
+    except Exception as e:
+        logger.warning(f"Tokenizer {name} unavailable, estimating token counts from word counts: {e}")
+        return None
+
+
+class TokenCounter:
+    """Thread-safe token counts, memoized by (encoding, content hash)."""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._counts: "OrderedDict[Tuple[str, bytes], int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def count(self, text: str, model: Optional[str] = None) -> int:
+        if not text:
+            return 0
+        name = encoding_name(model)
+        key = (name, hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest())
+        with self._lock:
+            tokens = self._counts.get(key)
+            if tokens is not None:
+                self._counts.move_to_end(key)
+                return tokens
+
+        encoding = get_encoding(name)
+        if encoding is not None:
+            tokens = len(encoding.encode(text, disallowed_special=()))
+        else:
+            # Fallback: rough estimate based on whitespace-split words × 1.3
+            tokens = int(len(text.split()) * 1.3)
+
+        with self._lock:
+            self._counts[key] = tokens
+            if len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return tokens
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counts.clear()
+
+
+token_counter = TokenCounter()
+
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    return token_counter.count(text, model)
+
+
+def message_tokens(message: Dict[str, Any], model: Optional[str] = None) -> int:
+    return count_tokens(message.get("content") or "", model) + MESSAGE_OVERHEAD_TOKENS
+
+
+class ContextBudget:
+    """Fits a chat request into a model's input window."""
+
+    def __init__(self, model: Optional[str] = None, window: Optional[int] = None,
+                 max_output_tokens: Optional[int] = None):
+        self.model = model
+        self.window = window or context_window(model)
+        self.max_output_tokens = max_output_tokens or LLM_MAX_OUTPUT_TOKENS
+
+    @property
+    def input_tokens(self) -> int:
+        """Tokens available for the prompt once the reply is reserved."""
+        return max(self.window - self.max_output_tokens - REPLY_PRIMING_TOKENS, 0)
+
+    def system_tokens(self, message: str, history: Optional[List[Dict[str, str]]] = None,
+                      blocks: int = 2) -> int:
+        """
+        Tokens left for ``blocks`` system prompt blocks once the new message
+        and up to MIN_HISTORY_TOKENS of the newest history are reserved.
+        """
+        reserved = 0
+        for entry in reversed(history or []):
+            if reserved >= MIN_HISTORY_TOKENS:
+                break
+            reserved += message_tokens(entry, self.model)
+        reserved = min(reserved, MIN_HISTORY_TOKENS)
+        reserved += message_tokens({"content": message}, self.model) + blocks * MESSAGE_OVERHEAD_TOKENS
+        return max(self.input_tokens - reserved, 0)
+
+    def pack(self, system_prompt: Union[str, Sequence[str], None], history: List[Dict[str, str]],
+             message: str) -> List[Dict[str, str]]:
+        """
+        Build the message list: system prompt, the newest history that fits,
+        then the new user message. Older turns are dropped first, and history
+        is never split, so the model sees a contiguous tail of the chat.
+
+        ``system_prompt`` may be a list of blocks (stable first, see
+        ``ContextManager.get_context_blocks``); each becomes its own system
+        message so adapters can place cache breakpoints between them. If the
+        blocks and the message overflow the window, the trailing (volatile)
+        blocks are dropped; if the first block and the message still do not
+        fit, ``ContextOverflowError`` is raised.
+        """
+        blocks = [system_prompt] if isinstance(system_prompt, str) else list(system_prompt or [])
+        head = [{"role": "system", "content": block} for block in blocks if block]
+        tail = [{"role": "user", "content": message}]
+        remaining = self.input_tokens - sum(message_tokens(m, self.model) for m in head + tail)
+        while remaining < 0 and len(head) > 1:
+            remaining += message_tokens(head.pop(), self.model)
+            logger.warning("Dropped a volatile system prompt block to fit the context window")
+        if remaining < 0:
+            raise ContextOverflowError(
+                f"Prompt exceeds the {self.input_tokens}-token input budget by {-remaining} tokens")
+
+        kept: List[Dict[str, str]] = []
+        for entry in reversed(history):
+            cost = message_tokens(entry, self.model)
+            if cost > remaining:
+                break
+            kept.append(entry)
+            remaining -= cost
+        if len(kept) < len(history):
+            logger.info(f"Dropped {len(history) - len(kept)} of {len(history)} history messages to fit the context window")
+        return head + kept[::-1] + tail
+
+
+def history_to_messages(history: Optional[List[Dict[str, Any]]]) -> List[Dict[str, str]]:
+    """Map saved chat history (agent/persona/target roles) to LLM chat messages."""
+    messages = []
+    for msg in history or []:
+        role = msg.get('role', '')
+        content = msg.get('content', '')
+
+        llm_role = 'user'
+        if role in ('agent', 'assistant', 'target'):
+            llm_role = 'assistant'
+        elif role in ('user', 'persona'):
+            llm_role = 'user'
+
+        if content and role:
+            messages.append({"role": llm_role, "content": content})
+    return messages
@@ -42,11 +42,13 @@ document.addEventListener('DOMContentLoaded', function () {
         messageContainer.scrollTop = messageContainer.scrollHeight;
 
         // Add to history
-        conversationHistory.push({
+        const entry = {
             sender: sender,
             message: message,
             timestamp: new Date().toISOString()
-        });
+        };
+        conversationHistory.push(entry);
+        return { paragraph: messagePara, entry: entry };
     }
 
     // Function to send message to agent
@@ -62,35 +64,35 @@ document.addEventListener('DOMContentLoaded', function () {
             console.log("Using model:", model);
             console.log("Using system prompt:", systemPrompt);
 
-            const response = await fetch(`/agent/message`, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'X-Requested-With': 'XMLHttpRequest'
+            // Render the reply token by token as it streams in
+            let reply = null;
+            let errorMsg = null;
+            await streamChat('/agent/message', {
+                message: message,
+                conversation_id: conversationId,
+                model: model,
+                system_prompt: systemPrompt
+            }, {
+                token: function (data) {
+                    if (!reply) {
+                        loadingIndicator.style.display = 'none';
+                        reply = addMessage('', 'agent');
+                    }
+                    reply.entry.message += data.text;
+                    reply.paragraph.innerText = reply.entry.message;
+                    messageContainer.scrollTop = messageContainer.scrollHeight;
                 },
-                body: JSON.stringify({
-                    message: message,
-                    conversation_id: conversationId,
-                    model: model,
-                    system_prompt: systemPrompt
-                })
+                done: function (data) {
+                    if (!reply) {
+                        reply = addMessage(data.response, 'agent');
+                    }
+                },
+                error: function (data) {
+                    errorMsg = data.error || "Unknown error occurred";
+                }
             });
 
-            console.log("Response status:", response.status);
-            
-            if (!response.ok) {
-                const errorText = await response.text();
-                console.error("Error response:", errorText);
-                throw new Error(`Failed to get response from agent: ${response.status} ${errorText}`);
-            }
-
-            const data = await response.json();
-            console.log("Response data:", data);
-
-            if (data.success) {
-                addMessage(data.response, 'agent');
-            } else {
-                const errorMsg = data.error || "Unknown error occurred";
+            if (errorMsg) {
                 console.error('Agent error:', errorMsg);
                 showError(errorMsg);
                 addMessage("I'm sorry, I encountered an error processing your request: " + errorMsg, 'agent');
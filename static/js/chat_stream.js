@@ -0,0 +1,51 @@
+/*
+ * Streams an agent reply from a chat endpoint as Server-Sent Events.
+ * EventSource can only GET, so the stream is read from a fetch() POST.
+ * handlers.token / handlers.done / handlers.error receive each event's JSON data.
+ */
+async function streamChat(url, payload, handlers) {
+    const response = await fetch(url, {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json',
+            'Accept': 'text/event-stream',
+            'X-Requested-With': 'XMLHttpRequest'
+        },
+        body: JSON.stringify(payload)
+    });
+
+    if (!response.ok) {
+        const errorText = await response.text();
+        throw new Error(`Failed to get response from agent: ${response.status} ${errorText}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            handleStreamEvent(buffer.slice(0, boundary), handlers);
+            buffer = buffer.slice(boundary + 2);
+        }
+    }
+}
+
+function handleStreamEvent(block, handlers) {
+    let event = 'message';
+    const data = [];
+    block.split('\n').forEach(line => {
+        if (line.startsWith('event:')) {
+            event = line.slice(6).trim();
+        } else if (line.startsWith('data:')) {
+            data.push(line.slice(5).trim());
+        }
+    });
+    if (handlers[event] && data.length) {
+        handlers[event](JSON.parse(data.join('\n')));
+    }
+}
@@ -0,0 +1,198 @@
+"""
+Tests for the archive garbage collector (utils/archive_gc.py): retention
+policies, the deleted-memento sweep, LRU quota eviction and blob reclamation.
+
+Mementos are laid out by hand in a temporary working directory (archives/
+and the blob store are cwd-relative), with the DB swapped for a temp file.
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from database import connection as db_connection
+from utils import url_index
+from utils.archive_gc import ArchiveGC
+from utils.blob_store import BlobStore
+
+
+class ArchiveGCTest(unittest.TestCase):
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.mkdtemp()
+        os.chdir(self._tmp)
+        self.original_db_path = db_connection.DEFAULT_DB_PATH
+        db_connection.DEFAULT_DB_PATH = os.path.join(self._tmp, "test.db")
+        db_connection._db_instance = None
+        database._archive_repo = None
+        database.init_db()
+
+        self.store = BlobStore()
+        self.gc = ArchiveGC(blob_store=self.store, grace_seconds=0)
+        self._seq = 0
+
+    def tearDown(self):
+        db_connection.DEFAULT_DB_PATH = self.original_db_path
+        db_connection._db_instance = None
+        database._archive_repo = None
+        os.chdir(self._cwd)
+        shutil.rmtree(self._tmp, ignore_errors=True)
+
+    def _capture(self, url, html, persona_id=None, save=True):
+        """Lay out one files-mode memento the way BrowserManager._write_memento does."""
+        self._seq += 1
+        url_dir = os.path.join("archives", hashlib.md5(url.encode()).hexdigest())
+        timestamp = f"20250101-0000{self._seq:02d}"
+        memento_dir = os.path.join(url_dir, timestamp)
+        os.makedirs(memento_dir)
+        html_blob = self.store.put_and_link(html, os.path.join(memento_dir, "content.html.gz"))
+        png_blob = self.store.put_and_link(b"PNG" + html[:16], os.path.join(memento_dir, "screenshot.png"))
+        with open(os.path.join(memento_dir, "screenshot.thumb-sm.jpg"), "wb") as f:
+            f.write(b"jpeg")
+        with open(os.path.join(memento_dir, "metadata.json"), "w") as f:
+            json.dump({"url": url, "timestamp": timestamp}, f)
+
+        memento_id = None
+        if save:
+            site = database.save_archived_website(url=url, persona_id=persona_id, archive_location=url_dir)
+            memento_id = database.save_memento(site, memento_dir, blobs={
+                "html": (html_blob.sha256, html_blob.size),
+                "screenshot": (png_blob.sha256, png_blob.size),
+            })
+        url_index.append_memento(url_dir, url, timestamp, memento_id=memento_id)
+        return memento_id, memento_dir
+
+    def test_deleted_website_files_and_blobs_are_reclaimed(self):
+        memento_id, memento_dir = self._capture("https://example.com/a", b"a" * 5000)
+        html_sha = database.get_memento_blobs(memento_id)["html"]
+        database.delete_archived_website(database.get_memento(memento_id)["archived_website_id"])
+
+        status = self.gc.run()
+        self.assertIsNone(status["error"])
+        self.assertEqual(status["orphan_dirs"], 1)
+        self.assertEqual(status["blobs_deleted"], 2)
+        self.assertGreaterEqual(status["bytes_reclaimed"], 5000)
+        self.assertFalse(os.path.exists(os.path.dirname(memento_dir)))
+        self.assertFalse(self.store.exists(html_sha))
+        self.assertNotIn(html_sha, database.get_blob_refcounts())
+
+    def test_standalone_captures_and_their_blobs_are_kept(self):
+        _, memento_dir = self._capture("https://example.com/cli", b"cli page", save=False)
+        status = self.gc.run()
+        self.assertEqual((status["orphan_dirs"], status["blobs_deleted"]), (0, 0))
+        self.assertTrue(os.path.exists(os.path.join(memento_dir, "content.html.gz")))
+
+    def test_dirs_without_rows_are_kept_unless_deleted(self):
+        # A legacy capture: metadata.json but no DB row and no memento_id in the index
+        legacy_dir = os.path.join("archives", hashlib.md5(b"https://example.com/legacy").hexdigest(), "20240101-000000")
+        os.makedirs(legacy_dir)
+        with open(os.path.join(legacy_dir, "metadata.json"), "w") as f:
+            json.dump({"url": "https://example.com/legacy", "persona_id": 3}, f)
+        with open(os.path.join(os.path.dirname(legacy_dir), "index.jsonl"), "w") as f:
+            f.write(json.dumps({"url": "https://example.com/legacy", "timestamp": "20240101-000000"}) + "\n")
+        # A lost or reset DB: the rows go without going through a delete
+        _, reset_dir = self._capture("https://example.com/a", b"page")
+        with db_connection.get_db().transaction() as cursor:
+            cursor.execute("DELETE FROM archived_websites")
+
+        status = self.gc.run()
+        self.assertEqual(status["orphan_dirs"], 0)
+        self.assertTrue(os.path.isfile(os.path.join(legacy_dir, "metadata.json")))
+        self.assertTrue(os.path.isfile(os.path.join(reset_dir, "content.html.gz")))
+
+    def test_orphans_are_removed_only_when_enabled(self):
+        self._capture("https://example.com/kept", b"registered")
+        # A capture that crashed before its DB write
+        _, orphan_dir = self._capture("https://example.com/a", b"crashed", save=False)
+        with open(os.path.join(os.path.dirname(orphan_dir), "index.jsonl"), "w") as f:
+            f.write(json.dumps({"url": "https://example.com/a", "timestamp": os.path.basename(orphan_dir)}) + "\n")
+
+        status = self.gc.run()
+        self.assertEqual((status["orphan_dirs"], status["unregistered_dirs"]), (0, 1))
+        self.assertTrue(os.path.isdir(orphan_dir))
+
+        self.assertEqual(ArchiveGC(blob_store=self.store).run(policy={"orphans": True})["orphan_dirs"], 0)
+        status = self.gc.run(policy={"orphans": True})
+        self.assertEqual(status["orphan_dirs"], 1)
+        self.assertFalse(os.path.exists(os.path.dirname(orphan_dir)))
+
+    def test_url_dir_with_a_new_capture_is_not_removed(self):
+        url_dir = os.path.join("archives", hashlib.md5(b"https://example.com/a").hexdigest())
+        os.makedirs(os.path.join(url_dir, "20250101-000000"))
+        url_index.append_memento(url_dir, "https://example.com/a", "20240101-000000")
+        self.gc._finish_url_dir(url_dir, ["20240101-000000"])
+        self.assertTrue(os.path.isdir(os.path.join(url_dir, "20250101-000000")))
+
+        os.rmdir(os.path.join(url_dir, "20250101-000000"))
+        self.gc._finish_url_dir(url_dir, [])
+        self.assertFalse(os.path.exists(url_dir))
+
+    def test_keep_last_expires_older_mementos_but_keeps_shared_blobs(self):
+        url = "https://example.com/news"
+        old_id, old_dir = self._capture(url, b"same page")
+        new_id, new_dir = self._capture(url, b"same page")
+        other_id, _ = self._capture(url, b"persona page", persona_id=7)
+
+        status = self.gc.run(policy={"keep_last": 1})
+        self.assertEqual(status["expired_mementos"]["keep_last"], 1)
+        self.assertIsNone(database.get_memento(old_id))
+        self.assertIsNotNone(database.get_memento(new_id))
+        self.assertIsNotNone(database.get_memento(other_id))
+        self.assertFalse(os.path.exists(old_dir))
+        # The newer capture still links the deduplicated blobs.
+        self.assertEqual(status["blobs_deleted"], 0)
+        with open(os.path.join(new_dir, "content.html.gz"), "rb") as f:
+            self.assertEqual(f.read(), b"same page")
+        timestamps = [e["timestamp"] for e in url_index.read_entries(os.path.dirname(new_dir))]
+        self.assertNotIn(os.path.basename(old_dir), timestamps)
+        self.assertEqual(len(timestamps), 2)
+
+    def test_max_age_expires_and_drops_empty_websites(self):
+        memento_id, memento_dir = self._capture("https://example.com/old", b"old page")
+        site_id = database.get_memento(memento_id)["archived_website_id"]
+        with db_connection.get_db().transaction() as cursor:
+            cursor.execute("UPDATE mementos SET memento_datetime = '2000-01-01 00:00:00' WHERE id = ?",
+                           (memento_id,))
+        status = self.gc.run(policy={"max_age_days": 30})
+        self.assertEqual(status["expired_mementos"]["max_age"], 1)
+        self.assertIsNone(database.get_archived_website(site_id))
+        self.assertFalse(os.path.exists(os.path.dirname(memento_dir)))
+
+    def test_quota_evicts_least_recently_viewed_first(self):
+        ids = [self._capture(f"https://example.com/{i}", os.urandom(20000))[0] for i in range(3)]
+        database.touch_memento(ids[0])   # oldest capture, but just viewed
+
+        usage = self.gc.run(dry_run=True)["bytes_before"]
+        status = self.gc.run(policy={"quota_bytes": usage - 10000})
+        self.assertEqual(status["expired_mementos"]["quota"], 1)
+        self.assertFalse(status["over_quota"])
+        self.assertLessEqual(status["bytes_after"], usage - 10000)
+        self.assertEqual([database.get_memento(i) is not None for i in ids], [True, False, True])
+
+    def test_dry_run_reports_without_deleting(self):
+        memento_id, memento_dir = self._capture("https://example.com/a", b"x" * 3000)
+        database.delete_archived_website(database.get_memento(memento_id)["archived_website_id"])
+        status = self.gc.run(dry_run=True)
+        self.assertEqual(status["orphan_dirs"], 1)
+        self.assertGreaterEqual(status["bytes_reclaimed"], 3000)
+        self.assertTrue(os.path.isdir(memento_dir))
+        self.assertEqual(self.gc.run()["orphan_dirs"], 1)
+        self.assertFalse(os.path.exists(memento_dir))
+        self.assertEqual(database.get_deleted_memento_locations(), [])
+
+    def test_orphan_thumbnails_are_removed(self):
+        _, memento_dir = self._capture("https://example.com/a", b"page")
+        os.remove(os.path.join(memento_dir, "screenshot.png"))
+        status = self.gc.run()
+        self.assertEqual(status["orphan_thumbnails"], 1)
+        self.assertFalse(os.path.exists(os.path.join(memento_dir, "screenshot.thumb-sm.jpg")))
+
+
+if __name__ == "__main__":
+    unittest.main()
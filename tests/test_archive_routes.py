@@ -0,0 +1,306 @@
+"""
+Tests for memento storage read paths and archive maintenance routes.
+
+Mementos are written straight to a temporary working directory (archives/ and
+the blob store are cwd-relative) and registered in a temporary database, so no
+browser is involved.
+"""
+import gzip
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app
+import database
+from database.connection import DatabaseConnection
+
+HTML = b"<html><body>" + b"archived news page " * 200 + b"</body></html>"
+
+
+class _AppTestCase(unittest.TestCase):
+    """Temporary cwd + database + Flask test client."""
+
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.mkdtemp()
+        os.chdir(self._tmp)
+
+        import database.connection as conn_module
+        self.original_db_instance = conn_module._db_instance
+        conn_module._db_instance = DatabaseConnection(os.path.join(self._tmp, "test.db"))
+        database._archive_repo = None
+        database._settings_repo = None
+
+        database.init_db()
+        database.init_settings_table()
+        database.init_user_table()
+
+        self.app = app.create_app()
+        self.app.config['TESTING'] = True
+        self.client = self.app.test_client()
+
+        self.website_id = database.save_archived_website(url="https://example.com/news")
+
+    def tearDown(self):
+        import database.connection as conn_module
+        conn_module._db_instance = self.original_db_instance
+        database._archive_repo = None
+        database._settings_repo = None
+        os.chdir(self._cwd)
+
+
+class ArchiveRoutesTest(_AppTestCase):
+    def _memento(self, filename, data, **kwargs):
+        memento_dir = tempfile.mkdtemp(dir=".")
+        with open(os.path.join(memento_dir, filename), "wb") as f:
+            f.write(data)
+        memento_id = database.save_memento(self.website_id, memento_dir, **kwargs)
+        return memento_id, memento_dir
+
+    def _content_url(self, memento_id):
+        return f"/archives/{self.website_id}/mementos/{memento_id}/content"
+
+    def test_gzip_content_passes_through_or_decompresses(self):
+        memento_id, _ = self._memento("content.html.gz", gzip.compress(HTML), content_encoding="gzip")
+
+        response = self.client.get(self._content_url(memento_id), headers={"Accept-Encoding": "gzip, br"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["Content-Encoding"], "gzip")
+        self.assertEqual(gzip.decompress(response.data), HTML)
+        response.close()
+
+        response = self.client.get(self._content_url(memento_id))
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.data, HTML)
+        response.close()
+
+        response = self.client.get(self._content_url(memento_id), headers={"Accept-Encoding": "gzip;q=0, br"})
+        self.assertNotIn("Content-Encoding", response.headers)
+        self.assertEqual(response.data, HTML)
+        response.close()
+
+    def test_view_memento_embeds_content_endpoint(self):
+        memento_id, _ = self._memento("content.html.gz", gzip.compress(HTML), content_encoding="gzip")
+        response = self.client.get(f"/archives/{self.website_id}/mementos/{memento_id}")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'src="{self._content_url(memento_id)}"'.encode(), response.data)
+        self.assertNotIn(b"archived news page", response.data)  # streamed, not inlined
+
+    def test_content_is_revalidated_with_strong_etag(self):
+        from utils.blob_store import get_blob_store
+
+        blob = get_blob_store().put(HTML)
+        memento_id, _ = self._memento("content.html", HTML, blobs={"html": (blob.sha256, blob.size)})
+
+        response = self.client.get(self._content_url(memento_id))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["ETag"], f'"{blob.sha256}"')
+        self.assertIn("Last-Modified", response.headers)
+        self.assertIn("no-cache", response.headers["Cache-Control"])
+        response.close()
+
+        response = self.client.get(self._content_url(memento_id),
+                                   headers={"If-None-Match": f'"{blob.sha256}"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+
+    def test_content_outside_the_blob_store_gets_a_content_etag(self):
+        import hashlib
+
+        memento_id, _ = self._memento("content.html", HTML)
+        response = self.client.get(self._content_url(memento_id))
+        self.assertEqual(response.headers["ETag"], f'"{hashlib.sha256(HTML).hexdigest()}"')
+        response.close()
+
+    def test_content_supports_ranges_and_text_view(self):
+        memento_id, _ = self._memento("content.html", HTML)
+
+        response = self.client.get(self._content_url(memento_id), headers={"Range": "bytes=0-5"})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, HTML[:6])
+        response.close()
+
+        response = self.client.get(self._content_url(memento_id) + "?as=text")
+        self.assertTrue(response.headers["Content-Type"].startswith("text/plain"))
+        self.assertEqual(response.data, HTML)
+        response.close()
+
+    def test_missing_content_is_404(self):
+        memento_id = database.save_memento(self.website_id, "archives/none")
+        self.assertEqual(self.client.get(self._content_url(memento_id)).status_code, 404)
+
+    def test_compression_job_rewrites_plain_mementos(self):
+        from utils.blob_store import get_blob_store
+        from utils.memento_content import CompressionJob
+
+        plain_blob = get_blob_store().put(HTML)
+        memento_id, memento_dir = self._memento(
+            "content.html", HTML, blobs={"html": (plain_blob.sha256, plain_blob.size)},
+        )
+
+        status = CompressionJob(batch_size=1).run()
+
+        self.assertEqual(status["compressed"], 1)
+        self.assertLess(status["bytes_after"], status["bytes_before"])
+        self.assertFalse(os.path.exists(os.path.join(memento_dir, "content.html")))
+        with open(os.path.join(memento_dir, "content.html.gz"), "rb") as f:
+            self.assertEqual(gzip.decompress(f.read()), HTML)
+
+        self.assertEqual(database.get_memento(memento_id)["content_encoding"], "gzip")
+        repo = database._get_archive_repo()
+        new_sha = database.get_memento_blobs(memento_id)["html"]
+        self.assertEqual(repo.get_blob(new_sha)["refcount"], 1)
+        self.assertEqual(repo.get_blob(plain_blob.sha256)["refcount"], 0)
+
+        # Already-compressed mementos are not picked up again.
+        self.assertEqual(database.get_uncompressed_mementos(), [])
+
+    def test_gc_endpoint_validates_and_runs_dry(self):
+        import time
+
+        # Deleting archives needs a login
+        self.assertNotEqual(self.client.post("/api/archives/gc", json={"keep_last": 1}).status_code, 202)
+        self.assertNotEqual(self.client.post("/api/archives/compress").status_code, 202)
+        self.app.config["LOGIN_DISABLED"] = True
+        self.assertEqual(self.client.post("/api/archives/gc", json={"keep_last": "many"}).status_code, 400)
+        response = self.client.post("/api/archives/gc", json={"dry_run": True, "keep_last": 3})
+        self.assertEqual(response.status_code, 202)
+        self.assertTrue(response.get_json()["dry_run"])
+        for _ in range(100):
+            status = self.client.get("/api/archives/gc").get_json()
+            if not status["running"]:
+                break
+            time.sleep(0.05)
+        self.assertIsNone(status["error"])
+        self.assertEqual(status["policy"]["keep_last"], 3)
+
+    def test_viewing_a_memento_records_access(self):
+        memento_id, _ = self._memento("content.html", HTML)
+        self.client.get(f"/archives/{self.website_id}/mementos/{memento_id}")
+        self.assertIsNotNone(database.get_memento(memento_id)["last_accessed_at"])
+
+    def test_visual_diff_and_similar_endpoints(self):
+        from PIL import Image, ImageDraw
+        from utils import image_hash
+
+        ids = []
+        for box in (None, (100, 200, 300, 400)):
+            image = Image.new("RGB", (640, 800), "white")
+            if box:
+                ImageDraw.Draw(image).rectangle(box, fill="black")
+            path = os.path.join(tempfile.mkdtemp(dir="."), "screenshot.png")
+            image.save(path)
+            ids.append(database.save_memento(self.website_id, os.path.dirname(path), screenshot_path=path,
+                                             screenshot_hashes=image_hash.compute_hashes(image)))
+
+        response = self.client.get(f"/api/mementos/{ids[0]}/visual-diff/{ids[1]}?width=640")
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body["bbox"], [100, 200, 301, 401])
+        self.assertIn("phash", body["hash_distance"])
+
+        response = self.client.get(body["heatmap_url"])
+        self.assertEqual(response.mimetype, "image/png")
+        self.assertEqual(response.headers["X-Changed-Bbox"], "100,200,301,401")
+
+        # Unrelated query parameters are not forwarded to the heatmap URL
+        body = self.client.get(f"/api/mementos/{ids[0]}/visual-diff/{ids[1]}?width=640&memento_id=1").get_json()
+        self.assertTrue(body["heatmap_url"].endswith("heatmap.png?width=640"))
+        for width in (0, -5):
+            response = self.client.get(f"/api/mementos/{ids[0]}/visual-diff/{ids[1]}?width={width}")
+            self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(f"/api/mementos/{ids[0]}/similar?max_distance=64")
+        self.assertEqual([m["memento_id"] for m in response.get_json()["matches"]], [ids[1]])
+        self.assertEqual(self.client.get("/api/mementos/999/similar").status_code, 404)
+
+    def test_html_diff_endpoint(self):
+        before, _ = self._memento("content.html.gz", gzip.compress(b"<body><p>Old headline</p><p>Story</p></body>"),
+                                  content_encoding="gzip")
+        after, after_dir = self._memento("content.html", b"<body><p>New headline</p><p>Story</p></body>")
+
+        response = self.client.get(f"/api/mementos/{before}/html-diff/{after}")
+        self.assertEqual(response.status_code, 200)
+        body = response.get_json()
+        self.assertEqual(body["stats"]["equal"], 1)
+        self.assertEqual(body["changes"][0]["words"], [["delete", "Old"], ["insert", "New"], ["equal", "headline"]])
+        self.assertTrue(os.path.exists(os.path.join(after_dir, "blocks.json")))
+
+        self.assertEqual(self.client.get(f"/api/mementos/{before}/html-diff/999").status_code, 404)
+        empty, _ = self._memento("screenshot.png", b"")
+        self.assertEqual(self.client.get(f"/api/mementos/{before}/html-diff/{empty}").status_code, 404)
+
+
+class ArtifactRoutesTest(_AppTestCase):
+    """The artifact endpoint serves screenshots and thumbnails to logged-in users."""
+
+    def setUp(self):
+        super().setUp()
+        from werkzeug.security import generate_password_hash
+        database.create_user("tester@example.com", generate_password_hash("pw"))
+
+        os.makedirs("screenshots")
+        self.png_path = os.path.join("screenshots", "shot.png")
+        from PIL import Image
+        Image.new("RGB", (1280, 4000), "white").save(self.png_path)
+
+    def _login(self):
+        self.client.post("/login", data={"username": "tester@example.com", "password": "pw"})
+
+    def test_requires_login(self):
+        response = self.client.get("/artifacts/screenshots/shot.png")
+        self.assertEqual(response.status_code, 302)
+
+    def test_serves_with_immutable_caching(self):
+        self._login()
+        response = self.client.get("/artifacts/screenshots/shot.png")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "image/png")
+        cache_control = response.headers["Cache-Control"]
+        self.assertIn("immutable", cache_control)
+        self.assertIn("private", cache_control)
+        self.assertNotIn("public", cache_control)
+        response.close()
+
+    def test_har_and_json_are_not_cached(self):
+        self._login()
+        with open(os.path.join("screenshots", "traffic.har"), "w") as f:
+            f.write("{}")
+        response = self.client.get("/artifacts/screenshots/traffic.har")
+        self.assertEqual(response.status_code, 200)
+        cache_control = response.headers["Cache-Control"]
+        self.assertIn("no-store", cache_control)
+        self.assertIn("private", cache_control)
+        self.assertNotIn("immutable", cache_control)
+        response.close()
+
+    def test_thumbnail_is_backfilled_on_request(self):
+        from PIL import Image
+        from utils import artifacts
+
+        self._login()
+        thumb = artifacts.thumbnail_path(self.png_path, "sm")
+        self.assertFalse(os.path.exists(thumb))
+
+        response = self.client.get("/artifacts/screenshots/shot.png?size=sm")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "image/jpeg")
+        response.close()
+        with Image.open(thumb) as image:
+            self.assertEqual(image.size, (320, 240))  # top 4:3 of the page
+
+        self.assertEqual(self.client.get("/artifacts/screenshots/shot.png?size=xl").status_code, 404)
+
+    def test_rejects_paths_outside_artifact_roots(self):
+        self._login()
+        with open("secret.json", "w") as f:
+            f.write("{}")
+        for path in ("secret.json", "screenshots/../secret.json", "archives/x/content.html.gz"):
+            self.assertEqual(self.client.get(f"/artifacts/{path}").status_code, 404, path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -252,6 +252,62 @@ class TestDatabase(unittest.TestCase):
         # Check that the memento is related to the correct website
         self.assertEqual(memento['uri_r'], url)
         
+    def test_memento_capture_timings_round_trip(self):
+        """Test that per-phase capture timings are stored and decoded"""
+        archived_website_id = database.save_archived_website(url="https://example.com/timed")
+        timings = {"navigate": 812.5, "screenshot": 240.1, "total": 6100.0}
+        memento_id = database.save_memento(
+            archived_website_id=archived_website_id,
+            memento_location="archives/timed/20250330120000",
+            capture_timings=timings,
+        )
+
+        self.assertEqual(database.get_memento(memento_id)['capture_timings'], timings)
+        mementos = database.get_mementos_for_website(archived_website_id)
+        self.assertEqual(mementos[0]['capture_timings'], timings)
+
+    def test_memento_blob_refcounts(self):
+        """Test that shared blobs are reference-counted and released on delete"""
+        sha = "ab" * 32
+        site_a = database.save_archived_website(url="https://example.com/a")
+        site_b = database.save_archived_website(url="https://example.com/b")
+        memento_a = database.save_memento(site_a, "archives/a/1", blobs={"html": (sha, 10)})
+        database.save_memento(site_a, "archives/a/2", blobs={"html": (sha, 10)})
+        database.save_memento(site_b, "archives/b/1", blobs={"screenshot": (sha, 10)})
+
+        self.assertEqual(database.get_memento_blobs(memento_a), {"html": sha})
+        repo = database._get_archive_repo()
+        self.assertEqual(repo.get_blob(sha)["refcount"], 3)
+
+        database.delete_archived_website(site_a)
+        self.assertEqual(repo.get_blob(sha)["refcount"], 1)
+
+    def test_warc_records_index(self):
+        """Test that WARC record offsets are indexed per memento and outlive it"""
+        from utils.warc import WarcRecordRef
+
+        site = database.save_archived_website(url="https://example.com/w", archive_type="warc")
+        memento = database.save_memento(site, "archives/w/1")
+        refs = [
+            WarcRecordRef("<urn:uuid:1>", "response", "https://example.com/w",
+                          "A-PROXY-20250101-00000.warc.gz", 120, 300, "2025-01-01T00:00:00Z"),
+            WarcRecordRef("<urn:uuid:2>", "metadata", "https://example.com/w",
+                          "A-PROXY-20250101-00000.warc.gz", 420, 80, "2025-01-01T00:00:00Z"),
+        ]
+        self.assertEqual(database.save_warc_records(refs, memento_id=memento), 2)
+
+        records = database.get_warc_records(memento)
+        self.assertEqual(set(records), {"response", "metadata"})
+        self.assertEqual(records["response"]["record_offset"], 120)
+        self.assertEqual(records["response"]["record_length"], 300)
+
+        database.delete_archived_website(site)
+        self.assertEqual(database.get_warc_records(memento), {})
+        conn = database.get_db_connection()
+        count = conn.execute("SELECT COUNT(*) FROM warc_records WHERE memento_id IS NULL").fetchone()[0]
+        conn.close()
+        self.assertEqual(count, 2)
+
     def test_delete_archived_website(self):
         """Test deleting an archived website and its associated mementos"""
         # Create a test website archive
@@ -0,0 +1,236 @@
+"""
+Tests for batch persona attribute extraction over saved conversations
+(ExtractionQueue.submit_batch / run_batch) and its endpoints.
+"""
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from tests.test_archive_routes import _AppTestCase
+from tests.test_internet_archive import _TempDatabaseTestCase
+from utils.extraction_queue import ExtractionQueue
+
+
+class _FakeService:
+    """Extracts the waypoint ID; records merges and peak concurrent extractions."""
+
+    def __init__(self, fail_for=(), delay=0.0):
+        self.fail_for = set(fail_for)
+        self.delay = delay
+        self.extracted = []
+        self.merges = []
+        self.in_flight = self.peak = 0
+        self.lock = threading.Lock()
+
+    def extract_waypoint(self, waypoint_id):
+        with self.lock:
+            self.extracted.append(waypoint_id)
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        time.sleep(self.delay)
+        with self.lock:
+            self.in_flight -= 1
+        if waypoint_id in self.fail_for:
+            raise RuntimeError("Structured generation failed")
+        waypoint = database.get_waypoint(waypoint_id)
+        persona_id = database.get_journey(waypoint['journey_id'])['persona_id']
+        return {"persona_id": persona_id, "extraction": {"waypoint": waypoint_id}}
+
+    def apply_extractions(self, persona_id, extractions):
+        self.merges.append((persona_id, [e["waypoint"] for e in extractions]))
+        database.save_persona({**database.get_persona(persona_id), "notes": "updated"})
+        return True
+
+
+class _BatchTestCase(_TempDatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        database.create_persona_tables()
+        self.chats = {}
+        for name in ("Nurse", "Farmer"):
+            persona_id = database.save_persona({"name": name})
+            journey_id = database.create_journey(name=f"Chats with {name}", persona_id=persona_id)
+            self.chats[persona_id] = [
+                database.add_waypoint(journey_id, "agent://conversation/with", title=f"Chat {n}", type='agent',
+                                      agent_data=json.dumps({"conversation": [{"role": "user", "content": "hi"}]}))
+                for n in range(3)
+            ]
+        # Not a conversation: never picked up
+        database.add_waypoint(journey_id, "https://example.com", title="Page")
+        self.all_chats = sorted(w for chats in self.chats.values() for w in chats)
+
+
+class FindUnextractedTest(_BatchTestCase):
+    def test_only_unextracted_or_stale_chats_are_found(self):
+        self.assertEqual(database.find_unextracted_waypoints(), self.all_chats)
+
+        nurse, farmer = self.chats
+        for waypoint_id in self.chats[nurse]:
+            job = database.enqueue_extraction_job(waypoint_id, delay=0)
+            database.claim_extraction_job()
+            database.finish_extraction_job(job['id'], persona_id=nurse)
+        self.assertEqual(database.find_unextracted_waypoints(), self.chats[farmer])
+        self.assertEqual(database.find_unextracted_waypoints(include_current=True), self.all_chats)
+
+        # Edited after extraction: the persona's chats are stale again
+        time.sleep(0.01)
+        database.save_persona({**database.get_persona(nurse), "notes": "edited by hand"})
+        self.assertEqual(database.find_unextracted_waypoints(), self.all_chats)
+
+    def test_chats_with_a_pending_job_are_left_to_it(self):
+        database.enqueue_extraction_job(self.all_chats[0], delay=60)
+        self.assertEqual(database.find_unextracted_waypoints(), self.all_chats[1:])
+
+
+class RunBatchTest(_BatchTestCase):
+    def test_results_are_merged_once_per_persona_per_group(self):
+        service = _FakeService()
+        queue = ExtractionQueue(service=service, batch_concurrency=4, batch_group_size=100)
+        batch = queue.submit_batch(start=False)
+        self.assertEqual((batch['queued'], batch['already_queued']), (6, 0))
+
+        self.assertTrue(queue.run_batch(batch['batch_id']))
+        self.assertEqual(sorted(service.extracted), self.all_chats)
+        self.assertEqual(sorted((p, sorted(w)) for p, w in service.merges), sorted(self.chats.items()))
+
+        status = database.get_extraction_batch(batch['batch_id'])
+        self.assertEqual((status['status'], status['jobs']['succeeded']), ('finished', 6))
+        # Extraction's own persona updates do not make the chats stale
+        self.assertEqual(database.find_unextracted_waypoints(), [])
+
+    def test_small_groups_flush_as_they_fill(self):
+        service = _FakeService()
+        queue = ExtractionQueue(service=service, batch_concurrency=1, batch_group_size=2)
+        self.assertTrue(queue.run_batch(queue.submit_batch(start=False)['batch_id']))
+        self.assertEqual(sum(len(w) for _, w in service.merges), 6)
+        self.assertTrue(all(len(w) <= 2 for _, w in service.merges))
+
+    def test_concurrency_is_bounded(self):
+        service = _FakeService(delay=0.05)
+        queue = ExtractionQueue(service=service, batch_concurrency=3)
+        self.assertTrue(queue.run_batch(queue.submit_batch(start=False)['batch_id']))
+        self.assertEqual(service.peak, 3)
+
+    def test_failures_are_retried_then_recorded(self):
+        failing = self.all_chats[0]
+        service = _FakeService(fail_for=[failing])
+        queue = ExtractionQueue(service=service, max_attempts=2, retry_base=0.05, poll_interval=0.05)
+        batch_id = queue.submit_batch(start=False)['batch_id']
+
+        self.assertTrue(queue.run_batch(batch_id))
+        self.assertEqual(service.extracted.count(failing), 2)
+        jobs = database.get_extraction_batch(batch_id)['jobs']
+        self.assertEqual((jobs['succeeded'], jobs['failed']), (5, 1))
+
+    def test_interrupted_batch_resumes(self):
+        service = _FakeService()
+        queue = ExtractionQueue(service=service, batch_concurrency=1, batch_group_size=1)
+        batch_id = queue.submit_batch(start=False)['batch_id']
+
+        original = service.apply_extractions
+
+        def stop_after_first(persona_id, extractions):
+            queue._stop.set()
+            return original(persona_id, extractions)
+
+        service.apply_extractions = stop_after_first
+        self.assertFalse(queue.run_batch(batch_id))
+        batch = database.get_extraction_batch(batch_id)
+        self.assertEqual((batch['status'], batch['jobs']['succeeded'], batch['jobs']['queued']),
+                         ('running', 1, 5))
+        self.assertEqual(database.get_running_extraction_batches(), [batch_id])
+
+        # A new queue (as after a restart) picks up only the remaining jobs
+        resumed = _FakeService()
+        self.assertTrue(ExtractionQueue(service=resumed).run_batch(batch_id))
+        self.assertEqual(len(resumed.extracted), 5)
+        self.assertNotIn(service.extracted[0], resumed.extracted)
+        self.assertEqual(database.get_running_extraction_batches(), [])
+
+    def test_jobs_of_a_killed_run_are_recovered(self):
+        queue = ExtractionQueue(service=_FakeService())
+        batch_id = queue.submit_batch(start=False)['batch_id']
+        # A hard-aborted extract_attributes.py left two jobs running
+        for _ in range(2):
+            database.claim_extraction_job(batch_id)
+
+        # Within the lease they may belong to a live process: the batch stays open
+        self.assertFalse(queue.run_batch(batch_id))
+        self.assertEqual(database.get_extraction_batch(batch_id)['jobs']['running'], 2)
+
+        # extract_attributes.py --requeue-running: nothing else is extracting
+        self.assertEqual(queue.requeue_stale(lease=0), 2)
+        self.assertTrue(queue.run_batch(batch_id))
+        self.assertEqual(database.get_extraction_batch(batch_id)['jobs']['succeeded'], 6)
+
+    def test_live_queue_does_not_claim_batch_jobs(self):
+        batch_id = ExtractionQueue(service=_FakeService()).submit_batch(start=False)['batch_id']
+        self.assertIsNone(database.claim_extraction_job())
+        job = database.claim_extraction_job(batch_id)
+        self.assertEqual(job['batch_id'], batch_id)
+
+
+class ApplyExtractionsTest(_BatchTestCase):
+    def test_merge_waits_for_and_keeps_another_connections_write(self):
+        from database.connection import get_db
+        from services import persona_attribute_service
+
+        patcher = mock.patch.object(persona_attribute_service, "_EXTRACTED_FILE",
+                                    persona_attribute_service.Path(self._tmp) / "chat_extracted.json")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        service = persona_attribute_service.PersonaAttributeService(llm_client=mock.Mock())
+        persona_id = next(iter(self.chats))
+
+        # Another process (e.g. the batch CLI) holds the write lock mid-merge
+        other = get_db().get_connection()
+        other.execute("BEGIN IMMEDIATE")
+        other.execute("INSERT INTO psychographic_data (persona_id, interests) VALUES (?, ?)",
+                      (persona_id, json.dumps(["cycling"])))
+        applied = threading.Thread(target=service.apply_extractions, args=(
+            persona_id, [{"psychographic": {"interests": ["chess"]}}]))
+        applied.start()
+        time.sleep(0.2)
+        self.assertTrue(applied.is_alive())
+        other.commit()
+        other.close()
+        applied.join(5)
+
+        interests = database.get_persona(persona_id)["psychographic"]["interests"]
+        self.assertEqual(interests, ["cycling", "chess"])
+
+
+class ExtractionBatchRouteTest(_AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config["LOGIN_DISABLED"] = True
+        database.create_persona_tables()
+        persona_id = database.save_persona({"name": "Nurse"})
+        journey_id = database.create_journey(name="Chats", persona_id=persona_id)
+        database.add_waypoint(journey_id, "agent://conversation/with", title="Chat", type='agent',
+                              agent_data=json.dumps({"conversation": []}))
+
+    def test_submit_and_poll(self):
+        from utils.extraction_queue import extraction_queue
+
+        with mock.patch.object(extraction_queue, "start_batch") as start_batch:
+            response = self.client.post("/api/extraction-batches", json={"label": "backfill"})
+        self.assertEqual(response.status_code, 202)
+        body = response.get_json()
+        self.assertEqual(body['queued'], 1)
+        start_batch.assert_called_once_with(body['batch_id'])
+
+        batch = self.client.get(body['status_url']).get_json()
+        self.assertEqual((batch['label'], batch['status'], batch['jobs']['queued']), ('backfill', 'running', 1))
+        self.assertEqual(self.client.get("/api/extraction-batches/9999").status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
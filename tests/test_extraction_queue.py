@@ -0,0 +1,172 @@
+"""
+Tests for the background persona attribute extraction queue
+(utils/extraction_queue.py) and its status endpoints.
+"""
+import os
+import sys
+import threading
+import time
+import types
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from database.connection import get_db
+from tests.test_archive_routes import _AppTestCase
+from tests.test_internet_archive import _TempDatabaseTestCase
+from utils.extraction_queue import ExtractionQueue
+
+
+def _make_due(job_id):
+    with get_db().transaction() as cursor:
+        cursor.execute("UPDATE extraction_jobs SET next_attempt_at = ? WHERE id = ?",
+                       (datetime.now() - timedelta(seconds=1), job_id))
+
+
+class ExtractionQueueTest(_TempDatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        journey_id = database.create_journey(name="Chats")
+        self.waypoints = [database.add_waypoint(journey_id, "agent://conversation/with", title=f"Chat {n}")
+                          for n in range(3)]
+        self.processed = []
+        self.outcomes = []
+        self.queue = ExtractionQueue(service=types.SimpleNamespace(process_waypoint=self._process),
+                                    coalesce_seconds=60, max_attempts=2, retry_base=30)
+
+    def _process(self, waypoint_id):
+        self.processed.append(waypoint_id)
+        outcome = self.outcomes.pop(0) if self.outcomes else 7
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def test_rapid_resaves_are_coalesced(self):
+        first = self.queue.enqueue(self.waypoints[0], start=False)
+        again = self.queue.enqueue(self.waypoints[0], start=False)
+        self.assertTrue(first['created'])
+        self.assertFalse(again['created'])
+        self.assertEqual((again['id'], again['requests']), (first['id'], 2))
+
+        # Not due until the coalescing window has passed
+        self.assertEqual(self.queue.process_next(), 30.0)
+        _make_due(first['id'])
+        self.assertIsNone(self.queue.process_next())
+        self.assertEqual(self.processed, [self.waypoints[0]])
+
+        job = database.get_extraction_job(first['id'])
+        self.assertEqual((job['status'], job['persona_id'], job['attempts']), ('succeeded', 7, 1))
+
+    def test_a_waypoint_is_never_extracted_twice_at_once(self):
+        running = self.queue.enqueue(self.waypoints[0], start=False)
+        _make_due(running['id'])
+        self.assertEqual(database.claim_extraction_job()['id'], running['id'])
+
+        # Saved again mid-extraction: a new job that waits for the running one
+        follow_up = self.queue.enqueue(self.waypoints[0], start=False)
+        self.assertTrue(follow_up['created'])
+        _make_due(follow_up['id'])
+        self.assertIsNone(database.claim_extraction_job())
+        self.assertIsNone(database.get_next_extraction_attempt_at())
+
+        database.finish_extraction_job(running['id'], persona_id=7)
+        self.assertEqual(database.claim_extraction_job()['id'], follow_up['id'])
+
+    def test_failures_are_retried_then_recorded(self):
+        job = self.queue.enqueue(self.waypoints[0], start=False)
+        _make_due(job['id'])
+        self.outcomes = [RuntimeError("Structured generation failed")] * 2
+        self.queue.process_next()
+        retried = database.get_extraction_job(job['id'])
+        self.assertEqual(retried['status'], 'queued')
+        self.assertGreater(datetime.fromisoformat(str(retried['next_attempt_at'])),
+                           datetime.now() + timedelta(seconds=25))
+
+        _make_due(job['id'])
+        self.queue.process_next()
+        failed = database.get_extraction_job(job['id'])
+        self.assertEqual((failed['status'], failed['attempts']), ('failed', 2))
+        self.assertEqual(failed['last_error'], "Structured generation failed")
+
+    def test_missing_waypoint_fails_at_once(self):
+        job = self.queue.enqueue(self.waypoints[0], start=False)
+        _make_due(job['id'])
+        self.outcomes = [ValueError("Waypoint was not found")]
+        self.queue.process_next()
+        self.assertEqual(database.get_extraction_job(job['id'])['status'], 'failed')
+
+    def test_workers_are_bounded_and_drain_on_stop(self):
+        release = threading.Event()
+        in_flight, peak, lock = [0], [0], threading.Lock()
+
+        def slow(waypoint_id):
+            with lock:
+                in_flight[0] += 1
+                peak[0] = max(peak[0], in_flight[0])
+            release.wait(5)
+            with lock:
+                in_flight[0] -= 1
+            return None
+
+        queue = ExtractionQueue(service=types.SimpleNamespace(process_waypoint=slow), concurrency=2,
+                                coalesce_seconds=0, poll_interval=0.05)
+        jobs = [queue.enqueue(waypoint_id) for waypoint_id in self.waypoints]
+        deadline = time.monotonic() + 5
+        while database.get_extraction_job_counts()['running'] < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(database.get_extraction_job_counts()['running'], 2)
+
+        stopper = threading.Thread(target=queue.stop, args=(5,))
+        stopper.start()
+        queue._stop.wait(5)
+        release.set()
+        stopper.join()
+
+        self.assertEqual(peak[0], 2)
+        self.assertEqual(queue.status()['workers'], 0)
+        # Running jobs finished; the third was never claimed and stays queued
+        statuses = sorted(database.get_extraction_job(job['id'])['status'] for job in jobs)
+        self.assertEqual(statuses, ['queued', 'succeeded', 'succeeded'])
+
+    def test_only_jobs_past_their_lease_are_requeued_on_start(self):
+        jobs = [self.queue.enqueue(waypoint_id, start=False) for waypoint_id in self.waypoints[:2]]
+        for job in jobs:
+            _make_due(job['id'])
+            database.claim_extraction_job()
+        # The first was started by a process that died; the second may still be in flight elsewhere
+        with get_db().transaction() as cursor:
+            cursor.execute("UPDATE extraction_jobs SET started_at = ? WHERE id = ?",
+                           (datetime.now() - timedelta(seconds=self.queue.lease + 1), jobs[0]['id']))
+        with mock.patch.object(self.queue, "_loop"):
+            self.assertTrue(self.queue.start())
+        self.assertEqual([database.get_extraction_job(job['id'])['status'] for job in jobs],
+                         ['queued', 'running'])
+
+
+class ExtractionStatusRouteTest(_AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config["LOGIN_DISABLED"] = True
+        journey_id = database.create_journey(name="Chats")
+        self.waypoint_id = database.add_waypoint(journey_id, "agent://conversation/with", title="Chat")
+
+    def test_waypoint_status(self):
+        self.assertEqual(self.client.get(f"/api/waypoints/{self.waypoint_id}/extraction").status_code, 404)
+
+        job = database.enqueue_extraction_job(self.waypoint_id, delay=60)
+        body = self.client.get(f"/api/waypoints/{self.waypoint_id}/extraction").get_json()
+        self.assertEqual((body['job_id'], body['status'], body['done']), (job['id'], 'queued', False))
+
+        database.finish_extraction_job(job['id'], persona_id=3)
+        body = self.client.get(f"/api/waypoints/{self.waypoint_id}/extraction").get_json()
+        self.assertEqual((body['status'], body['done'], body['persona_id']), ('succeeded', True, 3))
+
+        status = self.client.get("/api/extraction-status").get_json()
+        self.assertEqual(status['jobs']['succeeded'], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+"""
+Unit tests for the structural block-hash HTML diff (services/html_diff.py).
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import html_diff
+from utils import memento_content
+
+PAGE = """
+<html><head><title>t</title><script>var x = 1;</script></head><body>
+  <header><h1>Daily News</h1></header>
+  <div id="ad-top" class="ad-slot"><img src="/banner.png"></div>
+  <main>
+    <p>First story about  the
+       harbour.</p>
+    <p>Second <b>story</b> here.</p>
+    <ul><li>one</li><li>two</li></ul>
+  </main>
+  <iframe src="https://ads.example.net/frame?id=1"></iframe>
+</body></html>
+"""
+
+
+class TokenizeTest(unittest.TestCase):
+    def test_blocks_are_leaf_elements_with_normalized_text(self):
+        blocks = html_diff.tokenize(PAGE)
+        self.assertEqual([(b["kind"], b["text"]) for b in blocks], [
+            ("text", "Daily News"),
+            ("ad", "div#ad-top.ad-slot"),
+            ("text", "First story about the harbour."),
+            ("text", "Second story here."),
+            ("text", "one"),
+            ("text", "two"),
+            ("ad", "iframe@ads.example.net"),
+        ])
+
+    def test_hash_ignores_whitespace_and_markup_changes(self):
+        a = html_diff.tokenize("<p>Hello   <i>world</i></p>")
+        b = html_diff.tokenize("<p>\n Hello <span>world</span>\n</p>")
+        self.assertEqual([x["hash"] for x in a], [x["hash"] for x in b])
+
+
+class DiffBlocksTest(unittest.TestCase):
+    def test_insert_replace_and_ad_changes(self):
+        changed = (PAGE.replace("Second", "Updated second")
+                   .replace("<li>two</li>", "<li>two</li><li>three</li>")
+                   .replace("ads.example.net", "tracker.example.org"))
+        result = html_diff.diff_blocks(html_diff.tokenize(PAGE), html_diff.tokenize(changed))
+
+        stats = result["stats"]
+        self.assertEqual((stats["equal"], stats["inserted"], stats["deleted"], stats["replaced"]), (5, 1, 0, 2))
+        self.assertEqual([c["op"] for c in result["changes"]], ["replace", "insert", "replace"])
+        self.assertEqual(result["changes"][0]["words"],
+                         [["delete", "Second"], ["insert", "Updated second"], ["equal", "story here."]])
+        self.assertEqual(result["ads"], {"only_a": ["iframe@ads.example.net"],
+                                         "only_b": ["iframe@tracker.example.org"], "common": 1})
+
+    def test_limit_truncates_changes_not_stats(self):
+        a = html_diff.tokenize("".join(f"<p>a{i}</p>" for i in range(10)))
+        b = html_diff.tokenize("".join(f"<p>b{i}</p>" for i in range(10)))
+        result = html_diff.diff_blocks(a, b, limit=3)
+        self.assertEqual(len(result["changes"]), 3)
+        self.assertEqual(result["stats"]["replaced"], 10)
+        self.assertTrue(result["truncated"])
+
+
+class HtmlDiffServiceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.service = html_diff.HtmlDiffService(max_cached=1)
+        self.mementos = []
+        for i, html in enumerate((PAGE, PAGE.replace("harbour", "bridge"))):
+            memento_dir = os.path.join(self.tmp, str(i))
+            os.makedirs(memento_dir)
+            with open(os.path.join(memento_dir, "content.html"), "w") as f:
+                f.write(html)
+            self.mementos.append({"id": i + 1, "memento_location": memento_dir})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_baseline_is_tokenized_once(self):
+        with mock.patch.object(html_diff, "tokenize", wraps=html_diff.tokenize) as tokenize:
+            result = self.service.diff(self.mementos[0], self.mementos[1])
+            self.assertEqual(result["stats"]["replaced"], 1)
+            self.assertEqual(tokenize.call_count, 2)
+
+            # The LRU only holds one entry; the evicted baseline comes back from blocks.json.
+            self.service.diff(self.mementos[0], self.mementos[1])
+            self.assertEqual(tokenize.call_count, 2)
+
+    def test_stale_tokenizer_version_is_rebuilt(self):
+        path = os.path.join(self.mementos[0]["memento_location"], html_diff.CACHE_FILENAME)
+        with open(path, "w") as f:
+            json.dump({"version": html_diff.TOKENIZER_VERSION - 1, "blocks": []}, f)
+        blocks = self.service.get_blocks(self.mementos[0])
+        self.assertEqual(len(blocks), 7)
+        with open(path) as f:
+            self.assertEqual(json.load(f)["version"], html_diff.TOKENIZER_VERSION)
+
+    def test_missing_html_returns_none(self):
+        memento = {"id": 99, "memento_location": os.path.join(self.tmp, "missing")}
+        with mock.patch.object(memento_content, "read_warc_block", return_value=None):
+            self.assertIsNone(self.service.diff(self.mementos[0], memento))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+"""
+Unit tests for screenshot perceptual hashing (utils/image_hash.py), the
+Hamming near-duplicate index, and the pixel diff (utils/visual_diff.py).
+"""
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from database import connection as db_connection
+from utils import image_hash, visual_diff
+
+
+def _page(*boxes, size=(640, 1600)):
+    """A white 'page' with black rectangles drawn at ``boxes``."""
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    for box in boxes:
+        draw.rectangle(box, fill="black")
+    return image
+
+
+class ImageHashTest(unittest.TestCase):
+    def test_identical_images_hash_identically(self):
+        a = image_hash.compute_hashes(_page((50, 50, 300, 400)))
+        b = image_hash.compute_hashes(_page((50, 50, 300, 400)))
+        self.assertEqual(a, b)
+        self.assertEqual(len(a["dhash"]), 16)
+
+    def test_distance_grows_with_visual_change(self):
+        base = _page((50, 50, 300, 400))
+        small = _page((50, 50, 300, 400), (600, 1500, 630, 1590))
+        large = _page((50, 50, 300, 400), (320, 600, 620, 1400))
+        h = {name: image_hash.compute_hashes(img) for name, img in
+             (("base", base), ("small", small), ("large", large))}
+        self.assertLess(image_hash.hamming(h["base"]["phash"], h["small"]["phash"]),
+                        image_hash.hamming(h["base"]["phash"], h["large"]["phash"]))
+
+    def test_vectorized_hamming_matches_scalar(self):
+        target = "ffff0000ffff0000"
+        hashes = ["ffff0000ffff0000", "0000000000000000", "ffff0000ffff0001", "7fff0000ffff0000"]
+        self.assertEqual(list(image_hash.hamming_many(target, hashes)),
+                         [image_hash.hamming(target, h) for h in hashes])
+        self.assertEqual(image_hash.nearest(target, list(enumerate(hashes)), 1),
+                         [(0, 0), (2, 1), (3, 1)])
+
+
+class SimilarMementosTest(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.original_db_path = db_connection.DEFAULT_DB_PATH
+        db_connection.DEFAULT_DB_PATH = self.db_path
+        db_connection._db_instance = None
+        database._archive_repo = None
+        database.init_db()
+
+    def tearDown(self):
+        db_connection.DEFAULT_DB_PATH = self.original_db_path
+        db_connection._db_instance = None
+        database._archive_repo = None
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def _memento(self, site, phash, dhash="0" * 16):
+        return database.save_memento(site, f"archives/x/{phash}", screenshot_hashes={"phash": phash, "dhash": dhash})
+
+    def test_band_prefilter_and_scan_agree(self):
+        site_a = database.save_archived_website(url="https://example.com/a")
+        site_b = database.save_archived_website(url="https://example.com/b")
+        base = self._memento(site_a, "123456789abcdef0")
+        near = self._memento(site_b, "123456789abcdef3")   # 2 bits apart
+        mid = self._memento(site_a, "123456789abc0000")    # 10 bits apart
+        self._memento(site_a, "edcba9876543210f")          # 64 bits apart
+
+        self.assertEqual(image_hash.find_similar(base, max_distance=3),
+                         [{"memento_id": near, "distance": 2}])
+        self.assertEqual(image_hash.find_similar(base, max_distance=12),
+                         [{"memento_id": near, "distance": 2}, {"memento_id": mid, "distance": 10}])
+        self.assertEqual(image_hash.find_similar(base, max_distance=12, same_url=True),
+                         [{"memento_id": mid, "distance": 10}])
+
+    def test_hashes_are_removed_with_their_memento(self):
+        site = database.save_archived_website(url="https://example.com/a")
+        memento = self._memento(site, "123456789abcdef0")
+        self.assertEqual(database.get_screenshot_hashes(memento)["phash"], "123456789abcdef0")
+        database.delete_archived_website(site)
+        self.assertIsNone(database.get_screenshot_hashes(memento))
+
+
+class VisualDiffTest(unittest.TestCase):
+    def test_identical_screenshots_have_no_bbox(self):
+        result = visual_diff.diff_images(_page((10, 10, 50, 50)), _page((10, 10, 50, 50)))
+        self.assertIsNone(result["bbox"])
+        self.assertEqual(result["changed_fraction"], 0)
+
+    def test_bbox_covers_changed_region_in_source_pixels(self):
+        a = _page(size=(1280, 2000))
+        b = _page((400, 1000, 599, 1199), size=(1280, 2000))
+        result = visual_diff.diff_images(a, b, width=640)
+        x0, y0, x1, y1 = result["bbox"]
+        self.assertTrue(390 <= x0 <= 400 and 600 <= x1 <= 610, result["bbox"])
+        self.assertTrue(990 <= y0 <= 1000 and 1200 <= y1 <= 1210, result["bbox"])
+        self.assertEqual(result["size"], [640, 1000])
+        with Image.open(io.BytesIO(result["heatmap"])) as heatmap:
+            self.assertEqual(heatmap.size, (640, 1000))
+
+    def test_heatmap_can_be_skipped(self):
+        result = visual_diff.diff_images(_page(), _page((10, 10, 50, 50)), heatmap=False)
+        self.assertIsNone(result["heatmap"])
+        self.assertIsNotNone(result["bbox"])
+
+    def test_height_difference_counts_as_changed(self):
+        result = visual_diff.diff_images(_page(size=(100, 100)), _page(size=(100, 150)))
+        self.assertEqual(result["bbox"], [0, 100, 100, 150])
+
+
+if __name__ == "__main__":
+    unittest.main()
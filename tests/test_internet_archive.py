@@ -0,0 +1,401 @@
+"""
+Tests for the Internet Archive submission queue (utils/internet_archive.py):
+token-bucket pacing, retries with backoff, results recorded on the memento,
+bulk batches, and the submit endpoints.
+
+Save Page Now is replaced by a fake ``submit`` callable, a mocked
+``requests.get``, or a local HTTP server standing in for the Save Page Now and
+availability endpoints; the database is a temporary file.
+"""
+import functools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from database import connection as db_connection
+from tests.test_archive_routes import _AppTestCase
+from utils import internet_archive
+from utils.internet_archive import SubmissionError, SubmissionQueue, TokenBucket
+
+
+class _FakeResponse:
+    def __init__(self, status_code, headers=None, text=""):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.text = text
+
+
+class TokenBucketTest(unittest.TestCase):
+    def test_burst_then_refill_rate(self):
+        now = [0.0]
+        bucket = TokenBucket(rate=0.5, capacity=2, clock=lambda: now[0])
+        self.assertTrue(bucket.consume())
+        self.assertTrue(bucket.consume())
+        self.assertFalse(bucket.consume())
+        self.assertAlmostEqual(bucket.wait_time(), 2.0)
+        now[0] = 1.0
+        self.assertAlmostEqual(bucket.wait_time(), 1.0)
+        now[0] = 100.0
+        self.assertAlmostEqual(bucket.tokens(), 2)   # never above capacity
+
+
+class SavePageNowTest(unittest.TestCase):
+    def _save(self, response):
+        with mock.patch("utils.internet_archive.requests.get", return_value=response) as get:
+            try:
+                return internet_archive.save_page_now("https://example.com/a", save_url="http://spn/save/")
+            finally:
+                self.assertEqual(get.call_args[0][0], "http://spn/save/https://example.com/a")
+
+    def test_capture_url_comes_from_the_response(self):
+        response = _FakeResponse(200, {"Content-Location": "/web/20250101000000/https://example.com/a"})
+        self.assertEqual(self._save(response), "http://spn/web/20250101000000/https://example.com/a")
+
+    def test_throttling_and_server_errors_are_retryable(self):
+        with self.assertRaises(SubmissionError) as ctx:
+            self._save(_FakeResponse(429, {"Retry-After": "120"}))
+        self.assertTrue(ctx.exception.retryable)
+        self.assertEqual(ctx.exception.retry_after, 120)
+        with self.assertRaises(SubmissionError) as ctx:
+            self._save(_FakeResponse(403, text="blocked by robots.txt"))
+        self.assertFalse(ctx.exception.retryable)
+
+    def test_retry_after_accepts_an_http_date(self):
+        from email.utils import format_datetime
+
+        when = datetime.now(timezone.utc) + timedelta(seconds=300)
+        with self.assertRaises(SubmissionError) as ctx:
+            self._save(_FakeResponse(503, {"Retry-After": format_datetime(when, usegmt=True)}))
+        self.assertAlmostEqual(ctx.exception.retry_after, 300, delta=5)
+        with self.assertRaises(SubmissionError) as ctx:
+            self._save(_FakeResponse(503, {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}))
+        self.assertEqual(ctx.exception.retry_after, 0)
+        with self.assertRaises(SubmissionError) as ctx:
+            self._save(_FakeResponse(503, {"Retry-After": "soon"}))
+        self.assertIsNone(ctx.exception.retry_after)
+
+
+class _TempDatabaseTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.mkdtemp()
+        self.original_db_path = db_connection.DEFAULT_DB_PATH
+        db_connection.DEFAULT_DB_PATH = os.path.join(self._tmp, "test.db")
+        db_connection._db_instance = None
+        database._archive_repo = None
+        database._settings_repo = None
+        database.init_db()
+        database.init_settings_table()
+        database.init_default_settings()
+
+    def tearDown(self):
+        db_connection.DEFAULT_DB_PATH = self.original_db_path
+        db_connection._db_instance = None
+        database._archive_repo = None
+        database._settings_repo = None
+
+
+class SubmissionQueueTest(_TempDatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        self.submitted = []
+        self.outcomes = []
+        self.queue = SubmissionQueue(submit=self._submit, burst=5, max_attempts=3,
+                                     retry_base=60, retry_max=600)
+        site = database.save_archived_website(url="https://example.com/news")
+        self.memento_id = database.save_memento(site, os.path.join(self._tmp, "m"))
+
+    def _submit(self, url):
+        self.submitted.append(url)
+        outcome = self.outcomes.pop(0) if self.outcomes else "https://web.archive.org/web/1/" + url
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    def _make_due(self, job_id):
+        with db_connection.get_db().transaction() as cursor:
+            cursor.execute("UPDATE internet_archive_jobs SET next_attempt_at = ? WHERE id = ?",
+                           (datetime.now() - timedelta(seconds=1), job_id))
+
+    def test_enqueue_returns_immediately_and_dedupes(self):
+        job = self.queue.enqueue("https://example.com/news", self.memento_id, start=False)
+        again = self.queue.enqueue("https://example.com/news", self.memento_id, start=False)
+        self.assertEqual((job["created"], again["created"], again["id"]), (True, False, job["id"]))
+        self.assertEqual(self.submitted, [])
+        self.assertEqual(database.get_memento(self.memento_id)["internet_archive_status"], "queued")
+
+    def test_success_is_recorded_on_the_memento(self):
+        job = self.queue.enqueue("https://example.com/news", self.memento_id, start=False)
+        self.assertIsNone(self.queue.process_next())
+        memento = database.get_memento(self.memento_id)
+        self.assertEqual(memento["internet_archive_id"], "https://web.archive.org/web/1/https://example.com/news")
+        self.assertEqual(memento["internet_archive_status"], "archived")
+        self.assertEqual(database.get_ia_job(job["id"])["status"], "succeeded")
+
+    def test_transient_failures_back_off_then_succeed(self):
+        self.outcomes = [SubmissionError("503", retryable=True),
+                         SubmissionError("429", retryable=True, retry_after=900)]
+        job = self.queue.enqueue("https://example.com/news", self.memento_id, start=False)
+
+        before = datetime.now()
+        self.queue.process_next()
+        row = database.get_ia_job(job["id"])
+        self.assertEqual((row["status"], row["attempts"], row["last_error"]), ("queued", 1, "503"))
+        due = datetime.fromisoformat(row["next_attempt_at"])
+        self.assertGreaterEqual(due, before + timedelta(seconds=60))
+        # Not due yet: nothing is submitted.
+        self.assertGreater(self.queue.process_next(), 0)
+        self.assertEqual(len(self.submitted), 1)
+
+        self._make_due(job["id"])
+        self.queue.process_next()
+        row = database.get_ia_job(job["id"])
+        # Second backoff is 120s, but Retry-After asked for 900s.
+        self.assertGreaterEqual(datetime.fromisoformat(row["next_attempt_at"]), before + timedelta(seconds=900))
+
+        self._make_due(job["id"])
+        self.queue.process_next()
+        self.assertEqual(database.get_ia_job(job["id"])["status"], "succeeded")
+        self.assertEqual(len(self.submitted), 3)
+
+    def test_permanent_and_exhausted_failures(self):
+        self.outcomes = [SubmissionError("403 robots.txt", retryable=False)]
+        job = self.queue.enqueue("https://example.com/news", self.memento_id, start=False)
+        self.queue.process_next()
+        row = database.get_ia_job(job["id"])
+        self.assertEqual((row["status"], row["attempts"]), ("failed", 1))
+        self.assertEqual(database.get_memento(self.memento_id)["internet_archive_status"], "failed")
+
+        self.outcomes = [SubmissionError("timeout", retryable=True)] * 3
+        job = self.queue.enqueue("https://example.com/other", start=False)
+        for _ in range(3):
+            self._make_due(job["id"])
+            self.queue.process_next()
+        row = database.get_ia_job(job["id"])
+        self.assertEqual((row["status"], row["attempts"], row["last_error"]), ("failed", 3, "timeout"))
+
+    def test_daily_rate_setting_is_migrated_to_hourly(self):
+        for per_day, per_hour in (("100", "5"), ("10", "1"), ("many", "10")):
+            database._get_settings_repo().delete("internet_archive_rate_per_hour")
+            database.set_setting("internet_archive_rate_limit", per_day)
+            database.init_default_settings()
+            self.assertEqual(database.get_setting("internet_archive_rate_per_hour"), per_hour)
+            self.assertIsNone(database.get_setting("internet_archive_rate_limit"))
+
+        database.set_setting("internet_archive_rate_per_hour", "40")
+        database.init_default_settings()
+        self.assertEqual(internet_archive.hourly_rate(), 40)
+
+    def test_token_bucket_paces_submissions(self):
+        database.set_setting("internet_archive_rate_per_hour", "60")   # one a minute
+        self.queue.bucket.configure(60 / 3600, capacity=2)
+        for i in range(3):
+            self.queue.enqueue(f"https://example.com/{i}", start=False)
+        self.assertIsNone(self.queue.process_next())
+        self.assertIsNone(self.queue.process_next())
+        wait = self.queue.process_next()
+        self.assertGreater(wait, 50)
+        self.assertEqual(len(self.submitted), 2)
+        self.assertEqual(database.get_ia_job_counts()["queued"], 1)
+
+    def test_disabled_integration_leaves_jobs_queued(self):
+        database.set_setting("internet_archive_enabled", "false")
+        self.queue.enqueue("https://example.com/news", start=False)
+        self.assertEqual(self.queue.process_next(), self.queue.poll_interval)
+        self.assertEqual(self.submitted, [])
+
+    def test_interrupted_jobs_are_requeued_after_the_lease(self):
+        job = self.queue.enqueue("https://example.com/news", start=False)
+        database.claim_ia_job()
+        # Still within the lease: another process may be submitting it
+        self.assertEqual(self.queue.requeue_stale(), 0)
+        self.assertEqual(database.get_ia_job(job["id"])["status"], "running")
+
+        with db_connection.get_db().transaction() as cursor:
+            cursor.execute("UPDATE internet_archive_jobs SET updated_at = ? WHERE id = ?",
+                           (datetime.now() - timedelta(seconds=self.queue.lease + 1), job["id"]))
+        # An idle worker picks the stale job up without a restart
+        self.assertEqual(self.queue.process_next(), 0.0)
+        self.assertEqual(database.get_ia_job(job["id"])["status"], "queued")
+        self.assertIsNone(self.queue.process_next())
+        self.assertEqual(database.get_ia_job(job["id"])["status"], "succeeded")
+
+
+class _StandInArchive:
+    """Local stand-in for web.archive.org's /save/ and /wayback/available endpoints."""
+
+    def __init__(self, snapshots=None, save_delay=0.0):
+        self.snapshots = snapshots or {}   # url -> snapshot datetime (UTC)
+        self.save_delay = save_delay
+        self.saved = []
+        self.lookups = []
+        self.in_flight = self.max_in_flight = 0
+        self._lock = threading.Lock()
+        archive = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.startswith("/save/"):
+                    archive._save(self, self.path[len("/save/"):])
+                else:
+                    archive._available(self, parse_qs(urlparse(self.path).query)["url"][0])
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def _save(self, handler, url):
+        with self._lock:
+            self.saved.append(url)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.save_delay)
+        with self._lock:
+            self.in_flight -= 1
+        handler.send_response(200)
+        handler.send_header("Content-Location", f"/web/20250101000000/{url}")
+        handler.end_headers()
+
+    def _available(self, handler, url):
+        self.lookups.append(url)
+        closest = {}
+        if url in self.snapshots:
+            stamp = self.snapshots[url].strftime("%Y%m%d%H%M%S")
+            closest = {"closest": {"available": True, "status": "200", "timestamp": stamp,
+                                   "url": f"http://web.archive.org/web/{stamp}/{url}"}}
+        body = json.dumps({"url": url, "archived_snapshots": closest}).encode()
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.end_headers()
+        handler.wfile.write(body)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class BatchSubmissionTest(_TempDatabaseTestCase):
+    def setUp(self):
+        super().setUp()
+        now = datetime.now(timezone.utc)
+        self.archive = _StandInArchive(save_delay=0.3, snapshots={
+            "https://example.com/recent": now - timedelta(days=2),
+            "https://example.com/stale": now - timedelta(days=400),
+        })
+        self.queue = SubmissionQueue(
+            submit=functools.partial(internet_archive.save_page_now, save_url=self.archive.base + "/save/"),
+            availability=functools.partial(internet_archive.check_availability,
+                                           availability_url=self.archive.base + "/wayback/available"),
+            burst=10, concurrency=2, poll_interval=0.05,
+        )
+        database.set_setting("internet_archive_rate_per_hour", "100")
+
+    def tearDown(self):
+        self.queue.stop(timeout=5)
+        self.archive.close()
+        super().tearDown()
+
+    def _archive(self, url, persona_id=None):
+        site = database.save_archived_website(url=url, persona_id=persona_id)
+        return database.save_memento(site, os.path.join(self._tmp, f"m{site}"))
+
+    def _wait_for(self, batch_id):
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            batch = database.get_ia_batch(batch_id)
+            if batch["jobs"]["queued"] == batch["jobs"]["running"] == 0:
+                return batch
+            time.sleep(0.05)
+        self.fail(f"batch {batch_id} did not finish: {batch}")
+
+    def test_filtered_batch_dedupes_skips_recent_and_runs_concurrently(self):
+        urls = [f"https://example.com/{name}" for name in ("a", "b", "c", "recent", "stale")]
+        ids = {url: self._archive(url) for url in urls}
+        self._archive("https://example.com/a", persona_id=7)     # same URL, other persona
+        self._archive("https://other.org/x")                     # outside the filter
+
+        result = self.queue.submit_batch("example.com", internet_archive.filter_targets(url_contains="example.com"))
+        self.assertEqual((result["queued"], result["duplicates"]), (5, 1))
+        batch = self._wait_for(result["batch_id"])
+
+        self.assertEqual(batch["jobs"]["succeeded"], 4)
+        self.assertEqual(batch["jobs"]["skipped"], 1)
+        self.assertEqual(sorted(self.archive.saved), sorted(u for u in urls if u != "https://example.com/recent"))
+        self.assertEqual(self.archive.max_in_flight, 2)
+        recent = database.get_memento(ids["https://example.com/recent"])
+        self.assertTrue(recent["internet_archive_id"].startswith("http://web.archive.org/web/"))
+        self.assertEqual(recent["internet_archive_status"], "archived")
+        self.assertEqual(database.get_memento(ids["https://example.com/stale"])["internet_archive_id"],
+                         self.archive.base + "/web/20250101000000/https://example.com/stale")
+
+        # Availability answers are cached: a second batch does not ask again.
+        lookups = len(self.archive.lookups)
+        second = self.queue.submit_batch("again", [{"uri_r": "https://example.com/recent"}])
+        self.assertEqual(self._wait_for(second["batch_id"])["jobs"]["skipped"], 1)
+        self.assertEqual(len(self.archive.lookups), lookups)
+
+    def test_batch_leaves_urls_with_pending_jobs_alone(self):
+        self.queue.enqueue("https://example.com/a", start=False)
+        result = self.queue.submit_batch("b", [{"uri_r": "https://example.com/a"}, {"uri_r": "https://example.com/b"}],
+                                         check_availability=False, start=False)
+        self.assertEqual((result["queued"], result["already_queued"]), (1, 1))
+
+
+class SubmitEndpointTest(_AppTestCase):
+    def test_submit_is_accepted_without_calling_the_archive(self):
+        database.init_default_settings()
+        memento_id = database.save_memento(self.website_id, tempfile.mkdtemp(dir="."))
+        with mock.patch.object(internet_archive.submission_queue, "start") as start, \
+                mock.patch("utils.internet_archive.requests.get") as get:
+            response = self.client.post(f"/submit-to-internet-archive/{memento_id}",
+                                        headers={"X-Requested-With": "XMLHttpRequest"})
+        self.assertEqual(response.status_code, 202)
+        start.assert_called_once()
+        get.assert_not_called()
+
+        job = self.client.get(response.get_json()["status_url"]).get_json()
+        self.assertEqual((job["status"], job["memento_id"], job["uri_r"]),
+                         ("queued", memento_id, "https://example.com/news"))
+        status = self.client.get("/api/internet-archive-status").get_json()
+        self.assertEqual(status["jobs"]["queued"], 1)
+        self.assertEqual(self.client.get("/api/internet-archive/jobs/999").status_code, 404)
+
+    def test_journey_batch_endpoint(self):
+        database.init_default_settings()
+        journey_id = database.create_journey("Morning news")
+        for url in ("https://example.com/news", "https://example.com/sport", "https://example.com/news"):
+            database.add_waypoint(journey_id, url)
+        memento_id = database.save_memento(self.website_id, tempfile.mkdtemp(dir="."))
+
+        with mock.patch.object(internet_archive.submission_queue, "start"):
+            response = self.client.post("/api/internet-archive/batches", json={"journey_id": journey_id})
+            self.assertEqual(response.status_code, 202)
+            result = response.get_json()
+            self.assertEqual((result["queued"], result["duplicates"]), (2, 1))
+
+            self.assertEqual(self.client.post("/api/internet-archive/batches", json={}).status_code, 400)
+            self.assertEqual(self.client.post("/api/internet-archive/batches",
+                                              json={"journey_id": 999}).status_code, 404)
+            self.assertEqual(self.client.post("/api/internet-archive/batches",
+                                              json={"since": "last week"}).status_code, 400)
+
+        batch = self.client.get(result["status_url"]).get_json()
+        self.assertEqual((batch["label"], batch["jobs"]["queued"]), (f"journey {journey_id}", 2))
+        self.assertEqual(database.get_memento(memento_id)["internet_archive_status"], "queued")
+
+
+if __name__ == "__main__":
+    unittest.main()
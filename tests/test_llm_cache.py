@@ -0,0 +1,137 @@
+"""
+Tests for the persistent LLM response cache (utils/llm_cache.py) and its
+opt-in use from LLMClient.
+"""
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+import database.connection as db_connection
+from database.connection import get_db
+from utils import llm_client
+from utils.llm_cache import ResponseCache, cache_key
+from utils.llm_telemetry import Telemetry
+
+SCHEMA = {"type": "object", "properties": {"age": {"type": ["integer", "null"]}}}
+
+
+class _CountingAdapter:
+    provider_name = "fake"
+    default_model = "fake-model"
+
+    def __init__(self):
+        self.calls = 0
+
+    def chat(self, messages, model_hint=None):
+        self.calls += 1
+        return f"reply {self.calls}"
+
+    def generate_structured(self, prompt, schema, model_hint=None):
+        self.calls += 1
+        return {"age": 30 + self.calls}
+
+
+class _CacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.mkdtemp()
+        self.original_db_path = db_connection.DEFAULT_DB_PATH
+        db_connection.DEFAULT_DB_PATH = os.path.join(self._tmp, "test.db")
+        db_connection._db_instance = None
+        database._llm_cache_repo = None
+        database.init_db()
+
+    def tearDown(self):
+        db_connection.DEFAULT_DB_PATH = self.original_db_path
+        db_connection._db_instance = None
+        database._llm_cache_repo = None
+
+
+class CacheKeyTest(unittest.TestCase):
+    def test_key_covers_provider_model_prompt_and_schema(self):
+        key = cache_key("anthropic", "claude", "structured", "prompt", SCHEMA)
+        self.assertEqual(key, cache_key("anthropic", "claude", "structured", "prompt", dict(reversed(SCHEMA.items()))))
+        for other in (cache_key("openai", "claude", "structured", "prompt", SCHEMA),
+                      cache_key("anthropic", "gpt", "structured", "prompt", SCHEMA),
+                      cache_key("anthropic", "claude", "structured", "prompt!", SCHEMA),
+                      cache_key("anthropic", "claude", "structured", "prompt", {"type": "object"}),
+                      cache_key("anthropic", "claude", "chat", "prompt", SCHEMA)):
+            self.assertNotEqual(key, other)
+
+
+class ResponseCacheTest(_CacheTestCase):
+    def test_round_trip_and_metrics(self):
+        cache = ResponseCache(ttl=60, max_entries=0, max_bytes=0)
+        self.assertIsNone(cache.get("k"))
+        cache.put("k", "fake", "m", "structured", {"age": 30})
+        self.assertEqual(cache.get("k"), {"age": 30})
+        self.assertEqual(cache.get("k"), {"age": 30})
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"], stats["lifetime_hits"]), (2, 1, 1, 2))
+        self.assertEqual(stats["hit_rate"], 0.667)
+
+    def test_expired_entries_miss_and_are_evicted(self):
+        cache = ResponseCache(ttl=60, max_entries=0, max_bytes=0)
+        cache.put("old", "fake", "m", "chat", "stale")
+        with get_db().transaction() as cursor:
+            cursor.execute("UPDATE llm_response_cache SET expires_at = ?", (datetime.now() - timedelta(seconds=1),))
+        self.assertIsNone(cache.get("old"))
+
+        cache.put("new", "fake", "m", "chat", "fresh")
+        self.assertEqual(database.get_llm_cache_stats()["entries"], 1)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ResponseCache(ttl=0, max_entries=2, max_bytes=0)
+        cache.put("a", "fake", "m", "chat", "A")
+        cache.put("b", "fake", "m", "chat", "B")
+        cache.get("a")
+        cache.put("c", "fake", "m", "chat", "C")
+        self.assertEqual(cache.get("a"), "A")
+        self.assertIsNone(cache.get("b"))
+
+        sized = ResponseCache(ttl=0, max_entries=0, max_bytes=10)
+        sized.put("big", "fake", "m", "chat", "x" * 20)
+        self.assertIsNone(sized.get("big"))
+
+    def test_database_errors_fall_back_to_misses(self):
+        cache = ResponseCache()
+        with mock.patch.object(database, "get_llm_cache_entry", side_effect=RuntimeError("locked")):
+            self.assertIsNone(cache.get("k"))
+        self.assertEqual(cache.stats()["errors"], 1)
+
+
+class CachedClientTest(_CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.adapter = _CountingAdapter()
+        with mock.patch.object(llm_client.LLMClient, "_initialize_adapter", return_value=self.adapter):
+            self.client = llm_client.LLMClient("fake")
+        self.client.telemetry = Telemetry(enabled=False)
+        patcher = mock.patch("utils.llm_cache.response_cache", ResponseCache(ttl=60))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_structured_generation_is_cached_when_asked(self):
+        first = self.client.generate_structured("transcript", SCHEMA, cache=True)
+        self.assertEqual(self.client.generate_structured("transcript", SCHEMA, cache=True), first)
+        self.assertEqual(self.adapter.calls, 1)
+
+        self.client.generate_structured("transcript", SCHEMA)
+        self.client.generate_structured("transcript", SCHEMA, model_hint="other-model", cache=True)
+        self.assertEqual(self.adapter.calls, 3)
+
+    def test_chat_is_cached_when_asked(self):
+        messages = [{"role": "user", "content": "hi"}]
+        self.assertEqual(self.client.chat(messages, cache=True), "reply 1")
+        self.assertEqual(self.client.chat(messages, cache=True), "reply 1")
+        self.assertEqual(self.client.chat(messages), "reply 2")
+
+
+if __name__ == "__main__":
+    unittest.main()
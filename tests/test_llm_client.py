@@ -0,0 +1,225 @@
+"""
+Tests for utils/llm_client.py (shared client registry, chat streaming) and the
+streaming agent chat endpoints.
+"""
+import json
+import os
+import sys
+import threading
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from tests.test_archive_routes import _AppTestCase
+from utils import llm_client
+from utils.llm_telemetry import Telemetry
+
+
+class _FakeSDKClient:
+    def __init__(self, http_client):
+        self.http_client = http_client
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class _FakeAdapter:
+    provider_name = "fake"
+    default_model = "fake-model"
+
+    def __init__(self, chunks=("Hel", "lo", "!"), fail_after=None):
+        self.chunks = chunks
+        self.fail_after = fail_after
+        self.streams = []
+
+    def chat(self, messages, model_hint=None):
+        return "".join(self.chunks)
+
+    def chat_stream(self, messages, model_hint=None):
+        self.streams.append(messages)
+        for index, chunk in enumerate(self.chunks):
+            if index == self.fail_after:
+                raise ConnectionError("upstream went away")
+            yield chunk
+
+
+def _fake_client(adapter, telemetry=None):
+    with mock.patch.object(llm_client.LLMClient, "_initialize_adapter", return_value=adapter):
+        client = llm_client.LLMClient("fake")
+    # Keep test calls out of the real database
+    client.telemetry = telemetry or Telemetry(enabled=False)
+    return client
+
+
+def _events(response):
+    """Parse a text/event-stream body into (event, data) pairs."""
+    events = []
+    for block in response.get_data(as_text=True).strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+class ClientRegistryTest(unittest.TestCase):
+    def setUp(self):
+        llm_client.close_llm_clients()
+        patcher = mock.patch.object(llm_client, "_http_client", side_effect=object)
+        self.http_client = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(llm_client.close_llm_clients)
+
+    def test_one_sdk_client_per_provider_and_base_url(self):
+        built = []
+
+        def factory(http_client):
+            built.append(http_client)
+            return _FakeSDKClient(http_client)
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            llm_client.shared_sdk_client("openai_compatible", "http://vllm:8000/v1", factory)))
+            for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(built), 1)
+        self.assertTrue(all(client is results[0] for client in results))
+        other = llm_client.shared_sdk_client("openai_compatible", "http://ollama:11434/v1", factory)
+        self.assertIsNot(other, results[0])
+
+        llm_client.close_llm_clients()
+        self.assertTrue(results[0].closed and other.closed)
+        self.assertIsNot(llm_client.shared_sdk_client("openai_compatible", "http://vllm:8000/v1", factory),
+                         results[0])
+
+    def test_get_llm_client_is_shared(self):
+        with mock.patch.object(llm_client.LLMClient, "_initialize_adapter", return_value=_FakeAdapter()) as init:
+            first = llm_client.get_llm_client("openai_compatible")
+            self.assertIs(llm_client.get_llm_client("OpenAI_Compatible"), first)
+            self.assertIsNot(llm_client.get_llm_client("openai_compatible", max_output_tokens=256), first)
+        self.assertEqual(init.call_count, 2)
+
+    def test_unconfigured_provider_is_not_cached(self):
+        with mock.patch.object(llm_client.LLMClient, "_initialize_adapter",
+                               side_effect=llm_client.ProviderNotConfiguredError("not set")):
+            with self.assertRaises(llm_client.ProviderNotConfiguredError):
+                llm_client.get_llm_client("anthropic")
+        with mock.patch.object(llm_client.LLMClient, "_initialize_adapter", return_value=_FakeAdapter()):
+            self.assertIsInstance(llm_client.get_llm_client("anthropic"), llm_client.LLMClient)
+
+
+class ChatStreamTest(unittest.TestCase):
+    def test_chunks_are_yielded_and_timings_logged(self):
+        client = _fake_client(_FakeAdapter())
+        with self.assertLogs(llm_client.logger, level="INFO") as logs:
+            self.assertEqual(list(client.chat_stream([{"role": "user", "content": "hi"}])), ["Hel", "lo", "!"])
+        output = "\n".join(logs.output)
+        self.assertIn("time to first token", output)
+        self.assertIn("(first token", output)
+        self.assertIn("3 chunks", output)
+
+    def test_provider_errors_are_wrapped(self):
+        stream = _fake_client(_FakeAdapter(fail_after=1)).chat_stream([])
+        self.assertEqual(next(stream), "Hel")
+        with self.assertRaises(RuntimeError):
+            next(stream)
+
+
+class PromptCachingTest(unittest.TestCase):
+    MESSAGES = [
+        {"role": "system", "content": "Persona block"},
+        {"role": "system", "content": "Journey block"},
+        {"role": "user", "content": "earlier"},
+        {"role": "assistant", "content": "reply"},
+        {"role": "user", "content": "now"},
+    ]
+
+    def _adapter(self, cls, client=None):
+        adapter = cls.__new__(cls)
+        adapter.max_output_tokens = 100
+        adapter.client = client
+        return adapter
+
+    def test_anthropic_request_marks_cache_breakpoints(self):
+        request = self._adapter(llm_client.AnthropicAdapter)._message_request(self.MESSAGES, "claude-test")
+        ephemeral = {"type": "ephemeral"}
+        self.assertEqual(request["system"], [
+            {"type": "text", "text": "Persona block", "cache_control": ephemeral},
+            {"type": "text", "text": "Journey block", "cache_control": ephemeral},
+        ])
+        self.assertEqual(request["messages"][:2], [{"role": "user", "content": "earlier"},
+                                                   {"role": "assistant", "content": "reply"}])
+        self.assertEqual(request["messages"][-1]["content"],
+                         [{"type": "text", "text": "now", "cache_control": ephemeral}])
+
+    def test_anthropic_breakpoints_are_capped(self):
+        messages = [{"role": "system", "content": f"block {i}"} for i in range(5)] + [self.MESSAGES[-1]]
+        request = self._adapter(llm_client.AnthropicAdapter)._message_request(messages, None)
+        self.assertEqual(len(request["system"]), 5)
+        marked = sum("cache_control" in block for block in request["system"])
+        self.assertEqual(marked, llm_client.ANTHROPIC_CACHE_BREAKPOINTS - 1)
+        self.assertNotIn("system", self._adapter(llm_client.AnthropicAdapter)._message_request(self.MESSAGES[2:], None))
+
+    def test_openai_compatible_merges_system_blocks_and_logs_cached_tokens(self):
+        completion = SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))],
+            usage=SimpleNamespace(prompt_tokens=1500, completion_tokens=20,
+                                  prompt_tokens_details=SimpleNamespace(cached_tokens=1024)),
+        )
+        client = mock.Mock()
+        client.chat.completions.create.return_value = completion
+        adapter = self._adapter(llm_client.OpenAICompatibleAdapter, client)
+
+        with self.assertLogs(llm_client.logger, level="INFO") as logs:
+            self.assertEqual(adapter.chat(self.MESSAGES), "ok")
+        sent = client.chat.completions.create.call_args.kwargs["messages"]
+        self.assertEqual(sent[0], {"role": "system", "content": "Persona block\n\nJourney block"})
+        self.assertEqual(sent[1:], self.MESSAGES[2:])
+        self.assertIn("1500 prompt tokens (1024 cached)", "\n".join(logs.output))
+
+
+class AgentStreamingRouteTest(_AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config["LOGIN_DISABLED"] = True
+        self.adapter = _FakeAdapter()
+        patcher = mock.patch.object(llm_client, "get_llm_client", return_value=_fake_client(self.adapter))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _post(self, url, accept="text/event-stream"):
+        return self.client.post(url, json={"message": "hi", "conversation_id": "c1", "system_prompt": "Be brief."},
+                                headers={"Accept": accept})
+
+    def test_standalone_message_streams_tokens(self):
+        response = self._post("/agent/message")
+        self.assertEqual(response.mimetype, "text/event-stream")
+        self.assertEqual(response.headers["Cache-Control"], "no-cache")
+        events = _events(response)
+        self.assertEqual([data["text"] for event, data in events if event == "token"], ["Hel", "lo", "!"])
+        self.assertEqual(events[-1], ("done", {"success": True, "response": "Hello!",
+                                               "conversation_id": "c1", "context_depth": {},
+                                               "provider": "fake"}))
+
+    def test_json_reply_without_event_stream_accept(self):
+        response = self._post("/agent/message", accept="application/json")
+        self.assertEqual(response.get_json()["response"], "Hello!")
+        self.assertEqual(self.adapter.streams, [])
+
+    def test_journey_message_streams_and_reports_errors(self):
+        journey_id = database.create_journey(name="Trip", description="", persona_id=None)
+        self.adapter.fail_after = 2
+        events = _events(self._post(f"/journey/{journey_id}/agent/message"))
+        self.assertEqual([event for event, _ in events], ["token", "token", "error"])
+        self.assertFalse(events[-1][1]["success"])
+        self.assertEqual(self.adapter.streams[0][-1], {"role": "user", "content": "hi"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,203 @@
+"""
+Tests for LLM provider failover: circuit breakers (utils/llm_failover.py),
+the fallback chain and hedged requests in LLMClient.
+"""
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tests.test_archive_routes import _AppTestCase
+from tests.test_llm_client import _events
+from utils import llm_client, llm_failover
+from utils.llm_failover import CircuitBreaker
+from utils.llm_telemetry import Telemetry
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class _Provider:
+    """Answers with its own name; can fail, or stall until released."""
+
+    def __init__(self, name, fail=False, stall=None):
+        self.provider_name = name
+        self.default_model = f"{name}-model"
+        self.fail = fail
+        self.stall = stall
+        self.calls = []
+        self.closed = threading.Event()
+
+    def _begin(self, model_hint):
+        self.calls.append(model_hint)
+        if self.stall:
+            self.stall.wait(5)
+        if self.fail:
+            raise ConnectionError(f"{self.provider_name} is down")
+
+    def chat(self, messages, model_hint=None):
+        self._begin(model_hint)
+        return f"from {self.provider_name}"
+
+    def chat_stream(self, messages, model_hint=None):
+        try:
+            self._begin(model_hint)
+            yield f"from {self.provider_name}"
+            yield "!"
+        finally:
+            self.closed.set()
+
+    def generate_structured(self, prompt, schema, model_hint=None):
+        self._begin(model_hint)
+        return {"provider": self.provider_name}
+
+
+def _chain(*adapters, hedge_after_ms=0):
+    with mock.patch.object(llm_client.LLMClient, "_initialize_adapter", return_value=adapters[0]), \
+            mock.patch.object(llm_client.LLMClient, "_initialize_fallbacks", return_value=list(adapters[1:])):
+        client = llm_client.LLMClient("fake")
+    client.hedge_after_ms = hedge_after_ms
+    client.telemetry = Telemetry(enabled=False)
+    return client
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = _Clock()
+        self.breaker = CircuitBreaker("vllm", window=4, min_calls=4, failure_rate=0.5, slow_ms=1000,
+                                      cooldown=30, clock=self.clock)
+
+    def test_opens_on_failures_and_slow_calls(self):
+        for success, ms in ((True, 10), (False, 10), (True, 10)):
+            self.breaker.record(success, ms)
+        self.assertTrue(self.breaker.allow())
+        # A slow success counts against the provider
+        self.breaker.record(True, 5000)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.snapshot()["retry_in_s"], 30)
+
+    def test_half_open_lets_one_probe_through(self):
+        for _ in range(4):
+            self.breaker.record(False, 10)
+        self.clock.now = 31
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+
+        self.breaker.record(False, 10)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+        self.clock.now = 62
+        self.assertTrue(self.breaker.allow())
+        self.breaker.record(True, 10)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertEqual(self.breaker.snapshot()["calls"], 0)
+
+
+class FailoverTest(unittest.TestCase):
+    def setUp(self):
+        llm_failover.reset_breakers()
+        self.addCleanup(llm_failover.reset_breakers)
+
+    def test_falls_back_in_order(self):
+        primary, backup = _Provider("vllm", fail=True), _Provider("anthropic")
+        client = _chain(primary, backup)
+        self.assertEqual(client.chat([], model_hint="qwen"), "from anthropic")
+        self.assertEqual(client.served_by(), "anthropic")
+        # The model hint names a primary model; the fallback uses its own default
+        self.assertEqual((primary.calls, backup.calls), (["qwen"], [None]))
+        self.assertEqual(client.generate_structured("p", {}), {"provider": "anthropic"})
+
+    def test_every_provider_failing_raises(self):
+        client = _chain(_Provider("vllm", fail=True), _Provider("anthropic", fail=True))
+        with self.assertRaises(RuntimeError):
+            client.chat([])
+
+    def test_open_breaker_skips_the_provider(self):
+        primary, backup = _Provider("vllm"), _Provider("anthropic")
+        client = _chain(primary, backup)
+        for _ in range(llm_failover.get_breaker("vllm").min_calls):
+            llm_failover.get_breaker("vllm").record(False, 10)
+
+        self.assertEqual(client.chat([]), "from anthropic")
+        self.assertEqual(primary.calls, [])
+        states = {p["provider"]: p["state"] for p in client.provider_status()["providers"]}
+        self.assertEqual(states, {"vllm": "open", "anthropic": "closed"})
+
+    def test_all_breakers_open_still_tries(self):
+        primary = _Provider("vllm")
+        client = _chain(primary)
+        for _ in range(llm_failover.get_breaker("vllm").min_calls):
+            llm_failover.get_breaker("vllm").record(False, 10)
+        self.assertEqual(client.chat([]), "from vllm")
+
+    def test_stream_fails_over_before_the_first_token(self):
+        client = _chain(_Provider("vllm", fail=True), _Provider("anthropic"))
+        self.assertEqual(list(client.chat_stream([])), ["from anthropic", "!"])
+        self.assertEqual(client.served_by(), "anthropic")
+
+    def test_slow_chat_is_hedged(self):
+        release = threading.Event()
+        primary, backup = _Provider("vllm", stall=release), _Provider("anthropic")
+        client = _chain(primary, backup, hedge_after_ms=50)
+        started = time.monotonic()
+        self.assertEqual(client.chat([]), "from anthropic")
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(client.served_by(), "anthropic")
+        release.set()
+
+    def test_hedged_stream_closes_the_loser(self):
+        release = threading.Event()
+        primary, backup = _Provider("vllm", stall=release), _Provider("anthropic")
+        client = _chain(primary, backup, hedge_after_ms=50)
+        self.assertEqual(list(client.chat_stream([])), ["from anthropic", "!"])
+
+        # The stalled stream is closed once it produces its first token
+        release.set()
+        self.assertTrue(primary.closed.wait(5))
+
+    def test_fast_primary_is_not_hedged(self):
+        primary, backup = _Provider("vllm"), _Provider("anthropic")
+        client = _chain(primary, backup, hedge_after_ms=1000)
+        self.assertEqual(client.chat([]), "from vllm")
+        self.assertEqual(backup.calls, [])
+
+
+class ProviderReportingRouteTest(_AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config["LOGIN_DISABLED"] = True
+        llm_failover.reset_breakers()
+        self.addCleanup(llm_failover.reset_breakers)
+        client = _chain(_Provider("vllm", fail=True), _Provider("anthropic"))
+        patcher = mock.patch.object(llm_client, "get_llm_client", return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_replies_name_the_provider(self):
+        payload = {"message": "hi", "system_prompt": "Be brief."}
+        body = self.client.post("/agent/message", json=payload).get_json()
+        self.assertEqual((body["response"], body["provider"]), ("from anthropic", "anthropic"))
+
+        events = _events(self.client.post("/agent/message", json=payload, headers={"Accept": "text/event-stream"}))
+        self.assertEqual(events[-1][0], "done")
+        self.assertEqual(events[-1][1]["provider"], "anthropic")
+
+    def test_provider_status(self):
+        self.client.post("/agent/message", json={"message": "hi", "system_prompt": "Be brief."})
+        status = self.client.get("/api/llm-providers").get_json()
+        self.assertEqual([p["provider"] for p in status["providers"]], ["vllm", "anthropic"])
+        self.assertEqual(status["providers"][0]["failures"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+"""
+Tests for the stub LLM server used for load tests (utils/llm_stub.py).
+"""
+import json
+import os
+import random
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.persona_attribute_service import EXTRACTION_SCHEMA
+from utils.llm_stub import StubConfig, create_stub_app, instance_for_schema, parse_distribution
+
+SCHEMA = {
+    "type": "object",
+    "properties": {
+        "age": {"type": ["integer", "null"], "minimum": 18, "maximum": 90},
+        "tone": {"enum": ["warm", "curt"]},
+        "interests": {"type": "array", "items": {"type": "string"}, "minItems": 2, "maxItems": 2},
+    },
+}
+
+
+def _instant(**overrides):
+    return StubConfig(**dict(dict(ttft_ms="0", tokens_per_second=0, output_tokens="fixed:12"), **overrides))
+
+
+def _sse(response):
+    """(event, data) pairs of a text/event-stream body."""
+    events = []
+    for block in response.get_data(as_text=True).strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines.get("event"), lines["data"]))
+    return events
+
+
+class DistributionTest(unittest.TestCase):
+    def test_specs(self):
+        rng = random.Random(0)
+        self.assertEqual(parse_distribution("250")(rng), 250)
+        self.assertEqual(parse_distribution("fixed:80")(rng), 80)
+        self.assertTrue(all(100 <= parse_distribution("uniform:100,200")(rng) <= 200 for _ in range(50)))
+        self.assertTrue(all(parse_distribution("normal:0,100")(rng) >= 0 for _ in range(50)))
+        self.assertGreater(parse_distribution("lognormal:300,0.5")(rng), 0)
+
+    def test_invalid_specs(self):
+        for spec in ("gamma:1,2", "uniform:1", "fixed:soon"):
+            with self.assertRaises(ValueError):
+                parse_distribution(spec)
+
+    def test_instances_conform_to_schema(self):
+        rng = random.Random(1)
+        for _ in range(20):
+            value = instance_for_schema(SCHEMA, rng)
+            self.assertTrue(value["age"] is None or 18 <= value["age"] <= 90)
+            self.assertIn(value["tone"], ("warm", "curt"))
+            self.assertEqual(len(value["interests"]), 2)
+        extraction = instance_for_schema(EXTRACTION_SCHEMA, rng)
+        self.assertEqual(set(extraction), set(EXTRACTION_SCHEMA["properties"]))
+        self.assertIsInstance(extraction["psychographic"]["interests"], list)
+
+
+class OpenAIStubTest(unittest.TestCase):
+    def setUp(self):
+        self.client = create_stub_app(_instant()).test_client()
+
+    def _chat(self, **body):
+        return self.client.post("/v1/chat/completions",
+                                json=dict({"model": "qwen", "messages": [{"role": "user", "content": "Hi"}]}, **body))
+
+    def test_completion(self):
+        body = self._chat(max_tokens=100).get_json()
+        self.assertEqual(body["model"], "qwen")
+        self.assertEqual(len(body["choices"][0]["message"]["content"].split()), 12)
+        self.assertEqual(body["usage"]["completion_tokens"], 12)
+        self.assertEqual(body["choices"][0]["finish_reason"], "stop")
+
+    def test_replies_are_deterministic(self):
+        first = self._chat().get_json()["choices"][0]["message"]["content"]
+        self.assertEqual(self._chat().get_json()["choices"][0]["message"]["content"], first)
+        other = self._chat(messages=[{"role": "user", "content": "Hello"}]).get_json()
+        self.assertNotEqual(other["choices"][0]["message"]["content"], first)
+
+    def test_max_tokens_truncates(self):
+        body = self._chat(max_tokens=5).get_json()
+        self.assertEqual(body["usage"]["completion_tokens"], 5)
+        self.assertEqual(body["choices"][0]["finish_reason"], "length")
+
+    def test_stream_with_usage(self):
+        events = _sse(self._chat(stream=True, stream_options={"include_usage": True}))
+        self.assertEqual(events[-1][1], "[DONE]")
+        chunks = [json.loads(data) for _, data in events[:-1]]
+        text = "".join(c["choices"][0]["delta"].get("content", "") for c in chunks if c["choices"])
+        self.assertEqual(text, self._chat().get_json()["choices"][0]["message"]["content"])
+        self.assertEqual(chunks[-1]["usage"]["completion_tokens"], 12)
+
+    def test_structured_outputs(self):
+        body = self._chat(response_format={"type": "json_schema", "json_schema": {"name": "r", "schema": SCHEMA}})
+        value = json.loads(body.get_json()["choices"][0]["message"]["content"])
+        self.assertEqual(set(value), {"age", "tone", "interests"})
+
+        # The LLM client's prompt form for providers without structured outputs
+        prompt = f"Extract.\n\nRespond ONLY with valid JSON that matches this schema: {json.dumps(SCHEMA)}"
+        body = self._chat(messages=[{"role": "user", "content": prompt}])
+        self.assertIn(json.loads(body.get_json()["choices"][0]["message"]["content"])["tone"], ("warm", "curt"))
+
+    def test_injected_errors(self):
+        client = create_stub_app(_instant(error_rate=1, error_statuses=[429])).test_client()
+        response = client.post("/v1/chat/completions", json={"messages": []})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers["Retry-After"], "1")
+        self.assertEqual(response.get_json()["error"]["type"], "rate_limit_error")
+
+    def test_paced_generation(self):
+        client = create_stub_app(_instant(ttft_ms="50", tokens_per_second=100)).test_client()
+        started = time.monotonic()
+        client.post("/v1/chat/completions", json={"messages": []})
+        # 50 ms to the first token, then 11 more tokens at 10 ms each
+        self.assertGreaterEqual(time.monotonic() - started, 0.15)
+
+
+class AnthropicStubTest(unittest.TestCase):
+    def setUp(self):
+        self.client = create_stub_app(_instant()).test_client()
+        self.request = {"model": "claude", "max_tokens": 100,
+                        "system": [{"type": "text", "text": "Be brief."}],
+                        "messages": [{"role": "user", "content": [{"type": "text", "text": "Hi"}]}]}
+
+    def test_message(self):
+        body = self.client.post("/v1/messages", json=self.request).get_json()
+        self.assertEqual((body["type"], body["stop_reason"]), ("message", "end_turn"))
+        self.assertEqual(body["usage"]["output_tokens"], 12)
+        self.assertEqual(len(body["content"][0]["text"].split()), 12)
+
+    def test_stream_events(self):
+        events = _sse(self.client.post("/v1/messages", json=dict(self.request, stream=True)))
+        names = [event for event, _ in events]
+        self.assertEqual(names[:2], ["message_start", "content_block_start"])
+        self.assertEqual(names[-3:], ["content_block_stop", "message_delta", "message_stop"])
+        text = "".join(json.loads(data)["delta"]["text"] for event, data in events if event == "content_block_delta")
+        self.assertEqual(text, self.client.post("/v1/messages", json=self.request).get_json()["content"][0]["text"])
+
+    def test_injected_errors(self):
+        client = create_stub_app(_instant(error_rate=1, error_statuses=[529])).test_client()
+        response = client.post("/v1/messages", json=self.request)
+        self.assertEqual(response.status_code, 529)
+        self.assertEqual(response.get_json()["error"]["type"], "overloaded_error")
+
+
+if __name__ == "__main__":
+    unittest.main()
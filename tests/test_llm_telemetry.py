@@ -0,0 +1,213 @@
+"""
+Tests for LLM call telemetry (utils/llm_telemetry.py): what LLMClient
+records per call, batched writes, the summary and hourly rollups.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from database import connection as db_connection
+from tests.test_archive_routes import _AppTestCase
+from tests.test_llm_client import _fake_client
+from utils import llm_client
+from utils.llm_telemetry import Telemetry, percentile
+
+
+class _Recorder(Telemetry):
+    """Keeps records in memory instead of writing them."""
+
+    def __init__(self):
+        super().__init__(enabled=True, flush_size=1000, flush_seconds=3600)
+        self.rows = []
+
+    def record(self, row):
+        self.rows.append(row)
+
+
+class _UsageAdapter:
+    provider_name = "vllm"
+    default_model = "qwen"
+
+    def chat(self, messages, model_hint=None):
+        llm_client._log_usage("vllm", 120, 100, 30)
+        return "reply"
+
+    def chat_stream(self, messages, model_hint=None):
+        yield "a"
+        yield "b"
+        llm_client._log_usage("vllm", 50, 0, 2)
+
+    def generate_structured(self, prompt, schema, model_hint=None):
+        raise ValueError("bad JSON")
+
+
+def _call(provider="vllm", model="qwen", latency_ms=100.0, ttft_ms=None, completion_tokens=10,
+          outcome="ok", created_at=None, attempts=1):
+    return {
+        "provider": provider, "model": model, "kind": "chat", "outcome": outcome,
+        "prompt_tokens": 100, "cached_tokens": 0, "completion_tokens": completion_tokens,
+        "ttft_ms": ttft_ms, "latency_ms": latency_ms, "attempts": attempts, "error": None,
+        "created_at": created_at or datetime.now(),
+    }
+
+
+def _wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for the telemetry thread")
+        time.sleep(0.01)
+
+
+class _TelemetryTestCase(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.mkdtemp()
+        self.original_db_path = db_connection.DEFAULT_DB_PATH
+        db_connection.DEFAULT_DB_PATH = os.path.join(self._tmp, "test.db")
+        db_connection._db_instance = None
+        database._llm_telemetry_repo = None
+        database.init_db()
+
+    def tearDown(self):
+        db_connection.DEFAULT_DB_PATH = self.original_db_path
+        db_connection._db_instance = None
+        database._llm_telemetry_repo = None
+
+
+class CallRecordTest(unittest.TestCase):
+    def setUp(self):
+        self.recorder = _Recorder()
+        self.client = _fake_client(_UsageAdapter(), telemetry=self.recorder)
+
+    def test_chat_records_usage_and_model(self):
+        self.assertEqual(self.client.chat([]), "reply")
+        row, = self.recorder.rows
+        self.assertEqual((row["provider"], row["model"], row["kind"], row["outcome"]),
+                         ("vllm", "qwen", "chat", "ok"))
+        self.assertEqual((row["prompt_tokens"], row["cached_tokens"], row["completion_tokens"]), (120, 100, 30))
+        self.assertEqual(row["attempts"], 1)
+        self.assertIsNone(row["ttft_ms"])
+
+    def test_stream_records_time_to_first_token(self):
+        self.assertEqual(list(self.client.chat_stream([])), ["a", "b"])
+        row, = self.recorder.rows
+        self.assertEqual((row["kind"], row["completion_tokens"]), ("stream", 2))
+        self.assertLessEqual(row["ttft_ms"], row["latency_ms"])
+
+    def test_abandoned_stream_is_cancelled(self):
+        stream = self.client.chat_stream([])
+        next(stream)
+        stream.close()
+        self.assertEqual(self.recorder.rows[0]["outcome"], "cancelled")
+
+    def test_failure_is_recorded(self):
+        with self.assertRaises(Exception):
+            self.client.generate_structured("p", {})
+        row, = self.recorder.rows
+        self.assertEqual((row["kind"], row["outcome"]), ("structured", "error"))
+        self.assertIn("bad JSON", row["error"])
+
+
+class TelemetryStoreTest(_TelemetryTestCase):
+    def test_records_are_written_in_batches(self):
+        telemetry = Telemetry(enabled=True, flush_size=3, flush_seconds=3600)
+        telemetry.record(_call())
+        telemetry.record(_call())
+        self.assertEqual(database.get_llm_calls(), [])
+        telemetry.record(_call())
+        _wait_for(lambda: len(database.get_llm_calls()) == 3)
+
+    def test_records_are_written_off_the_calling_thread(self):
+        telemetry = Telemetry(enabled=True, flush_size=1, flush_seconds=3600)
+        writers = []
+        with mock.patch.object(database, "save_llm_calls", side_effect=lambda rows: writers.append(
+                threading.current_thread())):
+            telemetry.record(_call())
+            _wait_for(lambda: writers)
+        self.assertIsNot(writers[0], threading.current_thread())
+
+    def test_disabled_telemetry_writes_nothing(self):
+        telemetry = Telemetry(enabled=False, flush_size=1)
+        telemetry.record(_call())
+        self.assertEqual(telemetry.flush(), 0)
+        self.assertEqual(database.get_llm_calls(), [])
+
+    def test_write_failures_are_counted_not_raised(self):
+        telemetry = Telemetry(enabled=True, flush_size=1)
+        with mock.patch.object(database, "save_llm_calls", side_effect=RuntimeError("locked")):
+            telemetry.record(_call())
+            _wait_for(lambda: telemetry.summary()["dropped"] == 1)
+
+    def test_summary_percentiles_and_throughput(self):
+        telemetry = Telemetry(enabled=True, flush_size=1000)
+        for ms in range(100, 1100, 100):
+            telemetry.record(_call(latency_ms=ms, ttft_ms=ms / 10, completion_tokens=90))
+        telemetry.record(_call(outcome="error", completion_tokens=None, attempts=2))
+        telemetry.record(_call(provider="anthropic", model="claude"))
+
+        models = {m["model"]: m for m in telemetry.summary()["models"]}
+        qwen = models["qwen"]
+        self.assertEqual((qwen["calls"], qwen["errors"], qwen["retries"]), (11, 1, 1))
+        self.assertEqual((qwen["p50_ms"], qwen["p95_ms"]), (500, 1000))
+        self.assertEqual((qwen["ttft_p50_ms"], qwen["ttft_p95_ms"]), (50, 100))
+        # 900 tokens over 4950 ms of generation (latency minus time to first token)
+        self.assertEqual(qwen["tokens_per_s"], 181.8)
+        self.assertEqual(models["claude"]["calls"], 1)
+
+    def test_old_calls_are_rolled_up(self):
+        old = datetime.now() - timedelta(days=10)
+        database.save_llm_calls([_call(created_at=old, latency_ms=200),
+                                 _call(created_at=old, latency_ms=400, outcome="error"),
+                                 _call()])
+        self.assertEqual(database.rollup_llm_calls(datetime.now() - timedelta(days=7)), 2)
+        self.assertEqual(len(database.get_llm_calls()), 1)
+
+        daily = database.get_llm_call_daily(datetime.now() - timedelta(days=30))
+        self.assertEqual([(d["calls"], d["errors"]) for d in daily], [(2, 1), (1, 0)])
+        self.assertEqual(daily[0]["latency_ms"], 600)
+
+        # Rolling up into an existing hour adds to it
+        database.save_llm_calls([_call(created_at=old)])
+        database.rollup_llm_calls(datetime.now() - timedelta(days=7))
+        self.assertEqual(database.get_llm_call_daily(datetime.now() - timedelta(days=30))[0]["calls"], 3)
+
+    def test_percentile(self):
+        self.assertIsNone(percentile([], 50))
+        self.assertEqual(percentile([1, 2, 3, 4], 50), 2)
+        self.assertEqual(percentile([1, 2, 3, 4], 95), 4)
+
+
+class TelemetryRouteTest(_AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config["LOGIN_DISABLED"] = True
+        database._llm_telemetry_repo = None
+        self.addCleanup(setattr, database, "_llm_telemetry_repo", None)
+        patcher = mock.patch("utils.llm_telemetry.telemetry", Telemetry(enabled=True))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_summary_endpoint(self):
+        database.save_llm_calls([_call()])
+        body = self.client.get("/api/llm-telemetry?hours=1").get_json()
+        self.assertEqual(body["hours"], 1)
+        self.assertEqual([m["model"] for m in body["models"]], ["qwen"])
+
+    def test_invalid_window(self):
+        for query in ("hours=0", "days=-1", "hours=soon"):
+            self.assertEqual(self.client.get(f"/api/llm-telemetry?{query}").status_code, 400)
+
+    def test_dashboard_renders(self):
+        self.assertEqual(self.client.get("/llm-telemetry").status_code, 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+"""
+Tests for the RFC 7089 TimeGate/TimeMap endpoints (routes/memento.py) and the
+Memento headers on archived content.
+"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from database.connection import get_db
+from routes import memento as memento_routes
+from tests.test_archive_routes import HTML, _AppTestCase
+from utils import memento_protocol
+
+
+class MementoProtocolHelpersTest(unittest.TestCase):
+    def test_accept_datetime_round_trips_through_local_time(self):
+        when = memento_protocol.parse_accept_datetime("Tue, 20 Mar 2001 20:35:00 GMT")
+        self.assertIsNone(when.tzinfo)
+        self.assertEqual(memento_protocol.format_http_datetime(when), "Tue, 20 Mar 2001 20:35:00 GMT")
+        self.assertEqual(memento_protocol.format_iso_datetime(when), "2001-03-20T20:35:00Z")
+
+    def test_malformed_accept_datetime(self):
+        self.assertIsNone(memento_protocol.parse_accept_datetime("last tuesday"))
+
+    def test_rels_for_the_same_memento_are_merged(self):
+        first = {"id": 1}
+        rels = memento_protocol.memento_rels([("first memento", first), ("last memento", first),
+                                              ("prev memento", None), ("memento", first)])
+        self.assertEqual(rels, [("first last memento", first)])
+
+
+class MementoEndpointsTest(_AppTestCase):
+    URI_R = "https://example.com/news"
+
+    def _memento(self, when, website_id=None):
+        memento_dir = tempfile.mkdtemp(dir=".")
+        with open(os.path.join(memento_dir, "content.html"), "wb") as f:
+            f.write(HTML)
+        memento_id = database.save_memento(website_id or self.website_id, memento_dir)
+        with get_db().transaction() as cursor:
+            cursor.execute("UPDATE mementos SET memento_datetime = ? WHERE id = ?",
+                           (datetime.fromisoformat(when), memento_id))
+        return memento_id
+
+    def _http_date(self, when):
+        return memento_protocol.format_http_datetime(datetime.fromisoformat(when))
+
+    def _uri_m(self, memento_id, website_id=None):
+        return f"http://localhost/archives/{website_id or self.website_id}/mementos/{memento_id}/content"
+
+    def test_timegate_negotiates_nearest_memento(self):
+        ids = [self._memento(f"2024-0{month}-01 12:00:00") for month in (1, 3, 5)]
+
+        response = self.client.get(f"/timegate/{self.URI_R}",
+                                   headers={"Accept-Datetime": self._http_date("2024-03-20 00:00:00")})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.headers["Location"], self._uri_m(ids[1]))
+        self.assertIn("accept-datetime", response.headers["Vary"])
+        link = response.headers["Link"]
+        self.assertIn(f'<{self.URI_R}>; rel="original"', link)
+        self.assertIn(f'<{self._uri_m(ids[0])}>; rel="first prev memento"', link)
+        self.assertIn(f'<{self._uri_m(ids[2])}>; rel="last next memento"', link)
+        self.assertIn(f'<{self._uri_m(ids[1])}>; rel="memento"; '
+                      f'datetime="{self._http_date("2024-03-01 12:00:00")}"', link)
+
+        # No Accept-Datetime: the latest memento; before the first capture: the first.
+        self.assertEqual(self.client.get(f"/timegate/{self.URI_R}").headers["Location"], self._uri_m(ids[2]))
+        early = self.client.get(f"/timegate/{self.URI_R}/",
+                                headers={"Accept-Datetime": "Mon, 01 Jan 1990 00:00:00 GMT"})
+        self.assertEqual(early.headers["Location"], self._uri_m(ids[0]))
+
+    def test_timegate_errors(self):
+        self._memento("2024-01-01 00:00:00")
+        self.assertEqual(self.client.get("/timegate/https://example.com/missing").status_code, 404)
+        bad = self.client.get(f"/timegate/{self.URI_R}", headers={"Accept-Datetime": "yesterday"})
+        self.assertEqual(bad.status_code, 400)
+
+    def test_timegate_persona_scope_and_query_strings(self):
+        self._memento("2024-01-01 00:00:00")
+        uri_r = "https://example.com/search?q=news&page=2"
+        persona_site = database.save_archived_website(url=uri_r, persona_id=7)
+        persona_memento = self._memento("2023-01-01 00:00:00", website_id=persona_site)
+
+        response = self.client.get(f"/timegate/persona/7/{uri_r}")
+        self.assertEqual(response.headers["Location"], self._uri_m(persona_memento, persona_site))
+        self.assertEqual(self.client.get(f"/timegate/persona/8/{uri_r}").status_code, 404)
+        self.assertEqual(self.client.get(f"/timegate/persona/7/{self.URI_R}").status_code, 404)
+
+    def test_captures_of_one_url_are_scoped_by_persona(self):
+        from tests.test_write_memento import _FakeResponse, _StubPage
+        from utils.browser import BrowserManager
+
+        uri_r = "https://example.com/pricing"
+        captures = {}
+        for persona_id, timestamp in ((1, "20240101-000000"), (2, "20240102-000000")):
+            memento_dir = os.path.join("archives", "pricing", timestamp)
+            os.makedirs(memento_dir)
+            with mock.patch("utils.browser.requests.get", return_value=_FakeResponse()):
+                captures[persona_id] = BrowserManager.get_instance()._write_memento(
+                    _StubPage(url=uri_r), uri_r, persona_id=persona_id,
+                    memento_dir=memento_dir, timestamp=timestamp,
+                )
+        self.assertNotEqual(captures[1]["archived_website_id"], captures[2]["archived_website_id"])
+
+        for persona_id, capture in captures.items():
+            uri_m = self._uri_m(capture["memento_id"], capture["archived_website_id"])
+            self.assertEqual(self.client.get(f"/timegate/persona/{persona_id}/{uri_r}").headers["Location"], uri_m)
+            timemap = json.loads(self.client.get(f"/timemap/json/persona/{persona_id}/{uri_r}").get_data(as_text=True))
+            self.assertEqual([entry["uri"] for entry in timemap["mementos"]["list"]], [uri_m])
+
+    def test_link_timemap_lists_mementos_in_order(self):
+        ids = [self._memento(when) for when in ("2024-02-01 00:00:00", "2024-01-01 00:00:00")]
+        response = self.client.get(f"/timemap/link/{self.URI_R}")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, "application/link-format")
+        body = response.get_data(as_text=True)
+        self.assertTrue(body.startswith(f'<{self.URI_R}>; rel="original",\n'))
+        self.assertIn(f'<http://localhost/timegate/{self.URI_R}>; rel="timegate"', body)
+        self.assertLess(body.index(f'<{self._uri_m(ids[1])}>; rel="first memento"'),
+                        body.index(f'<{self._uri_m(ids[0])}>; rel="last memento"'))
+        self.assertNotIn('rel="next"', body)
+
+    def test_timemaps_are_paginated(self):
+        ids = [self._memento(f"2024-01-0{day} 00:00:00") for day in range(1, 6)]
+        with mock.patch.object(memento_routes, "TIMEMAP_PAGE_SIZE", 2), \
+                mock.patch.object(memento_routes, "TIMEMAP_BATCH_SIZE", 1):
+            seen, url = [], f"/timemap/json/{self.URI_R}"
+            while url:
+                page = json.loads(self.client.get(url).get_data(as_text=True))
+                self.assertLessEqual(len(page["mementos"]["list"]), 2)
+                seen.extend(entry["uri"] for entry in page["mementos"]["list"])
+                url = page["next"]
+            self.assertEqual(page["mementos"]["first"]["uri"], self._uri_m(ids[0]))
+
+            link_page = self.client.get(f"/timemap/link/{self.URI_R}").get_data(as_text=True)
+            self.assertIn(f'<http://localhost/timemap/link/after/20240102000000-{ids[1]}/{self.URI_R}>; rel="next"',
+                          link_page)
+
+            # The cursor carries its position, so deleting that memento does not end the listing
+            next_uri = json.loads(self.client.get(f"/timemap/json/{self.URI_R}").get_data(as_text=True))["next"]
+            database.delete_memento(ids[1])
+            page = json.loads(self.client.get(next_uri).get_data(as_text=True))
+            self.assertEqual([entry["uri"] for entry in page["mementos"]["list"]],
+                             [self._uri_m(i) for i in ids[2:4]])
+        self.assertEqual(seen, [self._uri_m(i) for i in ids])
+        self.assertEqual(self.client.get("/timemap/json/https://example.com/missing").status_code, 404)
+        self.assertEqual(self.client.get(f"/timemap/json/after/bogus/{self.URI_R}").status_code, 404)
+
+    def test_archived_content_carries_memento_headers(self):
+        memento_id = self._memento("2024-01-01 12:00:00")
+        response = self.client.get(f"/archives/{self.website_id}/mementos/{memento_id}/content")
+        self.assertEqual(response.headers["Memento-Datetime"], self._http_date("2024-01-01 12:00:00"))
+        self.assertIn(f'<{self.URI_R}>; rel="original"', response.headers["Link"])
+        self.assertIn(f'<http://localhost/timemap/link/{self.URI_R}>; rel="timemap"', response.headers["Link"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+"""
+Tests for panel chat (services/panel.py) and the /agent/panel endpoint.
+"""
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from services.panel import PanelChat
+from tests.test_archive_routes import _AppTestCase
+from tests.test_llm_client import _events, _fake_client
+from utils import llm_client
+
+
+class _PanelAdapter:
+    """Answers with the persona's occupation; waits for `parties` concurrent calls."""
+
+    provider_name = "fake"
+    default_model = "fake-model"
+
+    def __init__(self, parties=1, fail_for=None):
+        self.barrier = threading.Barrier(parties, timeout=5)
+        self.fail_for = fail_for
+        self.prompts = []
+        self.in_flight = self.peak = 0
+        self.lock = threading.Lock()
+
+    def chat(self, messages, model_hint=None):
+        with self.lock:
+            self.prompts.append(messages)
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        self.barrier.wait()
+        time.sleep(0.01)
+        with self.lock:
+            self.in_flight -= 1
+        system = messages[0]["content"]
+        if self.fail_for and self.fail_for in system:
+            raise ConnectionError("upstream went away")
+        return next(line for line in system.split("\n") if "Occupation" in line)
+
+
+class PanelRouteTest(_AppTestCase):
+    def setUp(self):
+        super().setUp()
+        self.app.config["LOGIN_DISABLED"] = True
+        database.create_persona_tables()
+        self.persona_ids = [
+            database.save_persona({"name": name, "demographic": {"occupation": name}})
+            for name in ("Nurse", "Farmer", "Pilot")
+        ]
+
+    def _use(self, adapter):
+        patcher = mock.patch.object(llm_client, "get_llm_client", return_value=_fake_client(adapter))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _post(self, payload, accept="application/json"):
+        return self.client.post("/agent/panel", json=payload, headers={"Accept": accept})
+
+    def test_personas_are_asked_concurrently(self):
+        # The barrier only releases once all three calls are in flight
+        adapter = _PanelAdapter(parties=3)
+        self._use(adapter)
+        response = self._post({"message": "What do you do?", "persona_ids": self.persona_ids})
+
+        body = response.get_json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([a["persona_id"] for a in body["answers"]], self.persona_ids)
+        self.assertEqual([a["response"] for a in body["answers"]],
+                         ["- Occupation: Nurse", "- Occupation: Farmer", "- Occupation: Pilot"])
+        self.assertEqual((body["count"], body["failed"]), (3, 0))
+        self.assertTrue(all(p[-1] == {"role": "user", "content": "What do you do?"} for p in adapter.prompts))
+
+    def test_answers_stream_as_they_complete(self):
+        self._use(_PanelAdapter(parties=3, fail_for="Farmer"))
+        events = _events(self._post({"message": "hi", "persona_ids": self.persona_ids},
+                                    accept="text/event-stream"))
+
+        self.assertEqual([event for event, _ in events], ["answer", "answer", "answer", "done"])
+        answers = {data["persona_id"]: data for event, data in events if event == "answer"}
+        self.assertFalse(answers[self.persona_ids[1]]["success"])
+        self.assertIn("error", answers[self.persona_ids[1]])
+        self.assertTrue(answers[self.persona_ids[2]]["success"])
+        self.assertEqual(events[-1][1]["failed"], 1)
+
+    def test_concurrency_is_bounded(self):
+        adapter = _PanelAdapter(parties=2)
+        panel = PanelChat(_fake_client(adapter), concurrency=2)
+        persona_ids = self.persona_ids + [database.save_persona({"name": "Chef", "demographic": {"occupation": "Chef"}})]
+        results = list(panel.answers(persona_ids, "hi"))
+        self.assertTrue(all(result["success"] for result in results))
+        self.assertEqual(sorted(r["persona_id"] for r in results), persona_ids)
+        self.assertEqual(adapter.peak, 2)
+
+    def test_rejects_bad_requests(self):
+        self._use(_PanelAdapter())
+        self.assertEqual(self._post({"persona_ids": self.persona_ids}).status_code, 400)
+        self.assertEqual(self._post({"message": "hi", "persona_ids": []}).status_code, 400)
+        self.assertEqual(self._post({"message": "hi", "persona_ids": ["x"]}).status_code, 400)
+        with mock.patch("config.LLM_PANEL_MAX_PERSONAS", 2):
+            self.assertEqual(self._post({"message": "hi", "persona_ids": self.persona_ids}).status_code, 400)
+
+        response = self._post({"message": "hi", "persona_ids": [self.persona_ids[0], 9999]})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.get_json()["persona_ids"], [9999])
+
+
+if __name__ == "__main__":
+    unittest.main()
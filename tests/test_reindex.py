@@ -0,0 +1,166 @@
+"""
+Tests for rebuilding the archive tables from disk (utils/reindex.py).
+
+Mementos are written by the real BrowserManager._write_memento pipeline with
+save_to_db=False (what capture_as_persona does), into a temporary working
+directory with a temporary database.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+from database import connection as db_connection
+from tests.test_write_memento import _FakeResponse, _StubPage
+from utils.reindex import Reindexer, find_memento_dirs
+
+
+class ReindexTest(unittest.TestCase):
+    def setUp(self):
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.mkdtemp()
+        os.chdir(self._tmp)
+        self.original_db_path = db_connection.DEFAULT_DB_PATH
+        db_connection.DEFAULT_DB_PATH = os.path.join(self._tmp, "test.db")
+        db_connection._db_instance = None
+        database._archive_repo = None
+        database.init_db()
+
+    def tearDown(self):
+        db_connection.DEFAULT_DB_PATH = self.original_db_path
+        db_connection._db_instance = None
+        database._archive_repo = None
+        os.chdir(self._cwd)
+        shutil.rmtree(self._tmp, ignore_errors=True)
+
+    def _capture(self, url, persona_id=None, archive_format="files"):
+        from utils.browser import BrowserManager
+
+        with mock.patch("utils.browser.requests.get", return_value=_FakeResponse()):
+            return BrowserManager.get_instance()._write_memento(
+                _StubPage(url=url), url, persona_id=persona_id,
+                save_to_db=False, archive_format=archive_format,
+            )
+
+    def _mementos(self):
+        with db_connection.get_db().cursor() as cursor:
+            cursor.execute("SELECT m.*, aw.uri_r, aw.persona_id FROM mementos m "
+                           "JOIN archived_websites aw ON m.archived_website_id = aw.id ORDER BY m.id")
+            return [dict(row) for row in cursor.fetchall()]
+
+    def test_standalone_captures_become_browsable(self):
+        result = self._capture("https://example.com/a", persona_id=3)
+        stats = Reindexer(workers=1).run()
+
+        self.assertEqual((stats["pending"], stats["inserted"], stats["errors"]), (1, 1, []))
+        self.assertGreater(stats["files_per_second"], 0)
+        [row] = self._mementos()
+        self.assertEqual((row["uri_r"], row["persona_id"]), ("https://example.com/a", 3))
+        self.assertEqual(row["memento_location"], result["memento_location"])
+        self.assertEqual(row["content_encoding"], "gzip")
+        self.assertEqual(row["http_status"], 200)
+        self.assertEqual(database.get_memento_blobs(row["id"]), result["blobs"])
+        self.assertEqual(database._get_archive_repo().get_blob(result["blobs"]["html"])["refcount"], 1)
+        self.assertEqual(database.get_screenshot_hashes(row["id"])["phash"],
+                         result["screenshot_hashes"]["phash"])
+
+    def test_rerun_is_a_no_op_and_force_updates_in_place(self):
+        self._capture("https://example.com/a")
+        Reindexer(workers=1).run()
+        self.assertEqual(Reindexer(workers=1).run()["pending"], 0)
+
+        stats = Reindexer(workers=1, replace=True).run()
+        self.assertEqual((stats["inserted"], stats["updated"]), (0, 1))
+        [row] = self._mementos()
+        blobs = database.get_memento_blobs(row["id"])
+        self.assertEqual(database._get_archive_repo().get_blob(blobs["html"])["refcount"], 1)
+
+    def test_force_moves_mementos_filed_under_another_persona(self):
+        # What captures as a second persona looked like before they got their own website
+        first = self._capture("https://example.com/a", persona_id=1)
+        Reindexer(workers=1).run()
+        memento_dir = os.path.join(os.path.dirname(first["memento_location"]), "20000101-000000")
+        os.makedirs(memento_dir)
+        with mock.patch("utils.browser.BrowserManager._memento_paths",
+                        return_value=(os.path.dirname(memento_dir), memento_dir, "20000101-000000")):
+            second = self._capture("https://example.com/a", persona_id=2)
+        [first] = self._mementos()
+        database.save_memento(first["archived_website_id"], second["memento_location"])
+
+        stats = Reindexer(workers=1, replace=True).run()
+        self.assertEqual(stats["updated"], 2)
+        rows = self._mementos()
+        self.assertEqual(sorted(row["persona_id"] for row in rows), [1, 2])
+        self.assertEqual(len({row["archived_website_id"] for row in rows}), 2)
+
+    def test_absolute_root_matches_captured_locations(self):
+        from utils.browser import BrowserManager
+
+        with mock.patch("utils.browser.requests.get", return_value=_FakeResponse()):
+            captured = BrowserManager.get_instance()._write_memento(_StubPage(), "https://example.com/a")
+        reindexer = Reindexer(root=os.path.abspath("archives"), workers=1)
+        self.assertEqual(reindexer.pending(), [])
+
+        stats = Reindexer(root=os.path.abspath("archives"), workers=1, replace=True).run()
+        self.assertEqual((stats["inserted"], stats["updated"]), (0, 1))
+        [row] = self._mementos()
+        self.assertEqual(row["memento_location"], captured["memento_location"])
+
+    def test_a_dir_is_registered_once(self):
+        result = self._capture("https://example.com/a")
+        site = database.save_archived_website(url="https://example.com/a")
+        # A capture's DB write landing after a re-index registered its dir
+        reindexer = Reindexer(workers=1)
+        records = list(reindexer._parse_all(reindexer.pending()))
+        first = database.save_memento(site, result["memento_location"])
+        self.assertEqual(database.save_memento(site, result["memento_location"]), first)
+        self.assertEqual(database.import_mementos(records)["skipped"], 1)
+        self.assertEqual(len(self._mementos()), 1)
+
+    def test_duplicate_rows_are_dropped_on_upgrade(self):
+        result = self._capture("https://example.com/a")
+        with db_connection.get_db().transaction() as cursor:
+            cursor.execute("DROP INDEX idx_mementos_location_unique")
+        Reindexer(workers=1).run()
+        site = self._mementos()[0]["archived_website_id"]
+        database.save_memento(site, result["memento_location"], blobs={
+            role: (sha256, 1) for role, sha256 in result["blobs"].items()})
+        self.assertEqual(len(self._mementos()), 2)
+
+        database.init_db()
+        [row] = self._mementos()
+        self.assertEqual(database._get_archive_repo().get_blob(result["blobs"]["html"])["refcount"], 1)
+
+    def test_parallel_run_with_bad_metadata(self):
+        for i in range(6):
+            self._capture(f"https://example.com/{i}")
+        broken = sorted(find_memento_dirs())[0]
+        with open(os.path.join(broken, "metadata.json"), "w") as f:
+            f.write("{not json")
+
+        stats = Reindexer(workers=2, batch_size=2).run()
+        self.assertEqual((stats["parsed"], stats["inserted"]), (6, 5))
+        self.assertEqual([e["memento_location"] for e in stats["errors"]], [broken])
+        self.assertEqual(len({row["archived_website_id"] for row in self._mementos()}), 5)
+
+    def test_warc_captures_relink_their_records(self):
+        result = self._capture("https://example.com/w", archive_format="warc")
+        with db_connection.get_db().transaction() as cursor:
+            cursor.execute("DELETE FROM warc_records")   # as if the DB was lost
+
+        Reindexer(workers=1).run()
+        [row] = self._mementos()
+        records = database.get_warc_records(row["id"])
+        self.assertEqual(set(records), {"response", "request", "resource", "metadata"})
+        self.assertEqual(records["response"]["record_id"], result["warc_records"]["response"]["record_id"])
+        self.assertEqual(records["resource"]["target_uri"], "urn:screenshot:https://example.com/w")
+        self.assertIsNotNone(database.get_screenshot_hashes(row["id"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
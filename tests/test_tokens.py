@@ -0,0 +1,159 @@
+"""
+Tests for token counting and context budgeting (services/tokens.py).
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import context, tokens
+
+
+class _WordEncoding:
+    """Stand-in tokenizer: one token per word, counting encode() calls."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def encode(self, text, disallowed_special=()):
+        self.calls += 1
+        return text.split()
+
+
+class TokenCounterTest(unittest.TestCase):
+    def setUp(self):
+        self.encoding = _WordEncoding()
+        patcher = mock.patch.object(tokens, "get_encoding", return_value=self.encoding)
+        self.get_encoding = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.counter = tokens.TokenCounter(max_entries=2)
+
+    def test_counts_are_memoized_by_content(self):
+        self.assertEqual(self.counter.count("a b c", "qwen2.5:7b"), 3)
+        self.assertEqual(self.counter.count("a b c", "Qwen/Qwen2.5-72B-Instruct"), 3)
+        self.assertEqual(self.encoding.calls, 1)
+        self.get_encoding.assert_called_with("cl100k_base")
+
+        # A different tokenizer family is counted separately.
+        self.counter.count("a b c", "gpt-4o-mini")
+        self.get_encoding.assert_called_with("o200k_base")
+        self.assertEqual(self.encoding.calls, 2)
+
+    def test_cache_is_bounded(self):
+        for text in ("one", "two", "three"):
+            self.counter.count(text)
+        self.counter.count("one")
+        self.assertEqual(self.encoding.calls, 4)
+
+    def test_word_estimate_without_tokenizer(self):
+        self.get_encoding.return_value = None
+        self.assertEqual(self.counter.count("one two three four five six seven eight nine ten"), 13)
+
+
+class GetEncodingTest(unittest.TestCase):
+    def test_unavailable_tokenizer_is_loaded_once(self):
+        tokens.get_encoding.cache_clear()
+        self.addCleanup(tokens.get_encoding.cache_clear)
+        with mock.patch("tiktoken.get_encoding", side_effect=ConnectionError("offline")) as load:
+            self.assertIsNone(tokens.get_encoding("cl100k_base"))
+            self.assertIsNone(tokens.get_encoding("cl100k_base"))
+        self.assertEqual(load.call_count, 1)
+
+
+class ContextBudgetTest(unittest.TestCase):
+    def setUp(self):
+        patcher = mock.patch.object(tokens, "get_encoding", return_value=_WordEncoding())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        tokens.token_counter.clear()
+
+    def test_context_window_by_family_and_override(self):
+        self.assertEqual(tokens.context_window("claude-sonnet-4-20250514"), 200000)
+        self.assertEqual(tokens.context_window("Qwen/Qwen2.5-72B-Instruct"), 32768)
+        self.assertEqual(tokens.context_window("mystery-model"), tokens.DEFAULT_CONTEXT_WINDOW)
+        with mock.patch.object(tokens, "LLM_CONTEXT_WINDOW", 4096):
+            self.assertEqual(tokens.context_window("claude-sonnet-4-20250514"), 4096)
+
+    def test_pack_keeps_the_newest_contiguous_history(self):
+        history = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "word " * 10}
+                   for i in range(20)]
+        # system (2 words) + message (1 word) + 4 overhead each = 11; history entries cost 16 each
+        budget = tokens.ContextBudget("qwen2.5:7b", window=100 + 11 + 50 + tokens.REPLY_PRIMING_TOKENS,
+                                      max_output_tokens=50)
+        messages = budget.pack("Be brief.", history, "hello")
+
+        self.assertEqual(messages[0], {"role": "system", "content": "Be brief."})
+        self.assertEqual(messages[-1], {"role": "user", "content": "hello"})
+        self.assertEqual(messages[1:-1], history[-6:])
+
+    def test_pack_without_room_for_history(self):
+        budget = tokens.ContextBudget("qwen2.5:7b", window=8 + 5 + tokens.REPLY_PRIMING_TOKENS,
+                                      max_output_tokens=8)
+        messages = budget.pack(None, [{"role": "user", "content": "old"}], "hello")
+        self.assertEqual(messages, [{"role": "user", "content": "hello"}])
+
+    def test_pack_drops_the_volatile_block_then_refuses(self):
+        # stable block 6 + message 5 fit; the 10-word volatile block does not
+        budget = tokens.ContextBudget("qwen2.5:7b", window=8 + 11 + tokens.REPLY_PRIMING_TOKENS,
+                                      max_output_tokens=8)
+        with self.assertLogs(tokens.logger, level="WARNING"):
+            messages = budget.pack(["Be brief.", "word " * 10], [], "hello")
+        self.assertEqual([m["content"] for m in messages], ["Be brief.", "hello"])
+
+        with self.assertRaises(tokens.ContextOverflowError):
+            budget.pack(["word " * 10], [], "hello")
+
+    def test_system_context_leaves_room_for_message_and_history(self):
+        budget = tokens.ContextBudget("qwen2.5:7b", window=5000, max_output_tokens=1000)
+        history = [{"role": "user", "content": "word " * 96}] * 20  # 100 tokens each
+        # message 5 + two block overheads 8 + history capped at MIN_HISTORY_TOKENS
+        self.assertEqual(budget.system_tokens("hello", history),
+                         budget.input_tokens - 13 - tokens.MIN_HISTORY_TOKENS)
+        # A short history only reserves what it uses
+        self.assertEqual(budget.system_tokens("hello", history[:2]), budget.input_tokens - 13 - 200)
+
+    def test_history_roles_are_mapped(self):
+        self.assertEqual(tokens.history_to_messages([
+            {"role": "persona", "content": "hi"},
+            {"role": "target", "content": "hello"},
+            {"role": "agent", "content": ""},
+        ]), [{"role": "user", "content": "hi"}, {"role": "assistant", "content": "hello"}])
+
+    def test_context_manager_budgets_against_the_input_window(self):
+        manager = context.ContextManager(model="qwen2.5:7b")
+        self.assertEqual(manager.max_tokens, tokens.ContextBudget("qwen2.5:7b").input_tokens)
+        self.assertGreater(manager.max_tokens, tokens.LLM_MAX_OUTPUT_TOKENS)
+
+
+class _Provider(context.ContextProvider):
+    def __init__(self, text, stable=True):
+        self.text = text
+        self.stable = stable
+
+    def get_context(self, **kwargs):
+        return self.text
+
+
+class PromptLayoutTest(unittest.TestCase):
+    def test_stable_context_comes_first(self):
+        manager = context.ContextManager(max_tokens=1000)
+        manager.add_provider(_Provider("Journey: 3 waypoints", stable=False))
+        manager.add_provider(_Provider("Persona Context:"))
+
+        blocks = manager.get_context_blocks(mode="with")
+        self.assertEqual(len(blocks), 2)
+        self.assertTrue(blocks[0].startswith("Persona Context:\n\nYou are the persona described above."))
+        self.assertEqual(blocks[1], "Journey: 3 waypoints")
+        self.assertEqual(manager.get_combined_context(mode="with"), "\n\n".join(blocks))
+
+    def test_persona_prompt_is_independent_of_field_order(self):
+        fields = [("occupation", "Nurse"), ("age", 41), ("city", "Leeds")]
+        first = context.persona_context_to_system_prompt({"Demographic": dict(fields)})
+        second = context.persona_context_to_system_prompt({"Demographic": dict(reversed(fields))})
+        self.assertEqual(first, second)
+
+
+if __name__ == "__main__":
+    unittest.main()
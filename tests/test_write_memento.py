@@ -11,6 +11,7 @@ import json
 import os
 import sys
 import tempfile
+import time
 import unittest
 from unittest import mock
 
@@ -22,6 +23,17 @@ def _read_json(path):
         return json.load(f)
 
 
+def _stub_png():
+    from io import BytesIO
+    from PIL import Image
+    out = BytesIO()
+    Image.new("RGB", (64, 96), "white").save(out, format="PNG")
+    return out.getvalue()
+
+
+STUB_PNG = _stub_png()
+
+
 class _StubPage:
     """Minimal stand-in for a Playwright Page."""
 
@@ -36,9 +48,12 @@ class _StubPage:
     def content(self):
         return self._html
 
-    def screenshot(self, path, full_page=False):
-        with open(path, "wb") as f:
-            f.write(b"\x89PNG-stub")
+    def screenshot(self, path=None, full_page=False):
+        data = STUB_PNG
+        if path:
+            with open(path, "wb") as f:
+                f.write(data)
+        return data
 
 
 class _FakeResponse:
@@ -72,8 +87,11 @@ class WriteMementoTest(unittest.TestCase):
             )
 
         md = result["memento_location"]
-        self.assertTrue(os.path.exists(os.path.join(md, "content.html")))
+        self.assertEqual(result["html_path"], os.path.join(md, "content.html.gz"))
+        self.assertEqual(result["content_encoding"], "gzip")
         self.assertTrue(os.path.exists(os.path.join(md, "screenshot.png")))
+        from utils import memento_content
+        self.assertEqual(memento_content.read_html(md), b"<html>hello</html>")
 
         meta = _read_json(os.path.join(md, "metadata.json"))
         self.assertEqual(meta["url"], "https://example.com/")
@@ -82,11 +100,15 @@ class WriteMementoTest(unittest.TestCase):
         self.assertEqual(meta["http_status"], 200)
         self.assertEqual(meta["content_type"], "text/html; charset=utf-8")
         self.assertEqual(meta["language"], "en-US")  # extra_metadata merged in
+        self.assertEqual(meta["screenshot_hashes"], result["screenshot_hashes"])
+        self.assertEqual(len(meta["screenshot_hashes"]["phash"]), 16)
+        self.assertTrue(os.path.exists(os.path.join(md, "screenshot.thumb-sm.jpg")))
         self.assertIsNone(meta["geolocation"])
 
         # URL-level index records this memento's timestamp.
-        url_meta = _read_json(os.path.join(os.path.dirname(md), "metadata.json"))
-        self.assertIn(meta["timestamp"], url_meta["mementos"])
+        from utils import url_index
+        entries = url_index.read_entries(os.path.dirname(md))
+        self.assertIn(meta["timestamp"], [e["timestamp"] for e in entries])
 
         # save_to_db=False -> no DB identifiers in the result.
         self.assertNotIn("archived_website_id", result)
@@ -113,6 +135,36 @@ class WriteMementoTest(unittest.TestCase):
         self.assertEqual(meta["timestamp"], ts)
         self.assertEqual(meta["final_url"], "https://example.com/x")
 
+    def test_url_index_is_append_only_and_seeded_from_legacy_metadata(self):
+        """Captures append to index.jsonl; a legacy metadata.json seeds the log."""
+        from utils import url_index
+
+        url_dir = os.path.join("archives", "u")
+        os.makedirs(url_dir)
+        with open(os.path.join(url_dir, "metadata.json"), "w") as f:
+            json.dump({"url": "https://example.com/", "first_archived": "20240101-000000",
+                       "mementos": ["20240101-000000"]}, f)
+        # Before the first appended capture the legacy file is read directly
+        self.assertEqual([e["timestamp"] for e in url_index.read_entries(url_dir)], ["20240101-000000"])
+
+        for ts in ("20250101-000001", "20250101-000000"):
+            url_index.append_memento(url_dir, "https://example.com/", ts)
+        entries = url_index.read_entries(url_dir)
+        self.assertEqual([e["timestamp"] for e in entries],
+                         ["20240101-000000", "20250101-000001", "20250101-000000"])
+        self.assertEqual(url_index.read_entries(os.path.join("archives", "none")), [])
+
+        # metadata.json is rebuilt from the log on read
+        url_meta = url_index.load_url_metadata(url_dir)
+        self.assertEqual(url_meta["mementos"],
+                         ["20240101-000000", "20250101-000000", "20250101-000001"])
+        self.assertEqual(url_meta["last_archived"], "20250101-000001")
+        self.assertEqual(_read_json(os.path.join(url_dir, "metadata.json")), url_meta)
+        url_index.remove_mementos(url_dir, ["20250101-000001"])
+        os.utime(url_index.index_path(url_dir), (time.time() + 5, time.time() + 5))
+        self.assertEqual(url_index.load_url_metadata(url_dir)["last_archived"], "20250101-000000")
+        self.assertIsNone(url_index.load_url_metadata(os.path.join("archives", "none")))
+
     def test_survives_http_fetch_failure(self):
         """A failed requests.get must not abort the memento write."""
         mgr = self._manager()
@@ -122,7 +174,155 @@ class WriteMementoTest(unittest.TestCase):
                 page, "https://example.com/", save_to_db=False,
             )
         self.assertIsNone(result["http_status"])
-        self.assertTrue(os.path.exists(os.path.join(result["memento_location"], "content.html")))
+        self.assertTrue(os.path.exists(result["html_path"]))
+
+    def test_identical_artifacts_are_stored_once(self):
+        """Repeat captures of a byte-identical page hardlink the same blobs."""
+        from utils.blob_store import get_blob_store
+
+        mgr = self._manager()
+        results = []
+        for ts in ("20250101-000000", "20250101-000001"):
+            memento_dir = os.path.join("archives", "u", ts)
+            os.makedirs(memento_dir)
+            with mock.patch("utils.browser.requests.get", return_value=_FakeResponse()):
+                results.append(mgr._write_memento(
+                    _StubPage(), "https://example.com/", save_to_db=False,
+                    memento_dir=memento_dir, timestamp=ts,
+                ))
+        first, second = results
+
+        self.assertEqual(first["blobs"], second["blobs"])
+        blob_path = get_blob_store().path_for(first["blobs"]["html"])
+        self.assertTrue(os.path.samefile(first["html_path"], blob_path))
+        self.assertTrue(os.path.samefile(second["html_path"], blob_path))
+        self.assertEqual(os.stat(blob_path).st_nlink, 3)
+        from utils import memento_content
+        self.assertEqual(memento_content.read_html(second["memento_location"]), b"<html>hello</html>")
+
+        meta = _read_json(os.path.join(second["memento_location"], "metadata.json"))
+        self.assertEqual(meta["blobs"], second["blobs"])
+
+    def test_blob_put_skips_existing(self):
+        from utils.blob_store import BlobStore
+
+        store = BlobStore(root="blobs")
+        first = store.put(b"same bytes")
+        second = store.put(b"same bytes")
+        self.assertTrue(first.created)
+        self.assertFalse(second.created)
+        self.assertEqual(first.sha256, second.sha256)
+        self.assertEqual(first.path, os.path.join("blobs", first.sha256[:2], first.sha256[2:4], first.sha256))
+
+    def test_records_phase_timings(self):
+        """The per-phase breakdown lands in metadata.json and the result."""
+        from utils.capture_timing import CaptureTimer
+
+        mgr = self._manager()
+        timer = CaptureTimer()
+        with timer.phase("navigate"):
+            pass
+        with mock.patch("utils.browser.requests.get", return_value=_FakeResponse()):
+            result = mgr._write_memento(
+                _StubPage(), "https://example.com/", save_to_db=False, timer=timer,
+            )
+
+        meta = _read_json(os.path.join(result["memento_location"], "metadata.json"))
+        for phase in ("navigate", "http_info", "page_content", "screenshot", "file_write", "thumbnails", "total"):
+            self.assertIn(phase, meta["timings"])
+            self.assertGreaterEqual(meta["timings"][phase], 0)
+        self.assertNotIn("db_write", meta["timings"])  # save_to_db=False
+        self.assertGreaterEqual(result["timings"]["total"], meta["timings"]["total"])
+
+    def test_metadata_survives_db_failure(self):
+        """metadata.json is on disk before the DB write, so the re-indexer can recover it."""
+        mgr = self._manager()
+        with mock.patch("utils.browser.requests.get", return_value=_FakeResponse()), \
+                mock.patch("utils.browser.BrowserManager._memento_paths",
+                           return_value=("archives/u", "archives/u/20240101-000000", "20240101-000000")), \
+                mock.patch("database.get_db_connection", side_effect=RuntimeError("database is locked")):
+            os.makedirs("archives/u/20240101-000000")
+            with self.assertRaises(RuntimeError):
+                mgr._write_memento(_StubPage(), "https://example.com/")
+
+        meta = _read_json("archives/u/20240101-000000/metadata.json")
+        self.assertEqual(meta["url"], "https://example.com/")
+        self.assertNotIn("db_write", meta["timings"])
+
+    def test_warc_mode_appends_indexed_records(self):
+        """archive_format="warc" writes seekable records instead of loose files."""
+        from utils import warc
+
+        mgr = self._manager()
+        with mock.patch("utils.browser.requests.get", return_value=_FakeResponse()), \
+                mock.patch("database.save_warc_records") as save_records:
+            result = mgr._write_memento(
+                _StubPage(), "https://example.com/", locale="de-DE",
+                save_to_db=False, archive_format="warc",
+            )
+
+        md = result["memento_location"]
+        self.assertFalse(os.path.exists(os.path.join(md, "content.html")))
+        self.assertIsNone(result["html_path"])
+        refs = save_records.call_args[0][0]
+        self.assertEqual([r.record_type for r in refs], ["response", "request", "resource", "metadata"])
+        self.assertIsNone(save_records.call_args[1]["memento_id"])
+
+        path = warc.get_warc_writer().path_for(refs[0].filename)
+        headers, block = warc.read_record(path, refs[0].offset, refs[0].length)
+        self.assertEqual(headers["WARC-Type"], "response")
+        self.assertEqual(warc.http_body(block), b"<html>hello</html>")
+        self.assertTrue(block.startswith(b"HTTP/1.1 200 OK\r\n"))
+
+        headers, block = warc.read_record(path, refs[1].offset, refs[1].length)
+        self.assertIn(b"Accept-Language: de-DE", block)
+        self.assertEqual(headers["WARC-Concurrent-To"], refs[0].record_id)
+        headers, block = warc.read_record(path, refs[2].offset, refs[2].length)
+        self.assertEqual(headers["WARC-Target-URI"], "urn:screenshot:https://example.com/")
+        self.assertEqual(block, STUB_PNG)
+
+        meta = _read_json(os.path.join(md, "metadata.json"))
+        self.assertEqual(meta["warc"]["response"]["offset"], refs[0].offset)
+
+    def test_warc_writer_rolls_over_when_full(self):
+        from datetime import datetime
+        from utils.warc import WarcWriter
+
+        writer = WarcWriter(root="warc", max_file_size=1)
+        when = datetime(2025, 1, 2, 3, 4, 5)
+        first = writer.write_records([("resource", "urn:x", b"a", "text/plain", {})], when)
+        second = writer.write_records([("resource", "urn:x", b"b", "text/plain", {})], when)
+        self.assertEqual(first[0].filename, "A-PROXY-20250102-00000.warc.gz")
+        self.assertEqual(second[0].filename, "A-PROXY-20250102-00001.warc.gz")
+        self.assertEqual(first[0].warc_date, "2025-01-02T03:04:05Z")
+        # A new file starts with its warcinfo record, so the data record follows it.
+        self.assertGreater(second[0].offset, 0)
+
+
+class CaptureTimingStatsTest(unittest.TestCase):
+    def test_percentiles_per_phase(self):
+        from utils.capture_timing import CaptureTimingStats
+
+        stats = CaptureTimingStats(max_samples=100)
+        for ms in range(1, 101):
+            stats.record({"navigate": float(ms), "total": float(ms)}, path="archive_page")
+
+        summary = stats.summary()
+        self.assertEqual(stats.captures, 100)
+        self.assertEqual(summary["navigate"]["count"], 100)
+        self.assertEqual(summary["navigate"]["p50"], 50.0)
+        self.assertEqual(summary["navigate"]["p95"], 95.0)
+        self.assertEqual(summary["navigate"]["p99"], 99.0)
+        self.assertEqual(summary["archive_page.total"]["max"], 100.0)
+
+    def test_bounded_samples(self):
+        from utils.capture_timing import CaptureTimingStats
+
+        stats = CaptureTimingStats(max_samples=10)
+        for ms in range(50):
+            stats.record({"screenshot": float(ms)})
+        self.assertEqual(stats.summary()["screenshot"]["count"], 10)
+        self.assertEqual(stats.summary()["screenshot"]["p50"], 44.0)
 
 
 if __name__ == "__main__":
@@ -22,40 +22,15 @@ class AgentService:
     @property
     def llm(self):
         if self._llm is None:
-            from utils.llm_client import LLMClient
-            self._llm = LLMClient()
-            logger.info("LLMClient initialized for AgentService")
+            from utils.llm_client import get_llm_client
+            self._llm = get_llm_client()
         return self._llm
 
     def send_message(self, message, context=None):
         try:
             logger.info(f"Sending message: {message[:50]}...")
 
-            model = self.config.get('model')
-            if context and 'model' in context:
-                model = context['model']
-
-            system_prompt = self._build_system_prompt(context)
-
-            messages = []
-            if system_prompt:
-                messages.append({"role": "system", "content": system_prompt})
-
-            if context and 'history' in context:
-                for msg in context['history'][-10:]:
-                    role = msg.get('role', '')
-                    content = msg.get('content', '')
-
-                    llm_role = 'user'
-                    if role in ['agent', 'assistant', 'target']:
-                        llm_role = 'assistant'
-                    elif role in ['user', 'persona']:
-                        llm_role = 'user'
-
-                    if content and role:
-                        messages.append({"role": llm_role, "content": content})
-
-            messages.append({"role": "user", "content": message})
+            messages, model = self._build_messages(message, context)
 
             logger.info(f"Calling LLM with {len(messages)} messages")
             response_content = self.llm.chat(messages, model_hint=model)
@@ -63,7 +38,8 @@ class AgentService:
 
             return {
                 "role": "assistant",
-                "content": response_content
+                "content": response_content,
+                "provider": self.llm.served_by()
             }
 
         except Exception as e:
@@ -73,6 +49,26 @@ class AgentService:
                 "content": f"I'm sorry, but I encountered an error: {str(e)}"
             }
 
+    def stream_message(self, message, context=None):
+        """Like send_message, but yields the reply in chunks; errors are raised."""
+        messages, model = self._build_messages(message, context)
+        logger.info(f"Streaming LLM reply for {len(messages)} messages")
+        return self.llm.chat_stream(messages, model_hint=model)
+
+    def _build_messages(self, message, context):
+        from services import ContextBudget, history_to_messages
+
+        model = self.config.get('model')
+        if context and 'model' in context:
+            model = context['model']
+
+        system_prompt = self._build_system_prompt(context)
+        history = history_to_messages(context.get('history')) if context else []
+
+        # Keep the newest history that fits the model's context window
+        budget = ContextBudget(model or self.llm.adapter.default_model)
+        return budget.pack(system_prompt, history, message), model
+
     def _build_system_prompt(self, context):
         if not context:
             return "You are a helpful assistant."
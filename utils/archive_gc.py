@@ -0,0 +1,426 @@
+"""
+Archive garbage collector: retention, deleted-memento sweep and disk quota.
+
+Deleting archived websites only removes DB rows; this reclaims the files.
+One pass:
+
+1. **Retention** – expires mementos outside the policy: only the newest
+   ``keep_last`` per (URL, persona), none older than ``max_age_days``, and
+   least-recently-viewed first until ``archives/`` fits in ``quota_bytes``.
+   Expired mementos lose their DB rows (releasing blob refcounts) and dirs.
+2. **Deleted mementos** – dirs of mementos whose rows were deleted (e.g.
+   with their archived website), as recorded in ``deleted_mementos``.
+   **Orphans** – ``<url_hash>/<timestamp>`` dirs with a metadata.json but no
+   row, older than the grace period: left by deletions made before
+   ``deleted_mementos`` existed or by captures that crashed before their DB
+   write. They may also be standalone (``save_to_db=False``) or legacy
+   captures waiting for ``reindex_archives.py``, so they are only removed
+   with the ``orphans`` policy (``ARCHIVE_GC_ORPHANS``); otherwise they are
+   counted in ``unregistered_dirs``. Captures logged in index.jsonl with
+   ``memento_id: null`` and a DB without any mementos (lost or reset) are
+   never swept. URL dirs left without mementos are removed; otherwise the
+   index gets tombstones.
+3. **Thumbnails** whose source screenshot is gone.
+4. **Blobs** with no references: refcount 0 (or never registered) *and* no
+   hardlink left outside the blob store (``st_nlink == 1``).
+
+Bytes are accounted per inode, so a hardlinked artifact only counts as
+reclaimed once its last link goes. Thumbnails and blobs modified within the
+grace period are left alone so in-flight captures are never swept. WARC
+files are append-only: they are neither counted toward the quota nor
+rewritten.
+"""
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from config import (
+    ARCHIVE_DISK_QUOTA_MB,
+    ARCHIVE_GC_INTERVAL,
+    ARCHIVE_GC_ORPHANS,
+    ARCHIVE_RETENTION_KEEP_LAST,
+    ARCHIVE_RETENTION_MAX_AGE_DAYS,
+)
+from utils import artifacts, url_index
+from utils.blob_store import BlobStore, get_blob_store
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_ROOT = "archives"
+# Skip thumbnails and blobs modified this recently (seconds): a capture links
+# them before its DB row is written.
+GRACE_SECONDS = 3600
+
+_URL_DIR = re.compile(r"^[0-9a-f]{32}$")
+_THUMBNAIL = re.compile(r"^(?P<stem>.+)\.thumb-(?:%s)\.jpg$" % "|".join(artifacts.THUMBNAIL_SIZES))
+
+
+def default_policy() -> Dict[str, Any]:
+    """Retention policy from config (0 disables a rule)."""
+    return {
+        "keep_last": ARCHIVE_RETENTION_KEEP_LAST,
+        "max_age_days": ARCHIVE_RETENTION_MAX_AGE_DAYS,
+        "quota_bytes": ARCHIVE_DISK_QUOTA_MB * 1024 * 1024,
+        "orphans": ARCHIVE_GC_ORPHANS,
+    }
+
+
+def _abs(path: str) -> str:
+    return os.path.normcase(os.path.abspath(path))
+
+
+class _DiskModel:
+    """Inode-level view of the archive: who links what, and what a delete frees."""
+
+    def __init__(self, root: str, exclude: Tuple[str, ...] = ()):
+        self.inodes: Dict[Tuple[int, int], List[int]] = {}   # key -> [size, links left]
+        self.total = 0
+        excluded = {os.path.abspath(path) for path in exclude}
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if os.path.abspath(os.path.join(dirpath, d)) not in excluded]
+            for name in filenames:
+                try:
+                    st = os.lstat(os.path.join(dirpath, name))
+                except FileNotFoundError:
+                    continue
+                key = (st.st_dev, st.st_ino)
+                if key not in self.inodes:
+                    self.inodes[key] = [st.st_size, st.st_nlink]
+                    self.total += st.st_size
+
+    @staticmethod
+    def key(path: str) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            return None
+        return (st.st_dev, st.st_ino)
+
+    def unlink(self, key: Optional[Tuple[int, int]]) -> int:
+        """Drop one link; returns the bytes freed (non-zero only for the last link)."""
+        entry = self.inodes.get(key)
+        if entry is None:
+            return 0
+        entry[1] -= 1
+        if entry[1] > 0:
+            return 0
+        del self.inodes[key]
+        self.total -= entry[0]
+        return entry[0]
+
+    def remove_tree(self, path: str) -> int:
+        """Account for removing a directory; returns the bytes freed."""
+        freed = 0
+        for dirpath, _, filenames in os.walk(path):
+            for name in filenames:
+                freed += self.unlink(self.key(os.path.join(dirpath, name)))
+        return freed
+
+    def links(self, path: str) -> int:
+        entry = self.inodes.get(self.key(path))
+        return entry[1] if entry else 0
+
+
+class ArchiveGC:
+    """Reclaims disk space under ``archives/``; one run at a time.
+
+    ``run`` is synchronous, ``start`` runs in a daemon thread and
+    ``start_periodic`` repeats every ``interval`` seconds.
+    """
+
+    def __init__(self, root: str = ARCHIVE_ROOT, blob_store: Optional[BlobStore] = None,
+                 grace_seconds: int = GRACE_SECONDS):
+        self.root = root
+        self._blob_store = blob_store
+        self.grace_seconds = grace_seconds
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._periodic: Optional[threading.Thread] = None
+        self._status: Dict[str, Any] = {"running": False}
+
+    @property
+    def blob_store(self) -> BlobStore:
+        return self._blob_store or get_blob_store()
+
+    def _reset_status(self, dry_run: bool, policy: Dict[str, Any]) -> None:
+        self._status = {
+            "running": True,
+            "dry_run": dry_run,
+            "policy": policy,
+            "bytes_before": 0,
+            "bytes_after": 0,
+            "bytes_reclaimed": 0,
+            "expired_mementos": {"keep_last": 0, "max_age": 0, "quota": 0},
+            "orphan_dirs": 0,
+            "unregistered_dirs": 0,
+            "orphan_thumbnails": 0,
+            "blobs_deleted": 0,
+            "missing_blobs": 0,
+            "over_quota": False,
+            "started_at": datetime.now().isoformat(),
+            "finished_at": None,
+            "error": None,
+        }
+
+    def start(self, dry_run: bool = False, policy: Optional[Dict[str, Any]] = None) -> bool:
+        """Start a run in a daemon thread; returns False if one is already running."""
+        with self._lock:
+            if not self._run_lock.acquire(blocking=False):
+                return False
+            self._reset_status(dry_run, dict(default_policy(), **(policy or {})))
+            threading.Thread(target=self._run, daemon=True).start()
+            return True
+
+    def start_periodic(self, interval: int = ARCHIVE_GC_INTERVAL) -> bool:
+        """Run the GC every ``interval`` seconds in the background (0 disables)."""
+        with self._lock:
+            if interval <= 0 or self._periodic is not None:
+                return False
+
+            def loop():
+                while True:
+                    time.sleep(interval)
+                    self.run()
+
+            self._periodic = threading.Thread(target=loop, daemon=True)
+            self._periodic.start()
+            return True
+
+    def status(self) -> Dict[str, Any]:
+        return dict(self._status)
+
+    def run(self, dry_run: bool = False, policy: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Collect synchronously; returns the final status.
+
+        With ``dry_run`` nothing is deleted and the byte counts are what the
+        run would have reclaimed. If another run is active, returns its status.
+        """
+        if not self._run_lock.acquire(blocking=False):
+            return self.status()
+        self._reset_status(dry_run, dict(default_policy(), **(policy or {})))
+        return self._run()
+
+    def _run(self) -> Dict[str, Any]:
+        """Body of a run; the caller holds ``_run_lock``."""
+        try:
+            self._collect(self._status["dry_run"], self._status["policy"])
+        except Exception as e:
+            logger.error(f"Error collecting archive garbage: {e}", exc_info=True)
+            self._status["error"] = str(e)
+        finally:
+            self._status["running"] = False
+            self._status["finished_at"] = datetime.now().isoformat()
+            self._run_lock.release()
+        logger.info("Archive GC finished: %s", self._status)
+        return dict(self._status)
+
+    # ── Phases ──────────────────────────────────────────────────────────
+
+    def _collect(self, dry_run: bool, policy: Dict[str, Any]) -> None:
+        import database
+
+        if not os.path.isdir(self.root):
+            return
+        model = _DiskModel(self.root, exclude=(os.path.join(self.root, "warc"),))
+        self._status["bytes_before"] = model.total
+        refcounts = database.get_blob_refcounts()
+        removed_dirs: Set[str] = set()
+        now = time.time()
+
+        def expire(memento: Dict[str, Any], reason: str) -> None:
+            shas = list(database.get_memento_blobs(memento["id"]).values())
+            for sha256 in shas:
+                if sha256 in refcounts:
+                    refcounts[sha256] = max(refcounts[sha256] - 1, 0)
+            location = memento["memento_location"]
+            if self._is_memento_dir(location) and _abs(location) not in removed_dirs:
+                model.remove_tree(location)
+                removed_dirs.add(_abs(location))
+                # Blobs this memento held alone go in the blob phase; count them now
+                # so quota eviction stops as soon as enough is freed.
+                for sha256 in shas:
+                    blob_path = self.blob_store.path_for(sha256)
+                    if refcounts.get(sha256) == 0 and model.links(blob_path) == 1:
+                        model.unlink(model.key(blob_path))
+            if not dry_run:
+                database.delete_memento(memento["id"])
+                self._remove_dir(location)
+            self._status["expired_mementos"][reason] += 1
+
+        # 1. Retention policy.
+        older_than = None
+        if policy.get("max_age_days"):
+            older_than = datetime.now() - timedelta(days=policy["max_age_days"])
+        expired_ids: Set[int] = set()
+        for memento in database.get_expired_mementos(policy.get("keep_last"), older_than):
+            expired_ids.add(memento["id"])
+            expire(memento, memento["reason"])
+
+        quota = policy.get("quota_bytes")
+        if quota and model.total > quota:
+            for memento in database.get_mementos_by_last_access():
+                if model.total <= quota:
+                    break
+                if memento["id"] not in expired_ids:
+                    expired_ids.add(memento["id"])
+                    expire(memento, "quota")
+            self._status["over_quota"] = model.total > quota
+
+        # 2. Dirs of mementos deleted from the DB (e.g. with their website).
+        # Only dirs recorded at delete time are swept: a dir with no row may
+        # be a standalone capture, a legacy one or the archive of a lost DB.
+        registered = {_abs(path) for path in database.get_memento_locations()}
+        swept = []
+        for location in database.get_deleted_memento_locations():
+            swept.append(location)
+            if _abs(location) in registered or _abs(location) in removed_dirs:
+                continue
+            if not self._is_memento_dir(location) or not os.path.isdir(location):
+                continue
+            model.remove_tree(location)
+            removed_dirs.add(_abs(location))
+            self._status["orphan_dirs"] += 1
+            if not dry_run:
+                self._remove_dir(location)
+
+        # Orphans: dirs on disk without a row. With no rows at all the DB was
+        # lost or reset, and every dir is waiting for reindex_archives.py.
+        if registered:
+            for url_dir in self._url_dirs():
+                standalone = {entry["timestamp"] for entry in url_index.read_entries(url_dir)
+                              if "memento_id" in entry and entry["memento_id"] is None}
+                for name in sorted(os.listdir(url_dir)):
+                    memento_dir = os.path.join(url_dir, name)
+                    if (_abs(memento_dir) in registered or _abs(memento_dir) in removed_dirs
+                            or name in standalone
+                            or not os.path.isfile(os.path.join(memento_dir, "metadata.json"))
+                            or self._is_recent(memento_dir, now)):
+                        continue
+                    if not policy.get("orphans"):
+                        self._status["unregistered_dirs"] += 1
+                        continue
+                    model.remove_tree(memento_dir)
+                    removed_dirs.add(_abs(memento_dir))
+                    self._status["orphan_dirs"] += 1
+                    if not dry_run:
+                        self._remove_dir(memento_dir)
+
+        if not dry_run:
+            gone: Dict[str, List[str]] = {}
+            for path in removed_dirs:
+                gone.setdefault(os.path.dirname(path), []).append(os.path.basename(path))
+            for url_dir, names in sorted(gone.items()):
+                if os.path.isdir(url_dir):
+                    self._finish_url_dir(url_dir, names)
+            if swept:
+                database.forget_deleted_mementos(swept)
+
+        # 3. Thumbnails without a source screenshot.
+        for root in artifacts.ARTIFACT_ROOTS:
+            for dirpath, _, filenames in os.walk(root):
+                if any(_abs(dirpath) == d or _abs(dirpath).startswith(d + os.sep) for d in removed_dirs):
+                    continue
+                sources = {os.path.splitext(name)[0] for name in filenames if not _THUMBNAIL.match(name)}
+                for name in filenames:
+                    match = _THUMBNAIL.match(name)
+                    if not match or match.group("stem") in sources:
+                        continue
+                    path = os.path.join(dirpath, name)
+                    if self._is_recent(path, now):
+                        continue
+                    model.unlink(model.key(path))
+                    self._status["orphan_thumbnails"] += 1
+                    if not dry_run:
+                        os.remove(path)
+
+        # 4. Unreferenced blobs.
+        self._collect_blobs(model, refcounts, dry_run, now)
+
+        self._status["bytes_after"] = model.total
+        self._status["bytes_reclaimed"] = self._status["bytes_before"] - model.total
+
+    def _collect_blobs(self, model: _DiskModel, refcounts: Dict[str, int],
+                       dry_run: bool, now: float) -> None:
+        import database
+
+        blob_root = self.blob_store.root
+        forgotten = []
+        present = set()
+        for dirpath, _, filenames in os.walk(blob_root):
+            for sha256 in filenames:
+                if ".tmp-" in sha256:
+                    continue
+                present.add(sha256)
+                path = os.path.join(dirpath, sha256)
+                if refcounts.get(sha256, 0) > 0 or self._is_recent(path, now):
+                    continue
+                # Still hardlinked from a memento dir we are not deleting
+                # (e.g. a standalone capture): keep it so the link stays deduplicated.
+                key = model.key(path)
+                if key in model.inodes and model.inodes[key][1] > 1:
+                    continue
+                model.unlink(key)
+                self._status["blobs_deleted"] += 1
+                if sha256 in refcounts:
+                    forgotten.append(sha256)
+                if not dry_run:
+                    self.blob_store.delete(sha256)
+        self._status["missing_blobs"] = sum(
+            1 for sha256, count in refcounts.items() if count > 0 and sha256 not in present
+        )
+        if forgotten and not dry_run:
+            database.delete_blob_rows(forgotten)
+
+    # ── Helpers ─────────────────────────────────────────────────────────
+
+    def _url_dirs(self) -> List[str]:
+        return [
+            os.path.join(self.root, name) for name in sorted(os.listdir(self.root))
+            if _URL_DIR.match(name) and os.path.isdir(os.path.join(self.root, name))
+        ]
+
+    def _is_memento_dir(self, location: Optional[str]) -> bool:
+        """Only ``archives/<url_hash>/<timestamp>`` dirs are ever removed."""
+        if not location:
+            return False
+        url_dir, name = os.path.split(os.path.normpath(location))
+        parent, url_hash = os.path.split(url_dir)
+        return bool(name) and bool(_URL_DIR.match(url_hash)) and _abs(parent) == _abs(self.root)
+
+    def _is_recent(self, path: str, now: float) -> bool:
+        try:
+            return now - os.path.getmtime(path) < self.grace_seconds
+        except FileNotFoundError:
+            return True
+
+    @staticmethod
+    def _remove_dir(path: str) -> None:
+        shutil.rmtree(path, ignore_errors=True)
+
+    def _finish_url_dir(self, url_dir: str, removed: List[str]) -> None:
+        """Tombstone the removed mementos, and remove the URL dir once none are left.
+
+        Only the dir's own files are deleted and the dir itself goes with
+        ``os.rmdir``, so a capture that has just created a memento dir in it
+        is never swept along.
+        """
+        url_index.remove_mementos(url_dir, removed)
+        if any(os.path.isdir(os.path.join(url_dir, name)) for name in os.listdir(url_dir)):
+            return
+        for name in os.listdir(url_dir):
+            try:
+                os.remove(os.path.join(url_dir, name))
+            except OSError:
+                pass
+        try:
+            os.rmdir(url_dir)
+        except OSError:
+            pass
+
+
+archive_gc = ArchiveGC()
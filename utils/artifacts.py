@@ -0,0 +1,116 @@
+"""
+Capture artifacts (screenshots, archived files) and their thumbnails.
+
+Screenshots are written under ``archives/`` (mementos) and ``screenshots/``
+(session/visit/waypoint captures). Both are served by ``routes/artifacts.py``;
+``resolve_artifact`` keeps that endpoint inside those roots.
+
+Each PNG screenshot gets JPEG thumbnails next to it at write time
+(``<name>.thumb-<size>.jpg``), cropped to the top of the page so listings
+show what was above the fold. Captures from before thumbnails existed are
+backfilled on first request by ``ensure_thumbnail``.
+"""
+import io
+import logging
+import os
+import threading
+from typing import Dict, Optional, Union
+
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+ARTIFACT_ROOTS = ("archives", "screenshots")
+
+# Only media/data artifacts are served; archived HTML goes through the
+# sandboxed memento content endpoint instead.
+ARTIFACT_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webm", ".har", ".json"}
+
+# Media is written once per capture and may be cached as immutable. HAR and
+# JSON hold request headers/cookies and metadata.json is rewritten after the
+# DB step, so those must not be cached at all.
+IMMUTABLE_EXTENSIONS = {".png", ".jpg", ".jpeg", ".webm"}
+
+# Thumbnail widths in pixels.
+THUMBNAIL_SIZES = {
+    "sm": 320,
+    "md": 800,
+}
+
+# Crop full-page screenshots to this height/width ratio before scaling (4:3).
+_CROP_RATIO = 0.75
+_JPEG_QUALITY = 80
+
+
+def resolve_artifact(artifact_path: str) -> Optional[str]:
+    """Map a stored artifact path to an absolute path under an artifact root.
+
+    Returns None for absolute paths, traversal outside the roots, other file
+    types, or missing files.
+    """
+    normalized = os.path.normpath(artifact_path.replace("\\", "/"))
+    if os.path.isabs(normalized) or normalized.split(os.sep, 1)[0] not in ARTIFACT_ROOTS:
+        return None
+    if os.path.splitext(normalized)[1].lower() not in ARTIFACT_EXTENSIONS:
+        return None
+    path = os.path.abspath(normalized)
+    return path if os.path.isfile(path) else None
+
+
+def is_immutable(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in IMMUTABLE_EXTENSIONS
+
+
+def thumbnail_path(source_path: str, size: str) -> str:
+    stem, _ = os.path.splitext(source_path)
+    return f"{stem}.thumb-{size}.jpg"
+
+
+def _render_thumbnail(image: Image.Image, width: int) -> bytes:
+    crop_height = min(image.height, int(image.width * _CROP_RATIO))
+    thumb = image.crop((0, 0, image.width, crop_height))
+    if thumb.width > width:
+        thumb = thumb.resize((width, max(1, int(crop_height * width / image.width))), Image.LANCZOS)
+    out = io.BytesIO()
+    thumb.convert("RGB").save(out, format="JPEG", quality=_JPEG_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def make_thumbnails(source_path: str, data: Optional[bytes] = None,
+                    sizes: Optional[Dict[str, int]] = None) -> Dict[str, str]:
+    """Write every thumbnail size for the screenshot at ``source_path``.
+
+    ``data`` avoids re-reading a PNG the caller already holds. Errors are
+    logged rather than raised, so a bad image never fails a capture.
+    Returns ``{size: thumbnail_path}`` for the thumbnails written.
+    """
+    sizes = sizes or THUMBNAIL_SIZES
+    written = {}
+    try:
+        source: Union[str, io.BytesIO] = io.BytesIO(data) if data is not None else source_path
+        with Image.open(source) as image:
+            image.load()
+            for size, width in sizes.items():
+                path = thumbnail_path(source_path, size)
+                _write_atomic(path, _render_thumbnail(image, width))
+                written[size] = path
+    except Exception as e:
+        logger.error(f"Error creating thumbnails for {source_path}: {e}")
+    return written
+
+
+def ensure_thumbnail(source_path: str, size: str) -> Optional[str]:
+    """Return the thumbnail for ``source_path``, generating it if missing."""
+    if size not in THUMBNAIL_SIZES:
+        return None
+    path = thumbnail_path(source_path, size)
+    if not os.path.exists(path):
+        make_thumbnails(source_path, sizes={size: THUMBNAIL_SIZES[size]})
+    return path if os.path.exists(path) else None
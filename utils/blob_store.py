@@ -0,0 +1,104 @@
+"""
+Content-addressed artifact store for mementos.
+
+Artifacts (content.html[.gz], screenshot.png) are stored once under
+``archives/blobs/<aa>/<bb>/<sha256>`` and hardlinked into each memento dir, so
+byte-identical captures of the same page cost no extra disk and no extra
+write. Readers keep opening files in ``<memento_dir>/`` as before; the
+``blobs``/``memento_blobs`` tables reference-count DB-backed mementos so the
+archive GC knows when a blob is no longer needed.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import threading
+from typing import NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BLOB_ROOT = os.path.join("archives", "blobs")
+
+
+class StoredBlob(NamedTuple):
+    """Result of ``BlobStore.put``."""
+    sha256: str
+    size: int
+    path: str
+    created: bool  # False when an identical blob already existed (write skipped)
+
+
+class BlobStore:
+    """SHA-256 keyed, two-level sharded blob directory."""
+
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or DEFAULT_BLOB_ROOT
+
+    @staticmethod
+    def digest(data: bytes) -> str:
+        return hashlib.sha256(data).hexdigest()
+
+    def path_for(self, sha256: str) -> str:
+        """Return the on-disk path for a blob (whether or not it exists)."""
+        return os.path.join(self.root, sha256[:2], sha256[2:4], sha256)
+
+    def exists(self, sha256: str) -> bool:
+        return os.path.exists(self.path_for(sha256))
+
+    def put(self, data: bytes) -> StoredBlob:
+        """Store ``data`` unless an identical blob is already present."""
+        sha256 = self.digest(data)
+        path = self.path_for(sha256)
+        if os.path.exists(path):
+            return StoredBlob(sha256, len(data), path, False)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write-then-rename so a concurrent reader never sees a partial blob.
+        tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return StoredBlob(sha256, len(data), path, True)
+
+    def link(self, sha256: str, dest_path: str) -> str:
+        """Materialize a blob at ``dest_path`` (hardlink, falling back to a copy).
+
+        Copies are only needed where hardlinks are unsupported (e.g. some
+        mounted volumes); the blob stays the canonical, reference-counted copy.
+        """
+        src = self.path_for(sha256)
+        if os.path.lexists(dest_path):
+            os.remove(dest_path)
+        try:
+            os.link(src, dest_path)
+        except OSError as e:
+            logger.debug("Hardlink %s -> %s failed (%s); copying", src, dest_path, e)
+            shutil.copyfile(src, dest_path)
+        return dest_path
+
+    def put_and_link(self, data: bytes, dest_path: str) -> StoredBlob:
+        """Store ``data`` and materialize it at ``dest_path``."""
+        stored = self.put(data)
+        self.link(stored.sha256, dest_path)
+        return stored
+
+    def delete(self, sha256: str) -> int:
+        """Remove a blob; returns the bytes reclaimed (0 if it was absent)."""
+        path = self.path_for(sha256)
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+        except FileNotFoundError:
+            return 0
+        return size
+
+
+_blob_store = None
+
+
+def get_blob_store() -> BlobStore:
+    """Get the process-wide BlobStore rooted at archives/blobs."""
+    global _blob_store
+    if _blob_store is None:
+        _blob_store = BlobStore()
+    return _blob_store
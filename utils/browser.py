@@ -15,7 +15,10 @@ from datetime import datetime
 from typing import Any, Dict, List, Optional
 from playwright.sync_api import sync_playwright
 
-from config import BROWSER_HEADLESS
+from config import ARCHIVE_FORMAT, ARCHIVE_HTML_ENCODING, BROWSER_HEADLESS
+from utils import artifacts, image_hash, memento_content, url_index, warc
+from utils.blob_store import get_blob_store
+from utils.capture_timing import CaptureTimer, capture_stats
 from utils.persona_browser import (
     build_context_options as persona_context_options,
     channel_for_persona,
@@ -208,6 +211,7 @@ class BrowserManager:
             timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
             screenshot_path = os.path.join(screenshots_dir, f"session-{timestamp}.png")
             session.page.screenshot(path=screenshot_path, full_page=True)
+            artifacts.make_thumbnails(screenshot_path)
             logger.info(f"Session screenshot saved to {screenshot_path}")
             return {
                 "screenshot_path": screenshot_path,
@@ -233,42 +237,98 @@ class BrowserManager:
 
     def _write_memento(self, page, url, *, locale=None, persona_id=None,
                        extra_metadata=None, memento_dir=None, timestamp=None,
-                       save_to_db=True):
+                       save_to_db=True, timer=None, archive_format=None):
         """Persist an already-navigated ``page`` as a memento under archives/.
 
-        Writes content.html, screenshot.png, metadata.json (common keys plus any
-        ``extra_metadata``) and updates the url-level metadata index; unless
+        Writes content.html[.gz], screenshot.png, metadata.json (common keys plus any
+        ``extra_metadata``) and appends to the url-level index.jsonl; unless
         ``save_to_db`` is False, also records the archived_website/memento rows.
+        The HTML is stored with ``ARCHIVE_HTML_ENCODING`` (gzip by default, as
+        content.html.gz); HTML and screenshot are hardlinks into the
+        content-addressed blob store, so identical artifacts are written once.
         Callers that record HAR/video pre-create the dir and pass
         ``memento_dir``/``timestamp``. Shared by archive_page /
         archive_session_page / capture_as_persona.
+
+        Each step is timed on ``timer`` (a fresh ``CaptureTimer`` if omitted).
+        metadata.json is written before the DB step (so a failed DB write still
+        leaves a recoverable memento) and replaced afterwards so its ``timings``
+        also include ``db_write``; the mementos row stores the breakdown as of
+        the insert.
+        The screenshot's perceptual hashes are stored with the memento row.
+
+        With ``archive_format="warc"`` (default: ``ARCHIVE_FORMAT``) the HTML and
+        screenshot are not written as files; instead request/response/resource/
+        metadata records are appended to the rolling WARC file and indexed in
+        ``warc_records`` (even when ``save_to_db`` is False), and the memento
+        dir holds only metadata.json.
         """
-        page_title = page.title()
+        timer = timer or CaptureTimer()
+        use_warc = (archive_format or ARCHIVE_FORMAT) == "warc"
+
+        with timer.phase("page_content"):
+            page_title = page.title()
 
         # Best-effort HTTP info (adds Accept-Language when a locale is known).
         http_status = content_type = content_length = None
         headers = {}
-        try:
-            req_headers = {"Accept-Language": locale} if locale else {}
-            response = requests.get(url, headers=req_headers, timeout=10)
-            http_status = response.status_code
-            headers = dict(response.headers)
-            content_type = response.headers.get("Content-Type", "")
-            content_length = len(response.content)
-        except Exception as e:
-            logger.error(f"Error getting HTTP information: {e}")
+        with timer.phase("http_info"):
+            try:
+                req_headers = {"Accept-Language": locale} if locale else {}
+                response = requests.get(url, headers=req_headers, timeout=10)
+                http_status = response.status_code
+                headers = dict(response.headers)
+                content_type = response.headers.get("Content-Type", "")
+                content_length = len(response.content)
+            except Exception as e:
+                logger.error(f"Error getting HTTP information: {e}")
 
         if memento_dir is None:
             url_dir, memento_dir, timestamp = self._memento_paths(url)
         else:
             url_dir = os.path.dirname(memento_dir)
 
-        html_path = os.path.join(memento_dir, "content.html")
-        with open(html_path, "w", encoding="utf-8") as f:
-            f.write(page.content())
+        with timer.phase("page_content"):
+            html = page.content().encode("utf-8")
+        with timer.phase("screenshot"):
+            png = page.screenshot(full_page=True)
+            try:
+                screenshot_hashes = image_hash.compute_hashes(png)
+            except Exception as e:
+                logger.error(f"Error hashing screenshot: {e}")
+                screenshot_hashes = None
 
-        screenshot_path = os.path.join(memento_dir, "screenshot.png")
-        page.screenshot(path=screenshot_path, full_page=True)
+        if use_warc:
+            # Artifacts live in the WARC records appended after the DB step.
+            html_path = screenshot_path = content_encoding = None
+            blobs = {}
+        else:
+            blob_store = get_blob_store()
+            content_encoding = ARCHIVE_HTML_ENCODING
+            html_path = os.path.join(memento_dir, memento_content.html_filename(content_encoding))
+            screenshot_path = os.path.join(memento_dir, "screenshot.png")
+            with timer.phase("file_write"):
+                stored_html = memento_content.encode(html, content_encoding)
+                html_blob = blob_store.put_and_link(stored_html, html_path)
+                screenshot_blob = blob_store.put_and_link(png, screenshot_path)
+            with timer.phase("thumbnails"):
+                artifacts.make_thumbnails(screenshot_path, png)
+            blobs = {
+                "html": (html_blob.sha256, html_blob.size),
+                "screenshot": (screenshot_blob.sha256, screenshot_blob.size),
+            }
+
+        result = {
+            "url": url,
+            "title": page_title,
+            "memento_location": memento_dir,
+            "screenshot_path": screenshot_path,
+            "html_path": html_path,
+            "content_encoding": content_encoding,
+            "http_status": http_status,
+            "blobs": {role: sha256 for role, (sha256, _) in blobs.items()},
+            "screenshot_hashes": screenshot_hashes,
+        }
 
         metadata = {
             "url": url,
@@ -279,64 +339,109 @@ class BrowserManager:
             "content_type": content_type,
             "content_length": content_length,
             "headers": headers,
+            "content_encoding": content_encoding,
         }
         if extra_metadata:
             metadata.update(extra_metadata)
-        with open(os.path.join(memento_dir, "metadata.json"), "w", encoding="utf-8") as f:
-            json.dump(metadata, f, indent=2)
 
-        # URL-level metadata index.
-        url_metadata_path = os.path.join(url_dir, "metadata.json")
-        if os.path.exists(url_metadata_path):
-            with open(url_metadata_path, "r", encoding="utf-8") as f:
-                url_metadata = json.load(f)
-        else:
-            url_metadata = {"url": url, "first_archived": timestamp, "mementos": []}
-        url_metadata["mementos"].append(timestamp)
-        url_metadata["last_archived"] = timestamp
-        with open(url_metadata_path, "w", encoding="utf-8") as f:
-            json.dump(url_metadata, f, indent=2)
+        refs = None
+        if use_warc:
+            refs = self._append_warc_records(
+                url, locale, html, png, http_status, headers, metadata, timer,
+            )
+            result["warc_records"] = {
+                ref.record_type: {"filename": ref.filename, "offset": ref.offset,
+                                  "length": ref.length, "record_id": ref.record_id}
+                for ref in refs
+            }
+            metadata["warc"] = result["warc_records"]
 
-        result = {
-            "url": url,
-            "title": page_title,
-            "memento_location": memento_dir,
-            "screenshot_path": screenshot_path,
-            "html_path": html_path,
-            "http_status": http_status,
-        }
+        # metadata.json goes to disk before the DB write so a capture whose DB
+        # write fails can still be recovered by the re-indexer.
+        metadata["blobs"] = result["blobs"]
+        metadata["screenshot_hashes"] = screenshot_hashes
+        with timer.phase("file_write"):
+            metadata["timings"] = timer.as_dict()
+            self._write_metadata(memento_dir, metadata)
 
         if save_to_db:
             import database
 
-            conn = database.get_db_connection()
-            cursor = conn.cursor()
-            cursor.execute("SELECT id FROM archived_websites WHERE uri_r = ?", (url,))
-            existing = cursor.fetchone()
-            conn.close()
-
-            if existing:
-                archived_website_id = existing["id"]
-            else:
-                archived_website_id = database.save_archived_website(
-                    url=url, persona_id=persona_id,
-                    archive_type="filesystem", archive_location=url_dir,
+            with timer.phase("db_write"):
+                conn = database.get_db_connection()
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT id FROM archived_websites WHERE uri_r = ? AND persona_id IS ? ORDER BY id LIMIT 1",
+                    (url, persona_id)
+                )
+                existing = cursor.fetchone()
+                conn.close()
+
+                if existing:
+                    archived_website_id = existing["id"]
+                else:
+                    archived_website_id = database.save_archived_website(
+                        url=url, persona_id=persona_id,
+                        archive_type="warc" if use_warc else "filesystem",
+                        archive_location=url_dir,
+                    )
+
+                memento_id = database.save_memento(
+                    archived_website_id=archived_website_id,
+                    memento_location=memento_dir,
+                    http_status=http_status,
+                    content_type=content_type,
+                    content_length=content_length,
+                    headers=headers,
+                    screenshot_path=screenshot_path,
+                    capture_timings=timer.as_dict(),
+                    blobs=blobs or None,
+                    content_encoding=content_encoding,
+                    screenshot_hashes=screenshot_hashes,
                 )
-
-            memento_id = database.save_memento(
-                archived_website_id=archived_website_id,
-                memento_location=memento_dir,
-                http_status=http_status,
-                content_type=content_type,
-                content_length=content_length,
-                headers=headers,
-                screenshot_path=screenshot_path,
-            )
             result["archived_website_id"] = archived_website_id
             result["memento_id"] = memento_id
 
+        if refs is not None:
+            with timer.phase("db_write"):
+                import database
+                database.save_warc_records(refs, memento_id=result.get("memento_id"))
+
+        with timer.phase("file_write"):
+            if "db_write" in timer.as_dict():
+                # Replace the file so its timings include the DB step
+                metadata["timings"] = timer.as_dict()
+                self._write_metadata(memento_dir, metadata)
+
+            # URL-level index: one appended line; metadata.json is a lazy export.
+            url_index.append_memento(url_dir, url, timestamp,
+                                     memento_id=result.get("memento_id"))
+
+        result["timings"] = timer.as_dict()
         return result
 
+    @staticmethod
+    def _write_metadata(memento_dir, metadata):
+        """Write metadata.json atomically, so a rewrite never leaves it partial."""
+        path = os.path.join(memento_dir, "metadata.json")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(metadata, f, indent=2)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _append_warc_records(url, locale, html, png, http_status, headers, metadata, timer):
+        """Append one capture's request/response/resource/metadata WARC records."""
+        response_block = warc.http_response_block(html, http_status, headers)
+        with timer.phase("file_write"):
+            return warc.get_warc_writer().write_records([
+                ("response", url, response_block, "application/http; msgtype=response", {}),
+                ("request", url, warc.http_request_block(url, locale),
+                 "application/http; msgtype=request", {}),
+                ("resource", f"urn:screenshot:{url}", png, "image/png", {}),
+                ("metadata", url, warc.metadata_block(metadata), "application/json", {}),
+            ])
+
     def archive_session_page(self, persona_id=None) -> Optional[Dict[str, Any]]:
         """Archive the current page from the active browsing session."""
         session = self._active_session
@@ -346,15 +451,19 @@ class BrowserManager:
         page = session.page
         persona_id = persona_id or session.persona_id
 
+        timer = CaptureTimer()
         try:
             url = page.url
             logger.info(f"Archiving session page: {url}")
             result = self._write_memento(
                 page, url, persona_id=persona_id,
                 extra_metadata={"language": None, "geolocation": None},
+                timer=timer,
             )
-            logger.info("Session page archived: website=%s, memento=%s",
-                        result.get("archived_website_id"), result.get("memento_id"))
+            capture_stats.record(result["timings"], path="archive_session_page")
+            logger.info("Session page archived: website=%s, memento=%s (%.0f ms)",
+                        result.get("archived_website_id"), result.get("memento_id"),
+                        result["timings"]["total"])
             return result
         except Exception as e:
             logger.error(f"Error archiving session page: {e}", exc_info=True)
@@ -398,6 +507,7 @@ class BrowserManager:
                 timestamp = datetime.now().strftime("%Y%m%d-%H%M%S")
                 screenshot_path = os.path.join(screenshots_dir, f"screenshot-{timestamp}.png")
                 page.screenshot(path=screenshot_path, full_page=True)
+                artifacts.make_thumbnails(screenshot_path)
                 logger.info(f"Screenshot saved to {screenshot_path}")
                 result["screenshot_path"] = screenshot_path
 
@@ -408,29 +518,43 @@ class BrowserManager:
     def archive_page(self, url, locale=None, geolocation=None, timezone_id=None,
                      proxy=None, persona=None, persona_id=None):
         """Archive a webpage: save HTML, screenshot, metadata, and database record."""
-        context = self.create_context(
-            locale=locale, geolocation=geolocation,
-            timezone_id=timezone_id, proxy=proxy, persona=persona,
-        )
+        timer = CaptureTimer()
+        with timer.phase("browser_launch"):
+            self._ensure_browser()
+        with timer.phase("context_create"):
+            context = self.create_context(
+                locale=locale, geolocation=geolocation,
+                timezone_id=timezone_id, proxy=proxy, persona=persona,
+            )
+        result = None
         try:
-            page = context.new_page()
+            with timer.phase("context_create"):
+                page = context.new_page()
             logger.info(f"Archiving {url} with locale={locale}, geolocation={geolocation}")
-            page.goto(url, wait_until="domcontentloaded", timeout=30000)
-            page.wait_for_timeout(5000)
+            with timer.phase("navigate"):
+                page.goto(url, wait_until="domcontentloaded", timeout=30000)
+            with timer.phase("settle"):
+                page.wait_for_timeout(5000)
 
-            return self._write_memento(
+            result = self._write_memento(
                 page, url, locale=locale, persona_id=persona_id,
                 extra_metadata={
                     "language": locale,
                     "geolocation": geolocation if isinstance(geolocation, str) else None,
                 },
+                timer=timer,
             )
+            return result
 
         except Exception as e:
             logger.error(f"Error archiving page: {e}", exc_info=True)
             return None
         finally:
-            context.close()
+            with timer.phase("context_close"):
+                context.close()
+            if result is not None:
+                result["timings"] = timer.as_dict()
+                capture_stats.record(result["timings"], path="archive_page")
 
     # ── Persona capture (full attributes + HAR/video + real profile) ────
 
@@ -459,7 +583,8 @@ class BrowserManager:
 
     def capture_as_persona(self, url, persona, *, profile_dir=None, channel=None,
                            record_har=False, record_video=False, wait_time=5,
-                           headless=None, persona_id=None, extra_options=None):
+                           headless=None, persona_id=None, extra_options=None,
+                           archive_format=None):
         """Capture a page *as a persona* with full attribute emulation and optional
         HAR/video, into the archives/<url_hash>/<timestamp>/ memento layout.
 
@@ -472,8 +597,13 @@ class BrowserManager:
         Returns a result dict (screenshot_path, har_path, video_path, html_path,
         title, final_url, http_status, persona_snapshot, memento_location). This is
         pure capture -- persisting it as a journey waypoint is Phase C.
+        ``archive_format="warc"`` writes the HTML/screenshot as WARC records
+        instead of files (HAR/video stay in the memento dir).
         """
-        self._ensure_playwright()
+        timer = CaptureTimer()
+        use_warc = (archive_format or ARCHIVE_FORMAT) == "warc"
+        with timer.phase("browser_launch"):
+            self._ensure_playwright()
         headless = BROWSER_HEADLESS if headless is None else headless
         channel = channel or channel_for_persona(persona)
         if persona_id is None:
@@ -495,20 +625,27 @@ class BrowserManager:
             user_data_dir = self._resolve_user_data_dir(profile_dir)
             logger.info("Capturing %s as %r via real profile %s (channel=%s)",
                         url, persona.get("name"), user_data_dir, channel)
-            context = self._playwright.chromium.launch_persistent_context(
-                user_data_dir=user_data_dir, headless=headless, channel=channel, **options,
-            )
+            # A persistent context launches the browser and context in one call.
+            with timer.phase("browser_launch"):
+                context = self._playwright.chromium.launch_persistent_context(
+                    user_data_dir=user_data_dir, headless=headless, channel=channel, **options,
+                )
         else:
             logger.info("Capturing %s as %r via synthesized context (channel=%s)",
                         url, persona.get("name"), channel)
-            browser = self._playwright.chromium.launch(headless=headless, channel=channel)
-            context = browser.new_context(**options)
+            with timer.phase("browser_launch"):
+                browser = self._playwright.chromium.launch(headless=headless, channel=channel)
+            with timer.phase("context_create"):
+                context = browser.new_context(**options)
 
         video_path = None
         try:
-            page = context.pages[0] if context.pages else context.new_page()
-            page.goto(url, wait_until="domcontentloaded", timeout=30000)
-            page.wait_for_timeout(wait_time * 1000)
+            with timer.phase("context_create"):
+                page = context.pages[0] if context.pages else context.new_page()
+            with timer.phase("navigate"):
+                page.goto(url, wait_until="domcontentloaded", timeout=30000)
+            with timer.phase("settle"):
+                page.wait_for_timeout(wait_time * 1000)
 
             final_url = page.url
 
@@ -533,12 +670,13 @@ class BrowserManager:
             result = self._write_memento(
                 page, url, persona_id=persona_id,
                 memento_dir=memento_dir, timestamp=timestamp, save_to_db=False,
+                timer=timer, archive_format=archive_format,
                 extra_metadata={
                     "final_url": final_url,
                     "persona_snapshot": persona_snapshot,
                     "artifacts": {
-                        "screenshot": "screenshot.png",
-                        "html": "content.html",
+                        "screenshot": None if use_warc else "screenshot.png",
+                        "html": None if use_warc else memento_content.html_filename(ARCHIVE_HTML_ENCODING),
                         "har": "traffic.har" if har_path else None,
                         "video": os.path.basename(video_path) if video_path else None,
                     },
@@ -551,11 +689,15 @@ class BrowserManager:
                 "persona_snapshot": persona_snapshot,
             })
         finally:
-            context.close()  # flushes HAR + finalizes video
-            if browser is not None:
-                browser.close()
-
-        logger.info("Captured %s as %r -> %s", url, persona.get("name"), memento_dir)
+            with timer.phase("context_close"):
+                context.close()  # flushes HAR + finalizes video
+                if browser is not None:
+                    browser.close()
+
+        result["timings"] = timer.as_dict()
+        capture_stats.record(result["timings"], path="capture_as_persona")
+        logger.info("Captured %s as %r -> %s (%.0f ms)", url, persona.get("name"), memento_dir,
+                    result["timings"]["total"])
         return result
 
     def shutdown(self):
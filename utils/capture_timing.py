@@ -0,0 +1,116 @@
+"""
+Per-phase timing for BrowserManager capture paths.
+
+A ``CaptureTimer`` is threaded through archive_page / archive_session_page /
+capture_as_persona and ``_write_memento``; each costly step runs inside
+``timer.phase(name)``. The finished breakdown (milliseconds per phase) is
+persisted into the memento's metadata.json and mementos row, and recorded into
+the process-wide ``capture_stats`` so ``GET /api/capture-timings`` can report
+p50/p95/p99 per phase without scanning the archive.
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, Iterable, List, Optional
+
+# Phase names, in pipeline order. Paths only record the phases they execute
+# (e.g. a headful session capture has no browser_launch/navigate/settle).
+PHASES = (
+    "browser_launch",
+    "context_create",
+    "navigate",
+    "settle",
+    "http_info",
+    "page_content",
+    "screenshot",
+    "file_write",
+    "thumbnails",
+    "db_write",
+    "context_close",
+)
+
+# Samples kept per phase; old samples age out so percentiles track recent behaviour.
+DEFAULT_MAX_SAMPLES = 1000
+
+
+class CaptureTimer:
+    """Accumulates wall-clock milliseconds per named capture phase."""
+
+    def __init__(self):
+        self._started = time.perf_counter()
+        self._phases: Dict[str, float] = {}
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the enclosed block; repeated phases accumulate."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000.0
+            self._phases[name] = self._phases.get(name, 0.0) + elapsed
+
+    def as_dict(self) -> Dict[str, float]:
+        """Return ``{phase: ms}`` plus ``total`` (ms since the timer was created)."""
+        timings = {name: round(ms, 2) for name, ms in self._phases.items()}
+        timings["total"] = round((time.perf_counter() - self._started) * 1000.0, 2)
+        return timings
+
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already-sorted list (None when empty)."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class CaptureTimingStats:
+    """Thread-safe, bounded per-phase sample store with percentile summaries."""
+
+    def __init__(self, max_samples: int = DEFAULT_MAX_SAMPLES):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=self.max_samples))
+        self._count = 0
+
+    def record(self, timings: Dict[str, float], path: Optional[str] = None) -> None:
+        """Add one capture's breakdown (``path`` also keys a ``<path>.total`` series)."""
+        with self._lock:
+            self._count += 1
+            for name, ms in timings.items():
+                self._samples[name].append(ms)
+            if path and "total" in timings:
+                self._samples[f"{path}.total"].append(timings["total"])
+
+    def summary(self, phases: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, float]]:
+        """Return ``{phase: {count, p50, p95, p99, max}}`` for the retained samples."""
+        with self._lock:
+            snapshot = {name: sorted(values) for name, values in self._samples.items()}
+        if phases is not None:
+            wanted = set(phases)
+            snapshot = {name: values for name, values in snapshot.items() if name in wanted}
+        return {
+            name: {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+                "p99": percentile(values, 99),
+                "max": values[-1] if values else None,
+            }
+            for name, values in snapshot.items()
+        }
+
+    @property
+    def captures(self) -> int:
+        return self._count
+
+    def reset(self) -> None:
+        with self._lock:
+            self._samples.clear()
+            self._count = 0
+
+
+# Process-wide aggregate fed by every capture path.
+capture_stats = CaptureTimingStats()
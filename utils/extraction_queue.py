@@ -0,0 +1,306 @@
+"""
+Background persona attribute extraction.
+
+Saving a chat queues a row in ``extraction_jobs`` and returns straight away;
+``EXTRACTION_CONCURRENCY`` worker threads run
+``PersonaAttributeService.process_waypoint`` for each job:
+
+* A waypoint has at most one queued job. Re-saving it within
+  ``EXTRACTION_COALESCE_SECONDS`` pushes that job back instead of adding one,
+  so a burst of saves is extracted once, from the latest transcript.
+* A waypoint is never extracted by two workers at once; a save during an
+  extraction queues one more run after it.
+* LLM failures are retried with exponential backoff up to
+  ``EXTRACTION_MAX_ATTEMPTS``; a missing waypoint fails the job at once.
+* ``stop`` lets running extractions finish (up to a timeout) and leaves the
+  rest queued. Jobs live in the database, so a restart picks them up. A job
+  left running longer than ``EXTRACTION_JOB_LEASE`` (its process died) goes
+  back to the queue; younger ones may be another process's and are left.
+
+``submit_batch`` re-derives attributes for every saved conversation that was
+never extracted or whose persona changed since (``find_unextracted_waypoints``).
+A batch keeps ``EXTRACTION_BATCH_CONCURRENCY`` LLM calls in flight, enough to
+keep a vLLM server's batch full, and merges the results into personas in
+groups of ``EXTRACTION_BATCH_GROUP_SIZE``: one save per persona per group,
+and one transaction to mark the group's jobs done. Each job's status is its
+checkpoint, so an interrupted batch resumes where it stopped.
+"""
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import database
+from config import (
+    EXTRACTION_BATCH_CONCURRENCY,
+    EXTRACTION_BATCH_GROUP_SIZE,
+    EXTRACTION_COALESCE_SECONDS,
+    EXTRACTION_CONCURRENCY,
+    EXTRACTION_JOB_LEASE,
+    EXTRACTION_MAX_ATTEMPTS,
+    EXTRACTION_RETRY_BASE,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ExtractionQueue:
+    """Persistent attribute extraction queue worked off by a bounded pool of workers."""
+
+    def __init__(self, service: Optional[Any] = None,
+                 concurrency: int = EXTRACTION_CONCURRENCY,
+                 coalesce_seconds: float = EXTRACTION_COALESCE_SECONDS,
+                 max_attempts: int = EXTRACTION_MAX_ATTEMPTS,
+                 retry_base: float = EXTRACTION_RETRY_BASE,
+                 batch_concurrency: int = EXTRACTION_BATCH_CONCURRENCY,
+                 batch_group_size: int = EXTRACTION_BATCH_GROUP_SIZE,
+                 lease: float = EXTRACTION_JOB_LEASE,
+                 poll_interval: float = 30.0):
+        self._service = service
+        self.concurrency = max(1, concurrency)
+        self.coalesce_seconds = coalesce_seconds
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.batch_concurrency = max(1, batch_concurrency)
+        self.batch_group_size = max(1, batch_group_size)
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._batch_threads: Dict[int, threading.Thread] = {}
+
+    @property
+    def service(self):
+        """The PersonaAttributeService doing the work (created on first use)."""
+        if self._service is None:
+            from services.persona_attribute_service import PersonaAttributeService
+
+            self._service = PersonaAttributeService()
+        return self._service
+
+    def enqueue(self, waypoint_id: int, start: bool = True) -> Dict[str, Any]:
+        """Queue extraction for a waypoint (coalescing with a queued job) and wake a worker."""
+        job = database.enqueue_extraction_job(waypoint_id, self.coalesce_seconds, self.max_attempts)
+        if start:
+            self.start()
+        self._wake.set()
+        return job
+
+    def submit_batch(self, label: Optional[str] = None, include_current: bool = False,
+                     start: bool = True) -> Dict[str, Any]:
+        """
+        Queue every conversation that needs (re-)extracting as one batch and
+        start working it off in the background.
+
+        Returns:
+            Dictionary with batch_id, queued and already_queued counts
+        """
+        waypoint_ids = database.find_unextracted_waypoints(include_current)
+        label = label or ("all conversations" if include_current else "unextracted conversations")
+        result = database.create_extraction_batch(label, waypoint_ids, self.max_attempts)
+        logger.info(f"Extraction batch {result['batch_id']} queued {result['queued']} conversations")
+        if start:
+            self.start_batch(result['batch_id'])
+        return result
+
+    def start(self) -> bool:
+        """
+        Start the worker threads and resume unfinished batches; returns False
+        if the workers are already running.
+        """
+        with self._lock:
+            if any(thread.is_alive() for thread in self._threads):
+                return False
+            self.requeue_stale()
+            self._stop.clear()
+            self._threads = [threading.Thread(target=self._loop, name=f"extraction-{n}", daemon=True)
+                             for n in range(self.concurrency)]
+            for thread in self._threads:
+                thread.start()
+        for batch_id in database.get_running_extraction_batches():
+            self.start_batch(batch_id)
+        return True
+
+    def start_batch(self, batch_id: int) -> bool:
+        """Work off a batch in a background thread; returns False if it is already running."""
+        with self._lock:
+            thread = self._batch_threads.get(batch_id)
+            if thread and thread.is_alive():
+                return False
+            self._stop.clear()
+            thread = threading.Thread(target=self.run_batch, args=(batch_id,),
+                                      name=f"extraction-batch-{batch_id}", daemon=True)
+            self._batch_threads[batch_id] = thread
+            thread.start()
+            return True
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """
+        Stop claiming jobs and wait up to ``timeout`` seconds for running
+        extractions to finish. Returns False if some were still running.
+        """
+        self._stop.set()
+        self._wake.set()
+        threads = self._threads + list(self._batch_threads.values())
+        for thread in threads:
+            thread.join(timeout)
+        drained = not any(thread.is_alive() for thread in threads)
+        if not drained:
+            logger.warning("Attribute extraction still running at shutdown; it will be retried on restart")
+        return drained
+
+    def requeue_stale(self, lease: Optional[float] = None) -> int:
+        """
+        Requeue jobs running for longer than ``lease`` seconds (default: the
+        queue's lease); returns how many. ``lease=0`` requeues every running
+        job, for when no other process can be extracting.
+        """
+        lease = self.lease if lease is None else lease
+        requeued = database.requeue_running_extraction_jobs(datetime.now() - timedelta(seconds=lease))
+        if requeued:
+            logger.info(f"Requeued {requeued} interrupted attribute extraction jobs")
+        return requeued
+
+    def backoff(self, attempts: int) -> float:
+        """Seconds to wait before attempt ``attempts + 1``."""
+        return self.retry_base * 2 ** (attempts - 1)
+
+    def _next_wait(self, batch_id: Optional[int] = None) -> Optional[float]:
+        due = database.get_next_extraction_attempt_at(batch_id)
+        if due is None:
+            return None
+        return min(self.poll_interval, max(0.0, (due - datetime.now()).total_seconds()))
+
+    def process_next(self) -> Optional[float]:
+        """
+        Run the next due job.
+
+        Returns:
+            None if a job was processed, otherwise seconds until it is worth
+            looking again
+        """
+        job = database.claim_extraction_job()
+        if job is None:
+            if self.requeue_stale():
+                return 0.0
+            wait_time = self._next_wait()
+            return self.poll_interval if wait_time is None else wait_time
+
+        try:
+            persona_id = self.service.process_waypoint(job['waypoint_id'])
+        except Exception as e:
+            self._failed(job, e)
+        else:
+            database.finish_extraction_job(job['id'], persona_id=persona_id)
+            logger.info(f"Attribute extraction for waypoint {job['waypoint_id']} finished (job {job['id']})")
+        return None
+
+    def _failed(self, job: Dict[str, Any], error: Exception) -> None:
+        # A missing waypoint will not come back; anything else may be transient
+        if not isinstance(error, ValueError) and job['attempts'] < job['max_attempts']:
+            delay = self.backoff(job['attempts'])
+            database.retry_extraction_job(job['id'], str(error), datetime.now() + timedelta(seconds=delay))
+            logger.warning(f"Attribute extraction job {job['id']} attempt {job['attempts']} failed, "
+                           f"retrying in {delay:.0f}s: {error}")
+        else:
+            database.finish_extraction_job(job['id'], error=str(error))
+            logger.error(f"Attribute extraction job {job['id']} failed: {error}")
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            # Clear before looking at the table so an enqueue during the
+            # extraction still wakes the next wait.
+            self._wake.clear()
+            try:
+                wait_time = self.process_next()
+            except Exception as e:
+                logger.error(f"Attribute extraction worker error: {e}", exc_info=True)
+                wait_time = self.poll_interval
+            if wait_time:
+                self._wake.wait(wait_time)
+
+    def run_batch(self, batch_id: int) -> bool:
+        """
+        Work off a batch: up to ``batch_concurrency`` LLM extractions in
+        flight, results merged per persona every ``batch_group_size`` jobs.
+
+        Returns:
+            True if the batch finished, False if it was stopped first
+        """
+        pending: Dict[Optional[int], List] = defaultdict(list)
+        in_flight: Dict[Any, Dict[str, Any]] = {}
+        with ThreadPoolExecutor(max_workers=self.batch_concurrency,
+                                thread_name_prefix=f"extraction-batch-{batch_id}") as pool:
+            while True:
+                # Keep the LLM busy: top up to the concurrency limit
+                while not self._stop.is_set() and len(in_flight) < self.batch_concurrency:
+                    job = database.claim_extraction_job(batch_id)
+                    if job is None:
+                        break
+                    in_flight[pool.submit(self.service.extract_waypoint, job['waypoint_id'])] = job
+
+                if not in_flight:
+                    self._flush(pending)
+                    # Jobs a dead process left running would keep the batch open
+                    if not self._stop.is_set() and self.requeue_stale():
+                        continue
+                    wait_time = None if self._stop.is_set() else self._next_wait(batch_id)
+                    if wait_time is None:
+                        break
+                    # Only retries are left; wait until one is due
+                    self._stop.wait(wait_time)
+                    continue
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job = in_flight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        self._failed(job, e)
+                        continue
+                    pending[result['persona_id'] if result else None].append((job, result))
+                if sum(len(items) for items in pending.values()) >= self.batch_group_size:
+                    self._flush(pending)
+
+        database.finish_extraction_batch(batch_id)
+        batch = database.get_extraction_batch(batch_id)
+        finished = batch is not None and batch['status'] == 'finished'
+        if finished:
+            logger.info(f"Extraction batch {batch_id} finished: {batch['jobs']}")
+        return finished
+
+    def _flush(self, pending: Dict[Optional[int], List]) -> None:
+        """Merge the pending extractions: one persona save and one job update per persona."""
+        for persona_id, items in pending.items():
+            jobs = [job for job, _ in items]
+            updated = None
+            if persona_id is not None:
+                try:
+                    if self.service.apply_extractions(persona_id, [result['extraction'] for _, result in items]):
+                        updated = persona_id
+                except Exception as e:
+                    logger.error(f"Merging {len(items)} extractions into persona {persona_id} failed: {e}",
+                                 exc_info=True)
+                    for job in jobs:
+                        self._failed(job, e)
+                    continue
+            database.finish_extraction_jobs([job['id'] for job in jobs], persona_id=updated)
+        pending.clear()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "jobs": database.get_extraction_job_counts(),
+            "workers": sum(thread.is_alive() for thread in self._threads),
+            "concurrency": self.concurrency,
+            "coalesce_seconds": self.coalesce_seconds,
+            "batches": sorted(batch_id for batch_id, thread in self._batch_threads.items() if thread.is_alive()),
+            "batch_concurrency": self.batch_concurrency,
+        }
+
+
+extraction_queue = ExtractionQueue()
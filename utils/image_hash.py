@@ -0,0 +1,126 @@
+"""
+Perceptual hashes for screenshots.
+
+Every screenshot gets a 64-bit dHash (gradient) and pHash (DCT) at write time,
+stored in the ``screenshot_hashes`` table. Visually similar captures have
+hashes a small Hamming distance apart, which is what persona/time comparisons
+query for:
+
+* ``dhash`` is cheap and sensitive to layout shifts.
+* ``phash`` tolerates re-encoding and small colour changes.
+
+The pHash is also split into four 16-bit bands with their own DB indexes. Two
+hashes within distance 3 must agree exactly on at least one band (pigeonhole),
+so tight near-duplicate lookups use indexed equality instead of a scan.
+"""
+import io
+from typing import Dict, Iterable, List, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+# The DB splits the pHash into 4 bands; the band prefilter is exact up to this distance.
+BAND_MAX_DISTANCE = 3
+
+_PHASH_SIZE = 32
+_PHASH_LOW = 8
+
+
+def _load(image: Union[bytes, str, Image.Image]) -> Image.Image:
+    if isinstance(image, Image.Image):
+        return image
+    if isinstance(image, bytes):
+        image = io.BytesIO(image)
+    with Image.open(image) as opened:
+        opened.load()
+        return opened.copy()
+
+
+def _grayscale(image: Image.Image, width: int, height: int) -> np.ndarray:
+    return np.asarray(image.convert("L").resize((width, height), Image.LANCZOS), dtype=np.float64)
+
+
+def _bits_to_int(bits: np.ndarray) -> int:
+    return int.from_bytes(np.packbits(bits.ravel()).tobytes(), "big")
+
+
+def dhash(image: Union[bytes, str, Image.Image]) -> int:
+    """Difference hash: sign of horizontal gradients on a 9x8 grayscale thumbnail."""
+    pixels = _grayscale(_load(image), 9, 8)
+    return _bits_to_int(pixels[:, 1:] > pixels[:, :-1])
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2.0 / n)
+    matrix[0] /= np.sqrt(2.0)
+    return matrix
+
+
+_DCT = _dct_matrix(_PHASH_SIZE)
+
+
+def phash(image: Union[bytes, str, Image.Image]) -> int:
+    """DCT hash: low-frequency 8x8 coefficients of a 32x32 grayscale thumbnail vs. their median."""
+    pixels = _grayscale(_load(image), _PHASH_SIZE, _PHASH_SIZE)
+    low = (_DCT @ pixels @ _DCT.T)[:_PHASH_LOW, :_PHASH_LOW]
+    # Exclude the DC term from the median; it only encodes overall brightness.
+    median = np.median(low.ravel()[1:])
+    return _bits_to_int(low > median)
+
+
+def compute_hashes(image: Union[bytes, str, Image.Image]) -> Dict[str, str]:
+    """Return ``{"dhash": hex, "phash": hex}`` (16 hex digits each)."""
+    image = _load(image)
+    return {"dhash": to_hex(dhash(image)), "phash": to_hex(phash(image))}
+
+
+def to_hex(value: int) -> str:
+    return f"{value:016x}"
+
+
+def hamming(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def hamming_many(target: str, hashes: Sequence[str]) -> np.ndarray:
+    """Vectorized Hamming distance from ``target`` to every hash in ``hashes``."""
+    if not hashes:
+        return np.zeros(0, dtype=np.int64)
+    values = np.array([int(h, 16) for h in hashes], dtype=np.uint64)
+    xor = values ^ np.uint64(int(target, 16))
+    return np.unpackbits(xor.view(np.uint8).reshape(-1, 8), axis=1).sum(axis=1)
+
+
+def nearest(target: str, candidates: Iterable[Tuple[int, str]], max_distance: int) -> List[Tuple[int, int]]:
+    """Return ``[(id, distance)]`` for candidates within ``max_distance``, closest first."""
+    candidates = list(candidates)
+    distances = hamming_many(target, [h for _, h in candidates])
+    matches = [(candidates[i][0], int(d)) for i, d in enumerate(distances) if d <= max_distance]
+    return sorted(matches, key=lambda match: (match[1], match[0]))
+
+
+def find_similar(memento_id: int, max_distance: int = 6, kind: str = "phash",
+                 same_url: bool = False) -> List[Dict[str, int]]:
+    """Find mementos whose screenshots are within ``max_distance`` bits of ``memento_id``'s.
+
+    Returns ``[{"memento_id", "distance"}]`` closest first (excluding the
+    memento itself), or an empty list if its screenshot was never hashed.
+    """
+    import database
+
+    own = database.get_screenshot_hashes(memento_id)
+    if own is None:
+        return []
+    use_bands = kind == "phash" and max_distance <= BAND_MAX_DISTANCE
+    candidates = database.get_screenshot_hash_candidates(
+        kind,
+        archived_website_id=own["archived_website_id"] if same_url else None,
+        phash=own["phash"] if use_bands else None,
+    )
+    return [
+        {"memento_id": other_id, "distance": distance}
+        for other_id, distance in nearest(own[kind], candidates, max_distance)
+        if other_id != memento_id
+    ]
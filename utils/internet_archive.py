@@ -1,141 +1,428 @@
-import requests
+"""
+Internet Archive (Save Page Now) submissions.
+
+Submitting a page can take the Wayback Machine a minute, so requests never
+call it inline. ``submission_queue.enqueue`` records a row in
+``internet_archive_jobs`` and returns straight away; one background worker
+works the table off:
+
+* A token bucket paces submissions: ``INTERNET_ARCHIVE_BURST`` may go out
+  back to back, then one per ``3600 / internet_archive_rate_per_hour`` seconds.
+* Timeouts, connection errors, 429 and 5xx answers are retried with
+  exponential backoff (``Retry-After`` wins if it asks for longer). Other
+  4xx answers fail the job at once.
+* The outcome is written to the job and to its memento
+  (``internet_archive_id``/``internet_archive_status``).
+
+``submit_batch`` queues a journey's pages or a filtered set of archives in
+one go: one job per distinct URL, worked off by ``INTERNET_ARCHIVE_CONCURRENCY``
+workers sharing the bucket. Batch jobs first ask the Wayback availability API
+(cached in ``internet_archive_availability``) and are marked ``skipped`` when
+a snapshot newer than ``INTERNET_ARCHIVE_RECENT_DAYS`` already exists.
+
+Jobs live in the database, so a restart picks up where the workers stopped.
+A job left running longer than ``INTERNET_ARCHIVE_JOB_LEASE`` seconds (its
+worker died) goes back to the queue.
+"""
 import logging
-from datetime import datetime
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import requests
+
 import database
+from config import (
+    INTERNET_ARCHIVE_AVAILABILITY_TTL,
+    INTERNET_ARCHIVE_AVAILABILITY_URL,
+    INTERNET_ARCHIVE_BURST,
+    INTERNET_ARCHIVE_CONCURRENCY,
+    INTERNET_ARCHIVE_JOB_LEASE,
+    INTERNET_ARCHIVE_MAX_ATTEMPTS,
+    INTERNET_ARCHIVE_RECENT_DAYS,
+    INTERNET_ARCHIVE_RETRY_BASE,
+    INTERNET_ARCHIVE_RETRY_MAX,
+    INTERNET_ARCHIVE_SAVE_URL,
+    INTERNET_ARCHIVE_TIMEOUT,
+)
 
 logger = logging.getLogger(__name__)
 
-def reset_rate_limit_if_needed():
-    """
-    Reset the Internet Archive submission counter if it's a new day
-    
-    Returns:
-        bool: True if counter was reset, False otherwise
-    """
-    last_reset = database.get_setting('internet_archive_last_reset', datetime.now().strftime('%Y-%m-%d'))
-    today = datetime.now().strftime('%Y-%m-%d')
-    
-    if last_reset != today:
-        database.set_setting('internet_archive_submissions_today', '0')
-        database.set_setting('internet_archive_last_reset', today)
-        logger.info(f"Reset Internet Archive submission counter for new day: {today}")
-        return True
-    
-    return False
-
-def check_rate_limit():
-    """
-    Check if we've exceeded the Internet Archive submission rate limit
-    
-    Returns:
-        tuple: (bool, int, int) - (can_submit, submissions_today, rate_limit)
-    """
-    # Reset counter if it's a new day
-    reset_rate_limit_if_needed()
-    
-    # Get current values
-    submissions_today = int(database.get_setting('internet_archive_submissions_today', '0'))
-    rate_limit = int(database.get_setting('internet_archive_rate_limit', '10'))
-    
-    # Check if we're under the limit
-    can_submit = submissions_today < rate_limit
-    
-    return (can_submit, submissions_today, rate_limit)
-
-def increment_submission_counter():
-    """
-    Increment the Internet Archive submission counter
-    
-    Returns:
-        int: The new counter value
-    """
-    # Get current value
-    submissions_today = int(database.get_setting('internet_archive_submissions_today', '0'))
-    
-    # Increment and save
-    new_value = submissions_today + 1
-    database.set_setting('internet_archive_submissions_today', str(new_value))
-    
-    return new_value
-
-def submit_to_internet_archive(url):
+DEFAULT_RATE_LIMIT = 10  # submissions per hour
+
+
+class SubmissionError(Exception):
+    """A Save Page Now attempt failed; ``retryable`` says whether to try again."""
+
+    def __init__(self, message: str, retryable: bool, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retryable = retryable
+        self.retry_after = retry_after
+
+
+def is_enabled() -> bool:
+    return database.get_setting('internet_archive_enabled', 'true').lower() == 'true'
+
+
+def hourly_rate() -> int:
+    """The configured submissions per hour (the ``internet_archive_rate_per_hour`` setting)."""
+    try:
+        return max(1, int(database.get_setting('internet_archive_rate_per_hour', str(DEFAULT_RATE_LIMIT))))
+    except ValueError:
+        return DEFAULT_RATE_LIMIT
+
+
+def _retry_after(response) -> Optional[float]:
+    """Seconds to wait from a Retry-After header: delta-seconds or an HTTP-date."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+def save_page_now(url: str, save_url: str = INTERNET_ARCHIVE_SAVE_URL,
+                  timeout: float = INTERNET_ARCHIVE_TIMEOUT) -> str:
     """
-    Submit a URL to the Internet Archive for archiving
-    
+    Ask the Wayback Machine to capture a URL.
+
     Args:
         url: The URL to archive
-    
+        save_url: Save Page Now endpoint the URL is appended to
+        timeout: Request timeout in seconds
+
     Returns:
-        tuple: (success, archived_url or error_message)
+        The Wayback URL of the capture
+
+    Raises:
+        SubmissionError: If the capture was not accepted
     """
-    # Check if Internet Archive integration is enabled
-    ia_enabled = database.get_setting('internet_archive_enabled', 'true').lower() == 'true'
-    if not ia_enabled:
-        return (False, "Internet Archive integration is disabled")
-    
-    # Check rate limit
-    can_submit, submissions_today, rate_limit = check_rate_limit()
-    if not can_submit:
-        return (False, f"Rate limit exceeded: {submissions_today}/{rate_limit} submissions today")
-    
-    # Submit to Internet Archive
-    ia_url = f"https://web.archive.org/save/{url}"
-    
     try:
-        logger.info(f"Submitting URL to Internet Archive: {url}")
-        
-        # Make the request to the Internet Archive
-        response = requests.get(ia_url, timeout=30)
-        
-        # Handle the response
-        if response.status_code >= 200 and response.status_code < 300:
-            # Success - increment counter
-            increment_submission_counter()
-            
-            # The archived URL should be available at:
-            archived_url = f"https://web.archive.org/web/{datetime.now().strftime('%Y%m%d%H%M%S')}/{url}"
-            
-            # The actual URL will be in the Location header if redirected
-            if 'Location' in response.headers:
-                archived_url = response.headers['Location']
-            
-            logger.info(f"Successfully archived URL: {archived_url}")
-            return (True, archived_url)
-        else:
-            error_msg = f"Failed to archive URL: {response.status_code} - {response.text[:500]}"
-            logger.error(error_msg)
-            return (False, error_msg)
-    
-    except Exception as e:
-        error_msg = f"Error submitting URL to Internet Archive: {str(e)}"
-        logger.error(error_msg)
-        return (False, error_msg)
-
-def update_memento_with_ia_url(memento_id, ia_url):
+        response = requests.get(f"{save_url}{url}", timeout=timeout, allow_redirects=False)
+    except requests.RequestException as e:
+        raise SubmissionError(f"Error submitting URL to Internet Archive: {e}", retryable=True)
+
+    if 200 <= response.status_code < 400:
+        # Save Page Now points at the new capture in Location (or Content-Location).
+        archived_url = response.headers.get('Location') or response.headers.get('Content-Location')
+        if archived_url and archived_url.startswith('/'):
+            archived_url = requests.compat.urljoin(save_url, archived_url)
+        return archived_url or f"https://web.archive.org/web/{datetime.now().strftime('%Y%m%d%H%M%S')}/{url}"
+
+    message = f"Failed to archive URL: {response.status_code} - {response.text[:500]}"
+    retryable = response.status_code == 429 or response.status_code >= 500
+    raise SubmissionError(message, retryable=retryable, retry_after=_retry_after(response))
+
+
+def check_availability(url: str, availability_url: str = INTERNET_ARCHIVE_AVAILABILITY_URL,
+                       timeout: float = INTERNET_ARCHIVE_TIMEOUT) -> Tuple[Optional[str], Optional[datetime]]:
     """
-    Update a memento with the Internet Archive URL
-    
+    Look up the Wayback Machine's closest snapshot of a URL.
+
     Args:
-        memento_id: The ID of the memento
-        ia_url: The Internet Archive URL
-    
+        url: The URL to look up
+        availability_url: Wayback availability API endpoint
+        timeout: Request timeout in seconds
+
     Returns:
-        bool: True if successful, False otherwise
+        ``(snapshot_url, captured_at)`` with captured_at in UTC, or ``(None, None)``
+
+    Raises:
+        requests.RequestException: If the lookup failed
     """
+    response = requests.get(availability_url, params={'url': url}, timeout=timeout)
+    response.raise_for_status()
+    closest = (response.json().get('archived_snapshots') or {}).get('closest') or {}
+    if not closest.get('available') or not closest.get('url'):
+        return None, None
     try:
-        conn = database.get_db_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            "UPDATE mementos SET internet_archive_id = ? WHERE id = ?",
-            (ia_url, memento_id)
-        )
-        
-        conn.commit()
-        conn.close()
-        
-        return True
-    
-    except Exception as e:
-        logger.error(f"Error updating memento with Internet Archive URL: {str(e)}")
-        return False
+        captured_at = datetime.strptime(closest.get('timestamp', ''), '%Y%m%d%H%M%S')
+    except ValueError:
+        captured_at = None
+    return closest['url'], captured_at
+
+
+def dedupe_targets(rows: Iterable[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+    """Keep the first ``{"uri_r", "memento_id"}`` per URL; returns (targets, duplicates dropped)."""
+    targets: Dict[str, Dict[str, Any]] = {}
+    duplicates = 0
+    for row in rows:
+        if row['uri_r'] in targets:
+            duplicates += 1
+            continue
+        targets[row['uri_r']] = {'uri_r': row['uri_r'], 'memento_id': row.get('memento_id')}
+    return list(targets.values()), duplicates
+
+
+def journey_targets(journey_id: int) -> Optional[List[Dict[str, Any]]]:
+    """Every waypoint URL of a journey, with its newest memento (as the journey's persona) if any.
+
+    Returns None if the journey does not exist.
+    """
+    journey = database.get_journey(journey_id)
+    if not journey:
+        return None
+    urls = [waypoint['url'] for waypoint in database.get_waypoints(journey_id)]
+    latest: Dict[str, int] = {}
+    for row in database.get_latest_mementos(uris=sorted(set(urls)), persona_id=journey.get('persona_id')):
+        latest.setdefault(row['uri_r'], row['memento_id'])
+    return [{'uri_r': url, 'memento_id': latest.get(url)} for url in urls]
+
+
+def filter_targets(url_contains: Optional[str] = None, persona_id: Optional[int] = None,
+                   since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """The newest memento of every archived website matching the filter, newest first."""
+    return database.get_latest_mementos(url_contains=url_contains, persona_id=persona_id,
+                                        since=since, until=until)
+
+
+class TokenBucket:
+    """Classic token bucket: ``capacity`` tokens, refilled at ``rate`` per second."""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._tokens = capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def configure(self, rate: float, capacity: Optional[float] = None) -> None:
+        with self._lock:
+            self._refill()
+            self.rate = rate
+            if capacity is not None:
+                self.capacity = capacity
+                self._tokens = min(self._tokens, capacity)
+
+    def wait_time(self) -> float:
+        """Seconds until a token is available (0 if one is available now)."""
+        with self._lock:
+            self._refill()
+            return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def consume(self) -> bool:
+        """Take a token if one is available."""
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def refund(self) -> None:
+        """Give back a token that ended up unused."""
+        with self._lock:
+            self._tokens = min(self.capacity, self._tokens + 1)
+
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+
+class SubmissionQueue:
+    """Persistent Save Page Now queue worked off by rate-limited background workers."""
+
+    def __init__(self, submit: Optional[Callable[[str], str]] = None,
+                 availability: Optional[Callable[[str], Tuple[Optional[str], Optional[datetime]]]] = None,
+                 burst: int = INTERNET_ARCHIVE_BURST,
+                 concurrency: int = INTERNET_ARCHIVE_CONCURRENCY,
+                 max_attempts: int = INTERNET_ARCHIVE_MAX_ATTEMPTS,
+                 retry_base: float = INTERNET_ARCHIVE_RETRY_BASE,
+                 retry_max: float = INTERNET_ARCHIVE_RETRY_MAX,
+                 recent_days: int = INTERNET_ARCHIVE_RECENT_DAYS,
+                 availability_ttl: int = INTERNET_ARCHIVE_AVAILABILITY_TTL,
+                 lease: float = INTERNET_ARCHIVE_JOB_LEASE,
+                 poll_interval: float = 30.0):
+        self.submit = submit or save_page_now
+        self.availability = availability or check_availability
+        self.concurrency = max(1, concurrency)
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.recent_days = recent_days
+        self.availability_ttl = availability_ttl
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.bucket = TokenBucket(rate=DEFAULT_RATE_LIMIT / 3600, capacity=burst)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+
+    def enqueue(self, uri_r: str, memento_id: Optional[int] = None, start: bool = True) -> Dict[str, Any]:
+        """Queue a submission (or return the memento's pending one) and wake the worker."""
+        job = database.enqueue_ia_job(uri_r, memento_id, self.max_attempts)
+        if start:
+            self.start()
+        self._wake.set()
+        return job
+
+    def submit_batch(self, label: str, rows: Iterable[Dict[str, Any]], check_availability: bool = True,
+                     start: bool = True) -> Dict[str, Any]:
+        """
+        Queue many URLs as one batch (see journey_targets/filter_targets).
+
+        Returns:
+            Dictionary with batch_id, queued, already_queued and duplicates counts
+        """
+        targets, duplicates = dedupe_targets(rows)
+        result = database.create_ia_batch(label, targets, check_availability, self.max_attempts)
+        result['duplicates'] = duplicates
+        if start:
+            self.start()
+        self._wake.set()
+        return result
+
+    def start(self) -> bool:
+        """Start the worker threads; returns False if they are already running."""
+        with self._lock:
+            if any(thread.is_alive() for thread in self._threads):
+                return False
+            self.requeue_stale()
+            self._stop.clear()
+            self._threads = [threading.Thread(target=self._loop, daemon=True) for _ in range(self.concurrency)]
+            for thread in self._threads:
+                thread.start()
+            return True
+
+    def requeue_stale(self) -> int:
+        """Requeue jobs running for longer than the lease; returns how many."""
+        requeued = database.requeue_running_ia_jobs(datetime.now() - timedelta(seconds=self.lease))
+        if requeued:
+            logger.info(f"Requeued {requeued} interrupted Internet Archive submissions")
+        return requeued
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the workers once their current submissions finish."""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def recent_snapshot(self, uri_r: str) -> Optional[str]:
+        """Wayback URL of a snapshot newer than ``recent_days``, if any (lookups cached)."""
+        cached = database.get_ia_availability(uri_r)
+        if cached and datetime.now() - datetime.fromisoformat(str(cached['checked_at'])) < \
+                timedelta(seconds=self.availability_ttl):
+            snapshot_url, snapshot_at = cached['snapshot_url'], cached['snapshot_at']
+            snapshot_at = datetime.fromisoformat(str(snapshot_at)) if snapshot_at else None
+        else:
+            try:
+                snapshot_url, snapshot_at = self.availability(uri_r)
+            except Exception as e:
+                # A failed lookup only costs a possibly redundant capture.
+                logger.warning(f"Wayback availability lookup failed for {uri_r}: {e}")
+                return None
+            database.save_ia_availability(uri_r, snapshot_url, snapshot_at)
+        if snapshot_url and snapshot_at and \
+                datetime.now(timezone.utc).replace(tzinfo=None) - snapshot_at < timedelta(days=self.recent_days):
+            return snapshot_url
+        return None
+
+    def backoff(self, attempts: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait before attempt ``attempts + 1``."""
+        delay = min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+        return max(delay, retry_after or 0)
+
+    def process_next(self) -> Optional[float]:
+        """
+        Submit the next due job if the rate limit allows.
+
+        Returns:
+            None if a job was processed, otherwise seconds until it is worth
+            trying again (the integration is off, no token, or nothing due)
+        """
+        if not is_enabled():
+            return self.poll_interval
+        self.bucket.configure(hourly_rate() / 3600)
+        if not self.bucket.consume():
+            return self.bucket.wait_time()
+        job = database.claim_ia_job()
+        if job is None:
+            self.bucket.refund()
+            if self.requeue_stale():
+                return 0.0
+            due = database.get_next_ia_attempt_at()
+            if due is None:
+                return self.poll_interval
+            return min(self.poll_interval, max(0.0, (due - datetime.now()).total_seconds()))
+
+        if job['check_availability']:
+            snapshot_url = self.recent_snapshot(job['uri_r'])
+            if snapshot_url:
+                self.bucket.refund()
+                database.finish_ia_job(job['id'], archived_url=snapshot_url, skipped=True)
+                logger.info(f"Skipped {job['uri_r']}: recent snapshot {snapshot_url} (job {job['id']})")
+                return None
+
+        try:
+            archived_url = self.submit(job['uri_r'])
+        except SubmissionError as e:
+            self._failed(job, str(e), e.retryable, e.retry_after)
+        except Exception as e:
+            logger.error(f"Unexpected error submitting {job['uri_r']} to Internet Archive: {e}", exc_info=True)
+            self._failed(job, str(e), retryable=True)
+        else:
+            database.finish_ia_job(job['id'], archived_url=archived_url)
+            logger.info(f"Archived {job['uri_r']} at {archived_url} (job {job['id']})")
+        return None
+
+    def _failed(self, job: Dict[str, Any], error: str, retryable: bool,
+                retry_after: Optional[float] = None) -> None:
+        if retryable and job['attempts'] < job['max_attempts']:
+            delay = self.backoff(job['attempts'], retry_after)
+            database.retry_ia_job(job['id'], error, datetime.now() + timedelta(seconds=delay))
+            logger.warning(f"Internet Archive job {job['id']} attempt {job['attempts']} failed, "
+                           f"retrying in {delay:.0f}s: {error}")
+        else:
+            database.finish_ia_job(job['id'], error=error)
+            logger.error(f"Internet Archive job {job['id']} failed: {error}")
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            # Clear before looking at the table so an enqueue during the
+            # attempt still wakes the next wait.
+            self._wake.clear()
+            try:
+                wait = self.process_next()
+            except Exception as e:
+                logger.error(f"Internet Archive worker error: {e}", exc_info=True)
+                wait = self.poll_interval
+            if wait:
+                self._wake.wait(wait)
+
+    def status(self) -> Dict[str, Any]:
+        enabled = is_enabled()
+        rate = hourly_rate()
+        self.bucket.configure(rate / 3600)
+        return {
+            "enabled": enabled,
+            "rate_limit": rate,
+            "burst": self.bucket.capacity,
+            "tokens": round(self.bucket.tokens(), 2),
+            "next_slot_seconds": round(self.bucket.wait_time(), 1),
+            "can_submit": enabled,
+            "jobs": database.get_ia_job_counts(),
+            "workers": sum(thread.is_alive() for thread in self._threads),
+        }
+
+
+submission_queue = SubmissionQueue()
@@ -0,0 +1,105 @@
+"""
+Persistent cache for LLM responses.
+
+Responses are stored in the ``llm_response_cache`` table under a hash of the
+provider, model, prompt and (for structured generation) schema. An identical
+request, such as re-saving a conversation for attribute extraction, is then
+answered without calling the model. Entries expire after LLM_CACHE_TTL
+seconds, and the least recently used are evicted beyond LLM_CACHE_MAX_ENTRIES
+or LLM_CACHE_MAX_MB.
+
+Caching is opt-in per call site (``LLMClient.chat(..., cache=True)``,
+``generate_structured(..., cache=True)``): only deterministic uses such as
+extraction should reuse answers.
+"""
+import hashlib
+import json
+import logging
+import threading
+from typing import Any, Dict, Optional
+
+import database
+from config import LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_MB, LLM_CACHE_TTL
+
+logger = logging.getLogger(__name__)
+
+
+def _digest(value: Any) -> str:
+    canonical = json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def cache_key(provider: str, model: Optional[str], kind: str, prompt: Any,
+              schema: Optional[Dict[str, Any]] = None) -> str:
+    """Content address for a request: provider, model, kind, prompt hash and schema hash."""
+    return _digest([provider, model, kind, _digest(prompt), _digest(schema) if schema is not None else None])
+
+
+class ResponseCache:
+    """SQLite-backed response cache with in-process hit/miss counters."""
+
+    def __init__(self, ttl: int = LLM_CACHE_TTL, max_entries: int = LLM_CACHE_MAX_ENTRIES,
+                 max_bytes: int = LLM_CACHE_MAX_MB * 1024 * 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._errors = 0
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def get(self, key: str) -> Optional[Any]:
+        """The cached response, or None on a miss. Cache failures count as misses."""
+        try:
+            entry = database.get_llm_cache_entry(key)
+        except Exception:
+            logger.warning("LLM cache lookup failed", exc_info=True)
+            self._count("_errors")
+            entry = None
+        if entry is None:
+            self._count("_misses")
+            return None
+        self._count("_hits")
+        logger.debug("LLM cache hit", extra={"provider": entry["provider"], "model": entry["model"]})
+        return json.loads(entry["response"])
+
+    def put(self, key: str, provider: str, model: Optional[str], kind: str, value: Any) -> None:
+        """Store a response and evict down to the configured bounds."""
+        try:
+            database.save_llm_cache_entry(key, provider, model, kind, json.dumps(value), ttl=self.ttl)
+            evicted = database.evict_llm_cache(self.max_entries, self.max_bytes)
+        except Exception:
+            logger.warning("LLM cache store failed", exc_info=True)
+            self._count("_errors")
+            return
+        if evicted:
+            logger.info("Evicted %d LLM cache entries", evicted)
+
+    def clear(self) -> int:
+        with self._lock:
+            self._hits = self._misses = self._errors = 0
+        return database.clear_llm_cache()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits, misses, errors = self._hits, self._misses, self._errors
+        stored = database.get_llm_cache_stats()
+        return {
+            "hits": hits,
+            "misses": misses,
+            "errors": errors,
+            "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+            "entries": stored["entries"],
+            "bytes": stored["bytes"],
+            "lifetime_hits": stored["hits"],
+            "ttl": self.ttl,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+        }
+
+
+response_cache = ResponseCache()
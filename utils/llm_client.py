@@ -1,18 +1,31 @@
 import json
 import logging
-from typing import Any, Dict, List, Optional
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
 
 from config import (
     ANTHROPIC_API_KEY,
     ANTHROPIC_MODEL,
+    LLM_HTTP_CONNECT_TIMEOUT,
+    LLM_HTTP_KEEPALIVE_EXPIRY,
+    LLM_HTTP_MAX_CONNECTIONS,
+    LLM_HTTP_MAX_KEEPALIVE,
+    LLM_FALLBACK_PROVIDERS,
+    LLM_HEDGE_AFTER_MS,
+    LLM_HTTP_TIMEOUT,
     LLM_MAX_OUTPUT_TOKENS,
     LLM_PROVIDER,
+    LLM_PROVIDER_TIMEOUTS,
     OPENAI_API_KEY,
     OPENAI_MODEL,
     OPENAI_COMPATIBLE_URL,
     OPENAI_COMPATIBLE_MODEL,
     OPENAI_COMPATIBLE_API_KEY,
 )
+from utils.llm_failover import get_breaker
+from utils.llm_telemetry import CallRecord, collecting_usage, report_usage, telemetry
 
 
 logger = logging.getLogger(__name__)
@@ -22,6 +35,154 @@ class ProviderNotConfiguredError(RuntimeError):
     """Raised when a requested LLM provider is not configured."""
 
 
+# SDK clients are thread-safe and each owns an HTTP connection pool, so one
+# per (provider, base_url) is shared by every adapter in the process.
+_registry_lock = threading.Lock()
+_sdk_clients: Dict[Tuple[str, Optional[str]], Any] = {}
+_llm_clients: Dict[Tuple[str, int], "LLMClient"] = {}
+
+
+def _http_client():
+    """An HTTP client with the configured keep-alive pool and timeouts."""
+    import httpx
+
+    return httpx.Client(
+        limits=httpx.Limits(
+            max_connections=LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=LLM_HTTP_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(LLM_HTTP_TIMEOUT, connect=LLM_HTTP_CONNECT_TIMEOUT),
+    )
+
+
+def shared_sdk_client(provider: str, base_url: Optional[str], factory: Callable[[Any], Any]) -> Any:
+    """
+    Return the process-wide SDK client for ``(provider, base_url)``.
+
+    The first caller builds it with ``factory(http_client)``; later callers get
+    the same instance, and with it the same warm connections.
+    """
+    key = (provider, base_url)
+    with _registry_lock:
+        client = _sdk_clients.get(key)
+        if client is None:
+            client = factory(_http_client())
+            _sdk_clients[key] = client
+            logger.info("Created shared %s client", provider, extra={"base_url": base_url})
+        return client
+
+
+def get_llm_client(provider: Optional[str] = None, max_output_tokens: Optional[int] = None) -> "LLMClient":
+    """Return the shared LLMClient for the given (or configured) provider."""
+    key = ((provider or LLM_PROVIDER or "").lower(), max_output_tokens or LLM_MAX_OUTPUT_TOKENS)
+    with _registry_lock:
+        client = _llm_clients.get(key)
+    if client is not None:
+        return client
+    # Built outside the lock: the adapter takes it again for its SDK client.
+    client = LLMClient(provider, max_output_tokens)
+    with _registry_lock:
+        return _llm_clients.setdefault(key, client)
+
+
+def close_llm_clients() -> None:
+    """Close every shared SDK client and forget the shared LLMClients."""
+    with _registry_lock:
+        clients = list(_sdk_clients.values())
+        _sdk_clients.clear()
+        _llm_clients.clear()
+    for client in clients:
+        try:
+            client.close()
+        except Exception:
+            logger.warning("Failed to close LLM client", exc_info=True)
+
+
+def _log_usage(provider: str, prompt_tokens: int, cached_tokens: int, output_tokens: int) -> None:
+    """Log token usage, including prompt tokens served from the provider's prefix cache."""
+    report_usage(prompt_tokens, cached_tokens, output_tokens)
+    logger.info(
+        "LLM usage: %d prompt tokens (%d cached), %d output tokens",
+        prompt_tokens,
+        cached_tokens,
+        output_tokens,
+        extra={
+            "provider": provider,
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "output_tokens": output_tokens,
+        },
+    )
+
+
+def _log_openai_usage(provider: str, usage) -> None:
+    if usage is None:
+        return
+    # vLLM reports cached tokens only with --enable-prompt-tokens-details
+    details = getattr(usage, "prompt_tokens_details", None)
+    _log_usage(
+        provider,
+        usage.prompt_tokens or 0,
+        getattr(details, "cached_tokens", None) or 0,
+        usage.completion_tokens or 0,
+    )
+
+
+def _log_anthropic_usage(usage) -> None:
+    cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+    cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+    _log_usage("anthropic", usage.input_tokens + cache_read + cache_write, cache_read, usage.output_tokens)
+
+
+def _merge_system_messages(messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """
+    Fold system messages into one leading message, keeping their order.
+
+    Prompts are assembled as separate stable and volatile system blocks;
+    many chat templates (e.g. on vLLM) accept only a single system turn.
+    """
+    system = [m["content"] for m in messages if m.get("role") == "system"]
+    if len(system) < 2:
+        return messages
+    return [{"role": "system", "content": "\n\n".join(system)}] + [
+        m for m in messages if m.get("role") != "system"
+    ]
+
+
+def _openai_stream_text(stream, provider: str) -> Iterator[str]:
+    """Text deltas from a Chat Completions stream; the final usage chunk is logged."""
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+            if getattr(chunk, "usage", None):
+                _log_openai_usage(provider, chunk.usage)
+    finally:
+        # Release the connection back to the pool if the consumer stops early.
+        stream.close()
+
+
+_END = object()
+
+
+def _prime(chunks: Iterator[str]) -> Tuple[Iterator[str], Any]:
+    """Start a stream and wait for its first chunk (``_END`` if it is empty)."""
+    return chunks, next(chunks, _END)
+
+
+_hedge_pool: Optional[ThreadPoolExecutor] = None
+
+
+def _hedge_executor() -> ThreadPoolExecutor:
+    """Threads that run hedged provider calls side by side."""
+    global _hedge_pool
+    with _registry_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=2 * LLM_HTTP_MAX_CONNECTIONS, thread_name_prefix="llm-hedge")
+        return _hedge_pool
+
+
 class BaseAdapter:
     provider_name: str = "base"
     default_model: str = ""
@@ -32,6 +193,10 @@ class BaseAdapter:
     def chat(self, messages: List[Dict[str, str]], model_hint: Optional[str] = None) -> str:
         raise NotImplementedError
 
+    def chat_stream(self, messages: List[Dict[str, str]], model_hint: Optional[str] = None) -> Iterator[str]:
+        """Yield the reply in text chunks as the provider produces them."""
+        raise NotImplementedError
+
     def generate_structured(
         self, prompt: str, schema: Dict[str, Any], model_hint: Optional[str] = None
     ) -> Dict[str, Any]:
@@ -61,10 +226,14 @@ class OpenAICompatibleAdapter(BaseAdapter):
             raise ProviderNotConfiguredError("OPENAI_COMPATIBLE_URL is not set")
         from openai import OpenAI
 
-        logger.info("Initializing OpenAI-compatible client at %s", OPENAI_COMPATIBLE_URL)
-        self.client = OpenAI(
-            base_url=OPENAI_COMPATIBLE_URL,
-            api_key=OPENAI_COMPATIBLE_API_KEY,
+        self.client = shared_sdk_client(
+            self.provider_name,
+            OPENAI_COMPATIBLE_URL,
+            lambda http_client: OpenAI(
+                base_url=OPENAI_COMPATIBLE_URL,
+                api_key=OPENAI_COMPATIBLE_API_KEY,
+                http_client=http_client,
+            ),
         )
 
     def chat(self, messages: List[Dict[str, str]], model_hint: Optional[str] = None) -> str:
@@ -75,11 +244,27 @@ class OpenAICompatibleAdapter(BaseAdapter):
         )
         completion = self.client.chat.completions.create(
             model=model,
-            messages=messages,
+            messages=_merge_system_messages(messages),
             max_tokens=self._validate_tokens(None),
         )
+        _log_openai_usage(self.provider_name, completion.usage)
         return completion.choices[0].message.content or ""
 
+    def chat_stream(self, messages: List[Dict[str, str]], model_hint: Optional[str] = None) -> Iterator[str]:
+        model = model_hint or self.default_model
+        logger.debug(
+            "Streaming chat from OpenAI-compatible endpoint",
+            extra={"model": model, "message_count": len(messages)},
+        )
+        stream = self.client.chat.completions.create(
+            model=model,
+            messages=_merge_system_messages(messages),
+            max_tokens=self._validate_tokens(None),
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        yield from _openai_stream_text(stream, self.provider_name)
+
     def generate_structured(
         self, prompt: str, schema: Dict[str, Any], model_hint: Optional[str] = None
     ) -> Dict[str, Any]:
@@ -101,6 +286,10 @@ class OpenAICompatibleAdapter(BaseAdapter):
             raise ValueError("Structured response could not be parsed as JSON") from exc
 
 
+# The Messages API accepts at most four cache_control breakpoints per request.
+ANTHROPIC_CACHE_BREAKPOINTS = 4
+
+
 class AnthropicAdapter(BaseAdapter):
     provider_name = "anthropic"
     default_model = ANTHROPIC_MODEL
@@ -111,34 +300,72 @@ class AnthropicAdapter(BaseAdapter):
             raise ProviderNotConfiguredError("ANTHROPIC_API_KEY is not set")
         import anthropic
 
-        logger.info("Initializing Anthropic client")
-        self.client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+        self.client = shared_sdk_client(
+            self.provider_name,
+            None,
+            lambda http_client: anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, http_client=http_client),
+        )
 
     def chat(self, messages: List[Dict[str, str]], model_hint: Optional[str] = None) -> str:
-        model = model_hint or self.default_model
-        system_messages = [m["content"] for m in messages if m.get("role") == "system"]
-        system_prompt = "\n".join(system_messages) if system_messages else None
-        convo = [m for m in messages if m.get("role") != "system"]
-
+        request = self._message_request(messages, model_hint)
         logger.debug(
-            "Sending chat to Anthropic", extra={"model": model, "message_count": len(convo)}
+            "Sending chat to Anthropic",
+            extra={"model": request["model"], "message_count": len(request["messages"])},
         )
 
-        response = self.client.messages.create(
-            model=model,
-            system=system_prompt,
-            messages=[
-                {
-                    "role": m.get("role", "user"),
-                    "content": m.get("content", ""),
-                }
-                for m in convo
-            ],
-            max_tokens=self._validate_tokens(None),
-        )
+        response = self.client.messages.create(**request)
+        _log_anthropic_usage(response.usage)
 
         return response.content[0].text
 
+    def chat_stream(self, messages: List[Dict[str, str]], model_hint: Optional[str] = None) -> Iterator[str]:
+        request = self._message_request(messages, model_hint)
+        logger.debug(
+            "Streaming chat from Anthropic",
+            extra={"model": request["model"], "message_count": len(request["messages"])},
+        )
+        with self.client.messages.stream(**request) as stream:
+            yield from stream.text_stream
+            _log_anthropic_usage(stream.get_final_message().usage)
+
+    def _message_request(self, messages: List[Dict[str, str]], model_hint: Optional[str]) -> Dict[str, Any]:
+        """
+        Messages API arguments with prompt-cache breakpoints.
+
+        Each system message becomes its own ``system`` block (stable blocks
+        come first), and each block plus the final message is marked
+        ``cache_control``. A turn then reads the persona prefix and the
+        earlier conversation from the cache even when the volatile journey
+        block has changed. Anthropic ignores breakpoints on prefixes shorter
+        than its minimum cacheable length.
+        """
+        system_blocks = [
+            {"type": "text", "text": m["content"]} for m in messages if m.get("role") == "system" and m.get("content")
+        ]
+        convo = [
+            {
+                "role": m.get("role", "user"),
+                "content": m.get("content", ""),
+            }
+            for m in messages
+            if m.get("role") != "system"
+        ]
+        # One breakpoint is kept for the final message
+        for block in system_blocks[:ANTHROPIC_CACHE_BREAKPOINTS - 1]:
+            block["cache_control"] = {"type": "ephemeral"}
+        if convo:
+            convo[-1]["content"] = [
+                {"type": "text", "text": convo[-1]["content"], "cache_control": {"type": "ephemeral"}}
+            ]
+        request = {
+            "model": model_hint or self.default_model,
+            "messages": convo,
+            "max_tokens": self._validate_tokens(None),
+        }
+        if system_blocks:
+            request["system"] = system_blocks
+        return request
+
     def generate_structured(
         self, prompt: str, schema: Dict[str, Any], model_hint: Optional[str] = None
     ) -> Dict[str, Any]:
@@ -174,8 +401,11 @@ class OpenAIAdapter(BaseAdapter):
             raise ProviderNotConfiguredError("OPENAI_API_KEY is not set")
         from openai import OpenAI
 
-        logger.info("Initializing OpenAI client")
-        self.client = OpenAI(api_key=OPENAI_API_KEY)
+        self.client = shared_sdk_client(
+            self.provider_name,
+            None,
+            lambda http_client: OpenAI(api_key=OPENAI_API_KEY, http_client=http_client),
+        )
 
     def chat(self, messages: List[Dict[str, str]], model_hint: Optional[str] = None) -> str:
         model = model_hint or self.default_model
@@ -184,11 +414,26 @@ class OpenAIAdapter(BaseAdapter):
         )
         completion = self.client.chat.completions.create(
             model=model,
-            messages=messages,
+            messages=_merge_system_messages(messages),
             max_tokens=self._validate_tokens(None),
         )
+        _log_openai_usage(self.provider_name, completion.usage)
         return completion.choices[0].message.content or ""
 
+    def chat_stream(self, messages: List[Dict[str, str]], model_hint: Optional[str] = None) -> Iterator[str]:
+        model = model_hint or self.default_model
+        logger.debug(
+            "Streaming chat from OpenAI", extra={"model": model, "message_count": len(messages)}
+        )
+        stream = self.client.chat.completions.create(
+            model=model,
+            messages=_merge_system_messages(messages),
+            max_tokens=self._validate_tokens(None),
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        yield from _openai_stream_text(stream, self.provider_name)
+
     def generate_structured(
         self, prompt: str, schema: Dict[str, Any], model_hint: Optional[str] = None
     ) -> Dict[str, Any]:
@@ -208,39 +453,317 @@ class OpenAIAdapter(BaseAdapter):
 
 
 class LLMClient:
-    """Provider-aware client for chat and structured generation."""
+    """
+    Provider-aware client for chat and structured generation.
+
+    Calls go to ``LLM_PROVIDER`` first and fail over to the
+    ``LLM_FALLBACK_PROVIDERS`` in order, skipping providers whose circuit
+    breaker is open. With ``LLM_HEDGE_AFTER_MS`` set, a chat that has no
+    reply (or no first token) by then is also sent to the next provider and
+    the first answer wins. ``served_by()`` names the provider of the last
+    reply on the calling thread.
+    """
 
     def __init__(self, provider: Optional[str] = None, max_output_tokens: Optional[int] = None):
         self.provider_name = (provider or LLM_PROVIDER or "").lower()
         self.max_output_tokens = max_output_tokens or LLM_MAX_OUTPUT_TOKENS
         self.adapter = self._initialize_adapter()
+        self.adapters = [self.adapter] + self._initialize_fallbacks()
+        for adapter in self.adapters:
+            self._apply_timeout(adapter)
+        self.hedge_after_ms = LLM_HEDGE_AFTER_MS
+        self.telemetry = telemetry
+        self._served = threading.local()
         logger.info(
             "Initialized LLMClient",
             extra={
                 "provider": self.adapter.provider_name,
                 "model": self.adapter.default_model,
+                "fallbacks": [adapter.provider_name for adapter in self.adapters[1:]],
                 "max_output_tokens": self.max_output_tokens,
             },
         )
 
-    def chat(self, messages: List[Dict[str, str]], model_hint: Optional[str] = None) -> str:
+    def served_by(self) -> Optional[str]:
+        """The provider that served the last reply on this thread."""
+        return getattr(self._served, "provider", None)
+
+    def chat(
+        self, messages: List[Dict[str, str]], model_hint: Optional[str] = None, cache: bool = False
+    ) -> str:
+        """Complete a chat. With ``cache=True`` an identical earlier request is answered from the response cache."""
+        if cache:
+            return self._cached("chat", messages, None, model_hint, lambda: self.chat(messages, model_hint))
+        record = CallRecord("chat")
         try:
-            return self.adapter.chat(messages, model_hint)
+            adapter, response = self._run(lambda a, hint: a.chat(messages, hint), model_hint, record, hedge=True)
         except Exception as exc:
+            record.finish(exc, self.telemetry)
             logger.error("LLM chat request failed", exc_info=True)
             raise RuntimeError("Chat completion failed") from exc
+        self._served.provider = adapter.provider_name
+        logger.info(
+            "LLM chat completed in %.0f ms",
+            record.elapsed_ms(),
+            extra={"provider": adapter.provider_name},
+        )
+        record.finish(sink=self.telemetry)
+        return response
+
+    def chat_stream(self, messages: List[Dict[str, str]], model_hint: Optional[str] = None) -> Iterator[str]:
+        """
+        Yield the reply in text chunks as they arrive.
+
+        Failover and hedging apply until the first token; after that the
+        reply comes from one provider. Time to first token and total latency
+        are logged separately; closing the generator early (e.g. the browser
+        went away) ends the request.
+        """
+        record = CallRecord("stream")
+        try:
+            adapter, (chunks, first) = self._run(
+                lambda a, hint: _prime(a.chat_stream(messages, hint)), model_hint, record, hedge=True,
+                discard=lambda primed: primed[0].close(),
+            )
+        except Exception as exc:
+            record.finish(exc, self.telemetry)
+            logger.error("LLM chat stream failed", exc_info=True)
+            raise RuntimeError("Chat completion failed") from exc
+        self._served.provider = adapter.provider_name
+        count = 0
+        try:
+            # Streams report usage with their last chunk, on this thread
+            with collecting_usage(record.usage):
+                if first is not _END:
+                    logger.info(
+                        "LLM time to first token: %.0f ms",
+                        record.first_token(),
+                        extra={"provider": adapter.provider_name},
+                    )
+                    count = 1
+                    yield first
+                    for text in chunks:
+                        count += 1
+                        yield text
+        except GeneratorExit:
+            chunks.close()
+            record.finish(sink=self.telemetry, outcome="cancelled")
+            raise
+        except Exception as exc:
+            # The stream broke after its first token; too late to fail over
+            get_breaker(adapter.provider_name).record(False, record.elapsed_ms())
+            record.finish(exc, self.telemetry)
+            logger.error("LLM chat stream failed", exc_info=True)
+            raise RuntimeError("Chat completion failed") from exc
+        logger.info(
+            "LLM chat stream completed in %.0f ms (first token %s ms, %d chunks)",
+            record.elapsed_ms(),
+            "n/a" if record.ttft_ms is None else f"{record.ttft_ms:.0f}",
+            count,
+            extra={"provider": adapter.provider_name},
+        )
+        record.finish(sink=self.telemetry)
 
     def generate_structured(
-        self, prompt: str, schema: Dict[str, Any], model_hint: Optional[str] = None
+        self, prompt: str, schema: Dict[str, Any], model_hint: Optional[str] = None, cache: bool = False
     ) -> Dict[str, Any]:
+        """Generate JSON matching ``schema``. With ``cache=True`` identical requests reuse the cached result."""
+        if cache:
+            return self._cached(
+                "structured", prompt, schema, model_hint,
+                lambda: self.generate_structured(prompt, schema, model_hint),
+            )
+        record = CallRecord("structured")
         try:
-            return self.adapter.generate_structured(prompt, schema, model_hint)
+            adapter, result = self._run(lambda a, hint: a.generate_structured(prompt, schema, hint),
+                                        model_hint, record)
         except Exception as exc:
+            record.finish(exc, self.telemetry)
             logger.error("Structured generation failed", exc_info=True)
             raise RuntimeError("Structured generation failed") from exc
+        self._served.provider = adapter.provider_name
+        record.finish(sink=self.telemetry)
+        return result
+
+    def provider_status(self) -> Dict[str, Any]:
+        """The provider chain with each provider's circuit breaker state."""
+        return {
+            "providers": [
+                dict(
+                    provider=adapter.provider_name,
+                    model=adapter.default_model,
+                    timeout=LLM_PROVIDER_TIMEOUTS.get(adapter.provider_name, LLM_HTTP_TIMEOUT),
+                    **get_breaker(adapter.provider_name).snapshot(),
+                )
+                for adapter in self.adapters
+            ],
+            "hedge_after_ms": self.hedge_after_ms,
+        }
+
+    def _candidates(self) -> Iterator[BaseAdapter]:
+        """
+        Adapters to try, in order, skipping those whose breaker is open.
+        If every breaker is open they are all tried anyway: a slow answer
+        beats none.
+        """
+        skipped = []
+        for adapter in self.adapters:
+            if get_breaker(adapter.provider_name).allow():
+                yield adapter
+            else:
+                skipped.append(adapter)
+        if len(skipped) == len(self.adapters):
+            logger.warning("Every LLM provider's circuit breaker is open; trying them anyway")
+            yield from skipped
+
+    def _model_hint(self, adapter: BaseAdapter, model_hint: Optional[str]) -> Optional[str]:
+        # A model hint names a model of the primary provider; fallbacks use their own default
+        return model_hint if adapter is self.adapter else None
+
+    def _attempt(self, adapter: BaseAdapter, call: Callable[[BaseAdapter, Optional[str]], Any],
+                 model_hint: Optional[str], usage: Dict[str, int]) -> Any:
+        breaker = get_breaker(adapter.provider_name)
+        started = time.perf_counter()
+        try:
+            with collecting_usage(usage):
+                result = call(adapter, self._model_hint(adapter, model_hint))
+        except Exception:
+            breaker.record(False, (time.perf_counter() - started) * 1000)
+            raise
+        breaker.record(True, (time.perf_counter() - started) * 1000)
+        return result
+
+    def _run(self, call: Callable[[BaseAdapter, Optional[str]], Any], model_hint: Optional[str],
+             record: CallRecord, hedge: bool = False,
+             discard: Optional[Callable[[Any], None]] = None) -> Tuple[BaseAdapter, Any]:
+        """
+        Run ``call(adapter, model_hint)`` on the first provider that succeeds,
+        noting attempts and the winner's provider, model and usage in ``record``.
+
+        Returns:
+            The adapter that answered and its result; the last error is raised
+            if every provider failed
+        """
+        candidates = self._candidates()
+        if hedge and self.hedge_after_ms > 0 and len(self.adapters) > 1:
+            adapter, result, usage = self._run_hedged(candidates, call, model_hint, record, discard)
+            self._answered(record, adapter, model_hint, usage)
+            return adapter, result
+        last_error: Optional[Exception] = None
+        for adapter in candidates:
+            record.attempts += 1
+            usage: Dict[str, int] = {}
+            try:
+                result = self._attempt(adapter, call, model_hint, usage)
+            except Exception as exc:
+                last_error = exc
+                logger.warning("LLM provider %s failed: %s", adapter.provider_name, exc,
+                               extra={"provider": adapter.provider_name})
+                continue
+            self._answered(record, adapter, model_hint, usage)
+            return adapter, result
+        raise last_error
+
+    def _answered(self, record: CallRecord, adapter: BaseAdapter, model_hint: Optional[str],
+                  usage: Dict[str, int]) -> None:
+        record.provider = adapter.provider_name
+        record.model = self._model_hint(adapter, model_hint) or adapter.default_model
+        record.usage.update(usage)
+
+    def _run_hedged(self, candidates: Iterator[BaseAdapter], call: Callable[[BaseAdapter, Optional[str]], Any],
+                    model_hint: Optional[str], record: CallRecord,
+                    discard: Optional[Callable[[Any], None]]) -> Tuple[BaseAdapter, Any, Dict[str, int]]:
+        pool = _hedge_executor()
+        pending: Dict[Future, Tuple[BaseAdapter, Dict[str, int]]] = {}
+
+        def launch() -> bool:
+            adapter = next(candidates, None)
+            if adapter is not None:
+                record.attempts += 1
+                usage: Dict[str, int] = {}
+                pending[pool.submit(self._attempt, adapter, call, model_hint, usage)] = (adapter, usage)
+            return adapter is not None
+
+        can_hedge = launch()
+        last_error: Optional[Exception] = None
+        while pending:
+            done, _ = wait(pending, timeout=self.hedge_after_ms / 1000 if can_hedge else None,
+                           return_when=FIRST_COMPLETED)
+            if not done:
+                logger.info("No reply after %d ms; hedging with the next LLM provider", self.hedge_after_ms,
+                            extra={"providers": [adapter.provider_name for adapter, _ in pending.values()]})
+                can_hedge = launch()
+                continue
+            winner = None
+            for future in done:
+                adapter, usage = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    last_error = exc
+                    logger.warning("LLM provider %s failed: %s", adapter.provider_name, exc,
+                                   extra={"provider": adapter.provider_name})
+                    # Fail over straight away instead of waiting for the hedge timer
+                    can_hedge = launch() and can_hedge
+                    continue
+                if winner is None:
+                    winner = (adapter, result, usage)
+                elif discard:
+                    discard(result)
+            if winner is not None:
+                # Slower calls run on and feed their breakers; unused streams are closed
+                if discard:
+                    for future in pending:
+                        future.add_done_callback(lambda f: f.exception() is None and discard(f.result()))
+                return winner
+        raise last_error
+
+    def _cached(self, kind: str, prompt: Any, schema: Optional[Dict[str, Any]],
+                model_hint: Optional[str], call: Callable[[], Any]) -> Any:
+        from utils.llm_cache import cache_key, response_cache
+
+        provider = self.adapter.provider_name
+        model = model_hint or self.adapter.default_model
+        key = cache_key(provider, model, kind, prompt, schema)
+        value = response_cache.get(key)
+        if value is None:
+            value = call()
+            # A fallback provider's answer is not stored under the primary's key
+            if self.served_by() == provider:
+                response_cache.put(key, provider, model, kind, value)
+        else:
+            self._served.provider = provider
+        return value
+
+    def _initialize_fallbacks(self) -> List[BaseAdapter]:
+        primary = self.adapter.provider_name
+        fallbacks = []
+        for provider in dict.fromkeys(LLM_FALLBACK_PROVIDERS):
+            if provider == primary:
+                continue
+            try:
+                fallbacks.append(self._create_adapter(provider))
+            except (ProviderNotConfiguredError, ImportError) as exc:
+                logger.warning("Skipping fallback LLM provider %s: %s", provider, exc)
+        return fallbacks
+
+    def _apply_timeout(self, adapter: BaseAdapter) -> None:
+        """Give the adapter its provider timeout; with fallbacks, failing over replaces SDK retries."""
+        client = getattr(adapter, "client", None)
+        if client is None:
+            return
+        options: Dict[str, Any] = {}
+        if adapter.provider_name in LLM_PROVIDER_TIMEOUTS:
+            options["timeout"] = LLM_PROVIDER_TIMEOUTS[adapter.provider_name]
+        if len(self.adapters) > 1:
+            options["max_retries"] = 0
+        if options:
+            adapter.client = client.with_options(**options)
 
     def _initialize_adapter(self) -> BaseAdapter:
-        provider = self.provider_name or self._auto_detect_provider()
+        return self._create_adapter(self.provider_name or self._auto_detect_provider())
+
+    def _create_adapter(self, provider: str) -> BaseAdapter:
         if provider == "openai_compatible":
             return OpenAICompatibleAdapter(self.max_output_tokens)
         if provider == "anthropic":
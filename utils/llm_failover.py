@@ -0,0 +1,136 @@
+"""
+Circuit breakers for LLM providers.
+
+Each provider has one process-wide breaker fed with the outcome and latency
+of every call. When enough recent calls failed or were slower than
+``LLM_BREAKER_SLOW_MS``, the breaker opens and ``LLMClient`` skips the
+provider for ``LLM_BREAKER_COOLDOWN`` seconds. After that a single probe call
+is let through: success closes the breaker, failure re-opens it.
+"""
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict
+
+from config import (
+    LLM_BREAKER_COOLDOWN,
+    LLM_BREAKER_FAILURE_RATE,
+    LLM_BREAKER_MIN_CALLS,
+    LLM_BREAKER_SLOW_MS,
+    LLM_BREAKER_WINDOW,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Opens after too many recent failed or slow calls to one provider."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, window: int = LLM_BREAKER_WINDOW, min_calls: int = LLM_BREAKER_MIN_CALLS,
+                 failure_rate: float = LLM_BREAKER_FAILURE_RATE, slow_ms: float = LLM_BREAKER_SLOW_MS,
+                 cooldown: float = LLM_BREAKER_COOLDOWN, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.min_calls = max(1, min_calls)
+        self.failure_rate = failure_rate
+        self.slow_ms = slow_ms
+        self.cooldown = cooldown
+        self._clock = clock
+        self._lock = threading.Lock()
+        # (succeeded, latency_ms) of the most recent calls
+        self._calls: deque = deque(maxlen=max(1, window))
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._update()
+            return self._state
+
+    def _update(self) -> None:
+        if self._state == self.OPEN and self._clock() - self._opened_at >= self.cooldown:
+            self._state = self.HALF_OPEN
+            self._probing = False
+
+    def _open(self) -> None:
+        self._state = self.OPEN
+        self._opened_at = self._clock()
+        self._probing = False
+        logger.warning("Circuit breaker for %s opened", self.name, extra={"provider": self.name})
+
+    def allow(self) -> bool:
+        """True if a call may go to the provider now (claims the probe when half-open)."""
+        with self._lock:
+            self._update()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record(self, success: bool, latency_ms: float) -> None:
+        """Feed the outcome of a call; a slow success counts against the provider."""
+        healthy = success and not (self.slow_ms and latency_ms > self.slow_ms)
+        with self._lock:
+            self._calls.append((success, latency_ms))
+            if self._state == self.HALF_OPEN and self._probing:
+                if healthy:
+                    self._state = self.CLOSED
+                    self._calls.clear()
+                    logger.info("Circuit breaker for %s closed", self.name, extra={"provider": self.name})
+                else:
+                    self._open()
+            elif self._state == self.CLOSED and len(self._calls) >= self.min_calls:
+                if self._unhealthy_share() >= self.failure_rate:
+                    self._open()
+
+    def _unhealthy_share(self) -> float:
+        bad = sum(1 for ok, ms in self._calls if not ok or (self.slow_ms and ms > self.slow_ms))
+        return bad / len(self._calls)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._update()
+            latencies = sorted(ms for ok, ms in self._calls if ok)
+            return {
+                "state": self._state,
+                "calls": len(self._calls),
+                "failures": sum(1 for ok, _ in self._calls if not ok),
+                "slow": sum(1 for ok, ms in self._calls if ok and self.slow_ms and ms > self.slow_ms),
+                "p50_ms": round(latencies[len(latencies) // 2]) if latencies else None,
+                "p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]) if latencies else None,
+                "retry_in_s": (round(max(0.0, self.cooldown - (self._clock() - self._opened_at)), 1)
+                               if self._state == self.OPEN else None),
+            }
+
+
+_breakers_lock = threading.Lock()
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    """The process-wide breaker for a provider."""
+    with _breakers_lock:
+        breaker = _breakers.get(provider)
+        if breaker is None:
+            breaker = _breakers[provider] = CircuitBreaker(provider)
+        return breaker
+
+
+def breaker_states() -> Dict[str, Dict[str, Any]]:
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {name: breaker.snapshot() for name, breaker in breakers.items()}
+
+
+def reset_breakers() -> None:
+    """Forget every breaker (e.g. between tests)."""
+    with _breakers_lock:
+        _breakers.clear()
@@ -0,0 +1,331 @@
+"""
+A stub LLM server for load tests.
+
+Serves the OpenAI Chat Completions API (``/v1/chat/completions``, as vLLM
+and Ollama do) and the Anthropic Messages API (``/v1/messages``) without a
+model behind them. Replies are made-up words, streamed at a set number of
+tokens per second after a sampled time to first token. Structured requests
+(``response_format`` with a JSON schema, or a prompt ending in "matches this
+schema: {...}" as the LLM client sends) get JSON that conforms to the schema.
+A share of requests can be failed with an injected error status.
+
+Reply content is derived from a hash of the request, so the same request
+gets the same reply. Latency and error draws come from one seeded generator
+for the whole server.
+
+Run it with ``llm_stub_server.py`` and point ``OPENAI_COMPATIBLE_URL`` (or
+``ANTHROPIC_BASE_URL``) at it.
+"""
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from flask import Flask, Response, jsonify, request
+
+# Words the stub replies with, one token each
+_WORDS = (
+    "the archive keeps a copy of each page as the persona saw it on that day and the journey "
+    "links every waypoint to the search that led there while the agent answers in character "
+    "about places news shopping travel music weather local events and what to read next"
+).split()
+
+_SCHEMA_MARKER = re.compile(r"matches this schema:\s*")
+
+_ERROR_TYPES = {400: "invalid_request_error", 401: "authentication_error", 429: "rate_limit_error",
+                500: "api_error", 503: "overloaded_error", 529: "overloaded_error"}
+
+
+def parse_distribution(spec: str) -> Callable[[random.Random], float]:
+    """
+    Parse a distribution spec into a sampler (values are clamped at 0).
+
+    ``MS`` or ``fixed:MS``, ``uniform:LOW,HIGH``, ``normal:MEAN,SD`` and
+    ``lognormal:MEDIAN,SIGMA``.
+    """
+    name, _, args = str(spec).partition(":")
+    if not args:
+        name, args = "fixed", name
+    try:
+        params = [float(p) for p in args.split(",")]
+    except ValueError:
+        raise ValueError(f"Invalid distribution: {spec!r}") from None
+    samplers = {
+        ("fixed", 1): lambda rng: params[0],
+        ("uniform", 2): lambda rng: rng.uniform(params[0], params[1]),
+        ("normal", 2): lambda rng: rng.gauss(params[0], params[1]),
+        ("lognormal", 2): lambda rng: params[0] * rng.lognormvariate(0, params[1]),
+    }
+    sampler = samplers.get((name, len(params)))
+    if sampler is None:
+        raise ValueError(f"Invalid distribution: {spec!r}")
+    return lambda rng: max(0.0, sampler(rng))
+
+
+@dataclass
+class StubConfig:
+    """How the stub server behaves; distributions are ``parse_distribution`` specs."""
+
+    ttft_ms: str = "fixed:200"
+    tokens_per_second: float = 50.0
+    prefill_tokens_per_second: float = 0.0
+    output_tokens: str = "uniform:40,160"
+    error_rate: float = 0.0
+    error_statuses: List[int] = field(default_factory=lambda: [500, 503, 429])
+    seed: int = 0
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (four characters per token)."""
+    return max(1, len(text) // 4)
+
+
+def _content_text(content: Any) -> str:
+    if isinstance(content, list):
+        return "".join(block.get("text", "") for block in content if isinstance(block, dict))
+    return content or ""
+
+
+def _schema_from_prompt(text: str) -> Optional[Dict[str, Any]]:
+    match = _SCHEMA_MARKER.search(text)
+    if not match:
+        return None
+    try:
+        schema, _ = json.JSONDecoder().raw_decode(text, match.end())
+    except json.JSONDecodeError:
+        return None
+    return schema if isinstance(schema, dict) else None
+
+
+def _phrase(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(_WORDS) for _ in range(words))
+
+
+def instance_for_schema(schema: Dict[str, Any], rng: random.Random) -> Any:
+    """A value that conforms to a JSON schema (the subset structured outputs use)."""
+    if "const" in schema:
+        return schema["const"]
+    if "enum" in schema:
+        return rng.choice(schema["enum"])
+    for key in ("anyOf", "oneOf"):
+        if key in schema:
+            return instance_for_schema(rng.choice(schema[key]), rng)
+    kind = schema.get("type", "object" if "properties" in schema else "string")
+    if isinstance(kind, list):
+        # Nullable fields are filled most of the time, so callers have data to merge
+        types = [t for t in kind if t != "null"] or ["null"]
+        kind = "null" if "null" in kind and rng.random() < 0.3 else rng.choice(types)
+
+    if kind == "null":
+        return None
+    if kind == "boolean":
+        return rng.random() < 0.5
+    if kind in ("integer", "number"):
+        low, high = schema.get("minimum", 0), schema.get("maximum", 100)
+        return rng.randint(int(low), int(high)) if kind == "integer" else round(rng.uniform(low, high), 2)
+    if kind == "string":
+        fmt = schema.get("format")
+        if fmt == "date":
+            return f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        if fmt == "date-time":
+            return f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T12:00:00Z"
+        if fmt == "email":
+            return f"{rng.choice(_WORDS)}@example.com"
+        if fmt == "uri":
+            return f"https://example.com/{rng.choice(_WORDS)}"
+        text = _phrase(rng, rng.randint(1, 3))
+        text = text.ljust(schema.get("minLength", 0), "x")
+        return text[:schema["maxLength"]] if "maxLength" in schema else text
+    if kind == "array":
+        low = schema.get("minItems", 1)
+        count = rng.randint(low, max(low, schema.get("maxItems", 3)))
+        return [instance_for_schema(schema.get("items", {}), rng) for _ in range(count)]
+    if kind == "object":
+        properties = schema.get("properties", {})
+        value = {name: instance_for_schema(sub, rng) for name, sub in properties.items()}
+        extra = schema.get("additionalProperties")
+        if not properties and isinstance(extra, dict):
+            value[rng.choice(_WORDS)] = instance_for_schema(extra, rng)
+        return value
+    raise ValueError(f"Unsupported schema type: {kind!r}")
+
+
+class StubModel:
+    """Draws latencies and errors and writes replies."""
+
+    def __init__(self, config: StubConfig):
+        self.config = config
+        self._ttft = parse_distribution(config.ttft_ms)
+        self._output_tokens = parse_distribution(config.output_tokens)
+        self._rng = random.Random(config.seed)
+        self._lock = threading.Lock()
+
+    def draw(self, prompt_tokens: int) -> Tuple[Optional[int], float]:
+        """An injected error status (or None) and the time to first token in seconds."""
+        with self._lock:
+            failed = self._rng.random() < self.config.error_rate
+            status = self._rng.choice(self.config.error_statuses) if failed else None
+            ttft_ms = self._ttft(self._rng)
+        if self.config.prefill_tokens_per_second:
+            ttft_ms += prompt_tokens / self.config.prefill_tokens_per_second * 1000
+        return status, ttft_ms / 1000
+
+    def reply(self, body: Dict[str, Any], schema: Optional[Dict[str, Any]], max_tokens: Optional[int]) -> List[str]:
+        """The reply as a list of tokens; the same request gets the same reply, streamed or not."""
+        request_body = {k: v for k, v in body.items() if k not in ("stream", "stream_options")}
+        digest = hashlib.sha256(json.dumps([self.config.seed, request_body], sort_keys=True).encode()).digest()
+        rng = random.Random(digest)
+        if schema is not None:
+            text = json.dumps(instance_for_schema(schema, rng))
+            # Split JSON into token-sized pieces so it streams like text
+            return [text[i:i + 4] for i in range(0, len(text), 4)]
+        count = max(1, round(self._output_tokens(rng)))
+        if max_tokens:
+            count = min(count, max_tokens)
+        return [(" " if i else "") + rng.choice(_WORDS) for i in range(count)]
+
+    def pace(self, tokens: List[str], ttft: float) -> Iterator[str]:
+        """Yield tokens at the configured rate after ``ttft`` seconds."""
+        time.sleep(ttft)
+        interval = 1 / self.config.tokens_per_second if self.config.tokens_per_second else 0
+        started = time.monotonic()
+        for i, token in enumerate(tokens):
+            # Sleep to a schedule so per-token overhead does not slow the rate
+            delay = started + i * interval - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            yield token
+
+
+def _sse(data: Any, event: Optional[str] = None) -> str:
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {data if isinstance(data, str) else json.dumps(data)}\n\n"
+
+
+def create_stub_app(config: Optional[StubConfig] = None) -> Flask:
+    """Flask app serving the stub OpenAI and Anthropic endpoints."""
+    model = StubModel(config or StubConfig())
+    app = Flask(__name__)
+
+    def error(status: int, anthropic: bool):
+        message = f"Injected error ({status})"
+        if anthropic:
+            payload = {"type": "error", "error": {"type": _ERROR_TYPES.get(status, "api_error"), "message": message}}
+        else:
+            payload = {"error": {"message": message, "type": _ERROR_TYPES.get(status, "api_error"), "code": status}}
+        response = jsonify(payload)
+        response.status_code = status
+        if status == 429:
+            response.headers["Retry-After"] = "1"
+        return response
+
+    @app.get("/v1/models")
+    def models():
+        return jsonify({"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]})
+
+    @app.get("/health")
+    def health():
+        return jsonify({"status": "ok"})
+
+    @app.post("/v1/chat/completions")
+    def chat_completions():
+        body = request.get_json(force=True)
+        prompt = "\n".join(_content_text(m.get("content")) for m in body.get("messages", []))
+        response_format = body.get("response_format") or {}
+        schema = (response_format.get("json_schema", {}).get("schema")
+                  if response_format.get("type") == "json_schema" else None)
+        if schema is None:
+            schema = _schema_from_prompt(prompt)
+        prompt_tokens = estimate_tokens(prompt)
+        status, ttft = model.draw(prompt_tokens)
+        if status:
+            time.sleep(ttft)
+            return error(status, anthropic=False)
+
+        max_tokens = body.get("max_completion_tokens") or body.get("max_tokens")
+        tokens = model.reply(body, schema, max_tokens)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        created = int(time.time())
+        name = body.get("model", "stub")
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                 "total_tokens": prompt_tokens + len(tokens)}
+        finish_reason = "length" if schema is None and max_tokens == len(tokens) else "stop"
+
+        if not body.get("stream"):
+            text = "".join(model.pace(tokens, ttft))
+            return jsonify({
+                "id": completion_id, "object": "chat.completion", "created": created, "model": name,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text},
+                             "finish_reason": finish_reason}],
+                "usage": usage,
+            })
+
+        def chunk(delta: Dict[str, Any], finish: Optional[str] = None) -> Dict[str, Any]:
+            return {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": name,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish}]}
+
+        def events() -> Iterator[str]:
+            first = True
+            for token in model.pace(tokens, ttft):
+                yield _sse(chunk({"role": "assistant", "content": token} if first else {"content": token}))
+                first = False
+            yield _sse(chunk({}, finish_reason))
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield _sse({"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                            "model": name, "choices": [], "usage": usage})
+            yield _sse("[DONE]")
+
+        return Response(events(), mimetype="text/event-stream")
+
+    @app.post("/v1/messages")
+    def messages():
+        body = request.get_json(force=True)
+        system = body.get("system")
+        parts = [_content_text(system)] if system else []
+        parts += [_content_text(m.get("content")) for m in body.get("messages", [])]
+        prompt = "\n".join(parts)
+        schema = _schema_from_prompt(prompt)
+        prompt_tokens = estimate_tokens(prompt)
+        status, ttft = model.draw(prompt_tokens)
+        if status:
+            time.sleep(ttft)
+            return error(status, anthropic=True)
+
+        tokens = model.reply(body, schema, body.get("max_tokens"))
+        message_id = f"msg_{uuid.uuid4().hex[:24]}"
+        name = body.get("model", "stub")
+        stop_reason = "max_tokens" if schema is None and body.get("max_tokens") == len(tokens) else "end_turn"
+        usage = {"input_tokens": prompt_tokens, "output_tokens": len(tokens),
+                 "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+
+        if not body.get("stream"):
+            text = "".join(model.pace(tokens, ttft))
+            return jsonify({
+                "id": message_id, "type": "message", "role": "assistant", "model": name,
+                "content": [{"type": "text", "text": text}],
+                "stop_reason": stop_reason, "stop_sequence": None, "usage": usage,
+            })
+
+        def events() -> Iterator[str]:
+            yield _sse({"type": "message_start", "message": {
+                "id": message_id, "type": "message", "role": "assistant", "model": name, "content": [],
+                "stop_reason": None, "stop_sequence": None, "usage": dict(usage, output_tokens=0),
+            }}, "message_start")
+            yield _sse({"type": "content_block_start", "index": 0, "content_block": {"type": "text", "text": ""}},
+                       "content_block_start")
+            for token in model.pace(tokens, ttft):
+                yield _sse({"type": "content_block_delta", "index": 0,
+                            "delta": {"type": "text_delta", "text": token}}, "content_block_delta")
+            yield _sse({"type": "content_block_stop", "index": 0}, "content_block_stop")
+            yield _sse({"type": "message_delta", "delta": {"stop_reason": stop_reason, "stop_sequence": None},
+                        "usage": {"output_tokens": len(tokens)}}, "message_delta")
+            yield _sse({"type": "message_stop"}, "message_stop")
+
+        return Response(events(), mimetype="text/event-stream")
+
+    return app
@@ -0,0 +1,223 @@
+"""
+Telemetry for LLM calls.
+
+Every ``LLMClient`` call produces one ``CallRecord``: the provider and model
+that answered, prompt/cached/completion tokens as reported by the provider,
+time to first token (streams), total latency, how many providers were tried,
+and the outcome. Records are buffered and written to the ``llm_calls`` table
+in batches by a background thread, so the chat path (including the SSE
+generator) never waits on SQLite. The same thread folds rows older than
+``LLM_TELEMETRY_RETENTION_DAYS`` into hourly ``llm_call_rollups``.
+
+``summary()`` reports per-model p50/p95 latency and time to first token, and
+tokens per second of generation, for sizing vLLM nodes.
+"""
+import atexit
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional
+
+import database
+from config import (
+    LLM_TELEMETRY,
+    LLM_TELEMETRY_FLUSH_SECONDS,
+    LLM_TELEMETRY_FLUSH_SIZE,
+    LLM_TELEMETRY_RETENTION_DAYS,
+)
+
+logger = logging.getLogger(__name__)
+
+# Usage reported by the adapter running on this thread
+_local = threading.local()
+
+
+@contextmanager
+def collecting_usage(usage: Dict[str, int]) -> Iterator[Dict[str, int]]:
+    """Collect the token usage adapters report on this thread into ``usage``."""
+    previous = getattr(_local, "usage", None)
+    _local.usage = usage
+    try:
+        yield usage
+    finally:
+        _local.usage = previous
+
+
+def report_usage(prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> None:
+    """Called by adapters with the usage of a response."""
+    usage = getattr(_local, "usage", None)
+    if usage is not None:
+        usage.update(prompt_tokens=prompt_tokens, cached_tokens=cached_tokens,
+                     completion_tokens=completion_tokens)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of sorted ``values`` (None if empty)."""
+    if not values:
+        return None
+    return values[max(0, min(len(values) - 1, math.ceil(pct / 100 * len(values)) - 1))]
+
+
+class CallRecord:
+    """Measurements of one LLMClient call."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self.provider: Optional[str] = None
+        self.model: Optional[str] = None
+        self.attempts = 0
+        self.usage: Dict[str, int] = {}
+        self.ttft_ms: Optional[float] = None
+        self.created_at = datetime.now()
+        self._started = time.perf_counter()
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+    def first_token(self) -> float:
+        self.ttft_ms = self.elapsed_ms()
+        return self.ttft_ms
+
+    def finish(self, error: Optional[BaseException] = None, sink: Optional["Telemetry"] = None,
+               outcome: Optional[str] = None) -> None:
+        """Record the call as finished: ``ok``, ``error`` (if ``error`` is given) or ``outcome``."""
+        (sink or telemetry).record({
+            "provider": self.provider,
+            "model": self.model,
+            "kind": self.kind,
+            "outcome": outcome or ("error" if error else "ok"),
+            "prompt_tokens": self.usage.get("prompt_tokens"),
+            "cached_tokens": self.usage.get("cached_tokens"),
+            "completion_tokens": self.usage.get("completion_tokens"),
+            "ttft_ms": self.ttft_ms,
+            "latency_ms": self.elapsed_ms(),
+            "attempts": max(1, self.attempts),
+            "error": str(error.__cause__ or error)[:500] if error else None,
+            "created_at": self.created_at,
+        })
+
+
+class Telemetry:
+    """Buffers call records; a daemon thread writes them to the database in batches."""
+
+    def __init__(self, enabled: bool = LLM_TELEMETRY, flush_size: int = LLM_TELEMETRY_FLUSH_SIZE,
+                 flush_seconds: float = LLM_TELEMETRY_FLUSH_SECONDS,
+                 retention_days: int = LLM_TELEMETRY_RETENTION_DAYS):
+        self.enabled = enabled
+        self.flush_size = max(1, flush_size)
+        self.flush_seconds = flush_seconds
+        self.retention_days = retention_days
+        self._lock = threading.Lock()
+        # Held for a whole write, so flush() returns only once earlier rows are stored
+        self._flush_lock = threading.Lock()
+        self._buffer: List[Dict[str, Any]] = []
+        self._last_rollup = 0.0
+        self._dropped = 0
+        self._wake = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+
+    def record(self, row: Dict[str, Any]) -> None:
+        """Buffer one record; never touches the database on the calling thread."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._buffer.append(row)
+            full = len(self._buffer) >= self.flush_size
+            if self._worker is None or not self._worker.is_alive():
+                if self._worker is None:
+                    atexit.register(self.flush)
+                self._worker = threading.Thread(target=self._loop, name="llm-telemetry", daemon=True)
+                self._worker.start()
+        if full:
+            self._wake.set()
+
+    def _loop(self) -> None:
+        """Flush when the buffer fills or every ``flush_seconds``, and roll up hourly."""
+        while True:
+            self._wake.wait(self.flush_seconds)
+            self._wake.clear()
+            self.flush()
+            self._rollup_if_due()
+
+    def flush(self) -> int:
+        """Write buffered records; returns how many were written. Never raises."""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+            if not rows:
+                return 0
+            try:
+                database.save_llm_calls(rows)
+            except Exception:
+                # Telemetry must not break LLM calls; the batch is dropped
+                logger.warning("Failed to write %d LLM telemetry records", len(rows), exc_info=True)
+                with self._lock:
+                    self._dropped += len(rows)
+                return 0
+            return len(rows)
+
+    def _rollup_if_due(self) -> None:
+        with self._lock:
+            if time.monotonic() - self._last_rollup < 3600:
+                return
+            self._last_rollup = time.monotonic()
+        try:
+            folded = database.rollup_llm_calls(datetime.now() - timedelta(days=self.retention_days))
+        except Exception:
+            logger.warning("Failed to roll up LLM telemetry", exc_info=True)
+            return
+        if folded:
+            logger.info("Rolled up %d LLM telemetry records", folded)
+
+    def summary(self, hours: float = 24, days: int = 30) -> Dict[str, Any]:
+        """
+        Per provider/model latency, token and throughput figures for the
+        last ``hours``, plus daily totals for the last ``days``.
+        """
+        self.flush()
+        now = datetime.now()
+        since = now - timedelta(hours=hours)
+        models = []
+        for group in database.get_llm_call_summary(since):
+            latencies = group.pop("latencies")
+            ttfts = group.pop("ttfts")
+            generation_ms = group.pop("generation_ms")
+            group.update(
+                error_rate=round(group["errors"] / group["calls"], 3),
+                p50_ms=_round(percentile(latencies, 50)),
+                p95_ms=_round(percentile(latencies, 95)),
+                ttft_p50_ms=_round(percentile(ttfts, 50)),
+                ttft_p95_ms=_round(percentile(ttfts, 95)),
+                tokens_per_s=_tokens_per_s(group["completion_tokens"], generation_ms),
+            )
+            models.append(group)
+        daily = []
+        for day in database.get_llm_call_daily(now - timedelta(days=days)):
+            generation_ms = day.pop("generation_ms")
+            day["avg_ms"] = _round(day.pop("latency_ms") / day["calls"]) if day["calls"] else None
+            day["tokens_per_s"] = _tokens_per_s(day["completion_tokens"], generation_ms)
+            daily.append(day)
+        with self._lock:
+            dropped = self._dropped
+        return {
+            "since": since.isoformat(timespec="seconds"),
+            "hours": hours,
+            "models": models,
+            "daily": daily,
+            "enabled": self.enabled,
+            "dropped": dropped,
+        }
+
+
+def _round(value: Optional[float]) -> Optional[int]:
+    return None if value is None else round(value)
+
+
+def _tokens_per_s(tokens: int, generation_ms: float) -> Optional[float]:
+    return round(tokens / (generation_ms / 1000), 1) if tokens and generation_ms else None
+
+
+telemetry = Telemetry()
@@ -0,0 +1,207 @@
+"""
+Compressed storage for memento HTML.
+
+In "files" mode the rendered DOM is written gzip-compressed as
+``content.html.gz`` (``ARCHIVE_HTML_ENCODING=gzip``, the default) and the
+encoding is recorded in ``mementos.content_encoding``. Readers go through
+``read_html`` (transparent decompression) or ``locate_html`` (to stream the
+stored bytes with ``Content-Encoding: gzip``). Mementos written before this
+keep their plain ``content.html`` until ``CompressionJob`` rewrites them.
+
+gzip rather than zstd: it is in the standard library and every browser
+accepts it as a Content-Encoding, so stored bytes can be served unchanged.
+"""
+import gzip
+import logging
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from utils.blob_store import BlobStore, StoredBlob, get_blob_store
+
+logger = logging.getLogger(__name__)
+
+IDENTITY = "identity"
+GZIP = "gzip"
+
+HTML_FILENAMES = {
+    GZIP: "content.html.gz",
+    IDENTITY: "content.html",
+}
+
+_GZIP_LEVEL = 6
+
+
+def html_filename(encoding: Optional[str]) -> str:
+    return HTML_FILENAMES.get(encoding or IDENTITY, HTML_FILENAMES[IDENTITY])
+
+
+def encode(data: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == GZIP:
+        # Fixed mtime keeps the output byte-identical for identical HTML, so
+        # the blob store still deduplicates repeat captures.
+        return gzip.compress(data, compresslevel=_GZIP_LEVEL, mtime=0)
+    return data
+
+
+def decode(data: bytes, encoding: Optional[str]) -> bytes:
+    if encoding == GZIP:
+        return gzip.decompress(data)
+    return data
+
+
+def locate_html(memento_dir: str) -> Tuple[Optional[str], Optional[str]]:
+    """Return ``(path, encoding)`` of a memento's stored HTML, or (None, None).
+
+    Checks the compressed file first; a compression run that was interrupted
+    between linking the .gz and removing the plain file leaves both, and they
+    hold the same document.
+    """
+    for encoding in (GZIP, IDENTITY):
+        path = os.path.join(memento_dir, HTML_FILENAMES[encoding])
+        if os.path.exists(path):
+            return path, encoding
+    return None, None
+
+
+def read_html(memento_dir: str) -> Optional[bytes]:
+    """Return a memento's decompressed HTML bytes (None if not stored as files)."""
+    path, encoding = locate_html(memento_dir)
+    if path is None:
+        return None
+    with open(path, "rb") as f:
+        return decode(f.read(), encoding)
+
+
+def read_warc_block(memento_id: int, record_type: str) -> Optional[bytes]:
+    """Read one of a WARC-mode memento's record blocks via the offset index.
+
+    Returns None if the memento has no such record or the WARC file is unreadable.
+    """
+    import database
+    from utils import warc
+
+    record = database.get_warc_records(memento_id).get(record_type)
+    if not record:
+        return None
+    try:
+        path = warc.get_warc_writer().path_for(record['warc_filename'])
+        _, block = warc.read_record(path, record['record_offset'], record['record_length'])
+    except (OSError, ValueError) as e:
+        logger.error(f"Error reading WARC {record_type} record for memento {memento_id}: {e}")
+        return None
+    return block
+
+
+def read_memento_html(memento: Dict[str, Any]) -> Optional[bytes]:
+    """Return a memento's decompressed HTML from its files or WARC response record."""
+    from utils import warc
+
+    html = read_html(memento['memento_location'])
+    if html is not None:
+        return html
+    block = read_warc_block(memento['id'], 'response')
+    return warc.http_body(block) if block is not None else None
+
+
+def read_screenshot(memento: Dict[str, Any]) -> Optional[bytes]:
+    """Return a memento's screenshot PNG from its file or WARC resource record."""
+    path = memento.get('screenshot_path')
+    if path and os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read()
+    return read_warc_block(memento['id'], 'resource')
+
+
+def compress_memento(memento_dir: str, blob_store: Optional[BlobStore] = None) -> Optional[Tuple[int, StoredBlob]]:
+    """Replace a plain content.html with content.html.gz.
+
+    Returns ``(original_size, stored_blob)``, or None if there is no plain
+    content.html to compress.
+    """
+    blob_store = blob_store or get_blob_store()
+    plain_path = os.path.join(memento_dir, HTML_FILENAMES[IDENTITY])
+    try:
+        with open(plain_path, "rb") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    stored = blob_store.put_and_link(encode(data, GZIP), os.path.join(memento_dir, HTML_FILENAMES[GZIP]))
+    os.remove(plain_path)
+    return len(data), stored
+
+
+class CompressionJob:
+    """Background pass that gzips existing plain-HTML mementos in place.
+
+    Only one run is active at a time; ``status()`` reports progress.
+    """
+
+    def __init__(self, batch_size: int = 100):
+        self.batch_size = batch_size
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._status: Dict[str, Any] = {"running": False}
+
+    def _reset_status(self) -> None:
+        self._status = {
+            "running": True,
+            "scanned": 0,
+            "compressed": 0,
+            "bytes_before": 0,
+            "bytes_after": 0,
+            "started_at": datetime.now().isoformat(),
+            "finished_at": None,
+            "error": None,
+        }
+
+    def start(self) -> bool:
+        """Start a run in a daemon thread; returns False if one is already running."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return False
+            self._reset_status()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+            return True
+
+    def run(self) -> Dict[str, Any]:
+        """Compress every plain-HTML memento synchronously; returns the final status."""
+        self._reset_status()
+        return self._run()
+
+    def _run(self) -> Dict[str, Any]:
+        import database
+
+        after_id = 0
+        try:
+            while True:
+                batch = database.get_uncompressed_mementos(after_id=after_id, limit=self.batch_size)
+                if not batch:
+                    break
+                for row in batch:
+                    after_id = row["id"]
+                    self._status["scanned"] += 1
+                    compressed = compress_memento(row["memento_location"])
+                    if compressed is None:
+                        continue
+                    original_size, stored = compressed
+                    database.replace_memento_html(row["id"], GZIP, stored.sha256, stored.size)
+                    self._status["compressed"] += 1
+                    self._status["bytes_before"] += original_size
+                    self._status["bytes_after"] += stored.size
+        except Exception as e:
+            logger.error(f"Error compressing mementos: {e}", exc_info=True)
+            self._status["error"] = str(e)
+        finally:
+            self._status["running"] = False
+            self._status["finished_at"] = datetime.now().isoformat()
+        logger.info("Memento compression finished: %s", self._status)
+        return dict(self._status)
+
+    def status(self) -> Dict[str, Any]:
+        return dict(self._status)
+
+
+compression_job = CompressionJob()
@@ -0,0 +1,87 @@
+"""
+Helpers for the Memento protocol (RFC 7089).
+
+memento_datetime values are stored as naive local time; the protocol speaks
+RFC 1123 dates in GMT. These helpers convert between the two and build the
+``Link`` header values shared by the TimeGate, the TimeMaps and the mementos
+themselves.
+"""
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+def parse_accept_datetime(value: str) -> Optional[datetime]:
+    """Parse an ``Accept-Datetime`` header into naive local time (None if malformed)."""
+    try:
+        parsed = parsedate_to_datetime(value.strip())
+    except (TypeError, ValueError, IndexError):
+        return None
+    if parsed is None:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone().replace(tzinfo=None)
+
+
+def to_datetime(value: Any) -> Optional[datetime]:
+    """Coerce a stored memento_datetime (datetime or SQLite string) to a datetime."""
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+
+
+def format_http_datetime(value: Any) -> Optional[str]:
+    """Format a stored memento_datetime as an RFC 1123 GMT date."""
+    when = to_datetime(value)
+    if when is None:
+        return None
+    if when.tzinfo is None:
+        when = when.astimezone()
+    return format_datetime(when.astimezone(timezone.utc), usegmt=True)
+
+
+def format_iso_datetime(value: Any) -> Optional[str]:
+    """Format a stored memento_datetime as an ISO 8601 UTC timestamp (for JSON TimeMaps)."""
+    when = to_datetime(value)
+    if when is None:
+        return None
+    if when.tzinfo is None:
+        when = when.astimezone()
+    return when.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def link_value(uri: str, rel: str, **params: Optional[str]) -> str:
+    """One ``<uri>; rel="..."; key="value"`` entry of a Link header."""
+    parts = [f'<{uri}>', f'rel="{rel}"']
+    parts.extend(f'{key}="{value}"' for key, value in params.items() if value is not None)
+    return "; ".join(parts)
+
+
+def memento_link(uri: str, rel: str, memento_datetime: Any) -> str:
+    """Link entry for a memento, with its ``datetime`` attribute."""
+    return link_value(uri, rel, datetime=format_http_datetime(memento_datetime))
+
+
+def memento_rels(candidates: Iterable[Tuple[str, Dict[str, Any]]]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Merge ``(rel, memento)`` pairs pointing at the same memento.
+
+    RFC 7089 lets one link carry several relation types, e.g. a TimeGate
+    answer that is also the first memento is ``rel="first memento"``.
+    """
+    merged: Dict[int, Tuple[List[str], Dict[str, Any]]] = {}
+    for rel, memento in candidates:
+        if memento is None:
+            continue
+        rels, _ = merged.setdefault(memento["id"], ([], memento))
+        for token in rel.split():
+            if token not in rels:
+                rels.append(token)
+    return [(" ".join(sorted(rels, key=_REL_ORDER.index)), memento)
+            for rels, memento in merged.values()]
+
+
+_REL_ORDER = ["first", "last", "prev", "next", "memento"]
@@ -0,0 +1,229 @@
+"""
+Rebuild the archive tables from the memento dirs on disk.
+
+Captures made with ``save_to_db=False`` (``capture_as_persona.py``) and
+archives whose database was lost or reset only exist as
+``archives/<url_hash>/<timestamp>/metadata.json``. ``Reindexer`` walks those
+dirs and registers them:
+
+* Dirs already in ``mementos`` are filtered out before any parsing, so an
+  interrupted run resumes where its last committed batch ended and a
+  repeated run is a cheap no-op. Dirs are recorded the way captures record
+  them (relative to the working dir), whatever ``root`` is given as, and
+  ``memento_location`` is unique, so a dir is never registered twice.
+* A process pool parses the metadata, stats the artifacts, reads WARC
+  record headers and computes missing screenshot hashes, all in parallel.
+* The parent process is the only DB writer. It upserts results in batched
+  transactions via ``database.import_mementos``.
+"""
+import json
+import logging
+import multiprocessing
+import os
+import re
+import time
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_ROOT = "archives"
+METADATA_FILENAME = "metadata.json"
+
+_URL_DIR = re.compile(r"^[0-9a-f]{32}$")
+_TIMESTAMP_FORMAT = "%Y%m%d-%H%M%S"
+
+
+def find_memento_dirs(root: str = ARCHIVE_ROOT) -> Iterator[str]:
+    """Yield every ``<root>/<url_hash>/<timestamp>`` dir holding a metadata.json, sorted."""
+    try:
+        url_dirs = sorted(entry.path for entry in os.scandir(root)
+                          if entry.is_dir() and _URL_DIR.match(entry.name))
+    except FileNotFoundError:
+        return
+    for url_dir in url_dirs:
+        for entry in sorted(os.scandir(url_dir), key=lambda e: e.name):
+            if entry.is_dir() and os.path.isfile(os.path.join(entry.path, METADATA_FILENAME)):
+                yield entry.path
+
+
+def _stored_location(path: str) -> str:
+    """A memento dir as captures record it: relative to the working dir when under it."""
+    path = os.path.abspath(path)
+    relative = os.path.relpath(path)
+    return path if relative == os.pardir or relative.startswith(os.pardir + os.sep) else relative
+
+
+def _memento_datetime(metadata: Dict[str, Any], memento_dir: str) -> datetime:
+    for value in (metadata.get("timestamp"), os.path.basename(memento_dir)):
+        try:
+            return datetime.strptime(str(value), _TIMESTAMP_FORMAT)
+        except ValueError:
+            continue
+    return datetime.fromtimestamp(os.path.getmtime(os.path.join(memento_dir, METADATA_FILENAME)))
+
+
+def _warc_records(metadata: Dict[str, Any], root: str) -> List[Dict[str, Any]]:
+    """Rebuild ``warc_records`` rows from the refs in metadata.json and the WARC headers."""
+    from utils import warc
+
+    rows = []
+    for record_type, ref in (metadata.get("warc") or {}).items():
+        path = os.path.join(root, "warc", ref["filename"])
+        try:
+            headers, _ = warc.read_record(path, ref["offset"], ref["length"])
+        except (OSError, ValueError, EOFError) as e:
+            logger.warning(f"Unreadable WARC record {ref.get('record_id')} in {path}: {e}")
+            continue
+        rows.append({
+            "record_id": ref["record_id"],
+            "record_type": headers.get("WARC-Type", record_type),
+            "target_uri": headers.get("WARC-Target-URI", metadata.get("url")),
+            "filename": ref["filename"],
+            "offset": ref["offset"],
+            "length": ref["length"],
+            "warc_date": headers.get("WARC-Date", ""),
+        })
+    return rows
+
+
+def parse_memento(memento_dir: str, root: str = ARCHIVE_ROOT) -> Dict[str, Any]:
+    """Turn one memento dir into an ``import_mementos`` record (runs in a worker).
+
+    Returns ``{"memento_location": ..., "error": ...}`` if the dir is unusable.
+    """
+    from utils import image_hash, memento_content
+    from utils.blob_store import BlobStore
+
+    try:
+        with open(os.path.join(memento_dir, METADATA_FILENAME), "r", encoding="utf-8") as f:
+            metadata = json.load(f)
+        if not metadata.get("url"):
+            raise ValueError("metadata.json has no url")
+
+        html_path, encoding = memento_content.locate_html(memento_dir)
+        screenshot_path = os.path.join(memento_dir, "screenshot.png")
+        if not os.path.isfile(screenshot_path):
+            screenshot_path = None
+
+        blob_store = BlobStore(os.path.join(root, "blobs"))
+        blobs = {}
+        for role, sha256 in (metadata.get("blobs") or {}).items():
+            try:
+                blobs[role] = (sha256, os.path.getsize(blob_store.path_for(sha256)))
+            except OSError:
+                continue  # blob already collected; the memento keeps its own link
+
+        warc_rows = _warc_records(metadata, root)
+        hashes = metadata.get("screenshot_hashes")
+        if not hashes:
+            png = None
+            if screenshot_path:
+                with open(screenshot_path, "rb") as f:
+                    png = f.read()
+            elif any(row["record_type"] == "resource" for row in warc_rows):
+                from utils import warc
+                ref = next(row for row in warc_rows if row["record_type"] == "resource")
+                _, png = warc.read_record(os.path.join(root, "warc", ref["filename"]),
+                                          ref["offset"], ref["length"])
+            if png:
+                hashes = image_hash.compute_hashes(png)
+
+        return {
+            "memento_location": memento_dir,
+            "uri_r": metadata["url"],
+            "persona_id": metadata.get("persona_id"),
+            "archive_type": "warc" if metadata.get("warc") else "filesystem",
+            "archive_location": os.path.dirname(memento_dir),
+            "memento_datetime": _memento_datetime(metadata, memento_dir),
+            "http_status": metadata.get("http_status"),
+            "content_type": metadata.get("content_type"),
+            "content_length": metadata.get("content_length"),
+            "headers": metadata.get("headers"),
+            "screenshot_path": screenshot_path,
+            "capture_timings": metadata.get("timings"),
+            "content_encoding": encoding if html_path else metadata.get("content_encoding"),
+            "blobs": blobs,
+            "screenshot_hashes": hashes,
+            "warc_records": warc_rows,
+        }
+    except Exception as e:
+        return {"memento_location": memento_dir, "error": f"{type(e).__name__}: {e}"}
+
+
+def _parse_in_root(args):
+    return parse_memento(*args)
+
+
+class Reindexer:
+    """Parallel, resumable rebuild of ``archived_websites``/``mementos`` from disk."""
+
+    def __init__(self, root: str = ARCHIVE_ROOT, workers: Optional[int] = None,
+                 batch_size: int = 200, replace: bool = False, progress_interval: float = 5.0):
+        self.root = root
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.replace = replace
+        self.progress_interval = progress_interval
+
+    def pending(self) -> List[str]:
+        """Memento dirs still to parse (all of them when ``replace`` is set)."""
+        import database
+
+        dirs = [_stored_location(path) for path in find_memento_dirs(self.root)]
+        if self.replace:
+            return dirs
+        indexed = {os.path.abspath(path) for path in database.get_memento_locations()}
+        return [path for path in dirs if os.path.abspath(path) not in indexed]
+
+    def run(self) -> Dict[str, Any]:
+        """Index every pending dir; returns counts and throughput."""
+        import database
+
+        started = time.monotonic()
+        pending = self.pending()
+        stats: Dict[str, Any] = {
+            "pending": len(pending), "parsed": 0,
+            "inserted": 0, "updated": 0, "skipped": 0, "errors": [],
+        }
+
+        batch: List[Dict[str, Any]] = []
+        last_report = started
+
+        def flush():
+            if batch:
+                for key, count in database.import_mementos(batch, replace=self.replace).items():
+                    stats[key] += count
+                batch.clear()
+
+        for record in self._parse_all(pending):
+            stats["parsed"] += 1
+            if "error" in record:
+                logger.warning(f"Skipping {record['memento_location']}: {record['error']}")
+                stats["errors"].append(record)
+            else:
+                batch.append(record)
+            if len(batch) >= self.batch_size:
+                flush()
+            now = time.monotonic()
+            if now - last_report >= self.progress_interval:
+                last_report = now
+                logger.info("Re-indexed %d/%d memento dirs (%.1f files/s)", stats["parsed"],
+                            len(pending), stats["parsed"] / (now - started))
+        flush()
+
+        elapsed = time.monotonic() - started
+        stats["elapsed_seconds"] = round(elapsed, 3)
+        stats["files_per_second"] = round(stats["parsed"] / elapsed, 1) if elapsed > 0 else None
+        logger.info("Re-index finished: %s", {k: v for k, v in stats.items() if k != "errors"})
+        return stats
+
+    def _parse_all(self, paths: List[str]) -> Iterator[Dict[str, Any]]:
+        args = [(path, self.root) for path in paths]
+        if self.workers <= 1 or len(paths) < 2:
+            yield from map(_parse_in_root, args)
+            return
+        # Big enough chunks to amortize IPC, small enough to keep every worker busy.
+        chunksize = max(1, min(64, len(paths) // (self.workers * 4)))
+        with multiprocessing.Pool(self.workers) as pool:
+            yield from pool.imap_unordered(_parse_in_root, args, chunksize=chunksize)
@@ -0,0 +1,151 @@
+"""
+Append-only per-URL memento index.
+
+Each capture appends one JSON line to ``archives/<url_hash>/index.jsonl`` with
+a single O_APPEND write, so recording a memento is O(1) and concurrent
+captures of the same URL cannot drop each other's entries. The URL-level
+``metadata.json`` (url, first_archived, last_archived, mementos) is no longer
+maintained on the write path; ``load_url_metadata`` regenerates it as an export
+whenever the log is newer than the file. A ``metadata.json`` written before
+the log existed seeds the log on the next capture, and ``read_entries`` falls
+back to it until then.
+
+Deleted mementos are recorded by appending a tombstone line
+(``{"timestamp": ..., "deleted": true}``) rather than rewriting the log, so
+the archive GC never races a concurrent capture's append.
+"""
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+INDEX_FILENAME = "index.jsonl"
+EXPORT_FILENAME = "metadata.json"
+
+
+def index_path(url_dir: str) -> str:
+    return os.path.join(url_dir, INDEX_FILENAME)
+
+
+def _legacy_entries(url_dir: str) -> Optional[List[Dict[str, Any]]]:
+    """Entries listed in a pre-log URL-level ``metadata.json`` (None if absent)."""
+    try:
+        with open(os.path.join(url_dir, EXPORT_FILENAME), "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if not isinstance(legacy, dict):
+        return None
+    return [{"url": legacy.get("url"), "timestamp": ts} for ts in legacy.get("mementos", [])]
+
+
+def _seed_from_legacy_export(url_dir: str) -> None:
+    """Convert a pre-log ``metadata.json`` into the first lines of a new log.
+
+    O_EXCL makes exactly one concurrent writer do the conversion.
+    """
+    legacy = _legacy_entries(url_dir)
+    if legacy is None:
+        return
+    try:
+        fd = os.open(index_path(url_dir), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        return
+    try:
+        lines = "".join(json.dumps(entry) + "\n" for entry in legacy)
+        os.write(fd, lines.encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+def append_memento(url_dir: str, url: str, timestamp: str, **fields: Any) -> None:
+    """Record one memento of ``url``; extra ``fields`` are stored on the entry."""
+    entry = {"url": url, "timestamp": timestamp}
+    entry.update(fields)
+    line = (json.dumps(entry, default=str) + "\n").encode("utf-8")
+    os.makedirs(url_dir, exist_ok=True)
+    if not os.path.exists(index_path(url_dir)):
+        _seed_from_legacy_export(url_dir)
+    fd = os.open(index_path(url_dir), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+def remove_mementos(url_dir: str, timestamps: Iterable[str]) -> None:
+    """Tombstone the given mementos of a URL in one appended write."""
+    lines = "".join(json.dumps({"timestamp": ts, "deleted": True}) + "\n" for ts in timestamps)
+    if not lines or not os.path.exists(index_path(url_dir)):
+        return
+    fd = os.open(index_path(url_dir), os.O_WRONLY | os.O_APPEND)
+    try:
+        os.write(fd, lines.encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+def read_entries(url_dir: str) -> List[Dict[str, Any]]:
+    """Return the live logged entries in append order.
+
+    Skips a torn trailing line and entries tombstoned by ``remove_mementos``
+    (a later append of the same timestamp revives it). A URL not captured
+    since the log was introduced is read from its legacy ``metadata.json``.
+    """
+    try:
+        with open(index_path(url_dir), "r", encoding="utf-8") as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return _legacy_entries(url_dir) or []
+    entries = []
+    for line in lines:
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if entry.get("deleted"):
+            entries = [e for e in entries if e["timestamp"] != entry["timestamp"]]
+        else:
+            entries.append(entry)
+    return entries
+
+
+def load_url_metadata(url_dir: str) -> Optional[Dict[str, Any]]:
+    """Return the URL-level metadata, regenerating ``metadata.json`` if stale.
+
+    Returns None when the URL has no live mementos.
+    """
+    export_path = os.path.join(url_dir, EXPORT_FILENAME)
+    try:
+        log_mtime = os.path.getmtime(index_path(url_dir))
+    except FileNotFoundError:
+        log_mtime = None
+
+    if log_mtime is not None:
+        try:
+            # Strictly newer: an append in the same mtime tick forces a rebuild.
+            if os.path.getmtime(export_path) > log_mtime:
+                with open(export_path, "r", encoding="utf-8") as f:
+                    return json.load(f)
+        except (FileNotFoundError, ValueError):
+            pass
+
+    entries = read_entries(url_dir)
+    if not entries:
+        return None
+    timestamps = sorted(entry["timestamp"] for entry in entries)
+    metadata = {
+        "url": next((entry["url"] for entry in entries if entry.get("url")), None),
+        "first_archived": timestamps[0],
+        "last_archived": timestamps[-1],
+        "mementos": timestamps,
+    }
+    if log_mtime is None:
+        # Legacy directory: metadata.json is still the source, leave it alone.
+        return metadata
+    # Write-then-rename so concurrent readers never see a partial export.
+    tmp_path = f"{export_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2)
+    os.replace(tmp_path, export_path)
+    return metadata
@@ -0,0 +1,104 @@
+"""
+Vectorized pixel diff between two screenshots.
+
+Both images are scaled to a common width (full-page screenshots are tall, and
+a per-pixel diff at full resolution is rarely needed). They are then padded
+to the same height, with the padding counted as changed, and compared
+channel-wise in NumPy. The result is a heatmap PNG (changed pixels in red
+over a dimmed copy of the first image) plus the changed fraction and the
+bounding box of the changed region, in the first image's pixel coordinates.
+"""
+import io
+from typing import Any, Dict, Optional, Union
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_WIDTH = 800
+# Per-channel difference (0-255) below which a pixel counts as unchanged;
+# absorbs JPEG-like noise and anti-aliasing.
+DEFAULT_THRESHOLD = 24
+
+
+def _load_rgb(image: Union[bytes, str, Image.Image]) -> Image.Image:
+    if isinstance(image, Image.Image):
+        return image.convert("RGB")
+    if isinstance(image, bytes):
+        image = io.BytesIO(image)
+    with Image.open(image) as opened:
+        return opened.convert("RGB")
+
+
+def _scaled(image: Image.Image, width: int) -> np.ndarray:
+    if image.width != width:
+        height = max(1, round(image.height * width / image.width))
+        image = image.resize((width, height), Image.BILINEAR)
+    return np.asarray(image, dtype=np.int16)
+
+
+def _pad(pixels: np.ndarray, height: int) -> np.ndarray:
+    if pixels.shape[0] == height:
+        return pixels
+    padded = np.zeros((height,) + pixels.shape[1:], dtype=pixels.dtype)
+    padded[:pixels.shape[0]] = pixels
+    return padded
+
+
+def diff_images(a: Union[bytes, str, Image.Image], b: Union[bytes, str, Image.Image],
+                width: int = DEFAULT_WIDTH, threshold: int = DEFAULT_THRESHOLD,
+                heatmap: bool = True) -> Dict[str, Any]:
+    """Compare two screenshots.
+
+    Returns ``{"changed_fraction", "bbox", "heatmap", "size"}``. ``bbox`` is
+    ``[x0, y0, x1, y1]`` (exclusive end) in image ``a``'s pixels, or None if
+    nothing changed. ``heatmap`` holds PNG bytes at the comparison width, or
+    None with ``heatmap=False`` (which skips rendering it).
+    """
+    if width <= 0:
+        raise ValueError("width must be positive")
+    image_a = _load_rgb(a)
+    image_b = _load_rgb(b)
+    width = min(width, image_a.width)
+    pixels_a = _scaled(image_a, width)
+    pixels_b = _scaled(image_b, width)
+
+    height = max(pixels_a.shape[0], pixels_b.shape[0])
+    valid = np.zeros(height, dtype=bool)
+    valid[:min(pixels_a.shape[0], pixels_b.shape[0])] = True
+    pixels_a = _pad(pixels_a, height)
+    pixels_b = _pad(pixels_b, height)
+
+    delta = np.abs(pixels_a - pixels_b).max(axis=2)
+    changed = (delta > threshold) | ~valid[:, None]
+
+    rows = np.flatnonzero(changed.any(axis=1))
+    cols = np.flatnonzero(changed.any(axis=0))
+    bbox: Optional[list] = None
+    if rows.size:
+        scale = image_a.width / width
+        bbox = [
+            int(cols[0] * scale),
+            int(rows[0] * scale),
+            int(np.ceil((cols[-1] + 1) * scale)),
+            int(np.ceil((rows[-1] + 1) * scale)),
+        ]
+
+    png = None
+    if heatmap:
+        # Dimmed grayscale base, red channel scaled by the difference.
+        base = (pixels_a.mean(axis=2) * 0.4 + 90).astype(np.uint8)
+        heat = np.stack([base, base, base], axis=2)
+        intensity = np.where(valid[:, None], np.clip(delta * 2, 96, 255), 255)
+        heat[changed, 0] = intensity[changed]
+        heat[changed, 1] = 0
+        heat[changed, 2] = 0
+        out = io.BytesIO()
+        Image.fromarray(heat, "RGB").save(out, format="PNG", optimize=True)
+        png = out.getvalue()
+
+    return {
+        "changed_fraction": round(float(changed.mean()), 6),
+        "bbox": bbox,
+        "heatmap": png,
+        "size": [width, height],
+    }
@@ -0,0 +1,228 @@
+"""
+Streaming WARC writer/reader for mementos.
+
+In WARC mode (``ARCHIVE_FORMAT=warc`` or ``archive_format="warc"``) a capture
+appends request, response, resource (screenshot) and metadata records to a
+rolling per-day ``archives/warc/A-PROXY-<YYYYMMDD>-<nnnnn>.warc.gz``. Each
+record is its own gzip member, so the ``warc_records`` offset index can seek
+straight to one record and standard tools (pywb, warcio, ReplayWeb.page) can
+read and replay the files as-is.
+"""
+import base64
+import gzip
+import hashlib
+import http
+import json
+import logging
+import os
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlsplit
+
+from config import WARC_MAX_FILE_SIZE
+
+try:
+    import fcntl
+except ImportError:  # Windows: fall back to the in-process lock only.
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WARC_ROOT = os.path.join("archives", "warc")
+WARC_PREFIX = "A-PROXY"
+
+# Headers that describe the wire encoding of the original fetch; the stored
+# response body is the decoded, rendered DOM, so they no longer apply.
+_HOP_HEADERS = {"content-encoding", "transfer-encoding", "content-length", "connection"}
+
+
+class WarcRecordRef(NamedTuple):
+    """Location of one appended record (what the offset index stores)."""
+    record_id: str
+    record_type: str
+    target_uri: str
+    filename: str
+    offset: int
+    length: int
+    warc_date: str
+
+
+def _warc_date(when: Optional[datetime] = None) -> str:
+    when = when or datetime.now(timezone.utc)
+    if when.tzinfo is None:
+        when = when.astimezone(timezone.utc)
+    return when.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def _block_digest(block: bytes) -> str:
+    return "sha1:" + base64.b32encode(hashlib.sha1(block).digest()).decode("ascii")
+
+
+def build_record(record_type: str, block: bytes, content_type: str,
+                 target_uri: Optional[str] = None, warc_date: Optional[str] = None,
+                 extra_headers: Optional[Dict[str, str]] = None) -> Tuple[str, bytes]:
+    """Serialize one uncompressed WARC/1.1 record; returns (record_id, bytes)."""
+    record_id = f"<urn:uuid:{uuid.uuid4()}>"
+    headers = [
+        ("WARC-Type", record_type),
+        ("WARC-Record-ID", record_id),
+        ("WARC-Date", warc_date or _warc_date()),
+    ]
+    if target_uri:
+        headers.append(("WARC-Target-URI", target_uri))
+    headers.extend((extra_headers or {}).items())
+    headers.extend([
+        ("Content-Type", content_type),
+        ("WARC-Block-Digest", _block_digest(block)),
+        ("Content-Length", str(len(block))),
+    ])
+    head = "WARC/1.1\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers) + "\r\n"
+    return record_id, head.encode("utf-8") + block + b"\r\n\r\n"
+
+
+def http_request_block(url: str, locale: Optional[str] = None) -> bytes:
+    """Reconstruct the GET request the capture made."""
+    parts = urlsplit(url)
+    target = parts.path or "/"
+    if parts.query:
+        target += f"?{parts.query}"
+    lines = [f"GET {target} HTTP/1.1", f"Host: {parts.netloc}"]
+    if locale:
+        lines.append(f"Accept-Language: {locale}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8")
+
+
+def http_response_block(body: bytes, status: Optional[int], headers: Optional[Dict[str, str]]) -> bytes:
+    """Wrap the rendered DOM in an HTTP/1.1 response using the fetched status/headers."""
+    status = status or 200
+    try:
+        reason = http.HTTPStatus(status).phrase
+    except ValueError:
+        reason = ""
+    lines = [f"HTTP/1.1 {status} {reason}".rstrip()]
+    has_content_type = False
+    for name, value in (headers or {}).items():
+        if name.lower() in _HOP_HEADERS:
+            continue
+        has_content_type = has_content_type or name.lower() == "content-type"
+        lines.append(f"{name}: {value}")
+    if not has_content_type:
+        lines.append("Content-Type: text/html; charset=utf-8")
+    lines.append(f"Content-Length: {len(body)}")
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8") + body
+
+
+class WarcWriter:
+    """Appends gzip-per-record WARC entries to rolling per-day files."""
+
+    def __init__(self, root: Optional[str] = None, max_file_size: int = WARC_MAX_FILE_SIZE):
+        self.root = root or DEFAULT_WARC_ROOT
+        self.max_file_size = max_file_size
+        self._lock = threading.Lock()
+
+    def _path(self, day: str, serial: int) -> str:
+        return os.path.join(self.root, f"{WARC_PREFIX}-{day}-{serial:05d}.warc.gz")
+
+    def _current_file(self, day: str) -> str:
+        """Return today's newest file, rolling to the next serial when full."""
+        os.makedirs(self.root, exist_ok=True)
+        serial = 0
+        while os.path.exists(self._path(day, serial + 1)):
+            serial += 1
+        path = self._path(day, serial)
+        if os.path.exists(path) and os.path.getsize(path) >= self.max_file_size:
+            path = self._path(day, serial + 1)
+        return path
+
+    def _warcinfo(self, filename: str) -> bytes:
+        fields = (
+            "software: A-Proxy\r\n"
+            "format: WARC File Format 1.1\r\n"
+            "conformsTo: http://iipc.github.io/warc-specifications/specifications/warc-format/warc-1.1/\r\n"
+        ).encode("utf-8")
+        _, record = build_record("warcinfo", fields, "application/warc-fields",
+                                 extra_headers={"WARC-Filename": filename})
+        return gzip.compress(record)
+
+    def write_records(self, records: List[Tuple[str, Optional[str], bytes, str, Dict[str, str]]],
+                      when: Optional[datetime] = None) -> List[WarcRecordRef]:
+        """Append ``(record_type, target_uri, block, content_type, extra_headers)``
+        records as one contiguous run; returns their offset references.
+
+        Records after the first get ``WARC-Concurrent-To`` pointing at it, which
+        is how replay tools associate a capture's request/metadata/resource.
+        """
+        when = when or datetime.now()
+        warc_date = _warc_date(when)
+        day = when.strftime("%Y%m%d")
+        refs: List[WarcRecordRef] = []
+
+        with self._lock:
+            path = self._current_file(day)
+            filename = os.path.basename(path)
+            with open(path, "ab") as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    f.seek(0, os.SEEK_END)
+                    if f.tell() == 0:
+                        f.write(self._warcinfo(filename))
+
+                    first_id = None
+                    for record_type, target_uri, block, content_type, extra in records:
+                        extra = dict(extra or {})
+                        if first_id:
+                            extra.setdefault("WARC-Concurrent-To", first_id)
+                        record_id, raw = build_record(record_type, block, content_type,
+                                                      target_uri, warc_date, extra)
+                        first_id = first_id or record_id
+                        member = gzip.compress(raw)
+                        offset = f.tell()
+                        f.write(member)
+                        refs.append(WarcRecordRef(record_id, record_type, target_uri or "",
+                                                  filename, offset, len(member), warc_date))
+                    f.flush()
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+        return refs
+
+    def path_for(self, filename: str) -> str:
+        return os.path.join(self.root, os.path.basename(filename))
+
+
+def read_record(path: str, offset: int, length: int) -> Tuple[Dict[str, str], bytes]:
+    """Read the gzip-member record at ``offset``; returns (warc_headers, block)."""
+    with open(path, "rb") as f:
+        f.seek(offset)
+        raw = gzip.decompress(f.read(length))
+    head, _, rest = raw.partition(b"\r\n\r\n")
+    lines = head.decode("utf-8").split("\r\n")
+    headers = {}
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        headers[name.strip()] = value.strip()
+    block_len = int(headers.get("Content-Length", len(rest)))
+    return headers, rest[:block_len]
+
+
+def http_body(block: bytes) -> bytes:
+    """Strip the HTTP status line and headers from a request/response block."""
+    return block.partition(b"\r\n\r\n")[2]
+
+
+def metadata_block(metadata: Dict) -> bytes:
+    return json.dumps(metadata, indent=2, default=str).encode("utf-8")
+
+
+_warc_writer = None
+
+
+def get_warc_writer() -> WarcWriter:
+    """Get the process-wide WarcWriter rooted at archives/warc."""
+    global _warc_writer
+    if _warc_writer is None:
+        _warc_writer = WarcWriter(max_file_size=WARC_MAX_FILE_SIZE)
+    return _warc_writer